@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script benchmarks the end-to-end throughput of RPMDrate on shortened
+versions of the shipped example systems, using a few umbrella windows, a few
+picoseconds of sampling per trajectory, and a few hundred recrossing factor
+child trajectories. Each example is run with several numbers of processes,
+and the wall time of each stage, the number of trajectories per hour, and the
+parallel efficiency relative to a single process are reported. To use, first
+build the potential energy surface of each example (by running ``make`` in its
+directory), then run ::
+
+$ python benchmarks/examples.py
+
+Examples whose potential energy surface has not been built are skipped. The
+LEPS example uses an analytic potential energy surface, so it needs no
+building.
+"""
+
+import os
+import os.path
+import sys
+import time
+import json
+import shutil
+import argparse
+import logging
+import platform
+import tempfile
+import multiprocessing
+import numpy
+
+# Allow the script to be run from a source checkout without installing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rpmdrate.main import Window
+from rpmdrate.input import loadInputFile
+from rpmdrate.jobs import runJob
+
+################################################################################
+
+# The example systems to benchmark
+EXAMPLES = ['LEPS', 'H+H2', 'H+CH4', 'OH+CH4', 'H+C2H6']
+
+# The stages to time, in the order they are run
+STAGES = ['configurations', 'umbrella', 'PMF', 'recrossing', 'rate']
+
+################################################################################
+
+def getShortenedJobList(jobList, windows, trajectories, evolutionTime, children):
+    """
+    Return a shortened version of the `jobList` read from an example input
+    file, using `windows` evenly spaced umbrella windows with `trajectories`
+    trajectories of `evolutionTime` ps each (after a fifth of that for
+    equilibration), and `children` recrossing factor child trajectories. Jobs
+    other than those in :data:`STAGES` are dropped. Also returns the number of
+    trajectories run in each stage.
+    """
+    shortJobList = []
+    counts = {}
+    xi_list = None
+    for job, params in jobList:
+        if job == 'configurations':
+            dt, configurationTime, xi_list, kforce, stride = params
+            xi_list = numpy.array(xi_list, numpy.float64)
+            indices = numpy.unique(numpy.round(numpy.linspace(0, len(xi_list) - 1, windows)).astype(int))
+            if isinstance(kforce, numpy.ndarray):
+                kforce = kforce[indices]
+            xi_list = xi_list[indices]
+            shortJobList.append([job, (dt, (0.1 * evolutionTime,"ps"), xi_list, kforce, 1)])
+            counts[job] = len(xi_list)
+        elif job == 'umbrella':
+            dt, windowList, saveTrajectories, staticFactorError, minTrajectories = params
+            windowList = sorted(windowList, key=lambda window: window.xi)
+            shortWindows = []
+            for xi in xi_list:
+                window = min(windowList, key=lambda window: abs(window.xi - xi))
+                shortWindows.append(Window(xi=window.xi, kforce=window.kforce, trajectories=trajectories,
+                    equilibrationTime=(0.2 * evolutionTime,"ps"), evolutionTime=(evolutionTime,"ps"), xi_range=window.xi_range))
+            shortJobList.append([job, (dt, shortWindows, False, None, minTrajectories)])
+            counts[job] = len(shortWindows) * trajectories
+        elif job == 'PMF':
+            windowList, xi_min, xi_max, bins = params
+            shortJobList.append([job, (shortWindows, xi_min, xi_max, bins)])
+            counts[job] = 0
+        elif job == 'recrossing':
+            params = list(params)
+            # Equilibration time, child trajectories, child sampling time,
+            # children per sampling; no error target, so all children are run
+            params[1] = (0.2 * evolutionTime,"ps")
+            params[2] = children
+            params[3] = (0.02 * evolutionTime,"ps")
+            params[4] = min(params[4], children)
+            params[9] = None
+            # The maximum of the shortened potential of mean force is too
+            # noisy to locate the barrier, so use the transition state
+            # dividing surface unless the input file gives a location
+            if params[6] is None:
+                params[6] = 1.0
+            shortJobList.append([job, tuple(params)])
+            counts[job] = children
+        elif job == 'rate':
+            shortJobList.append([job, params])
+            counts[job] = 0
+    return shortJobList, counts
+
+def runExample(path, T, Nbeads, processes, windows, trajectories, evolutionTime, children):
+    """
+    Run a shortened version of the example input file at `path` with the
+    given number of `processes`, in a scratch directory that is removed
+    afterwards. Returns dictionaries of the wall time in s and the number of
+    trajectories for each stage.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    scratch = tempfile.mkdtemp(prefix='rpmdrate-benchmark-')
+    try:
+        # The input file and any matrices it references are copied to the
+        # scratch directory, so that the output is written there, while the
+        # compiled potential is still imported from the example directory
+        for filename in os.listdir(directory):
+            if filename.endswith('.py') or filename.endswith('.txt'):
+                shutil.copy(os.path.join(directory, filename), scratch)
+        sys.path.insert(0, directory)
+        try:
+            system, jobList = loadInputFile(os.path.join(scratch, os.path.basename(path)), T, Nbeads, processes)
+        finally:
+            sys.path.remove(directory)
+        jobList, counts = getShortenedJobList(jobList, windows, trajectories, evolutionTime, children)
+
+        times = {}
+        try:
+            for job, params in jobList:
+                startTime = time.time()
+                runJob(system, job, params)
+                times[job] = times.get(job, 0.0) + time.time() - startTime
+        finally:
+            if system.pool is not None:
+                system.pool.terminate()
+                system.pool.join()
+        return times, counts
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def isExampleBuilt(directory):
+    """
+    Return ``True`` if the potential energy surface of the example in
+    `directory` has been compiled, i.e. a Python extension module exists, or
+    if there is nothing to compile (no makefile).
+    """
+    if not os.path.isdir(directory):
+        return False
+    if not os.path.exists(os.path.join(directory, 'Makefile')):
+        return True
+    return any([filename.endswith('.so') or filename.endswith('.pyd') for filename in os.listdir(directory)])
+
+################################################################################
+
+def parseList(value):
+    """
+    Parse a comma-separated list of integers from a command-line argument.
+    """
+    try:
+        return [int(item) for item in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid list of values {0!r}'.format(value))
+
+def parseCommandLineArguments():
+    
+    cpus = multiprocessing.cpu_count()
+    
+    parser = argparse.ArgumentParser(description='Benchmark the throughput of RPMDrate on shortened versions of the examples.')
+    parser.add_argument('--examples', metavar='NAME', type=str, nargs='+', default=EXAMPLES, help='the examples to benchmark')
+    parser.add_argument('--directory', metavar='DIR', type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples'), help='the directory containing the examples')
+    parser.add_argument('-p', '--processes', metavar='PROC', type=parseList, default=sorted(set([1,2,4,cpus])), help='a comma-separated list of numbers of processes')
+    parser.add_argument('-T', '--temperature', metavar='TEMP', type=float, default=300.0, help='the temperature in K')
+    parser.add_argument('-n', '--nbeads', metavar='BEADS', type=int, default=4, help='the number of beads')
+    parser.add_argument('--windows', metavar='N', type=int, default=5, help='the number of umbrella windows')
+    parser.add_argument('--trajectories', metavar='N', type=int, default=4, help='the number of umbrella sampling trajectories per window')
+    parser.add_argument('--time', metavar='PS', type=float, default=2.0, help='the evolution time of each umbrella sampling trajectory in ps')
+    parser.add_argument('--children', metavar='N', type=int, default=200, help='the number of recrossing factor child trajectories')
+    parser.add_argument('--save', metavar='FILE', type=str, help='save the results to FILE in JSON format')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the log of each run')
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    
+    args = parseCommandLineArguments()
+    
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(message)s', stream=sys.stdout)
+    
+    results = []
+    for example in args.examples:
+        directory = os.path.join(args.directory, example)
+        if not isExampleBuilt(directory):
+            print 'Skipping {0}: the potential energy surface has not been built (run make in {1}).'.format(example, directory)
+            print
+            continue
+        
+        print 'Throughput for {0} ({1:g} K, {2:d} beads)'.format(example, args.temperature, args.nbeads)
+        print '=========== ================ =========== =========== ============= =========='
+        print 'Processes   Stage            Trajs       Time (s)    Trajs/hour    Efficiency'
+        print '=========== ================ =========== =========== ============= =========='
+        serialTimes = None
+        for processes in args.processes:
+            times, counts = runExample(os.path.join(directory, 'input.py'), args.temperature, args.nbeads, processes,
+                args.windows, args.trajectories, args.time, args.children)
+            if serialTimes is None and processes == 1:
+                serialTimes = times
+            for stage in STAGES + ['total']:
+                if stage == 'total':
+                    wallTime = sum(times.values())
+                    count = sum(counts.values())
+                    serialTime = sum(serialTimes.values()) if serialTimes else None
+                elif stage in times:
+                    wallTime = times[stage]
+                    count = counts[stage]
+                    serialTime = serialTimes.get(stage) if serialTimes else None
+                else:
+                    continue
+                rate = count / wallTime * 3600 if wallTime > 0 and count > 0 else None
+                efficiency = serialTime / (processes * wallTime) if serialTime and wallTime > 0 and count > 0 else None
+                print '{0:11d} {1:16} {2:11d} {3:11.2f} {4:>13} {5:>10}'.format(processes, stage, count, wallTime,
+                    '{0:.4g}'.format(rate) if rate is not None else '-',
+                    '{0:.2f}'.format(efficiency) if efficiency is not None else '-')
+                results.append({'example': example, 'processes': processes, 'stage': stage, 'trajectories': count,
+                    'wallTime': wallTime, 'efficiency': efficiency})
+                sys.stdout.flush()
+        print '=========== ================ =========== =========== ============= =========='
+        print
+    
+    if args.save:
+        data = {
+            'date': time.asctime(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpus': multiprocessing.cpu_count(),
+            'T': args.temperature,
+            'Nbeads': args.nbeads,
+            'windows': args.windows,
+            'trajectories': args.trajectories,
+            'evolutionTime': args.time,
+            'children': args.children,
+            'results': results,
+        }
+        f = open(args.save, 'w')
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.close()
+        print 'Saved results to {0}'.format(args.save)
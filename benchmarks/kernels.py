@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains microbenchmarks of the kernels of the RPMD trajectory
+integrator in the Fortran layer. Each kernel is timed on a grid of numbers of
+atoms and beads, using a cheap analytic stand-in for the potential energy
+surface (or, using the ``--potential`` flag, one of the synthetic surfaces in
+:mod:`rpmdrate.potentials`), and the number of calls per second (i.e. time steps per second for
+the kernel) is reported along with the scaling exponents with respect to the
+numbers of atoms and beads. To use, run ::
+
+$ python benchmarks/kernels.py
+
+The results can be saved as a baseline using the ``--save`` flag, and a later
+build compared against it using the ``--compare`` flag, e.g. ::
+
+$ python benchmarks/kernels.py --save baseline.json
+$ python benchmarks/kernels.py --compare baseline.json
+"""
+
+import os.path
+import sys
+import time
+import json
+import argparse
+import platform
+import numpy
+
+# Allow the script to be run from a source checkout without installing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rpmdrate.main import RPMD
+from rpmdrate.surface import Reactants, TransitionState
+from rpmdrate.thermostat import AndersenThermostat, GLEThermostat
+from rpmdrate.potentials import SyntheticPotential
+from rpmdrate._main import system
+
+################################################################################
+
+# The kernels to benchmark
+KERNELS = [
+    'verlet_step',
+    'free_ring_polymer_step',
+    'get_reaction_coordinate',
+    'add_bias_potential',
+    'gle_thermostat',
+    'constrain_to_dividing_surface',
+]
+
+# The potential energy surfaces available: the harmonic stand-in below, and
+# the NumPy and compiled versions of the synthetic N-atom surface; the
+# compiled surface is called directly from the Fortran layer
+POTENTIALS = ['harmonic', 'synthetic', 'compiled']
+
+# The GLE thermostat matrix used for the gle_thermostat kernel
+GLE_MATRIX = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'H+H2', 'gle_A.txt')
+
+################################################################################
+
+class HarmonicPotential:
+    """
+    A cheap analytic stand-in for a potential energy surface, in which each
+    atom is bound harmonically to its position in a reference `geometry` with
+    force constant `kforce` (both in atomic units).
+    """
+
+    def __init__(self, geometry, kforce=0.1):
+        self.geometry = geometry[:,:,numpy.newaxis]
+        self.kforce = kforce
+
+    def __call__(self, q):
+        dq = q - self.geometry
+        V = 0.5 * self.kforce * numpy.sum(numpy.sum(dq * dq, axis=0), axis=0)
+        dVdq = self.kforce * dq
+        return V, dVdq, 0
+
+################################################################################
+
+def createSystem(Natoms, Nbeads, T=300.0, dt=(0.0001,"ps"), potential='harmonic'):
+    """
+    Return an RPMD object for a benchmark system of `Natoms` hydrogen atoms
+    with `Nbeads` beads, along with the transition state geometry in bohr.
+    The first three atoms form a linear H + H2 transition state, and the
+    remaining atoms are spectators on a grid next to the first reactant. The
+    `potential` is one of the names in :data:`POTENTIALS`.
+    """
+    synthetic = SyntheticPotential(Natoms)
+    geometry = synthetic.getTransitionStateGeometry()
+    if potential == 'harmonic':
+        geometry[0:3,2] = [-1.757, 0.0, 1.757]
+
+    reactants = Reactants(
+        atoms = ['H'] * Natoms,
+        reactant1Atoms = [1,2] + range(4, Natoms+1),
+        reactant2Atoms = [3],
+        Rinf = (30.0,"bohr"),
+    )
+    transitionState = TransitionState(
+        geometry = (geometry,"bohr"),
+        formingBonds = [(2,3)],
+        breakingBonds = [(1,2)],
+    )
+    if potential == 'harmonic':
+        potential = HarmonicPotential(geometry.T.copy())
+    elif potential == 'synthetic':
+        potential = synthetic
+    elif potential == 'compiled':
+        potential = synthetic.getCompiledPotential()
+    else:
+        raise ValueError('Invalid potential {0!r}.'.format(potential))
+
+    rpmd = RPMD(label='benchmark', T=T, Nbeads=Nbeads, reactants=reactants,
+        transitionState=transitionState, potential=potential,
+        thermostat=AndersenThermostat(), randomSeed=1)
+    rpmd.dt = dt[0] / 2.418884326505e-5
+    rpmd.mode = 1
+    return rpmd, geometry.T.copy()
+
+def timeKernel(function, minTime):
+    """
+    Return the number of calls per second of `function`, calling it
+    repeatedly (after a warm-up call) until at least `minTime` seconds have
+    elapsed.
+    """
+    function()
+    calls = 1
+    while True:
+        startTime = time.time()
+        for n in xrange(calls):
+            function()
+        elapsed = time.time() - startTime
+        if elapsed >= minTime:
+            return calls / elapsed
+        calls *= 2
+
+def benchmarkSystem(Natoms, Nbeads, kernels, minTime, potential='harmonic'):
+    """
+    Return a dictionary of the number of calls per second for each of the
+    given `kernels` for a system of `Natoms` atoms with `Nbeads` beads on the
+    given `potential` energy surface. Kernels that are not used for the given
+    system (the free ring polymer step for a single bead) are omitted.
+    """
+    rpmd, geometry = createSystem(Natoms, Nbeads, potential=potential)
+    # A compiled potential is passed to the Fortran layer as a pointer, so
+    # that it is called without going through Python
+    callback = getattr(rpmd.potential, '_cpointer', rpmd.potential)
+    rpmd.activate()
+    numpy.random.seed(1)
+
+    xi_current = 1.0
+    kforce = 0.1 * rpmd.T
+    q0 = numpy.asfortranarray(geometry[:,:,numpy.newaxis] + 0.01 * numpy.random.randn(3, Natoms, Nbeads))
+    p0 = numpy.asfortranarray(rpmd.sampleMomentum())
+    centroid = numpy.asfortranarray(numpy.mean(q0, axis=2))
+    xi0, dxi0, d2xi0 = system.get_reaction_coordinate(centroid, xi_current)
+    V0, dVdq0, info = rpmd.potential(q0)
+    
+    def getState():
+        """
+        Return a fresh copy of the initial state, so that each kernel is timed
+        independently of the others.
+        """
+        return [numpy.array(x, numpy.float64, order='F') for x in [0.0, p0, q0, V0, dVdq0, xi0, dxi0, d2xi0]]
+
+    functions = {}
+    t, p, q, V, dVdq, xi, dxi, d2xi = getState()
+    functions['verlet_step'] = lambda: system.verlet_step(t, p, q, V, dVdq, xi, dxi, d2xi, xi_current, callback, kforce, 0)
+    if Nbeads > 1:
+        t, p, q, V, dVdq, xi, dxi, d2xi = getState()
+        functions['free_ring_polymer_step'] = lambda: system.free_ring_polymer_step(p, q)
+    functions['get_reaction_coordinate'] = lambda: system.get_reaction_coordinate(centroid, xi_current)
+    t, p, q, V, dVdq, xi, dxi, d2xi = getState()
+    functions['add_bias_potential'] = lambda: system.add_bias_potential(dxi, d2xi, V, dVdq)
+    t, p, q, V, dVdq, xi, dxi, d2xi = getState()
+    functions['gle_thermostat'] = lambda: system.gle_thermostat(p, rpmd.mass, rpmd.beta, dxi, Ns, 0, 0)
+    # The constraint is only used in the recrossing factor calculation; each
+    # call starts from the same position just off a nearby dividing surface,
+    # so that it has to iterate onto the surface as it would after a time step
+    # (the cost of restoring the position is small in comparison)
+    system.mode[0] = 2
+    t, p, q, V, dVdq, xi, dxi, d2xi = getState()
+    dxi[:,:] = system.get_reaction_coordinate(centroid, xi_current)[1]
+    system.mode[0] = rpmd.mode
+    def constrain():
+        p[:,:,:] = p0
+        q[:,:,:] = q0
+        return system.constrain_to_dividing_surface(p, q, dxi, xi_current + 1e-3)
+    functions['constrain_to_dividing_surface'] = constrain
+    modes = {'constrain_to_dividing_surface': 2}
+
+    thermostat = GLEThermostat(A=(GLE_MATRIX,'s^-1'))
+    thermostat.activate(module=system, Natoms=Natoms, Nbeads=Nbeads)
+    Ns = int(system.gle_ns[0])
+    system.gle_initialize(rpmd.dt, Natoms, Nbeads, system.gle_a[0:Ns+1,0:Ns+1,0], system.gle_c[0:Ns+1,0:Ns+1,0])
+
+    results = {}
+    try:
+        for kernel in kernels:
+            if kernel in functions:
+                system.mode[0] = modes.get(kernel, rpmd.mode)
+                results[kernel] = timeKernel(functions[kernel], minTime)
+    finally:
+        system.mode[0] = rpmd.mode
+        system.gle_cleanup()
+    return results
+
+def getScalingExponents(results, kernel):
+    """
+    Return the exponents of the number of atoms and the number of beads in a
+    power-law fit of the time per call of `kernel` to the given `results`, a
+    list of (kernel, Natoms, Nbeads, callsPerSecond) tuples. An exponent that
+    cannot be determined is returned as ``None``.
+    """
+    data = numpy.array([(Natoms, Nbeads, rate) for k, Natoms, Nbeads, rate in results if k == kernel], numpy.float64)
+    if data.shape[0] == 0:
+        return None, None
+    columns = [numpy.ones(data.shape[0])]
+    variables = []
+    for index in range(2):
+        if len(numpy.unique(data[:,index])) > 1:
+            columns.append(numpy.log(data[:,index]))
+            variables.append(index)
+    coefficients = numpy.linalg.lstsq(numpy.array(columns).T, -numpy.log(data[:,2]), rcond=None)[0]
+    exponents = [None, None]
+    for index, coefficient in zip(variables, coefficients[1:]):
+        exponents[index] = coefficient
+    return tuple(exponents)
+
+################################################################################
+
+def saveBaseline(path, results, minTime, potential='harmonic'):
+    """
+    Save the benchmark `results`, a list of (kernel, Natoms, Nbeads,
+    callsPerSecond) tuples, to a JSON file at `path` along with a description
+    of the build and the `potential` used.
+    """
+    data = {
+        'date': time.asctime(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'minTime': minTime,
+        'potential': potential,
+        'results': [{'kernel': kernel, 'Natoms': Natoms, 'Nbeads': Nbeads, 'callsPerSecond': rate} for kernel, Natoms, Nbeads, rate in results],
+    }
+    f = open(path, 'w')
+    json.dump(data, f, indent=2, sort_keys=True)
+    f.close()
+
+def loadBaseline(path):
+    """
+    Load benchmark results from a JSON file at `path` created by
+    :func:`saveBaseline()`, returning a dictionary mapping (kernel, Natoms,
+    Nbeads) to the number of calls per second.
+    """
+    f = open(path, 'r')
+    data = json.load(f)
+    f.close()
+    return dict([((str(entry['kernel']), entry['Natoms'], entry['Nbeads']), entry['callsPerSecond']) for entry in data['results']])
+
+################################################################################
+
+def parseList(value):
+    """
+    Parse a comma-separated list of integers from a command-line argument.
+    """
+    try:
+        return [int(item) for item in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid list of values {0!r}'.format(value))
+
+def parseCommandLineArguments():
+    
+    parser = argparse.ArgumentParser(description='Benchmark the kernels of the RPMD trajectory integrator.')
+    parser.add_argument('--natoms', metavar='N', type=parseList, default=[3,10,30,100], help='a comma-separated list of numbers of atoms')
+    parser.add_argument('--nbeads', metavar='N', type=parseList, default=[1,4,16,64,256], help='a comma-separated list of numbers of beads')
+    parser.add_argument('--kernels', metavar='NAME', type=str, nargs='+', default=KERNELS, choices=KERNELS, help='the kernels to benchmark')
+    parser.add_argument('--potential', metavar='NAME', type=str, default='harmonic', choices=POTENTIALS, help='the potential energy surface to use ({0})'.format(', '.join(POTENTIALS)))
+    parser.add_argument('--min-time', metavar='SEC', type=float, default=0.2, dest='minTime', help='the minimum time to spend timing each kernel')
+    parser.add_argument('--save', metavar='FILE', type=str, help='save the results as a baseline to FILE')
+    parser.add_argument('--compare', metavar='FILE', type=str, help='compare the results to the baseline in FILE')
+    parser.add_argument('--tolerance', metavar='FRAC', type=float, default=0.2, help='the fractional slowdown relative to the baseline reported as a regression')
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    
+    args = parseCommandLineArguments()
+    
+    results = []
+    print 'Kernel throughput'
+    print '================='
+    print '=============================== ====== ====== ==========='
+    print 'Kernel                          Natoms Nbeads steps/s'
+    print '=============================== ====== ====== ==========='
+    for Natoms in args.natoms:
+        for Nbeads in args.nbeads:
+            rates = benchmarkSystem(Natoms, Nbeads, args.kernels, args.minTime, args.potential)
+            for kernel in args.kernels:
+                if kernel in rates:
+                    results.append((kernel, Natoms, Nbeads, rates[kernel]))
+                    print '{0:31} {1:6d} {2:6d} {3:11.4g}'.format(kernel, Natoms, Nbeads, rates[kernel])
+                    sys.stdout.flush()
+    print '=============================== ====== ====== ==========='
+    print
+    
+    print 'Scaling exponents of time per step'
+    print '=================================='
+    print '=============================== ========== =========='
+    print 'Kernel                          Natoms     Nbeads'
+    print '=============================== ========== =========='
+    for kernel in args.kernels:
+        exponents = getScalingExponents(results, kernel)
+        print '{0:31} '.format(kernel) + ' '.join(['{0:10.2f}'.format(e) if e is not None else '{0:>10}'.format('-') for e in exponents])
+    print '=============================== ========== =========='
+    print
+
+    if args.save:
+        saveBaseline(args.save, results, args.minTime, args.potential)
+        print 'Saved baseline to {0}'.format(args.save)
+        print
+    
+    regressions = 0
+    if args.compare:
+        baseline = loadBaseline(args.compare)
+        print 'Comparison to baseline {0}'.format(args.compare)
+        print '=============================== ====== ====== =========== =========== ======='
+        print 'Kernel                          Natoms Nbeads baseline    current     ratio'
+        print '=============================== ====== ====== =========== =========== ======='
+        for kernel, Natoms, Nbeads, rate in results:
+            if (kernel, Natoms, Nbeads) not in baseline:
+                continue
+            ratio = rate / baseline[kernel, Natoms, Nbeads]
+            flag = ''
+            if ratio < 1.0 - args.tolerance:
+                flag = ' slower'
+                regressions += 1
+            print '{0:31} {1:6d} {2:6d} {3:11.4g} {4:11.4g} {5:7.3f}{6}'.format(kernel, Natoms, Nbeads, baseline[kernel, Natoms, Nbeads], rate, ratio, flag)
+        print '=============================== ====== ====== =========== =========== ======='
+        print
+        print '{0:d} regressions of more than {1:g}% found.'.format(regressions, 100 * args.tolerance)
+
+    sys.exit(1 if regressions > 0 else 0)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python 
+# encoding: utf-8 
+
+# The H + H2 reaction on an analytic LEPS potential energy surface, which
+# needs no compiling and so is convenient for testing and benchmarking
+from rpmdrate.potentials import LEPSPotential
+
+get_potential = LEPSPotential()
+
+################################################################################
+ 
+label = 'H + H2 -> HH + H (LEPS)' 
+ 
+reactants( 
+    atoms = ['H', 'H', 'H'],
+    reactant1Atoms = [1,2], 
+    reactant2Atoms = [3], 
+    Rinf = (30 * 0.52918,"angstrom"), 
+) 
+ 
+transitionState( 
+    geometry = (get_potential.getTransitionStateGeometry(), "bohr"), 
+    formingBonds = [(2,3)],  
+    breakingBonds = [(1,2)], 
+) 
+equivalentTransitionState( 
+    formingBonds=[(1,3)],  
+    breakingBonds=[(2,1)], 
+) 
+ 
+thermostat('Andersen') 
+ 
+################################################################################# 
+ 
+xi_list = numpy.arange(-0.05, 1.05, 0.01) 
+ 
+generateUmbrellaConfigurations( 
+    dt = (0.0001,"ps"), 
+    evolutionTime = (5,"ps"), 
+    xi_list = xi_list, 
+    kforce = 0.1 * T, 
+) 
+ 
+windows = [] 
+for xi in xi_list: 
+    window = Window(xi=xi, kforce=0.1*T, trajectories=200, equilibrationTime=(20,"ps"), evolutionTime=(100,"ps")) 
+    windows.append(window) 
+ 
+conductUmbrellaSampling( 
+    dt = (0.0001,"ps"), 
+    windows = windows, 
+) 
+ 
+computePotentialOfMeanForce(windows=windows, xi_min=-0.02, xi_max=1.02, bins=5000) 
+ 
+computeRecrossingFactor( 
+    dt = (0.0001,"ps"), 
+    equilibrationTime = (20,"ps"), 
+    childTrajectories = 100000, 
+    childSamplingTime = (2,"ps"), 
+    childrenPerSampling = 100, 
+    childEvolutionTime = (0.05,"ps"), 
+) 
+ 
+computeRateCoefficient() 
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This is the script for analyzing the trajectories saved by an RPMDrate
+calculation. To use, pass the path of the input file of the calculation, the
+temperature in K, and the paths of the trajectory files on the command line,
+e.g. ::
+
+$ python rpmdrate-analyze.py examples/H+CH4/input.py 1000 examples/H+CH4/1000/16/trajectories/*.trj
+
+The observables of each frame of each trajectory are saved to a NumPy ``.npz``
+file next to it. Several files can be analyzed at once using the ``-p`` flag.
+By default the distances of the forming and breaking bonds are computed; other
+bonds can be given as a comma-separated list of pairs of atom indices starting
+from one using the ``--bonds`` flag, e.g. ``--bonds 1-2,2-5``.
+"""
+
+import sys
+import argparse
+import logging
+
+################################################################################
+
+def parseBonds(value):
+    """
+    Parse a comma-separated list of bonds of the form ``I-J`` from a
+    command-line argument.
+    """
+    try:
+        return [tuple(int(atom) for atom in bond.split('-', 1)) for bond in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid list of bonds {0!r}'.format(value))
+
+def parseCommandLineArguments():
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', metavar='FILE', type=str, nargs=1, help='the input file of the calculation that saved the trajectories')
+    parser.add_argument('T', metavar='TEMP', type=float, nargs=1, help='the temperature in K')
+    parser.add_argument('trajectories', metavar='TRAJECTORY', type=str, nargs='+', help='the trajectory files to analyze')
+    parser.add_argument('-p', '--processes', metavar='PROC', type=int, nargs=1, default=[1], help='the number of processors to use')
+    parser.add_argument('--bonds', metavar='I-J,...', type=parseBonds, help='the bonds to compute the distances of')
+
+    return parser.parse_args()
+
+################################################################################
+
+if __name__ == '__main__':
+    
+    args = parseCommandLineArguments()
+    
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s', stream=sys.stdout)
+    
+    from rpmdrate.input import loadInputFile
+    from rpmdrate.analysis import analyzeTrajectories
+    
+    rpmd, jobList = loadInputFile(args.file[0], args.T[0], 1)
+    outputPaths = analyzeTrajectories(rpmd, args.trajectories, args.bonds, args.processes[0])
+    if len(outputPaths) < len(args.trajectories):
+        sys.exit(1)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This is the worker script for running RPMDrate trajectories on behalf of a
+broker, i.e. an RPMDrate run started with the ``--broker`` flag, possibly on
+another machine. To use, pass the address of the broker and its key on the
+command line, e.g. ::
+
+$ python rpmdrate-worker.py host:5000 --authkey secret
+
+Several worker processes can be started at once using the ``-p`` flag. Each
+worker loads the potential energy surface from the input file of the broker;
+if the input file is at a different path on this machine, give that path
+using the ``--input`` flag. The workers exit when the broker finishes.
+"""
+
+import sys
+import argparse
+import logging
+import multiprocessing
+
+from rpmdrate.broker import runWorker, parseAddress
+
+################################################################################
+
+def parseCommandLineArguments():
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('address', metavar='HOST:PORT', type=str, nargs=1, help='the address of the broker')
+    parser.add_argument('--authkey', metavar='KEY', type=str, required=True, help='the key of the broker')
+    parser.add_argument('-p', '--processes', metavar='PROC', type=int, nargs=1, default=[1], help='the number of worker processes to start')
+    parser.add_argument('--input', metavar='FILE', type=str, help='the path of the input file on this machine, if different from that of the broker')
+
+    return parser.parse_args()
+
+################################################################################
+
+if __name__ == '__main__':
+    
+    args = parseCommandLineArguments()
+    
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s', stream=sys.stdout)
+    
+    address = parseAddress(args.address[0])
+    workers = []
+    for n in range(args.processes[0]):
+        worker = multiprocessing.Process(target=runWorker, args=(address, args.authkey, args.input))
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
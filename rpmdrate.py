@@ -42,7 +42,66 @@ flag, e.g. ::
 
 $ python rpmdrate.py examples/H+CH4/input.py 1000 1 -p 8
 
-Only one processor is used by default.
+Only one processor is used by default. If the RPMDrate extension modules
+were built with OpenMP support, each process can also run its trajectories on
+several threads using the ``--threads`` flag; when fewer trajectories than
+processes are running, e.g. the parent trajectory of the recrossing factor
+calculation, the threads of the idle processes are given to the running
+trajectories, e.g. ::
+
+$ python rpmdrate.py examples/H+CH4/input.py 1000 16 -p 4 --threads 2
+
+Several temperatures and/or numbers of beads can be given as comma-separated
+lists to run a sweep over all of their combinations, sharing a single pool of
+processors, e.g. ::
+
+$ python rpmdrate.py examples/H+CH4/input.py 300,500,1000 1,4,16 -p 8
+
+The time spent in each of the kernels of the trajectory integrator (potential,
+free ring polymer step, reaction coordinate, etc.) can be summarized in the
+log for each window and stage using the ``--profile`` flag.
+
+To estimate the cost of the requested jobs without running them, use the
+``--plan`` flag; the cost per time step is measured by timing a few short
+trajectories, and the projected core-hours and wall time for the given number
+of processors are printed, e.g. ::
+
+$ python rpmdrate.py examples/H+CH4/input.py 1000 16 -p 8 --plan
+
+The plan also recommends the largest time step for which the energy drift of
+short trajectories run without a thermostat stays within the tolerance given
+by the ``--drift-tolerance`` flag. The kinetic temperature and energy drift of
+the trajectories of a calculation can be summarized in the log for each stage
+using the ``--monitor-energy`` flag.
+
+To farm the trajectories out to other machines as well, serve them over TCP
+using the ``--broker`` flag, then start workers on the other machines using
+the ``rpmdrate-worker.py`` script, e.g. ::
+
+$ python rpmdrate.py examples/H+CH4/input.py 1000 16 -p 8 --broker :5000 --authkey secret
+$ python rpmdrate-worker.py host:5000 --authkey secret -p 16
+
+In this mode ``-p`` is the number of workers started on the local machine.
+
+On a batch-scheduled cluster, the umbrella sampling and recrossing factor can
+instead be split into shards run as separate jobs, e.g. the elements of a job
+array, using the ``--shard`` flag. Once all of the shards have finished, their
+results are merged into the standard output files using the ``--merge`` flag,
+which also computes the potential of mean force and rate coefficient from the
+merged results, e.g. ::
+
+$ python rpmdrate.py examples/H+CH4/input.py 1000 16 -p 8 --shard 3/10
+$ python rpmdrate.py examples/H+CH4/input.py 1000 16 --merge
+
+To protect a long calculation against crashes or hangs in the potential, each
+trajectory can be run in its own child process using the ``--isolate`` flag,
+optionally killing trajectories that run for longer than a given number of
+seconds using the ``--trajectory-timeout`` flag, e.g. ::
+
+$ python rpmdrate.py examples/H+CH4/input.py 1000 16 -p 8 --trajectory-timeout 600
+
+A failed trajectory is run again with fresh momenta up to ``--max-retries``
+times (10 by default) before the calculation is stopped.
 """
 
 import os.path
@@ -53,13 +112,50 @@ import logging
 
 ################################################################################
 
+def parseList(itemType):
+    """
+    Return a function that parses a comma-separated list of values of type
+    `itemType` from a command-line argument.
+    """
+    def parse(value):
+        try:
+            return [itemType(item) for item in value.split(',')]
+        except ValueError:
+            raise argparse.ArgumentTypeError('invalid list of values {0!r}'.format(value))
+    return parse
+
+def parseShard(value):
+    """
+    Parse a shard of the form ``I/N`` from a command-line argument.
+    """
+    from rpmdrate.shards import parseShard
+    try:
+        return parseShard(value)
+    except ValueError, e:
+        raise argparse.ArgumentTypeError(str(e))
+
 def parseCommandLineArguments():
     
     parser = argparse.ArgumentParser()
     parser.add_argument('file', metavar='FILE', type=str, nargs=1, help='a file describing the job to execute')
-    parser.add_argument('T', metavar='TEMP', type=float, nargs=1, help='the temperature in K')
-    parser.add_argument('Nbeads', metavar='BEADS', type=int, nargs=1, help='the number of beads')
+    parser.add_argument('T', metavar='TEMP', type=parseList(float), nargs=1, help='the temperature in K, or a comma-separated list of temperatures')
+    parser.add_argument('Nbeads', metavar='BEADS', type=parseList(int), nargs=1, help='the number of beads, or a comma-separated list of numbers of beads')
     parser.add_argument('-p', '--processes', metavar='PROC', type=int, nargs=1, default=[1], help='the number of processors to use')
+    parser.add_argument('--threads', metavar='THREADS', type=int, help='the number of threads each process may run trajectories on')
+    parser.add_argument('--thread-pool', action='store_true', dest='threadPool', help='run trajectories concurrently on threads of one process instead of on subprocesses (needs a compiled, thread-safe potential)')
+    parser.add_argument('--pipeline', action='store_true', help='run independent jobs concurrently on the pool of processors')
+    parser.add_argument('--profile', action='store_true', help='time the trajectory kernels and summarize them in the log')
+    parser.add_argument('--plan', action='store_true', help='print the projected cost of the jobs without running them')
+    parser.add_argument('--drift-tolerance', metavar='TOL', type=float, default=0.002, dest='driftTolerance', help='the energy drift tolerance used to recommend a time step with --plan')
+    parser.add_argument('--monitor-energy', action='store_true', dest='monitorEnergy', help='monitor the kinetic temperature and energy drift and summarize them in the log')
+    parser.add_argument('--broker', metavar='[HOST:]PORT', type=str, help='serve trajectories over TCP to workers started with rpmdrate-worker.py')
+    parser.add_argument('--authkey', metavar='KEY', type=str, help='the key that workers must present to connect to the broker')
+    parser.add_argument('--shard', metavar='I/N', type=parseShard, help='run only the I-th of N shards of the umbrella sampling and recrossing factor')
+    parser.add_argument('--merge', action='store_true', help='merge the results of the shards into the standard output files and run the jobs that need them')
+    parser.add_argument('--isolate', action='store_true', help='run each trajectory in its own child process, so that a crash only loses that trajectory')
+    parser.add_argument('--trajectory-timeout', metavar='SEC', type=float, dest='trajectoryTimeout', help='kill isolated trajectories that run for longer than this (implies --isolate)')
+    parser.add_argument('--max-retries', metavar='N', type=int, default=10, dest='maxRetries', help='the number of times a failed trajectory is run again before giving up')
+    parser.add_argument('--worker-timeout', metavar='SEC', type=float, default=120.0, dest='workerTimeout', help='the time after which a silent worker is dropped and its trajectories re-queued')
 
     # Options for controlling the amount of information printed to the console
     # By default a moderate level of information is printed; you can either
@@ -165,27 +261,64 @@ if __name__ == '__main__':
     # Print some information to the beginning of the log
     logHeader()
     
-    # Load the input file for the job
-    from rpmdrate.input import loadInputFile
-    system, jobList = loadInputFile(args.file[0], args.T[0], args.Nbeads[0], args.processes[0])
+    # Load the input file for the job, once for each combination of
+    # temperature, number of beads, and isotopologue
+    from rpmdrate.input import loadSystems
+    systems = loadSystems(args.file[0], args.T[0], args.Nbeads[0], args.processes[0])
+    for label, system, jobList in systems:
+        system.profiling = args.profile
+        system.monitorEnergy = args.monitorEnergy
+        system.shard = args.shard
+        system.isolateTrajectories = args.isolate or args.trajectoryTimeout is not None
+        system.trajectoryTimeout = args.trajectoryTimeout
+        system.maxRetries = args.maxRetries
+        system.threads = args.threads
+        system.threadPool = args.threadPool
+    if args.threads is not None and args.threads > 1:
+        import rpmdrate._main
+        if not rpmdrate._main.system.get_openmp():
+            logging.warning('RPMDrate was built without OpenMP support, so each trajectory will run on a single thread.')
     logging.info('')
     
-    # Run the requested jobs
-    for job, params in jobList:
-        if job == 'configurations':
-            dt, evolutionTime, xi_list, kforce = params
-            system.generateUmbrellaConfigurations(dt, evolutionTime, xi_list, kforce)
-        elif job == 'umbrella':
-            dt, windows, saveTrajectories = params
-            system.conductUmbrellaSampling(dt, windows, saveTrajectories)
-        elif job == 'PMF':
-            windows, xi_min, xi_max, bins = params
-            system.computePotentialOfMeanForce(windows, xi_min, xi_max, bins)
-        elif job == 'recrossing':
-            dt, equilibrationTime, childTrajectories, childSamplingTime, childrenPerSampling, childEvolutionTime, xi_current, saveParentTrajectory, saveChildTrajectories = params
-            system.computeRecrossingFactor(dt, equilibrationTime, childTrajectories, childSamplingTime, childrenPerSampling, childEvolutionTime, xi_current, saveParentTrajectory, saveChildTrajectories)
-        elif job == 'rate':
-            system.computeRateCoefficient()
+    # In broker mode, all of the systems share a broker in place of the pool
+    # of subprocesses
+    broker = None
+    if args.broker and not args.plan and not args.merge:
+        from rpmdrate.broker import Broker, parseAddress
+        authkey = args.authkey
+        if authkey is None:
+            authkey = os.urandom(8).encode('hex')
+            logging.info('No broker key given; using randomly generated key {0}.'.format(authkey))
+        broker = Broker(parseAddress(args.broker), authkey, args.processes[0], args.workerTimeout, args.file[0])
+        logging.info('Serving trajectories to workers at {0}:{1:d}.'.format(*broker.address))
+        logging.info('')
+        for label, system, jobList in systems:
+            system.pool = broker
+    
+    # Run the requested jobs, or only estimate their cost
+    try:
+        if args.plan:
+            from rpmdrate.planning import logPlan
+            logPlan(systems, args.processes[0], driftTolerance=args.driftTolerance)
+        elif args.merge:
+            from rpmdrate.shards import mergeShards, runMergedJobs
+            for label, system, jobList in systems:
+                system.shard = None
+                mergeShards(system)
+                runMergedJobs(system, jobList)
+        elif len(systems) == 1:
+            label, system, jobList = systems[0]
+            from rpmdrate.jobs import runJobs
+            runJobs(system, jobList, args.pipeline)
+        else:
+            from rpmdrate.jobs import runSweep, saveKineticIsotopeEffects
+            runSweep(systems, args.pipeline)
+            if any([system.isotopologue is not None for label, system, jobList in systems]):
+                saveKineticIsotopeEffects(os.path.join(outputDirectory, 'kinetic_isotope_effects.dat'), [system for label, system, jobList in systems])
+    finally:
+        if broker is not None:
+            broker.close()
+            broker.join()
     
     # Print some information to the end of the log
     logFooter()
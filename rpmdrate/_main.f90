@@ -30,26 +30,110 @@ module system
 
     implicit none
 
+    ! The parameters of the simulation are kept separately for each of up to
+    ! MAX_CONTEXTS contexts, in the last dimension of each of the variables
+    ! below, so that several systems (e.g. umbrella integration windows) can
+    ! be simulated at once on separate threads sharing the same potential;
+    ! each routine that needs them takes the index of its context, which is 1
+    ! unless given otherwise, and the parameters of each context are set from
+    ! Python by RPMD.activate()
+    integer, parameter :: MAX_CONTEXTS = 64
+
     integer, parameter :: MAX_ATOMS = 100
-    double precision :: dt
-    double precision :: beta
-    double precision :: mass(MAX_ATOMS)
-    integer :: mode
+    double precision :: dt(MAX_CONTEXTS)
+    double precision :: beta(MAX_CONTEXTS)
+    double precision :: mass(MAX_ATOMS,MAX_CONTEXTS)
+    integer :: mode(MAX_CONTEXTS)
     double precision :: pi = dacos(-1.0d0)
     
     ! The type of thermostat (1 = Andersen, 2 = GLE)
-    integer :: thermostat
+    integer :: thermostat(MAX_CONTEXTS)
     
     ! Parameters for the Andersen thermostat
-    double precision :: andersen_sampling_time
+    double precision :: andersen_sampling_time(MAX_CONTEXTS)
     
     ! Parameters for the GLE thermostat
     integer, parameter :: MAX_GLE_NS = 20
-    integer :: gle_Ns
-    double precision :: gle_A(MAX_GLE_NS+1,MAX_GLE_NS+1)
-    double precision :: gle_C(MAX_GLE_NS+1,MAX_GLE_NS+1)
-    double precision, allocatable, save :: gle_S(:,:), gle_T(:,:)
-    double precision, allocatable, save :: gle_p(:,:,:,:), gle_np(:,:,:,:)
+    integer :: gle_Ns(MAX_CONTEXTS)
+    double precision :: gle_A(MAX_GLE_NS+1,MAX_GLE_NS+1,MAX_CONTEXTS)
+    double precision :: gle_C(MAX_GLE_NS+1,MAX_GLE_NS+1,MAX_CONTEXTS)
+
+    ! Kernel profiling (0 = off, 1 = on); when turned on, the wall time spent
+    ! in and the number of calls to each kernel are accumulated in
+    ! profile_time and profile_calls until reset_profile() is called
+    integer, parameter :: PROFILE_KERNELS = 8
+    integer, parameter :: PROFILE_POTENTIAL = 1
+    integer, parameter :: PROFILE_FREE_RING = 2
+    integer, parameter :: PROFILE_REACTION_COORDINATE = 3
+    integer, parameter :: PROFILE_BIAS = 4
+    integer, parameter :: PROFILE_CONSTRAINT = 5
+    integer, parameter :: PROFILE_THERMOSTAT = 6
+    integer, parameter :: PROFILE_CHECKS = 7
+    integer, parameter :: PROFILE_REWEIGHTING = 8
+    integer :: profiling(MAX_CONTEXTS) = 0
+    double precision :: profile_time(PROFILE_KERNELS,MAX_CONTEXTS) = 0.0d0
+    integer :: profile_calls(PROFILE_KERNELS,MAX_CONTEXTS) = 0
+
+    ! Trajectory recording; when a trajectory is saved, the position of each
+    ! bead (or only the centroid, if record_centroid is 1) at every
+    ! record_stride-th step is stored in the recording buffers allocated by
+    ! start_recording(), along with the number of the step, until the
+    ! buffers are full; record_count is the number of frames stored so far,
+    ! which are returned by get_recorded_frames()
+    integer :: record_stride(MAX_CONTEXTS) = 1
+    integer :: record_centroid(MAX_CONTEXTS) = 0
+    integer :: record_count(MAX_CONTEXTS) = 0
+
+    ! Energy monitoring (0 = off, 1 = on); when turned on, the kinetic energy
+    ! at each time step is accumulated in monitor_temperature as a fraction
+    ! of its equipartition value, i.e. as the kinetic temperature relative to
+    ! the target temperature, over monitor_steps time steps; the largest
+    ! deviation of the ring polymer Hamiltonian from its initial value in
+    ! each recrossing trajectory, which is run without a thermostat, is
+    ! accumulated in monitor_drift and monitor_max_drift over
+    ! monitor_trajectories trajectories, in units of the thermal energy of
+    ! the ring polymer per degree of freedom; the sums are accumulated until
+    ! reset_monitor() is called
+    integer :: monitoring(MAX_CONTEXTS) = 0
+    integer :: monitor_steps(MAX_CONTEXTS) = 0
+    double precision :: monitor_temperature(MAX_CONTEXTS) = 0.0d0
+    integer :: monitor_trajectories(MAX_CONTEXTS) = 0
+    double precision :: monitor_drift(MAX_CONTEXTS) = 0.0d0
+    double precision :: monitor_max_drift(MAX_CONTEXTS) = 0.0d0
+
+    ! Threading; the per-bead and per-atom loops of each time step (the
+    ! normal mode transforms, the free ring polymer propagation, and the
+    ! momentum and bias force updates) are run on this many OpenMP threads,
+    ! if the module was compiled with OpenMP support; if thread_potential is
+    ! 1, the potential of each bead is also evaluated separately on these
+    ! threads, which is only safe if the potential is a thread-safe compiled
+    ! routine rather than a Python function
+    integer :: threads(MAX_CONTEXTS) = 1
+    integer :: thread_potential(MAX_CONTEXTS) = 0
+
+    ! The interface of the potential, which evaluates the potential energy
+    ! and its gradient for each bead at the given position
+    abstract interface
+        subroutine potential_function(q, V, dVdq, Natoms, Nbeads, info)
+            integer, intent(in) :: Natoms, Nbeads
+            double precision, intent(in) :: q(3,Natoms,Nbeads)
+            double precision, intent(out) :: V(Nbeads), dVdq(3,Natoms,Nbeads)
+            integer, intent(out) :: info
+        end subroutine potential_function
+    end interface
+
+    ! The work arrays of each context, which are allocated as needed: the
+    ! propagator matrices and auxiliary momenta of the GLE thermostat, and
+    ! the trajectory recording buffers; and the compiled potential set by
+    ! set_potential(), if any
+    type context_buffers
+        double precision, allocatable :: gle_S(:,:), gle_T(:,:)
+        double precision, allocatable :: gle_p(:,:,:,:), gle_np(:,:,:,:)
+        double precision, allocatable :: record_frames(:,:,:,:)
+        integer, allocatable :: record_steps(:)
+        procedure(potential_function), pointer, nopass :: potential => null()
+    end type context_buffers
+    type(context_buffers), save :: buffers(MAX_CONTEXTS)
 
 contains
 
@@ -57,6 +141,7 @@ contains
     ! thermostat, with option to constrain the trajectory to the transition
     ! state dividing surface.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   t - The initial time
     !   p - The initial momentum of each bead in each atom
     !   q - The initial position of each bead in each atom
@@ -67,16 +152,17 @@ contains
     !   potential - A function that evaluates the potential and force for a given position
     !   kforce - The umbrella potential force constant
     !   constrain - 1 to constrain to dividing surface, 0 otherwise
-    !   save_trajectory - 1 to save the trajectory to disk for visualization (slow!), 0 otherwise
+    !   save_trajectory - 1 to record the trajectory (see record_frame()), 0 otherwise
     ! Returns:
     !   result - 0 if the trajectory evolution was successful, nonzero if unsuccessful
-    subroutine equilibrate(t, p, q, Natoms, Nbeads, steps, &
+    subroutine equilibrate(context, t, p, q, Natoms, Nbeads, steps, &
         xi_current, potential, kforce, constrain, save_trajectory, result)
 
         use transition_state, only: check_for_valid_position
 
         implicit none
         external potential
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(inout) :: t, p(3,Natoms,Nbeads), q(3,Natoms,Nbeads)
         integer, intent(in) :: steps
@@ -86,59 +172,59 @@ contains
 
         double precision :: V(Nbeads), dVdq(3,Natoms,Nbeads)
         double precision :: xi, dxi(3,Natoms), d2xi(3,Natoms,3,Natoms)
-        double precision :: centroid(3,Natoms)
-        integer :: step, andersen_sampling_steps
+        double precision :: centroid(3,Natoms), H
+        integer :: step, andersen_sampling_steps, Ns
+        integer(8) :: clock
 
         result = 0
 
         ! Set up Andersen thermostat (if turned on)
-        andersen_sampling_steps = int(andersen_sampling_time / dt)
-        if (thermostat .eq. 1) then
-            if (andersen_sampling_time .gt. 0) then
-                andersen_sampling_steps = int(andersen_sampling_time / dt)
+        andersen_sampling_steps = int(andersen_sampling_time(context) / dt(context))
+        if (thermostat(context) .eq. 1) then
+            if (andersen_sampling_time(context) .gt. 0) then
+                andersen_sampling_steps = int(andersen_sampling_time(context) / dt(context))
             else
                 andersen_sampling_steps = int(dsqrt(dble(steps)))
             end if
         end if
         ! Set up GLE thermostat (if turned on)
-        if (thermostat .eq. 2) then
-            call gle_initialize(dt, Natoms, Nbeads, gle_A(1:gle_Ns+1,1:gle_Ns+1), gle_C(1:gle_Ns+1,1:gle_Ns+1), gle_Ns)
-        end if
-
-        if (save_trajectory .eq. 1) then
-            open(unit=77,file='equilibrate.xyz')
-            open(unit=88,file='equilibrate_centroid.xyz')
+        Ns = gle_Ns(context)
+        if (thermostat(context) .eq. 2) then
+            call gle_initialize(context, dt(context), Natoms, Nbeads, &
+                gle_A(1:Ns+1,1:Ns+1,context), gle_C(1:Ns+1,1:Ns+1,context), Ns)
         end if
 
         call get_centroid(q, Natoms, Nbeads, centroid)
-        call get_reaction_coordinate(centroid, Natoms, xi_current, xi, dxi, d2xi)
-        call potential(q, V, dVdq, Natoms, Nbeads, result)
+        call get_reaction_coordinate(context, centroid, Natoms, xi_current, xi, dxi, d2xi)
+        call get_potential(context, q, V, dVdq, Natoms, Nbeads, potential, result)
         if (result > 0) then
             ! The initial position is unphysical, so abort
             result = -1
             return
         end if
-        if (mode .eq. 1) then
-            call add_umbrella_potential(xi, dxi, V, dVdq, Natoms, Nbeads, xi_current, kforce)
-            call add_bias_potential(dxi, d2xi, V, dVdq, Natoms, Nbeads)
+        if (mode(context) .eq. 1) then
+            call add_umbrella_potential(context, xi, dxi, V, dVdq, Natoms, Nbeads, xi_current, kforce)
+            call add_bias_potential(context, dxi, d2xi, V, dVdq, Natoms, Nbeads)
         end if
 
         ! Apply GLE thermostat if turned on
-        if (thermostat .eq. 2) then
-            call gle_thermostat(p, mass, beta, dxi, Natoms, Nbeads, gle_Ns, constrain, result)
+        if (thermostat(context) .eq. 2) then
+            call gle_thermostat(context, p, mass(1:Natoms,context), beta(context), dxi, Natoms, Nbeads, Ns, constrain, result)
             if (result .ne. 0) return
         end if
 
         do step = 1, steps
-            call verlet_step(t, p, q, V, dVdq, xi, dxi, d2xi, Natoms, Nbeads, &
+            call verlet_step(context, t, p, q, V, dVdq, xi, dxi, d2xi, Natoms, Nbeads, &
                 xi_current, potential, kforce, constrain, result)
             if (result .ne. 0) exit
 
             ! If constraining to dividing surface, check that the values of
             ! the forming and breaking bonds are reasonable
             if (constrain .eq. 1) then
+                call profile_start(context, clock)
                 call get_centroid(q, Natoms, Nbeads, centroid)
-                call check_for_valid_position(centroid, Natoms, 20.0d0, result)
+                call check_for_valid_position(context, centroid, Natoms, 20.0d0, result)
+                call profile_stop(context, PROFILE_CHECKS, clock)
                 if (result .ne. 0) then
                     write (*,fmt='(A)') &
                         'Error: Invalid geometry for recrossing factor parent trajectory. Restarting trajectory.'
@@ -146,28 +232,27 @@ contains
                 end if
             end if
 
-            if (save_trajectory .eq. 1) call update_vmd_output(q, Natoms, Nbeads, 77, 88)
+            if (save_trajectory .eq. 1) call record_frame(context, q, Natoms, Nbeads, step)
+            if (monitoring(context) .eq. 1) call monitor_step(context, p, q, V, Natoms, Nbeads, H)
 
             ! Apply Andersen thermostat (if turned on)
-            if (thermostat .eq. 1) then
-                if (mod(step, andersen_sampling_steps) .eq. 0) call sample_momentum(p, mass, beta, Natoms, Nbeads)
+            call profile_start(context, clock)
+            if (thermostat(context) .eq. 1) then
+                if (mod(step, andersen_sampling_steps) .eq. 0) &
+                    call sample_momentum(p, mass(1:Natoms,context), beta(context), Natoms, Nbeads)
             end if
             ! Apply GLE thermostat if turned on
-            if (thermostat .eq. 2) then
-                call gle_thermostat(p, mass, beta, dxi, Natoms, Nbeads, gle_Ns, constrain, result)
-                if (result .ne. 0) return
+            if (thermostat(context) .eq. 2) then
+                call gle_thermostat(context, p, mass(1:Natoms,context), beta(context), dxi, Natoms, Nbeads, Ns, constrain, result)
             end if
+            call profile_stop(context, PROFILE_THERMOSTAT, clock)
+            if (result .ne. 0) return
 
         end do
 
         ! Clean up GLE thermostat (if turned on)
-        if (thermostat .eq. 2) then
-            call gle_cleanup()
-        end if
-
-        if (save_trajectory .eq. 1) then
-            close(unit=77)
-            close(unit=88)
+        if (thermostat(context) .eq. 2) then
+            call gle_cleanup(context)
         end if
 
     end subroutine equilibrate
@@ -175,6 +260,7 @@ contains
     ! Conduct a simulation of a RPMD trajectory to update the value of the
     ! recrossing factor.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   t - The initial time
     !   p - The initial momentum of each bead in each atom
     !   q - The initial position of each bead in each atom
@@ -183,186 +269,389 @@ contains
     !   steps - The number of time steps to take in this trajectory
     !   xi_current - The current centroid value of the reaction coordinate
     !   potential - A function that evaluates the potential and force for a given position
-    !   save_trajectory - 1 to save the trajectory to disk for visualization (slow!), 0 otherwise
+    !   save_trajectory - 1 to record the trajectory (see record_frame()), 0 otherwise
     !   kappa_num - The numerator of the recrossing factor expression
     !   kappa_denom - The denominator of the recrossing factor expression
+    !   xi_commit - The distance from xi_current in the (umbrella integration)
+    !       reaction coordinate beyond which the trajectory is considered
+    !       committed, or 0 to always run the full number of steps
+    !   commit_steps - The number of consecutive steps the trajectory must
+    !       remain beyond xi_commit before it is stopped
     ! Returns:
+    !   actual_steps - The number of time steps actually taken
     !   result - 0 if the trajectory evolution was successful, nonzero if unsuccessful
-    subroutine recrossing_trajectory(t, p, q, Natoms, Nbeads, steps, &
-        xi_current, potential, save_trajectory, kappa_num, kappa_denom, result)
+    subroutine recrossing_trajectory(context, t, p, q, Natoms, Nbeads, steps, &
+        xi_current, potential, save_trajectory, kappa_num, kappa_denom, &
+        xi_commit, commit_steps, actual_steps, result)
+
+        use reactants, only: reactants_value => value
+        use transition_state, only: transition_state_value => value
 
         implicit none
 
         external potential
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(inout) :: t, p(3,Natoms,Nbeads), q(3,Natoms,Nbeads)
         integer, intent(in) :: steps
         double precision, intent(in) :: xi_current
         double precision, intent(inout) :: kappa_num(steps), kappa_denom
         integer, intent(in) :: save_trajectory
-        integer, intent(out) :: result
+        double precision, intent(in) :: xi_commit
+        integer, intent(in) :: commit_steps
+        integer, intent(out) :: actual_steps, result
 
         double precision :: V(Nbeads), dVdq(3,Natoms,Nbeads)
         double precision :: xi, dxi(3,Natoms), d2xi(3,Natoms,3,Natoms)
-        double precision :: centroid(3,Natoms), vs, fs
-        integer :: step
+        double precision :: centroid(3,Natoms), vs, fs, s0, s1, H, H0, drift
+        integer :: step, dwell
+        integer(8) :: clock
 
         result = 0
-
-        if (save_trajectory .eq. 1) then
-            open(unit=777,file='child.xyz')
-            open(unit=888,file='child_centroid.xyz')
-        end if
+        actual_steps = 0
+        dwell = 0
 
         call get_centroid(q, Natoms, Nbeads, centroid)
-        call get_reaction_coordinate(centroid, Natoms, xi_current, xi, dxi, d2xi)
-        call potential(q, V, dVdq, Natoms, Nbeads, result)
+        call get_reaction_coordinate(context, centroid, Natoms, xi_current, xi, dxi, d2xi)
+        call get_potential(context, q, V, dVdq, Natoms, Nbeads, potential, result)
         if (result > 0) then
             ! The initial position is unphysical, so abort
             result = -1
             return
         end if
  
-        call get_recrossing_velocity(p, dxi, Natoms, Nbeads, vs)
-        call get_recrossing_flux(dxi, Natoms, fs)
+        call get_recrossing_velocity(context, p, dxi, Natoms, Nbeads, vs)
+        call get_recrossing_flux(context, dxi, Natoms, fs)
         if (vs .gt. 0) kappa_denom = kappa_denom + vs / fs
 
+        if (monitoring(context) .eq. 1) call get_hamiltonian(context, p, q, V, Natoms, Nbeads, H0)
+        drift = 0.0d0
+
         do step = 1, steps
-            call verlet_step(t, p, q, V, dVdq, xi, dxi, d2xi, Natoms, Nbeads, &
+            call verlet_step(context, t, p, q, V, dVdq, xi, dxi, d2xi, Natoms, Nbeads, &
                 xi_current, potential, 0.d0, 0, result)
             if (result .ne. 0) exit
-            if (save_trajectory .eq. 1) call update_vmd_output(q, Natoms, Nbeads, 777, 888)
+            actual_steps = step
+            if (save_trajectory .eq. 1) call record_frame(context, q, Natoms, Nbeads, step)
+            if (monitoring(context) .eq. 1) then
+                call monitor_step(context, p, q, V, Natoms, Nbeads, H)
+                drift = max(drift, abs(H - H0))
+            end if
             if (xi .gt. 0) kappa_num(step) = kappa_num(step) + vs / fs
+
+            ! Check whether the trajectory has committed to the reactant or
+            ! product side; if so, its contribution to the numerator is
+            ! constant for the remaining steps and need not be simulated
+            ! The recrossing reaction coordinate is (s0 - s1) * (xi - xi_current),
+            ! where xi is the umbrella integration reaction coordinate
+            if (xi_commit .gt. 0.0d0) then
+                call profile_start(context, clock)
+                call get_centroid(q, Natoms, Nbeads, centroid)
+                call reactants_value(context, centroid, Natoms, s0)
+                call transition_state_value(context, centroid, Natoms, s1)
+                call profile_stop(context, PROFILE_REACTION_COORDINATE, clock)
+                if (abs(xi) .gt. xi_commit * abs(s0 - s1)) then
+                    dwell = dwell + 1
+                else
+                    dwell = 0
+                end if
+                if (dwell .ge. commit_steps) then
+                    if (xi .gt. 0) kappa_num(step+1:steps) = kappa_num(step+1:steps) + vs / fs
+                    exit
+                end if
+            end if
         end do
 
-        if (save_trajectory .eq. 1) then
-            close(unit=777)
-            close(unit=888)
+        if (monitoring(context) .eq. 1 .and. actual_steps .gt. 0) then
+            ! The thermal energy of the ring polymer per degree of freedom
+            ! is Nbeads / beta
+            drift = drift * beta(context) / (3 * Natoms * Nbeads * Nbeads)
+            monitor_trajectories(context) = monitor_trajectories(context) + 1
+            monitor_drift(context) = monitor_drift(context) + drift
+            monitor_max_drift(context) = max(monitor_max_drift(context), drift)
         end if
 
     end subroutine recrossing_trajectory
 
-    subroutine umbrella_trajectory(t, p, q, Natoms, Nbeads, steps, &
-        xi_current, potential, kforce, xi_range, save_trajectory, av, av2, &
-        actual_steps, result)
+    ! Conduct a simulation of a RPMD trajectory in an umbrella integration
+    ! window. The samples are accumulated separately for each segment of
+    ! block_steps time steps, so that a corrupted segment can be dropped
+    ! without discarding the rest of the trajectory. Along with the first and
+    ! second moments of the reaction coordinate, a histogram of the reaction
+    ! coordinate is accumulated for each segment, in
+    ! which each bin contains the number of samples and the sums over those
+    ! samples of xi, xi^2, U, S, U^2, S^2, and U*S, where U is the potential
+    ! (including the umbrella potential, but not the bias potential) averaged
+    ! over the beads and S is the ring polymer spring energy without its
+    ! temperature-dependent prefactor; these allow the results to be
+    ! reweighted to other temperatures. Samples outside of the histogram
+    ! range are placed in the first or last bin. The position is saved as a
+    ! checkpoint every checkpoint_steps steps, so that a trajectory that
+    ! becomes unphysical can be rolled back to its last good position without
+    ! losing the samples accumulated up to the failure. A checkpoint is
+    ! skipped if xi is in the outer half of the allowed range, since fresh
+    ! momenta would likely push a trajectory rolled back to it straight out of
+    ! the range again.
+    ! Parameters:
+    !   context - The index of the context to simulate
+    !   t - The initial time
+    !   p - The initial momentum of each bead in each atom
+    !   q - The initial position of each bead in each atom
+    !   Natoms - The number of atoms in the molecular system
+    !   Nbeads - The number of beads to use per atom
+    !   steps - The number of time steps to take in this trajectory
+    !   xi_current - The center of the umbrella integration window
+    !   potential - A function that evaluates the potential and force for a given position
+    !   kforce - The umbrella integration force constant
+    !   xi_range - The maximum allowed distance of xi from xi_current, or 0 for no limit
+    !   save_trajectory - 1 to record the trajectory (see record_frame()), 0 otherwise
+    !   xi_hist_min - The lower bound of the histogram
+    !   xi_hist_width - The width of each histogram bin
+    !   hist - The histogram of each segment to add the samples to
+    !   nbins - The number of histogram bins
+    !   q_checkpoint - The last checkpointed position of each bead in each atom
+    !   checkpoint_steps - The number of time steps between checkpoints
+    !   step0 - The number of time steps already taken in this trajectory
+    !   block_steps - The number of time steps in each segment
+    !   block_av - The sum of the reaction coordinate over the samples in each segment
+    !   block_av2 - The sum of the square of the reaction coordinate over the samples in each segment
+    !   block_count - The number of samples in each segment
+    !   nblocks - The number of segments
+    ! Returns:
+    !   actual_steps - The number of time steps actually taken
+    !   result - 0 if the trajectory evolution was successful, nonzero if unsuccessful
+    subroutine umbrella_trajectory(context, t, p, q, Natoms, Nbeads, steps, &
+        xi_current, potential, kforce, xi_range, save_trajectory, &
+        xi_hist_min, xi_hist_width, hist, nbins, q_checkpoint, &
+        checkpoint_steps, step0, block_steps, block_av, block_av2, &
+        block_count, nblocks, actual_steps, result)
 
         use transition_state, only: check_for_valid_position, check_values
 
         implicit none
         external potential
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(inout) :: t, p(3,Natoms,Nbeads), q(3,Natoms,Nbeads)
         double precision, intent(in) :: xi_current, kforce, xi_range
         integer, intent(in) :: steps
         integer, intent(in) :: save_trajectory
-        double precision, intent(out) :: av, av2
+        integer, intent(in) :: nbins, nblocks
+        double precision, intent(in) :: xi_hist_min, xi_hist_width
+        double precision, intent(inout) :: hist(8,nbins,nblocks)
+        double precision, intent(inout) :: q_checkpoint(3,Natoms,Nbeads)
+        integer, intent(in) :: checkpoint_steps, step0, block_steps
+        double precision, intent(inout) :: block_av(nblocks), block_av2(nblocks), block_count(nblocks)
         integer, intent(out) :: actual_steps, result
 
         double precision :: V(Nbeads), dVdq(3,Natoms,Nbeads)
         double precision :: xi, dxi(3,Natoms), d2xi(3,Natoms,3,Natoms)
-        double precision :: centroid(3,Natoms)
-        integer :: step, andersen_sampling_steps
+        double precision :: centroid(3,Natoms), U, S, H
+        integer :: step, andersen_sampling_steps, bin, block, Ns
+        integer(8) :: clock
 
         result = 0
         actual_steps = 0
 
-        av = 0.0d0
-        av2 = 0.0d0
-
         ! Set up Andersen thermostat (if turned on)
-        andersen_sampling_steps = int(andersen_sampling_time / dt)
-        if (thermostat .eq. 1) then
-            if (andersen_sampling_time .gt. 0) then
-                andersen_sampling_steps = floor(andersen_sampling_time / dt)
+        andersen_sampling_steps = int(andersen_sampling_time(context) / dt(context))
+        if (thermostat(context) .eq. 1) then
+            if (andersen_sampling_time(context) .gt. 0) then
+                andersen_sampling_steps = floor(andersen_sampling_time(context) / dt(context))
             else
                 andersen_sampling_steps = floor(dsqrt(dble(steps)))
             end if
         end if
         ! Set up GLE thermostat (if turned on)
-        if (thermostat .eq. 2) then
-            call gle_initialize(dt, Natoms, Nbeads, gle_A(1:gle_Ns+1,1:gle_Ns+1), gle_C(1:gle_Ns+1,1:gle_Ns+1), gle_Ns)
-        end if
-
-        if (save_trajectory .eq. 1) then
-            open(unit=777,file='child.xyz')
-            open(unit=888,file='child_centroid.xyz')
+        Ns = gle_Ns(context)
+        if (thermostat(context) .eq. 2) then
+            call gle_initialize(context, dt(context), Natoms, Nbeads, &
+                gle_A(1:Ns+1,1:Ns+1,context), gle_C(1:Ns+1,1:Ns+1,context), Ns)
         end if
 
         call get_centroid(q, Natoms, Nbeads, centroid)
-        call get_reaction_coordinate(centroid, Natoms, xi_current, xi, dxi, d2xi)
-        call potential(q, V, dVdq, Natoms, Nbeads, result)
+        call get_reaction_coordinate(context, centroid, Natoms, xi_current, xi, dxi, d2xi)
+        call get_potential(context, q, V, dVdq, Natoms, Nbeads, potential, result)
         if (result > 0) then
             ! The initial position is unphysical, so abort
             result = -1
             return
         end if
-        call add_umbrella_potential(xi, dxi, V, dVdq, Natoms, Nbeads, xi_current, kforce)
-        call add_bias_potential(dxi, d2xi, V, dVdq, Natoms, Nbeads)
+        call add_umbrella_potential(context, xi, dxi, V, dVdq, Natoms, Nbeads, xi_current, kforce)
+        call add_bias_potential(context, dxi, d2xi, V, dVdq, Natoms, Nbeads)
 
         ! Apply GLE thermostat if turned on
-        if (thermostat .eq. 2) then
-            call gle_thermostat(p, mass, beta, dxi, Natoms, Nbeads, gle_Ns, 0, result)
+        if (thermostat(context) .eq. 2) then
+            call gle_thermostat(context, p, mass(1:Natoms,context), beta(context), dxi, Natoms, Nbeads, Ns, 0, result)
             if (result .ne. 0) return
         end if
 
         do step = 1, steps
 
-            call verlet_step(t, p, q, V, dVdq, xi, dxi, d2xi, Natoms, Nbeads, &
+            call verlet_step(context, t, p, q, V, dVdq, xi, dxi, d2xi, Natoms, Nbeads, &
                 xi_current, potential, kforce, 0, result)
             if (xi_range .ne. 0.0d0 .and. abs(xi - xi_current) > xi_range) then
-                actual_steps = step - 1
-                exit
-            end if
-            if (result .ne. 0) then
-                actual_steps = step - 1
+                result = 1
                 exit
             end if
+            if (result .ne. 0) exit
 
             ! Check that the values of the forming and breaking bonds are reasonable
+            call profile_start(context, clock)
             call get_centroid(q, Natoms, Nbeads, centroid)
-            call check_for_valid_position(centroid, Natoms, 200.0d0, result)
-            call check_values(centroid, Natoms, result)
+            call check_for_valid_position(context, centroid, Natoms, 200.0d0, result)
+            call check_values(context, centroid, Natoms, result)
+            call profile_stop(context, PROFILE_CHECKS, clock)
             if (result .ne. 0) then
                 write (*,fmt='(A)') &
-                    'Error: Invalid geometry for umbrella sampling trajectory. Restarting trajectory.'
-                actual_steps = step - 1
+                    'Error: Invalid geometry for umbrella sampling trajectory. Rolling back to last checkpoint.'
                 exit
             end if
 
-            if (save_trajectory .eq. 1) call update_vmd_output(q, Natoms, Nbeads, 777, 888)
-
-            av = av + xi
-            av2 = av2 + xi * xi
+            if (save_trajectory .eq. 1) call record_frame(context, q, Natoms, Nbeads, step)
+            if (monitoring(context) .eq. 1) call monitor_step(context, p, q, V, Natoms, Nbeads, H)
+
+            block = min(nblocks, (step0 + step - 1) / block_steps + 1)
+            block_av(block) = block_av(block) + xi
+            block_av2(block) = block_av2(block) + xi * xi
+            block_count(block) = block_count(block) + 1.0d0
+            actual_steps = step
+
+            call profile_start(context, clock)
+            call get_reweighting_energies(context, q, V, dxi, Natoms, Nbeads, U, S)
+            bin = floor((xi - xi_hist_min) / xi_hist_width) + 1
+            bin = max(1, min(nbins, bin))
+            hist(1,bin,block) = hist(1,bin,block) + 1.0d0
+            hist(2,bin,block) = hist(2,bin,block) + xi
+            hist(3,bin,block) = hist(3,bin,block) + xi * xi
+            hist(4,bin,block) = hist(4,bin,block) + U
+            hist(5,bin,block) = hist(5,bin,block) + S
+            hist(6,bin,block) = hist(6,bin,block) + U * U
+            hist(7,bin,block) = hist(7,bin,block) + S * S
+            hist(8,bin,block) = hist(8,bin,block) + U * S
+            call profile_stop(context, PROFILE_REWEIGHTING, clock)
 
             ! Apply Andersen thermostat (if turned on)
-            if (thermostat .eq. 1) then
-                if (mod(step, andersen_sampling_steps) .eq. 0) call sample_momentum(p, mass, beta, Natoms, Nbeads)
+            call profile_start(context, clock)
+            if (thermostat(context) .eq. 1) then
+                if (mod(step, andersen_sampling_steps) .eq. 0) &
+                    call sample_momentum(p, mass(1:Natoms,context), beta(context), Natoms, Nbeads)
             end if
             ! Apply GLE thermostat if turned on
-            if (thermostat .eq. 2) then
-                call gle_thermostat(p, mass, beta, dxi, Natoms, Nbeads, gle_Ns, 0, result)
-                if (result .ne. 0) return
+            if (thermostat(context) .eq. 2) then
+                call gle_thermostat(context, p, mass(1:Natoms,context), beta(context), dxi, Natoms, Nbeads, Ns, 0, result)
             end if
+            call profile_stop(context, PROFILE_THERMOSTAT, clock)
+            if (result .ne. 0) exit
 
-        end do
+            if (mod(step, checkpoint_steps) .eq. 0) then
+                if (xi_range .eq. 0.0d0 .or. abs(xi - xi_current) <= 0.5d0 * xi_range) q_checkpoint = q
+            end if
 
-        actual_steps = steps
+        end do
 
         ! Clean up GLE thermostat (if turned on)
-        if (thermostat .eq. 2) then
-            call gle_cleanup()
-        end if
-
-        if (save_trajectory .eq. 1) then
-            close(unit=777)
-            close(unit=888)
+        if (thermostat(context) .eq. 2) then
+            call gle_cleanup(context)
         end if
 
     end subroutine umbrella_trajectory
 
+    ! Set the compiled potential used by the routines below in the given
+    ! context.
+    ! Parameters:
+    !   context - The index of the context to simulate
+    !   potential - A compiled function that evaluates the potential and force for a given position
+    subroutine set_potential(context, potential)
+
+        implicit none
+        integer, intent(in) :: context
+        procedure(potential_function) :: potential
+
+        buffers(context)%potential => potential
+
+    end subroutine set_potential
+
+    ! The following routines are identical to equilibrate(),
+    ! recrossing_trajectory() and umbrella_trajectory(), except that they use
+    ! the compiled potential set by set_potential() for the given context
+    ! instead of taking the potential as an argument. They are called from
+    ! Python without holding the global interpreter lock, so that trajectories
+    ! in different contexts can run concurrently in threads; the f2py wrapper
+    ! of a potential argument is not safe to use from several threads at once.
+
+    subroutine equilibrate_nogil(context, t, p, q, Natoms, Nbeads, steps, &
+        xi_current, kforce, constrain, save_trajectory, result)
+
+        implicit none
+        integer, intent(in) :: context
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(inout) :: t, p(3,Natoms,Nbeads), q(3,Natoms,Nbeads)
+        integer, intent(in) :: steps
+        double precision, intent(in) :: xi_current, kforce
+        integer, intent(in) :: constrain, save_trajectory
+        integer, intent(out) :: result
+
+        call equilibrate(context, t, p, q, Natoms, Nbeads, steps, &
+            xi_current, buffers(context)%potential, kforce, constrain, save_trajectory, result)
+
+    end subroutine equilibrate_nogil
+
+    subroutine recrossing_trajectory_nogil(context, t, p, q, Natoms, Nbeads, steps, &
+        xi_current, save_trajectory, kappa_num, kappa_denom, &
+        xi_commit, commit_steps, actual_steps, result)
+
+        implicit none
+        integer, intent(in) :: context
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(inout) :: t, p(3,Natoms,Nbeads), q(3,Natoms,Nbeads)
+        integer, intent(in) :: steps
+        double precision, intent(in) :: xi_current
+        double precision, intent(inout) :: kappa_num(steps), kappa_denom
+        integer, intent(in) :: save_trajectory
+        double precision, intent(in) :: xi_commit
+        integer, intent(in) :: commit_steps
+        integer, intent(out) :: actual_steps, result
+
+        call recrossing_trajectory(context, t, p, q, Natoms, Nbeads, steps, &
+            xi_current, buffers(context)%potential, save_trajectory, kappa_num, kappa_denom, &
+            xi_commit, commit_steps, actual_steps, result)
+
+    end subroutine recrossing_trajectory_nogil
+
+    subroutine umbrella_trajectory_nogil(context, t, p, q, Natoms, Nbeads, steps, &
+        xi_current, kforce, xi_range, save_trajectory, &
+        xi_hist_min, xi_hist_width, hist, nbins, q_checkpoint, &
+        checkpoint_steps, step0, block_steps, block_av, block_av2, &
+        block_count, nblocks, actual_steps, result)
+
+        implicit none
+        integer, intent(in) :: context
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(inout) :: t, p(3,Natoms,Nbeads), q(3,Natoms,Nbeads)
+        double precision, intent(in) :: xi_current, kforce, xi_range
+        integer, intent(in) :: steps
+        integer, intent(in) :: save_trajectory
+        integer, intent(in) :: nbins, nblocks
+        double precision, intent(in) :: xi_hist_min, xi_hist_width
+        double precision, intent(inout) :: hist(8,nbins,nblocks)
+        double precision, intent(inout) :: q_checkpoint(3,Natoms,Nbeads)
+        integer, intent(in) :: checkpoint_steps, step0, block_steps
+        double precision, intent(inout) :: block_av(nblocks), block_av2(nblocks), block_count(nblocks)
+        integer, intent(out) :: actual_steps, result
+
+        call umbrella_trajectory(context, t, p, q, Natoms, Nbeads, steps, &
+            xi_current, buffers(context)%potential, kforce, xi_range, save_trajectory, &
+            xi_hist_min, xi_hist_width, hist, nbins, q_checkpoint, &
+            checkpoint_steps, step0, block_steps, block_av, block_av2, &
+            block_count, nblocks, actual_steps, result)
+
+    end subroutine umbrella_trajectory_nogil
+
     ! Advance the simluation by one time step using the velocity Verlet
     ! algorithm.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   t - The current simulation time
     !   p - The momentum of each bead in each atom
     !   q - The position of each bead in each atom
@@ -387,11 +676,12 @@ contains
     !   dxi - The updated gradient of the reaction coordinate
     !   d2xi - The updated Hessian of the reaction coordinate
     !   result - A flag that indicates if the time step completed successfully (if zero) or that an error occurred (if nonzero)
-    subroutine verlet_step(t, p, q, V, dVdq, xi, dxi, d2xi, Natoms, Nbeads, &
+    subroutine verlet_step(context, t, p, q, V, dVdq, xi, dxi, d2xi, Natoms, Nbeads, &
         xi_current, potential, kforce, constrain, result)
 
         implicit none
         external potential, reactants_surface, transition_state_surface
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(inout) :: t, p(3,Natoms,Nbeads), q(3,Natoms,Nbeads)
         double precision, intent(inout) :: V(Nbeads), dVdq(3,Natoms,Nbeads)
@@ -402,11 +692,12 @@ contains
 
         double precision :: centroid(3,Natoms)
         integer :: i, j
+        integer(8) :: clock
 
         result = 0
 
         ! Update momentum (half time step)
-        p = p - 0.5d0 * dt * dVdq
+        call update_momentum(context, p, dVdq, Natoms, Nbeads)
 
         ! Update position (full time step)
         if (Nbeads .eq. 1) then
@@ -415,50 +706,135 @@ contains
             ! classical trajectories
             do i = 1, 3
                 do j = 1, Natoms
-                    q(i,j,1) = q(i,j,1) + p(i,j,1) * dt / mass(j)
+                    q(i,j,1) = q(i,j,1) + p(i,j,1) * dt(context) / mass(j,context)
                 end do
             end do
         else
             ! For multiple beads, we update the positions and momenta for the
             ! harmonic free ring term in the Hamiltonian by transforming to
             ! and from normal mode space
-            call free_ring_polymer_step(p, q, Natoms, Nbeads)
+            call profile_start(context, clock)
+            call free_ring_polymer_step(context, p, q, Natoms, Nbeads)
+            call profile_stop(context, PROFILE_FREE_RING, clock)
         end if
 
         ! If constrain is on, the evolution will be constrained to the
         ! transition state dividing surface
-        if (constrain .eq. 1) call constrain_to_dividing_surface(p, q, dxi, Natoms, Nbeads, xi_current, result)
+        if (constrain .eq. 1) then
+            call profile_start(context, clock)
+            call constrain_to_dividing_surface(context, p, q, dxi, Natoms, Nbeads, xi_current, result)
+            call profile_stop(context, PROFILE_CONSTRAINT, clock)
+        end if
         if (result .ne. 0) return
 
         ! Update reaction coordinate value, gradient, and Hessian
+        call profile_start(context, clock)
         call get_centroid(q, Natoms, Nbeads, centroid)
-        call get_reaction_coordinate(centroid, Natoms, xi_current, xi, dxi, d2xi)
+        call get_reaction_coordinate(context, centroid, Natoms, xi_current, xi, dxi, d2xi)
+        call profile_stop(context, PROFILE_REACTION_COORDINATE, clock)
 
         ! Update potential and forces using new position
-        call potential(q, V, dVdq, Natoms, Nbeads, result)
+        call profile_start(context, clock)
+        call get_potential(context, q, V, dVdq, Natoms, Nbeads, potential, result)
+        call profile_stop(context, PROFILE_POTENTIAL, clock)
         if (result > 0) return
-        if (mode .eq. 1) then
-            call add_umbrella_potential(xi, dxi, V, dVdq, Natoms, Nbeads, xi_current, kforce)
-            call add_bias_potential(dxi, d2xi, V, dVdq, Natoms, Nbeads)
+        if (mode(context) .eq. 1) then
+            call profile_start(context, clock)
+            call add_umbrella_potential(context, xi, dxi, V, dVdq, Natoms, Nbeads, xi_current, kforce)
+            call add_bias_potential(context, dxi, d2xi, V, dVdq, Natoms, Nbeads)
+            call profile_stop(context, PROFILE_BIAS, clock)
         end if
 
         ! Update momentum (half time step)
-        p = p - 0.5d0 * dt * dVdq
+        call update_momentum(context, p, dVdq, Natoms, Nbeads)
 
         ! Constrain momentum again
-        if (constrain .eq. 1) call constrain_momentum_to_dividing_surface(p, dxi, Natoms, Nbeads)
+        if (constrain .eq. 1) then
+            call profile_start(context, clock)
+            call constrain_momentum_to_dividing_surface(context, p, dxi, Natoms, Nbeads)
+            call profile_stop(context, PROFILE_CONSTRAINT, clock)
+        end if
 
         ! Update time
-        t = t + dt
+        t = t + dt(context)
 
     end subroutine verlet_step
 
+    ! Evaluate the potential and forces of each bead. If thread_potential is
+    ! 1, the potential is evaluated for each bead separately, on threads
+    ! threads.
+    ! Parameters:
+    !   context - The index of the context to simulate
+    !   q - The position of each bead in each atom
+    !   Natoms - The number of atoms in the molecular system
+    !   Nbeads - The number of beads to use per atom
+    !   potential - A function that evaluates the potential and force for a given position
+    ! Returns:
+    !   V - The potential of each bead
+    !   dVdq - The force exerted on each bead in each atom
+    !   result - The largest status returned by the potential; nonzero if unsuccessful
+    subroutine get_potential(context, q, V, dVdq, Natoms, Nbeads, potential, result)
+
+        implicit none
+        external potential
+        integer, intent(in) :: context
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(in) :: q(3,Natoms,Nbeads)
+        double precision, intent(out) :: V(Nbeads), dVdq(3,Natoms,Nbeads)
+        integer, intent(out) :: result
+
+        integer :: k, info
+
+        if (thread_potential(context) .ne. 1 .or. threads(context) .le. 1) then
+            call potential(q, V, dVdq, Natoms, Nbeads, result)
+            return
+        end if
+
+        result = 0
+        !$omp parallel do num_threads(threads(context)) private(info) reduction(max:result)
+        do k = 1, Nbeads
+            call potential(q(:,:,k), V(k), dVdq(:,:,k), Natoms, 1, info)
+            result = max(result, info)
+        end do
+        !$omp end parallel do
+
+    end subroutine get_potential
+
+    ! Update the momentum of each bead in each atom by half a time step using
+    ! the forces on the beads.
+    ! Parameters:
+    !   context - The index of the context to simulate
+    !   p - The momentum of each bead in each atom
+    !   dVdq - The force exerted on each bead in each atom
+    !   Natoms - The number of atoms in the molecular system
+    !   Nbeads - The number of beads to use per atom
+    ! Returns:
+    !   p - The updated momentum of each bead in each atom
+    subroutine update_momentum(context, p, dVdq, Natoms, Nbeads)
+
+        implicit none
+        integer, intent(in) :: context
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(inout) :: p(3,Natoms,Nbeads)
+        double precision, intent(in) :: dVdq(3,Natoms,Nbeads)
+
+        integer :: k
+
+        !$omp parallel do num_threads(threads(context)) if(threads(context) .gt. 1)
+        do k = 1, Nbeads
+            p(:,:,k) = p(:,:,k) - 0.5d0 * dt(context) * dVdq(:,:,k)
+        end do
+        !$omp end parallel do
+
+    end subroutine update_momentum
+
     ! Update the positions and momenta of each atom in each free ring polymer
     ! bead for the term in the Hamiltonian describing the harmonic free ring
     ! polymer interactions. This is most efficiently done in normal mode space;
     ! this function therefore uses fast Fourier transforms (from the FFTW3
     ! library) to transform to and from normal mode space.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   p - The momentum of each bead in each atom
     !   q - The position of each bead in each atom
     !   Natoms - The number of atoms in the molecular system
@@ -466,39 +842,50 @@ contains
     ! Returns:
     !   p - The updated momentum of each bead in each atom
     !   q - The updated position of each bead in each atom
-    subroutine free_ring_polymer_step(p, q, Natoms, Nbeads)
+    subroutine free_ring_polymer_step(context, p, q, Natoms, Nbeads)
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(inout) :: p(3,Natoms,Nbeads), q(3,Natoms,Nbeads)
 
         double precision :: poly(4,Nbeads)
         double precision :: beta_n, twown, pi_n, wk, wt, wm, cos_wt, sin_wt, p_new
         integer :: i, j, k
+        integer*8 :: plan, iplan
+
+        ! Create the FFTW plans before the threads need them
+        call fft_plans(Nbeads, plan, iplan)
+
+        !$omp parallel num_threads(threads(context)) if(threads(context) .gt. 1) &
+        !$omp private(i, j, k, poly, beta_n, twown, pi_n, wk, wt, wm, cos_wt, sin_wt, p_new)
 
         ! Transform to normal mode space
+        !$omp do collapse(2)
         do i = 1, 3
             do j = 1, Natoms
-                call rfft(p(i,j,:), Nbeads)
-                call rfft(q(i,j,:), Nbeads)
+                call fft_execute(plan, p(i,j,:), Nbeads)
+                call fft_execute(plan, q(i,j,:), Nbeads)
             end do
         end do
+        !$omp end do
 
+        !$omp do
         do j = 1, Natoms
 
             poly(1,1) = 1.0d0
             poly(2,1) = 0.0d0
-            poly(3,1) = dt / mass(j)
+            poly(3,1) = dt(context) / mass(j,context)
             poly(4,1) = 1.0d0
 
             if (Nbeads .gt. 1) then
-                beta_n = beta / Nbeads
+                beta_n = beta(context) / Nbeads
                 twown = 2.0d0 / beta_n
                 pi_n = pi / Nbeads
                 do k = 1, Nbeads / 2
                     wk = twown * dsin(k * pi_n)
-                    wt = wk * dt
-                    wm = wk * mass(j)
+                    wt = wk * dt(context)
+                    wm = wk * mass(j,context)
                     cos_wt = dcos(wt)
                     sin_wt = dsin(wt)
                     poly(1,k+1) = cos_wt
@@ -523,20 +910,26 @@ contains
             end do
 
         end do
+        !$omp end do
 
         ! Transform back to Cartesian space
+        !$omp do collapse(2)
         do i = 1, 3
             do j = 1, Natoms
-                call irfft(p(i,j,:), Nbeads)
-                call irfft(q(i,j,:), Nbeads)
+                call fft_execute(iplan, p(i,j,:), Nbeads)
+                call fft_execute(iplan, q(i,j,:), Nbeads)
             end do
         end do
+        !$omp end do
+
+        !$omp end parallel
 
     end subroutine free_ring_polymer_step
 
     ! Constrain the position and the momentum to the dividing surface, using the
     ! SHAKE/RATTLE algorithm.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   p - The momentum of each bead in each atom
     !   q - The position of each bead in each atom
     !   dxi - The gradient of the reaction coordinate
@@ -546,9 +939,10 @@ contains
     !   p - The constrained momentum of each bead in each atom
     !   q - The constrained position of each bead in each atom
     !   info - 0 if the constraining was successful, 1 if unsuccessful
-    subroutine constrain_to_dividing_surface(p, q, dxi, Natoms, Nbeads, xi_current, info)
+    subroutine constrain_to_dividing_surface(context, p, q, dxi, Natoms, Nbeads, xi_current, info)
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(inout) :: p(3,Natoms,Nbeads), q(3,Natoms,Nbeads)
         double precision, intent(inout) :: dxi(3,Natoms)
@@ -572,21 +966,21 @@ contains
         maxiter = 100
         do iter = 1, maxiter
 
-            coeff = mult * dt * dt / Nbeads
+            coeff = mult * dt(context) * dt(context) / Nbeads
 
             do i = 1, 3
                 do j = 1, Natoms
-                    qctemp(i,j) = centroid(i,j) + coeff * dxi(i,j) / mass(j)
+                    qctemp(i,j) = centroid(i,j) + coeff * dxi(i,j) / mass(j,context)
                 end do
             end do
 
-            call get_reaction_coordinate(qctemp, Natoms, xi_current, xi_new, dxi_new, d2xi_new)
+            call get_reaction_coordinate(context, qctemp, Natoms, xi_current, xi_new, dxi_new, d2xi_new)
 
             sigma = xi_new
             dsigma = 0.0d0
             do i = 1, 3
                 do j = 1, Natoms
-                    dsigma = dsigma + dxi_new(i,j) * dt * dt * dxi(i,j) / (mass(j) * Nbeads)
+                    dsigma = dsigma + dxi_new(i,j) * dt(context) * dt(context) * dxi(i,j) / (mass(j,context) * Nbeads)
                 end do
             end do
 
@@ -606,8 +1000,8 @@ contains
         do i = 1, 3
             do j = 1, Natoms
                 do k = 1, Nbeads
-                    q(i,j,k) = q(i,j,k) + coeff / mass(j) * dxi(i,j)
-                    p(i,j,k) = p(i,j,k) + mult * dt / Nbeads * dxi(i,j)
+                    q(i,j,k) = q(i,j,k) + coeff / mass(j,context) * dxi(i,j)
+                    p(i,j,k) = p(i,j,k) + mult * dt(context) / Nbeads * dxi(i,j)
                 end do
             end do
         end do
@@ -617,15 +1011,17 @@ contains
     ! Constrain the momentum to the reaction coordinate, to ensure that the time
     ! derivative of the dividing surface is zero.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   p - The momentum of each bead in each atom
     !   dxi - The gradient of the reaction coordinate
     !   Natoms - The number of atoms in the molecular system
     !   Nbeads - The number of beads to use per atom
     ! Returns:
     !   p - The constrained momentum of each bead in each atom
-    subroutine constrain_momentum_to_dividing_surface(p, dxi, Natoms, Nbeads)
+    subroutine constrain_momentum_to_dividing_surface(context, p, dxi, Natoms, Nbeads)
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(in) :: dxi(3,Natoms)
         double precision, intent(inout) :: p(3,Natoms,Nbeads)
@@ -637,7 +1033,7 @@ contains
         do i = 1, 3
             do j = 1, Natoms
                 do k = 1, Nbeads
-                    coeff1 = coeff1 + dxi(i,j) * p(i,j,k) / mass(j)
+                    coeff1 = coeff1 + dxi(i,j) * p(i,j,k) / mass(j,context)
                 end do
             end do
         end do
@@ -645,7 +1041,7 @@ contains
         coeff2 = 0.0d0
         do i = 1, 3
             do j = 1, Natoms
-                coeff2 = coeff2 + dxi(i,j) * dxi(i,j) / mass(j)
+                coeff2 = coeff2 + dxi(i,j) * dxi(i,j) / mass(j,context)
             end do
         end do
 
@@ -664,7 +1060,7 @@ contains
         !do i = 1, 3
         !    do j = 1, Natoms
         !        do k = 1, Nbeads
-        !            coeff1 = coeff1 + dxi(i,j) * p(i,j,k) / mass(j)
+        !            coeff1 = coeff1 + dxi(i,j) * p(i,j,k) / mass(j,context)
         !        end do
         !    end do
         !end do
@@ -674,6 +1070,7 @@ contains
     ! Add an umbrella potential and the corresponding forces to the overall
     ! potential and forces of the RPMD system.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   xi - The value of the reaction coordinate
     !   dxi - The gradient of the reaction coordinate
     !   V - The potential of each bead
@@ -685,9 +1082,10 @@ contains
     ! Returns:
     !   V - The updated potential of each bead
     !   dVdq - The updated force exerted on each bead in each atom
-    subroutine add_umbrella_potential(xi, dxi, V, dVdq, Natoms, Nbeads, xi_current, kforce)
+    subroutine add_umbrella_potential(context, xi, dxi, V, dVdq, Natoms, Nbeads, xi_current, kforce)
 
         implicit none
+        integer, intent(in) :: context
         external potential
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(in) :: xi, dxi(3,Natoms)
@@ -705,19 +1103,22 @@ contains
         end do
 
         ! Add umbrella force
-        do i = 1, 3
+        !$omp parallel do num_threads(threads(context)) if(threads(context) .gt. 1) private(i, j)
+        do k = 1, Nbeads
             do j = 1, Natoms
-                do k = 1, Nbeads
+                do i = 1, 3
                     dVdq(i,j,k) = dVdq(i,j,k) + kforce * delta * dxi(i,j)
                 end do
             end do
         end do
+        !$omp end parallel do
 
     end subroutine add_umbrella_potential
 
     ! Add a bias potential and the corresponding forces to the overall
     ! potential and forces of the RPMD system.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   dxi - The gradient of the reaction coordinate
     !   d2xi - The Hessian of the reaction coordinate
     !   V - The potential of each bead
@@ -727,27 +1128,28 @@ contains
     ! Returns:
     !   V - The updated potential of each bead
     !   dVdq - The updated force exerted on each bead in each atom
-    subroutine add_bias_potential(dxi, d2xi, V, dVdq, Natoms, Nbeads)
+    subroutine add_bias_potential(context, dxi, d2xi, V, dVdq, Natoms, Nbeads)
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(in) :: dxi(3,Natoms), d2xi(3,Natoms,3,Natoms)
         double precision, intent(inout) :: V(Nbeads), dVdq(3,Natoms,Nbeads)
 
-        double precision :: fs, fs2, log_fs, coeff1, coeff2, dhams
+        double precision :: fs, fs2, log_fs, coeff1, coeff2, dhams(3,Natoms)
         integer :: i, j, k, i2, j2
 
         fs2 = 0.0d0
         do i = 1, 3
             do j = 1, Natoms
-                fs2 = fs2 + dxi(i,j) * dxi(i,j) / mass(j)
+                fs2 = fs2 + dxi(i,j) * dxi(i,j) / mass(j,context)
             end do
         end do
-        coeff1 = 2.0d0 * pi * beta
+        coeff1 = 2.0d0 * pi * beta(context)
         fs2 = fs2 / coeff1
         fs = sqrt(fs2)
         log_fs = log(fs)
-        coeff2 = -1.0d0 / beta
+        coeff2 = -1.0d0 / beta(context)
 
         ! Add bias term to potential
         do k = 1, Nbeads
@@ -755,32 +1157,92 @@ contains
         end do
 
         ! Add bias term to forces
-        do i = 1, 3
-            do j = 1, Natoms
-                dhams = 0.0d0
-                do i2 = 1, 3
-                    do j2 = 1, Natoms
-                        dhams = dhams + d2xi(i2,j2,i,j) * dxi(i2,j2) / mass(j2)
+        !$omp parallel num_threads(threads(context)) if(threads(context) .gt. 1) private(i, j, k, i2, j2)
+        !$omp do collapse(2)
+        do j = 1, Natoms
+            do i = 1, 3
+                dhams(i,j) = 0.0d0
+                do j2 = 1, Natoms
+                    do i2 = 1, 3
+                        dhams(i,j) = dhams(i,j) + d2xi(i2,j2,i,j) * dxi(i2,j2) / mass(j2,context)
                     end do
                 end do
-                dhams = dhams * coeff2 / (coeff1 * fs2)
-                do k = 1, Nbeads
-                    dVdq(i,j,k) = dVdq(i,j,k) + dhams
+                dhams(i,j) = dhams(i,j) * coeff2 / (coeff1 * fs2)
+            end do
+        end do
+        !$omp end do
+        !$omp do
+        do k = 1, Nbeads
+            do j = 1, Natoms
+                do i = 1, 3
+                    dVdq(i,j,k) = dVdq(i,j,k) + dhams(i,j)
                 end do
             end do
         end do
+        !$omp end do
+        !$omp end parallel
 
     end subroutine add_bias_potential
 
+    ! Compute the energies needed to reweight a sample of the ring polymer
+    ! distribution to a different temperature. The ring polymer distribution
+    ! at reciprocal temperature beta is proportional to
+    ! exp(-beta * U - Nbeads * S / beta), apart from the bias potential, which
+    ! only contributes a constant factor.
+    ! Parameters:
+    !   context - The index of the context to simulate
+    !   q - The position of each bead in each atom
+    !   V - The potential of each bead, including the umbrella and bias potentials
+    !   dxi - The gradient of the reaction coordinate
+    !   Natoms - The number of atoms in the molecular system
+    !   Nbeads - The number of beads to use per atom
+    ! Returns:
+    !   U - The potential averaged over the beads, excluding the bias potential
+    !   S - The ring polymer spring energy, excluding its dependence on beta
+    subroutine get_reweighting_energies(context, q, V, dxi, Natoms, Nbeads, U, S)
+
+        implicit none
+        integer, intent(in) :: context
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(in) :: q(3,Natoms,Nbeads), V(Nbeads), dxi(3,Natoms)
+        double precision, intent(out) :: U, S
+
+        double precision :: fs2, dq
+        integer :: i, j, k, k2
+
+        ! Remove the bias potential, which is the same for each bead
+        fs2 = 0.0d0
+        do i = 1, 3
+            do j = 1, Natoms
+                fs2 = fs2 + dxi(i,j) * dxi(i,j) / mass(j,context)
+            end do
+        end do
+        fs2 = fs2 / (2.0d0 * pi * beta(context))
+        U = sum(V) / Nbeads + 0.5d0 * log(fs2) / beta(context)
+
+        S = 0.0d0
+        do k = 1, Nbeads
+            k2 = mod(k, Nbeads) + 1
+            do j = 1, Natoms
+                do i = 1, 3
+                    dq = q(i,j,k) - q(i,j,k2)
+                    S = S + 0.5d0 * mass(j,context) * dq * dq
+                end do
+            end do
+        end do
+
+    end subroutine get_reweighting_energies
+
     ! Compute the value, gradient, and Hessian of the reaction coordinate.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   centroid - The centroid of each atom
     !   Natoms - The number of atoms in the molecular system
     ! Returns:
     !   xi - The value of the reaction coordinate
     !   dxi - The gradient of the reaction coordinate
     !   d2xi - The Hessian of the reaction coordinate
-    subroutine get_reaction_coordinate(centroid, Natoms, xi_current, xi, dxi, d2xi)
+    subroutine get_reaction_coordinate(context, centroid, Natoms, xi_current, xi, dxi, d2xi)
 
         use reactants, only: reactants_value => value, &
             reactants_gradient => gradient, &
@@ -790,6 +1252,7 @@ contains
             transition_state_hessian => hessian
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms
         double precision, intent(in) :: centroid(3,Natoms)
         double precision, intent(in) :: xi_current
@@ -804,19 +1267,19 @@ contains
         d2xi(:,:,:,:) = 0.0d0
 
         ! Evaluate reactants dividing surface value, gradient, and Hessian
-        call reactants_value(centroid, Natoms, s0)
-        call reactants_gradient(centroid, Natoms, ds0)
-        call reactants_hessian(centroid, Natoms, d2s0)
+        call reactants_value(context, centroid, Natoms, s0)
+        call reactants_gradient(context, centroid, Natoms, ds0)
+        call reactants_hessian(context, centroid, Natoms, d2s0)
 
         ! Evaluate transition state dividing surface value, gradient, and Hessian
-        call transition_state_value(centroid, Natoms, s1)
-        call transition_state_gradient(centroid, Natoms, ds1)
-        call transition_state_hessian(centroid, Natoms, d2s1)
+        call transition_state_value(context, centroid, Natoms, s1)
+        call transition_state_gradient(context, centroid, Natoms, ds1)
+        call transition_state_hessian(context, centroid, Natoms, d2s1)
 
         ! Compute reaction coordinate value, gradient, and Hessian
         ! The functional form is different depending on the type of RPMD
         ! calculation we are performing
-        if (mode .eq. 1) then
+        if (mode(context) .eq. 1) then
             ! Umbrella integration
             xi = s0 / (s0 - s1)
             dxi = (s0 * ds1 - s1 * ds0) / ((s0 - s1) * (s0 - s1))
@@ -833,13 +1296,13 @@ contains
                     end do
                 end do
             end do
-        elseif (mode .eq. 2) then
+        elseif (mode(context) .eq. 2) then
             ! Recrossing factor
             xi = xi_current * s1 + (1 - xi_current) * s0
             dxi = xi_current * ds1 + (1 - xi_current) * ds0
             d2xi = xi_current * d2s1 + (1 - xi_current) * d2s0
         else
-            write (*,fmt='(A,I3,A)') 'Invalid mode ', mode, ' encountered in get_reaction_coordinate().'
+            write (*,fmt='(A,I3,A)') 'Invalid mode ', mode(context), ' encountered in get_reaction_coordinate().'
             stop
         end if
 
@@ -847,14 +1310,16 @@ contains
 
     ! Return the flux used to compute the recrossing factor.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   dxi - The gradient of the reaction coordinate
     !   Natoms - The number of atoms in the molecular system
     !   Nbeads - The number of beads to use per atom
     ! Returns:
     !   fs - The flux used to compute the recrossing factor
-    subroutine get_recrossing_flux(dxi, Natoms, fs)
+    subroutine get_recrossing_flux(context, dxi, Natoms, fs)
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms
         double precision, intent(in) :: dxi(3,Natoms)
         double precision, intent(out) :: fs
@@ -864,24 +1329,26 @@ contains
         fs = 0.0d0
         do i = 1, 3
             do j = 1, Natoms
-                fs = fs + dxi(i,j) * dxi(i,j) / mass(j)
+                fs = fs + dxi(i,j) * dxi(i,j) / mass(j,context)
             end do
         end do
-        fs = sqrt(fs / (2.0d0 * pi * beta))
+        fs = sqrt(fs / (2.0d0 * pi * beta(context)))
 
     end subroutine get_recrossing_flux
 
     ! Return the velocity used to compute the recrossing factor.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   p - The momentum of each bead in each atom
     !   dxi - The gradient of the reaction coordinate
     !   Natoms - The number of atoms in the molecular system
     !   Nbeads - The number of beads to use per atom
     ! Returns:
     !   vs - The velocity used to compute the recrossing factor
-    subroutine get_recrossing_velocity(p, dxi, Natoms, Nbeads, vs)
+    subroutine get_recrossing_velocity(context, p, dxi, Natoms, Nbeads, vs)
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(in) :: p(3,Natoms,Nbeads), dxi(3,Natoms)
         double precision, intent(out) :: vs
@@ -892,7 +1359,7 @@ contains
         do i = 1, 3
             do j = 1, Natoms
                 do k = 1, Nbeads
-                    vs = vs + dxi(i,j) * p(i,j,k) / mass(j)
+                    vs = vs + dxi(i,j) * p(i,j,k) / mass(j,context)
                 end do
             end do
         end do
@@ -934,14 +1401,16 @@ contains
 
     ! Compute the total energy of all ring polymers in the RPMD system.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   q - The position of each bead in each atom
     !   Natoms - The number of atoms in the molecular system
     !   Nbeads - The number of beads to use per atom
     ! Returns:
     !   Ering - The total energy of all ring polymers
-    subroutine get_ring_polymer_energy(q, Natoms, Nbeads, Ering)
+    subroutine get_ring_polymer_energy(context, q, Natoms, Nbeads, Ering)
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(in) :: q(3,Natoms,Nbeads)
         double precision, intent(out) :: Ering
@@ -950,17 +1419,17 @@ contains
         integer :: j, k
 
         Ering = 0.0d0
-        wn = Nbeads / beta
+        wn = Nbeads / beta(context)
         do j = 1, Natoms
             dx = q(1,j,1) - q(1,j,Nbeads)
             dy = q(2,j,1) - q(2,j,Nbeads)
             dz = q(3,j,1) - q(3,j,Nbeads)
-            Ering = Ering + 0.5d0 * mass(j) * wn * wn * (dx * dx + dy * dy + dz * dz)
+            Ering = Ering + 0.5d0 * mass(j,context) * wn * wn * (dx * dx + dy * dy + dz * dz)
             do k = 2, Nbeads
                 dx = q(1,j,k-1) - q(1,j,k)
                 dy = q(2,j,k-1) - q(2,j,k)
                 dz = q(3,j,k-1) - q(3,j,k)
-                Ering = Ering + 0.5d0 * mass(j) * wn * wn * (dx * dx + dy * dy + dz * dz)
+                Ering = Ering + 0.5d0 * mass(j,context) * wn * wn * (dx * dx + dy * dy + dz * dz)
             end do
         end do
 
@@ -968,14 +1437,16 @@ contains
 
     ! Compute the total kinetic energy of the RPMD system.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   p - The momentum of each bead in each atom
     !   Natoms - The number of atoms in the molecular system
     !   Nbeads - The number of beads to use per atom
     ! Returns:
     !   Ek - The kinetic energy of the system
-    subroutine get_kinetic_energy(p, Natoms, Nbeads, Ek)
+    subroutine get_kinetic_energy(context, p, Natoms, Nbeads, Ek)
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(in) :: p(3,Natoms,Nbeads)
         double precision, intent(out) :: Ek
@@ -986,7 +1457,7 @@ contains
         do i = 1, 3
             do j = 1, Natoms
                 do k = 1, Nbeads
-                    Ek = Ek + 0.5d0 * p(i,j,k) * p(i,j,k) / mass(j)
+                    Ek = Ek + 0.5d0 * p(i,j,k) * p(i,j,k) / mass(j,context)
                 end do
             end do
         end do
@@ -995,14 +1466,16 @@ contains
 
     ! Compute the center of mass position of the RPMD system.
     ! Parameters:
+    !   context - The index of the context to simulate
     !   q - The position of each bead in each atom
     !   Natoms - The number of atoms in the molecular system
     !   Nbeads - The number of beads to use per atom
     ! Returns:
     !   cm - The center of mass of the system
-    subroutine get_center_of_mass(q, Natoms, Nbeads, cm)
+    subroutine get_center_of_mass(context, q, Natoms, Nbeads, cm)
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(in) :: q(3,Natoms,Nbeads)
         double precision, intent(out) :: cm(3)
@@ -1011,11 +1484,11 @@ contains
         integer :: i, j, k
 
         cm(:) = 0.0d0
-        total_mass = sum(mass)
+        total_mass = sum(mass(1:Natoms,context))
         do i = 1, 3
             do j = 1, Natoms
                 do k = 1, Nbeads
-                    cm(i) = cm(i) + q(i,j,k) * mass(j)
+                    cm(i) = cm(i) + q(i,j,k) * mass(j,context)
                 end do
             end do
             cm(i) = cm(i) / total_mass
@@ -1084,45 +1557,163 @@ contains
 
     end subroutine get_radius_of_gyration
 
-    ! Write the given position to a pair of VMD output files: one for all beads and
-    ! one for the centroid.
+    ! Allocate the recording buffers of a context for frames of the given
+    ! size (if they are not already large enough), and empty them.
     ! Parameters:
+    !   context - The index of the context to record
+    !   Natoms - The number of atoms in each frame
+    !   Nbeads - The number of beads in each frame (1 if only the centroids are recorded)
+    !   capacity - The number of frames to make room for
+    !   stride - The number of time steps between recorded frames
+    !   centroid - 1 to record only the centroids, 0 to record all of the beads
+    subroutine start_recording(context, Natoms, Nbeads, capacity, stride, centroid)
+
+        implicit none
+        integer, intent(in) :: context
+        integer, intent(in) :: Natoms, Nbeads, capacity, stride, centroid
+
+        if (allocated(buffers(context)%record_frames)) then
+            if (size(buffers(context)%record_frames, 2) .ne. Natoms .or. &
+                size(buffers(context)%record_frames, 3) .ne. Nbeads .or. &
+                size(buffers(context)%record_frames, 4) .lt. capacity) then
+                deallocate(buffers(context)%record_frames, buffers(context)%record_steps)
+            end if
+        end if
+        if (.not. allocated(buffers(context)%record_frames)) then
+            allocate(buffers(context)%record_frames(3,Natoms,Nbeads,capacity))
+            allocate(buffers(context)%record_steps(capacity))
+        end if
+
+        record_stride(context) = stride
+        record_centroid(context) = centroid
+        record_count(context) = 0
+
+    end subroutine start_recording
+
+    ! Return the first frames stored in the recording buffers of a context.
+    ! Parameters:
+    !   context - The index of the context to record
+    !   Natoms - The number of atoms in each frame
+    !   Nbeads - The number of beads in each frame (1 if only the centroids are recorded)
+    !   count - The number of frames to return, at most record_count
+    ! Returns:
+    !   frames - The position of each bead in each atom in each frame
+    !   steps - The number of the time step of each frame
+    subroutine get_recorded_frames(context, Natoms, Nbeads, count, frames, steps)
+
+        implicit none
+        integer, intent(in) :: context
+        integer, intent(in) :: Natoms, Nbeads, count
+        double precision, intent(out) :: frames(3,Natoms,Nbeads,count)
+        integer, intent(out) :: steps(count)
+
+        frames = buffers(context)%record_frames(:,1:Natoms,1:Nbeads,1:count)
+        steps = buffers(context)%record_steps(1:count)
+
+    end subroutine get_recorded_frames
+
+    ! Record the given position as a frame of the trajectory being saved, if
+    ! the step is a multiple of record_stride and there is room left in the
+    ! recording buffers (see start_recording()).
+    ! Parameters:
+    !   context - The index of the context to record
     !   q - The position of each bead in each atom
     !   Natoms - The number of atoms in the molecular system
     !   Nbeads - The number of beads to use per atom
-    !   beads_file_number - The output file number to save all beads to
-    !   centroid_file_number - The output file number to save the centroids to
-    subroutine update_vmd_output(q, Natoms, Nbeads, beads_file_number, centroid_file_number)
+    !   step - The number of the current time step
+    subroutine record_frame(context, q, Natoms, Nbeads, step)
 
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads
         double precision, intent(in) :: q(3,Natoms,Nbeads)
-        integer, intent(in) :: beads_file_number, centroid_file_number
-        integer :: j, k
+        integer, intent(in) :: step
 
         double precision :: centroid(3,Natoms)
+        integer :: n
 
-        call get_centroid(q, Natoms, Nbeads, centroid)
+        if (mod(step, record_stride(context)) .ne. 0) return
+        if (.not. allocated(buffers(context)%record_frames)) return
+        if (record_count(context) .ge. size(buffers(context)%record_frames, 4)) return
+        if (size(buffers(context)%record_frames, 2) .lt. Natoms) return
+        if (record_centroid(context) .ne. 1 .and. size(buffers(context)%record_frames, 3) .lt. Nbeads) return
 
-        write(beads_file_number,fmt='(I6)') Natoms * Nbeads
-        write(beads_file_number,fmt='(A)')
-        do j = 1, Natoms
-            do k = 1, Nbeads
-                write(beads_file_number,fmt='(I4,3F11.6)') j, q(1,j,k), q(2,j,k), q(3,j,k)
-            end do
-        end do
+        record_count(context) = record_count(context) + 1
+        n = record_count(context)
+        if (record_centroid(context) .eq. 1) then
+            call get_centroid(q, Natoms, Nbeads, centroid)
+            buffers(context)%record_frames(:,1:Natoms,1,n) = centroid
+        else
+            buffers(context)%record_frames(:,1:Natoms,1:Nbeads,n) = q
+        end if
+        buffers(context)%record_steps(n) = step
 
-        write(centroid_file_number,fmt='(I6)') Natoms
-        write(centroid_file_number,fmt='(A)')
-        do j = 1, Natoms
-            write(centroid_file_number,fmt='(I4,3F11.6)') j, centroid(1,j), centroid(2,j), centroid(3,j)
-        end do
+    end subroutine record_frame
+
+    ! Compute the ring polymer Hamiltonian, which is conserved by the
+    ! dynamics in the absence of a thermostat.
+    ! Parameters:
+    !   context - The index of the context to simulate
+    !   p - The momentum of each bead in each atom
+    !   q - The position of each bead in each atom
+    !   V - The potential of each bead
+    !   Natoms - The number of atoms in the molecular system
+    !   Nbeads - The number of beads to use per atom
+    ! Returns:
+    !   H - The ring polymer Hamiltonian
+    subroutine get_hamiltonian(context, p, q, V, Natoms, Nbeads, H)
+
+        implicit none
+        integer, intent(in) :: context
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(in) :: p(3,Natoms,Nbeads), q(3,Natoms,Nbeads), V(Nbeads)
+        double precision, intent(out) :: H
 
-    end subroutine
+        double precision :: Ek, Ering
 
-        ! Initialize the GLE thermostat by allocating and populating several
-    ! temporary arrays.
-    subroutine gle_initialize(dt, Natoms, Nbeads, A, C, Ns)
+        call get_kinetic_energy(context, p, Natoms, Nbeads, Ek)
+        call get_ring_polymer_energy(context, q, Natoms, Nbeads, Ering)
+        H = Ek + Ering + sum(V)
 
+    end subroutine get_hamiltonian
+
+    ! Add the kinetic temperature of the current time step to the energy
+    ! monitoring data, and return the ring polymer Hamiltonian.
+    ! Parameters:
+    !   context - The index of the context to simulate
+    !   p - The momentum of each bead in each atom
+    !   q - The position of each bead in each atom
+    !   V - The potential of each bead
+    !   Natoms - The number of atoms in the molecular system
+    !   Nbeads - The number of beads to use per atom
+    ! Returns:
+    !   H - The ring polymer Hamiltonian
+    subroutine monitor_step(context, p, q, V, Natoms, Nbeads, H)
+
+        implicit none
+        integer, intent(in) :: context
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(in) :: p(3,Natoms,Nbeads), q(3,Natoms,Nbeads), V(Nbeads)
+        double precision, intent(out) :: H
+
+        double precision :: Ek, Ering
+
+        call get_kinetic_energy(context, p, Natoms, Nbeads, Ek)
+        call get_ring_polymer_energy(context, q, Natoms, Nbeads, Ering)
+        H = Ek + Ering + sum(V)
+
+        ! The equipartition value of the kinetic energy is
+        ! 3 * Natoms * Nbeads / (2 * beta_n), where beta_n = beta / Nbeads
+        monitor_steps(context) = monitor_steps(context) + 1
+        monitor_temperature(context) = monitor_temperature(context) + 2.0d0 * beta(context) * Ek / (3 * Natoms * Nbeads * Nbeads)
+
+    end subroutine monitor_step
+
+    ! Initialize the GLE thermostat by allocating and populating several
+    ! temporary arrays in the buffers of the given context. Any arrays left
+    ! over from a trajectory that stopped without cleaning up are replaced.
+    subroutine gle_initialize(context, dt, Natoms, Nbeads, A, C, Ns)
+
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads, Ns
         double precision, intent(in) :: dt, A(Ns+1,Ns+1), C(Ns+1,Ns+1)
 
@@ -1130,16 +1721,18 @@ contains
         integer :: i, j, k, s
 
         ! Allocate arrays
-        allocate(gle_S(Ns+1,Ns+1))
-        allocate(gle_T(Ns+1,Ns+1))
-        allocate(gle_p(3,Natoms,Nbeads,Ns+1))
-        allocate(gle_np(3,Natoms,Nbeads,Ns+1))
+        if (allocated(buffers(context)%gle_S)) call gle_cleanup(context)
+        allocate(buffers(context)%gle_S(Ns+1,Ns+1))
+        allocate(buffers(context)%gle_T(Ns+1,Ns+1))
+        allocate(buffers(context)%gle_p(3,Natoms,Nbeads,Ns+1))
+        allocate(buffers(context)%gle_np(3,Natoms,Nbeads,Ns+1))
 
         ! Determine the deterministic part of the propagator
-        call matrix_exp(-dt*A, Ns+1, 15, 15, gle_T)
+        call matrix_exp(-dt*A, Ns+1, 15, 15, buffers(context)%gle_T)
 
         ! Determine the stochastic part of the propagator
-        call cholesky(C - matmul(gle_T, matmul(C, transpose(gle_T))), gle_S, Ns+1)
+        call cholesky(C - matmul(buffers(context)%gle_T, matmul(C, transpose(buffers(context)%gle_T))), &
+            buffers(context)%gle_S, Ns+1)
 
         ! Initialize the auxiliary noise vectors
         ! To stay general, we use the Cholesky decomposition of C; this allows
@@ -1153,17 +1746,19 @@ contains
                     do s = 1, Ns+1
                         call randomn(gr(s))
                     end do
-                    gle_p(i,j,k,:) = matmul(C1, gr)
+                    buffers(context)%gle_p(i,j,k,:) = matmul(C1, gr)
                 end do
             end do
         end do
 
     end subroutine gle_initialize
 
-    ! Apply the GLE thermostat to the momentum.
-    subroutine gle_thermostat(p, mass, beta, dxi, Natoms, Nbeads, Ns, constrain, result)
+    ! Apply the GLE thermostat to the momentum, using the arrays initialized
+    ! by gle_initialize() for the given context.
+    subroutine gle_thermostat(context, p, mass, beta, dxi, Natoms, Nbeads, Ns, constrain, result)
 
         implicit none
+        integer, intent(in) :: context
         integer, intent(in) :: Natoms, Nbeads, Ns
         double precision, intent(in) :: mass(Natoms), beta, dxi(3,Natoms)
         double precision, intent(inout) :: p(3,Natoms,Nbeads)
@@ -1181,17 +1776,18 @@ contains
         if (constrain .eq. 1) then
             call sample_momentum(p0, mass, beta, Natoms, Nbeads)
             p00(:,:,:) = p0(:,:,:)
-            call constrain_momentum_to_dividing_surface(p00, dxi, Natoms, Nbeads)
+            call constrain_momentum_to_dividing_surface(context, p00, dxi, Natoms, Nbeads)
             p = p + p0 - p00
         end if
 
         ! Switch to mass-scaled coordinates when storing momenta in gle_p
         do j = 1, Natoms
-            gle_p(:,j,:,1) = p(:,j,:) / dsqrt(mass(j))
+            buffers(context)%gle_p(:,j,:,1) = p(:,j,:) / dsqrt(mass(j))
         end do
 
         ! We pretend that gp is a (3*Natoms*Nbeads)x(Ns+1) matrix, which should be fine...
-        call dgemm('N','T', N, Ns+1, Ns+1, 1.0d0, gle_p, N, gle_T, Ns+1, 0.0d0, gle_np, N)
+        call dgemm('N','T', N, Ns+1, Ns+1, 1.0d0, buffers(context)%gle_p, N, buffers(context)%gle_T, Ns+1, &
+            0.0d0, buffers(context)%gle_np, N)
 
         ! Compute the random part
         do s = 1, Ns+1
@@ -1202,32 +1798,99 @@ contains
                         cgj = dsqrt(0.5d0)
                     end if
                     do j = 1, Natoms
-                        call randomn(gle_p(i,j,k,s))
-                        gle_p(i,j,k,s) = gle_p(i,j,k,s) * cgj
+                        call randomn(buffers(context)%gle_p(i,j,k,s))
+                        buffers(context)%gle_p(i,j,k,s) = buffers(context)%gle_p(i,j,k,s) * cgj
                     end do
                 end do
             end do
         end do
 
         ! Again we pretend that gp is a (3*Natoms*Nbeads)x(Ns+1) matrix, which should be fine...
-        call dgemm('N','T', N, Ns+1, Ns+1, 1.0d0, gle_p, N, gle_S, Ns+1, 1.0d0, gle_np, N)
-        gle_p = gle_np
+        call dgemm('N','T', N, Ns+1, Ns+1, 1.0d0, buffers(context)%gle_p, N, buffers(context)%gle_S, Ns+1, &
+            1.0d0, buffers(context)%gle_np, N)
+        buffers(context)%gle_p = buffers(context)%gle_np
 
         ! Switch back from mass-scaled coordinates when recovering momenta from gle_p
         do j = 1, Natoms
-            p(:,j,:) = gle_p(:,j,:,1) * dsqrt(mass(j))
+            p(:,j,:) = buffers(context)%gle_p(:,j,:,1) * dsqrt(mass(j))
         end do
 
         ! If desired, constrain the momentum to the dividing surface
-        if (constrain .eq. 1) call constrain_momentum_to_dividing_surface(p, dxi, Natoms, Nbeads)
+        if (constrain .eq. 1) call constrain_momentum_to_dividing_surface(context, p, dxi, Natoms, Nbeads)
 
     end subroutine gle_thermostat
 
-    ! Clean up the GLE thermostat by deallocating temporary arrays.
-    subroutine gle_cleanup()
+    ! Clean up the GLE thermostat by deallocating the temporary arrays of the
+    ! given context.
+    subroutine gle_cleanup(context)
 
-        deallocate(gle_S, gle_T, gle_p, gle_np)
+        integer, intent(in) :: context
+
+        deallocate(buffers(context)%gle_S, buffers(context)%gle_T, buffers(context)%gle_p, buffers(context)%gle_np)
 
     end subroutine gle_cleanup
 
+    ! Clear the accumulated kernel profiling times and call counts of the
+    ! given context.
+    subroutine reset_profile(context)
+        implicit none
+        integer, intent(in) :: context
+        profile_time(:,context) = 0.0d0
+        profile_calls(:,context) = 0
+    end subroutine reset_profile
+
+    ! Clear the accumulated energy monitoring data of the given context.
+    subroutine reset_monitor(context)
+        implicit none
+        integer, intent(in) :: context
+        monitor_steps(context) = 0
+        monitor_temperature(context) = 0.0d0
+        monitor_trajectories(context) = 0
+        monitor_drift(context) = 0.0d0
+        monitor_max_drift(context) = 0.0d0
+    end subroutine reset_monitor
+
+    ! Return whether the module was compiled with OpenMP support, i.e.
+    ! whether setting threads has any effect.
+    ! Returns:
+    !   available - 1 if OpenMP is available, 0 otherwise
+    subroutine get_openmp(available)
+        implicit none
+        integer, intent(out) :: available
+        available = 0
+        !$ available = 1
+    end subroutine get_openmp
+
+    ! Start timing a call to a kernel. This does nothing unless profiling is
+    ! turned on for the given context.
+    ! Parameters:
+    !   context - The index of the context being simulated
+    ! Returns:
+    !   clock - The system clock count at the start of the call
+    subroutine profile_start(context, clock)
+        implicit none
+        integer, intent(in) :: context
+        integer(8), intent(out) :: clock
+        clock = 0
+        if (profiling(context) .eq. 1) call system_clock(clock)
+    end subroutine profile_start
+
+    ! Stop timing a call to a kernel, adding the elapsed time to its total
+    ! for the given context. This does nothing unless profiling is turned on.
+    ! Parameters:
+    !   context - The index of the context being simulated
+    !   kernel - The index of the kernel in profile_time and profile_calls
+    !   clock - The system clock count returned by profile_start()
+    subroutine profile_stop(context, kernel, clock)
+        implicit none
+        integer, intent(in) :: context
+        integer, intent(in) :: kernel
+        integer(8), intent(in) :: clock
+        integer(8) :: now, rate
+        if (profiling(context) .ne. 1) return
+        call system_clock(now, rate)
+        profile_time(kernel,context) = profile_time(kernel,context) + dble(now - clock) / dble(rate)
+        profile_calls(kernel,context) = profile_calls(kernel,context) + 1
+    end subroutine profile_stop
+
 end module system
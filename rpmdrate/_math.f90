@@ -78,7 +78,9 @@ end subroutine random
 
 ! Compute a pseudo-random number weighted by a standard normal distribution.
 ! The Marsaglia polar method is used to convert from a uniform distribution to
-! a normal distribution.
+! a normal distribution. The spare number generated by each call of the method
+! is kept separately for each thread, so that threads drawing numbers at the
+! same time do not share it.
 ! Returns:
 !   rn - The pseudo-random number
 subroutine randomn(rn)
@@ -89,6 +91,7 @@ subroutine randomn(rn)
     double precision :: gset, u, v, S, fac
 
     save iset,gset
+    !$omp threadprivate(iset, gset)
 
     data iset/0/
 
@@ -113,6 +116,83 @@ subroutine randomn(rn)
 
 end subroutine randomn
 
+! Return the FFTW plans for the forward and inverse real fast Fourier
+! transforms of arrays of the given length. The plans for each of the last
+! MAX_PLANS lengths used are kept, and are never destroyed, so that threads
+! transforming arrays of different lengths at the same time (e.g. for systems
+! with different numbers of beads) can each keep using their own plans; since
+! FFTW can only create plans on one thread at a time, the table is only
+! accessed inside a critical section. Executing the plans is thread-safe, so
+! call this once before transforming many arrays of the same length (see
+! fft_execute()).
+! Parameters:
+!   N - The length of the arrays of data
+! Returns:
+!   plan - The plan for the forward transform
+!   iplan - The plan for the inverse transform
+subroutine fft_plans(N,plan,iplan)
+
+    implicit none
+    integer, intent(in) :: N
+    integer*8, intent(out) :: plan, iplan
+
+    integer, parameter :: Nmax = 1024, MAX_PLANS = 16
+    integer :: i, Nplans, oldest, lengths(MAX_PLANS)
+    double precision :: copy(Nmax)
+    integer*8 :: saved_plans(MAX_PLANS), saved_iplans(MAX_PLANS)
+
+    data Nplans /0/, oldest /0/
+    save copy, saved_plans, saved_iplans, lengths, Nplans, oldest
+
+    !$omp critical (fft_plans)
+    do i = 1, Nplans
+        if (lengths(i) .eq. N) exit
+    end do
+    if (i .gt. Nplans) then
+        ! There are no plans for arrays of this length yet, so we must
+        ! generate new FFTW plans for the transforms
+        if (Nplans .lt. MAX_PLANS) then
+            Nplans = Nplans + 1
+            i = Nplans
+        else
+            ! The table is full, so the oldest plans are replaced; they are
+            ! not destroyed, as another thread may still be executing them
+            oldest = mod(oldest, MAX_PLANS) + 1
+            i = oldest
+        end if
+        ! FFTW_ESTIMATE (64) + FFTW_UNALIGNED (2), so that the plans can
+        ! be executed on any array
+        call dfftw_plan_r2r_1d(saved_plans(i),N,copy,copy,0,66)
+        call dfftw_plan_r2r_1d(saved_iplans(i),N,copy,copy,1,66)
+        lengths(i) = N
+    end if
+    plan = saved_plans(i)
+    iplan = saved_iplans(i)
+    !$omp end critical (fft_plans)
+
+end subroutine fft_plans
+
+! Transform the given array of data using an FFTW plan returned by
+! fft_plans(), normalizing the result so that the forward and inverse
+! transforms are each other's inverse.
+! Parameters:
+!   plan - The plan for the forward or inverse transform
+!   x - The array of data to transform
+!   N - The length of the array of data
+! Returns:
+!   x - The transformed array of data
+subroutine fft_execute(plan,x,N)
+
+    implicit none
+    integer*8, intent(in) :: plan
+    integer, intent(in) :: N
+    double precision, intent(inout) :: x(N)
+
+    call dfftw_execute_r2r(plan,x,x)
+    x = dsqrt(1.d0/N) * x
+
+end subroutine fft_execute
+
 ! Compute the real fast Fourier transform of the given array of data.
 ! Parameters:
 !   x - The array of data to transform
@@ -125,24 +205,10 @@ subroutine rfft(x,N)
     integer, intent(in) :: N
     double precision, intent(inout) :: x(N)
 
-    integer, parameter :: Nmax = 1024
-    integer :: Np
-    double precision :: copy(Nmax), factor
-    integer*8 :: plan
+    integer*8 :: plan, iplan
 
-    data Np /0/
-    save copy, factor, plan, Np
-
-    if (N .ne. Np) then
-        if (Np .ne. 0) call dfftw_destroy_plan(plan)
-        call dfftw_plan_r2r_1d(plan,N,copy,copy,0,64)
-        factor = dsqrt(1.d0/N)
-        Np = N
-    end if
-
-    copy(1:N) = x
-    call dfftw_execute(plan)
-    x = factor * copy(1:N)
+    call fft_plans(N,plan,iplan)
+    call fft_execute(plan,x,N)
 
 end subroutine rfft
 
@@ -158,27 +224,10 @@ subroutine irfft(x,N)
     integer, intent(in) :: N
     double precision, intent(inout) :: x(N)
 
-    integer, parameter :: Nmax = 1024
-    integer :: Np
-    double precision :: copy(Nmax), factor
-    integer*8 :: plan
-
-    data Np /0/
-    save copy, factor, plan, Np
-
-    if (N .ne. Np) then
-        ! The input array is a different length than the last array, so we
-        ! must generate a new FFTW plan for the transform
-        ! First delete the previous plan
-        if (Np .ne. 0) call dfftw_destroy_plan(plan)
-        call dfftw_plan_r2r_1d(plan,N,copy,copy,1,64)
-        factor = dsqrt(1.d0/N)
-        Np = N
-    end if
+    integer*8 :: plan, iplan
 
-    copy(1:N) = x
-    call dfftw_execute(plan)
-    x = factor * copy(1:N)
+    call fft_plans(N,plan,iplan)
+    call fft_execute(iplan,x,N)
 
 end subroutine irfft
 
@@ -0,0 +1,254 @@
+!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+!
+!   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+!
+!   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+!                         William H. Green (whgreen@mit.edu)
+!                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+!
+!   Permission is hereby granted, free of charge, to any person obtaining a
+!   copy of this software and associated documentation files (the "Software"),
+!   to deal in the Software without restriction, including without limitation
+!   the rights to use, copy, modify, merge, publish, distribute, sublicense,
+!   and/or sell copies of the Software, and to permit persons to whom the
+!   Software is furnished to do so, subject to the following conditions:
+!
+!   The above copyright notice and this permission notice shall be included in
+!   all copies or substantial portions of the Software.
+!
+!   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+!   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+!   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+!   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+!   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+!   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+!   DEALINGS IN THE SOFTWARE.
+!
+!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+
+! The ``potentials`` module contains compiled versions of the analytic
+! potential energy surfaces in :mod:`rpmdrate.potentials`, which can be used
+! for testing and benchmarking without building one of the research potential
+! energy surfaces. Each surface has the same signature as the potential
+! callback used by the ``system`` module, and reads its parameters from the
+! module variables below, which are set from Python. All quantities are in
+! atomic units. The three reacting atoms are always atoms 1, 2, and 3, with
+! the bond between atoms 1 and 2 broken and the bond between atoms 2 and 3
+! formed by the reaction.
+module potentials
+
+    implicit none
+
+    integer, parameter :: MAX_ATOMS = 100
+
+    ! The parameters of the LEPS surface: the well depth, range parameter,
+    ! and equilibrium bond length of the Morse potential, and the Sato
+    ! parameter
+    double precision :: leps_d = 0.1744d0, leps_a = 1.04435d0, leps_r0 = 1.40083d0, leps_sato = 0.13d0
+
+    ! The parameters of the model A + BC surface: the well depth, range
+    ! parameter, and equilibrium bond length of the Morse potential, and the
+    ! strength of the coupling between the two bonds
+    double precision :: model_d = 0.1744d0, model_a = 1.04435d0, model_r0 = 1.40083d0, model_c = 0.4192646464646465d0
+
+    ! The parameters of the synthetic N-atom surface: the reference positions
+    ! of the spectator atoms, the force constant tethering them there, the
+    ! strength and range of the repulsion between each spectator atom and
+    ! every other atom, and the number of times to repeat each evaluation
+    double precision :: synthetic_reference(3,MAX_ATOMS)
+    double precision :: synthetic_kforce = 0.1d0, synthetic_repulsion = 0.01d0, synthetic_range = 0.5d0
+    integer :: synthetic_repeats = 1
+
+contains
+
+    ! Return the London-Eyring-Polanyi-Sato (LEPS) potential for three
+    ! identical atoms. Only the first three atoms interact; any other atoms
+    ! feel no force.
+    ! Parameters:
+    !   q - The position of each bead of each atom
+    !   Natoms - The number of atoms
+    !   Nbeads - The number of beads
+    ! Returns:
+    !   V - The potential of each bead
+    !   dVdq - The gradient of the potential for each bead of each atom
+    !   info - Nonzero if the potential could not be evaluated
+    subroutine leps(q, V, dVdq, Natoms, Nbeads, info)
+
+        implicit none
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(in) :: q(3,Natoms,Nbeads)
+        double precision, intent(out) :: V(Nbeads)
+        double precision, intent(out) :: dVdq(3,Natoms,Nbeads)
+        integer, intent(out) :: info
+
+        integer :: k, m
+        integer :: pairs(3,2)
+        double precision :: R(3,3), bond(3), coulomb(3), exchange(3), dcoulomb(3), dexchange(3)
+        double precision :: E, W, dVdr, dWdJ, f
+
+        info = 0
+        V(:) = 0.0d0
+        dVdq(:,:,:) = 0.0d0
+        if (Natoms < 3) then
+            info = 1
+            return
+        end if
+
+        pairs(1,:) = (/ 1, 2 /)
+        pairs(2,:) = (/ 2, 3 /)
+        pairs(3,:) = (/ 1, 3 /)
+        f = 0.25d0 * leps_d / (1.0d0 + leps_sato)
+
+        do k = 1, Nbeads
+            do m = 1, 3
+                R(:,m) = q(:,pairs(m,1),k) - q(:,pairs(m,2),k)
+                bond(m) = sqrt(dot_product(R(:,m), R(:,m)))
+                E = exp(-leps_a * (bond(m) - leps_r0))
+                coulomb(m) = f * ((3.0d0 + leps_sato) * E * E - (2.0d0 + 6.0d0 * leps_sato) * E)
+                exchange(m) = f * ((1.0d0 + 3.0d0 * leps_sato) * E * E - (6.0d0 + 2.0d0 * leps_sato) * E)
+                dcoulomb(m) = -leps_a * f * (2.0d0 * (3.0d0 + leps_sato) * E * E - (2.0d0 + 6.0d0 * leps_sato) * E)
+                dexchange(m) = -leps_a * f * (2.0d0 * (1.0d0 + 3.0d0 * leps_sato) * E * E - (6.0d0 + 2.0d0 * leps_sato) * E)
+            end do
+            W = exchange(1) * exchange(1) + exchange(2) * exchange(2) + exchange(3) * exchange(3) &
+                - exchange(1) * exchange(2) - exchange(2) * exchange(3) - exchange(3) * exchange(1)
+            W = sqrt(max(W, 0.0d0))
+            V(k) = coulomb(1) + coulomb(2) + coulomb(3) - W + leps_d
+            do m = 1, 3
+                if (W > 1.0d-12) then
+                    dWdJ = (2.0d0 * exchange(m) - exchange(mod(m,3)+1) - exchange(mod(m+1,3)+1)) / (2.0d0 * W)
+                else
+                    dWdJ = 0.0d0
+                end if
+                dVdr = dcoulomb(m) - dWdJ * dexchange(m)
+                dVdq(:,pairs(m,1),k) = dVdq(:,pairs(m,1),k) + dVdr * R(:,m) / bond(m)
+                dVdq(:,pairs(m,2),k) = dVdq(:,pairs(m,2),k) - dVdr * R(:,m) / bond(m)
+            end do
+        end do
+
+    end subroutine leps
+
+    ! Return the model A + BC potential, which is the sum of a Morse
+    ! potential for each of the breaking and forming bonds and a coupling
+    ! term between the two that sets the height of the barrier. Only the
+    ! first three atoms interact; any other atoms feel no force.
+    ! Parameters:
+    !   q - The position of each bead of each atom
+    !   Natoms - The number of atoms
+    !   Nbeads - The number of beads
+    ! Returns:
+    !   V - The potential of each bead
+    !   dVdq - The gradient of the potential for each bead of each atom
+    !   info - Nonzero if the potential could not be evaluated
+    subroutine model(q, V, dVdq, Natoms, Nbeads, info)
+
+        implicit none
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(in) :: q(3,Natoms,Nbeads)
+        double precision, intent(out) :: V(Nbeads)
+        double precision, intent(out) :: dVdq(3,Natoms,Nbeads)
+        integer, intent(out) :: info
+
+        integer :: k
+
+        info = 0
+        V(:) = 0.0d0
+        dVdq(:,:,:) = 0.0d0
+        if (Natoms < 3) then
+            info = 1
+            return
+        end if
+
+        do k = 1, Nbeads
+            call add_model_potential(q(:,:,k), Natoms, V(k), dVdq(:,:,k))
+        end do
+
+    end subroutine model
+
+    ! Add the model A + BC potential and its gradient for a single bead to
+    ! `V` and `dVdq`.
+    subroutine add_model_potential(q, Natoms, V, dVdq)
+
+        implicit none
+        integer, intent(in) :: Natoms
+        double precision, intent(in) :: q(3,Natoms)
+        double precision, intent(inout) :: V
+        double precision, intent(inout) :: dVdq(3,Natoms)
+
+        double precision :: R12(3), R23(3), r1, r2, x, y, dVdr1, dVdr2
+
+        R12 = q(:,1) - q(:,2)
+        R23 = q(:,2) - q(:,3)
+        r1 = sqrt(dot_product(R12, R12))
+        r2 = sqrt(dot_product(R23, R23))
+        x = exp(-model_a * (r1 - model_r0))
+        y = exp(-model_a * (r2 - model_r0))
+
+        V = V + model_d * (1.0d0 - x) * (1.0d0 - x) + model_d * (1.0d0 - y) * (1.0d0 - y) - model_d + model_c * x * y
+
+        ! dV/dr1 and dV/dr2, using dx/dr1 = -a x and dy/dr2 = -a y
+        dVdr1 = -model_a * x * (-2.0d0 * model_d * (1.0d0 - x) + model_c * y)
+        dVdr2 = -model_a * y * (-2.0d0 * model_d * (1.0d0 - y) + model_c * x)
+        dVdq(:,1) = dVdq(:,1) + dVdr1 * R12 / r1
+        dVdq(:,2) = dVdq(:,2) - dVdr1 * R12 / r1 + dVdr2 * R23 / r2
+        dVdq(:,3) = dVdq(:,3) - dVdr2 * R23 / r2
+
+    end subroutine add_model_potential
+
+    ! Return the synthetic N-atom potential, which is the model A + BC
+    ! potential for the first three atoms, plus a harmonic tether of each
+    ! remaining (spectator) atom to its reference position and a short-range
+    ! exponential repulsion between each spectator atom and every other atom.
+    ! The cost of each evaluation scales as the square of the number of atoms,
+    ! and can be increased further by repeating the evaluation.
+    ! Parameters:
+    !   q - The position of each bead of each atom
+    !   Natoms - The number of atoms
+    !   Nbeads - The number of beads
+    ! Returns:
+    !   V - The potential of each bead
+    !   dVdq - The gradient of the potential for each bead of each atom
+    !   info - Nonzero if the potential could not be evaluated
+    subroutine synthetic(q, V, dVdq, Natoms, Nbeads, info)
+
+        implicit none
+        integer, intent(in) :: Natoms, Nbeads
+        double precision, intent(in) :: q(3,Natoms,Nbeads)
+        double precision, intent(out) :: V(Nbeads)
+        double precision, intent(out) :: dVdq(3,Natoms,Nbeads)
+        integer, intent(out) :: info
+
+        integer :: i, j, k, n
+        double precision :: Rvec(3), r, Vij, dq(3)
+
+        info = 0
+        if (Natoms < 3 .or. Natoms > MAX_ATOMS) then
+            V(:) = 0.0d0
+            dVdq(:,:,:) = 0.0d0
+            info = 1
+            return
+        end if
+
+        do n = 1, max(synthetic_repeats, 1)
+            V(:) = 0.0d0
+            dVdq(:,:,:) = 0.0d0
+            do k = 1, Nbeads
+                call add_model_potential(q(:,:,k), Natoms, V(k), dVdq(:,:,k))
+                do i = 4, Natoms
+                    dq = q(:,i,k) - synthetic_reference(:,i)
+                    V(k) = V(k) + 0.5d0 * synthetic_kforce * dot_product(dq, dq)
+                    dVdq(:,i,k) = dVdq(:,i,k) + synthetic_kforce * dq
+                    do j = 1, i - 1
+                        Rvec = q(:,i,k) - q(:,j,k)
+                        r = sqrt(dot_product(Rvec, Rvec))
+                        Vij = synthetic_repulsion * exp(-r / synthetic_range)
+                        V(k) = V(k) + Vij
+                        dVdq(:,i,k) = dVdq(:,i,k) - Vij / synthetic_range * Rvec / r
+                        dVdq(:,j,k) = dVdq(:,j,k) + Vij / synthetic_range * Rvec / r
+                    end do
+                end do
+            end do
+        end do
+
+    end subroutine synthetic
+
+end module potentials
@@ -27,7 +27,9 @@
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 
 ! The ``transition_state`` module defines a dividing surface for a transition
-! state, defined by a set of forming bonds and a set of breaking bonds. The
+! state, defined by a set of forming bonds and a set of breaking bonds. Each
+! attribute holds a separate dividing surface for each of the MAX_CONTEXTS
+! contexts (see the ``system`` module), in its last dimension. The
 ! attributes are:
 !
 ! ================================= ============================================
@@ -47,27 +49,31 @@ module transition_state
     implicit none
 
     integer, parameter :: MAX_ATOMS = 100, MAX_BONDS = 16, MAX_TS = 16
+    integer, parameter :: MAX_CONTEXTS = 64
 
-    integer :: number_of_transition_states
-    integer :: number_of_bonds
+    integer :: number_of_transition_states(MAX_CONTEXTS)
+    integer :: number_of_bonds(MAX_CONTEXTS)
 
-    integer :: forming_bonds(MAX_TS,MAX_BONDS,2)
-    integer :: breaking_bonds(MAX_TS,MAX_BONDS,2)
-    double precision :: forming_bond_lengths(MAX_TS,MAX_BONDS)
-    double precision :: breaking_bond_lengths(MAX_TS,MAX_BONDS)
+    integer :: forming_bonds(MAX_TS,MAX_BONDS,2,MAX_CONTEXTS)
+    integer :: breaking_bonds(MAX_TS,MAX_BONDS,2,MAX_CONTEXTS)
+    double precision :: forming_bond_lengths(MAX_TS,MAX_BONDS,MAX_CONTEXTS)
+    double precision :: breaking_bond_lengths(MAX_TS,MAX_BONDS,MAX_CONTEXTS)
 
 contains
 
     ! Return the value of the dividing surface function for each of the
     ! equivalent transition states that define the dividing surface.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   values - The value of the dividing surface function for each transition state
-    subroutine evaluate_all(position, Natoms, values)
+    subroutine evaluate_all(context, position, Natoms, values)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, dimension(:,:), intent(out) :: values
@@ -77,25 +83,25 @@ contains
 
         values(:,:) = 0.0d0
 
-        do n = 1, number_of_transition_states
+        do n = 1, number_of_transition_states(context)
 
-            do m = 1, number_of_bonds
+            do m = 1, number_of_bonds(context)
                 ! Forming bond
-                atom1 = forming_bonds(n,m,1)
-                atom2 = forming_bonds(n,m,2)
+                atom1 = forming_bonds(n,m,1,context)
+                atom2 = forming_bonds(n,m,2,context)
                 Rx = position(1,atom1) - position(1,atom2)
                 Ry = position(2,atom1) - position(2,atom2)
                 Rz = position(3,atom1) - position(3,atom2)
                 R = sqrt(Rx * Rx + Ry * Ry + Rz * Rz)
-                values(n,m) = values(n,m) + (forming_bond_lengths(n,m) - R)
+                values(n,m) = values(n,m) + (forming_bond_lengths(n,m,context) - R)
                 ! Breaking bond
-                atom1 = breaking_bonds(n,m,1)
-                atom2 = breaking_bonds(n,m,2)
+                atom1 = breaking_bonds(n,m,1,context)
+                atom2 = breaking_bonds(n,m,2,context)
                 Rx = position(1,atom1) - position(1,atom2)
                 Ry = position(2,atom1) - position(2,atom2)
                 Rz = position(3,atom1) - position(3,atom2)
                 R = sqrt(Rx * Rx + Ry * Ry + Rz * Rz)
-                values(n,m) = values(n,m) - (breaking_bond_lengths(n,m) - R)
+                values(n,m) = values(n,m) - (breaking_bond_lengths(n,m,context) - R)
             end do
 
         end do
@@ -106,20 +112,23 @@ contains
     ! is the maximum of the individual values for each equivalent transition
     ! state, as determined by evaluate_all().
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   s1 - The value of the dividing surface function
-    subroutine value(position, Natoms, s1)
+    subroutine value(context, position, Natoms, s1)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(out) :: s1
 
-        double precision :: values(number_of_transition_states,number_of_bonds)
+        double precision :: values(number_of_transition_states(context),number_of_bonds(context))
 
-        call evaluate_all(position, Natoms, values)
+        call evaluate_all(context, position, Natoms, values)
 
         s1 = minval(maxval(values, 1))
 
@@ -128,31 +137,34 @@ contains
     ! Return the value of the gradient of the transition state dividing surface
     ! function.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   ds1 - The gradient of the dividing surface function
-    subroutine gradient(position, Natoms, ds1)
+    subroutine gradient(context, position, Natoms, ds1)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(out) :: ds1(3,Natoms)
 
-        double precision :: values(number_of_transition_states,number_of_bonds)
+        double precision :: values(number_of_transition_states(context),number_of_bonds(context))
         integer :: m, n, atom1, atom2
         double precision :: Rx, Ry, Rz, Rinv
 
         ds1(:,:) = 0.0d0
 
-        call evaluate_all(position, Natoms, values)
+        call evaluate_all(context, position, Natoms, values)
 
         m = minloc(maxval(values, 1), 1)
         n = maxloc(values(:,m), 1)
 
         ! Forming bond
-        atom1 = forming_bonds(n,m,1)
-        atom2 = forming_bonds(n,m,2)
+        atom1 = forming_bonds(n,m,1,context)
+        atom2 = forming_bonds(n,m,2,context)
         Rx = position(1,atom1) - position(1,atom2)
         Ry = position(2,atom1) - position(2,atom2)
         Rz = position(3,atom1) - position(3,atom2)
@@ -165,8 +177,8 @@ contains
         ds1(3,atom2) = ds1(3,atom2) + Rz * Rinv
 
         ! Breaking bond
-        atom1 = breaking_bonds(n,m,1)
-        atom2 = breaking_bonds(n,m,2)
+        atom1 = breaking_bonds(n,m,1,context)
+        atom2 = breaking_bonds(n,m,2,context)
         Rx = position(1,atom1) - position(1,atom2)
         Ry = position(2,atom1) - position(2,atom2)
         Rz = position(3,atom1) - position(3,atom2)
@@ -183,32 +195,35 @@ contains
     ! Return the value of the Hessian of the transition state dividing surface
     ! function.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   d2s1 - The Hessian of the dividing surface function
-    subroutine hessian(position, Natoms, d2s1)
+    subroutine hessian(context, position, Natoms, d2s1)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(out) :: d2s1(3,Natoms,3,Natoms)
 
-        double precision :: values(number_of_transition_states,number_of_bonds)
+        double precision :: values(number_of_transition_states(context),number_of_bonds(context))
         integer :: m, n, atom1, atom2
         double precision :: Rx, Ry, Rz, Rinv
         double precision :: dxx, dyy, dzz, dxy, dxz, dyz
 
         d2s1(:,:,:,:) = 0.0d0
 
-        call evaluate_all(position, Natoms, values)
+        call evaluate_all(context, position, Natoms, values)
 
         m = minloc(maxval(values, 1), 1)
         n = maxloc(values(:,m), 1)
 
         ! Forming bond
-        atom1 = forming_bonds(n,m,1)
-        atom2 = forming_bonds(n,m,2)
+        atom1 = forming_bonds(n,m,1,context)
+        atom2 = forming_bonds(n,m,2,context)
         Rx = position(1,atom1) - position(1,atom2)
         Ry = position(2,atom1) - position(2,atom2)
         Rz = position(3,atom1) - position(3,atom2)
@@ -262,8 +277,8 @@ contains
         d2s1(3,atom2,3,atom2) = d2s1(3,atom2,3,atom2) + dzz
 
         ! Breaking bond
-        atom1 = breaking_bonds(n,m,1)
-        atom2 = breaking_bonds(n,m,2)
+        atom1 = breaking_bonds(n,m,1,context)
+        atom2 = breaking_bonds(n,m,2,context)
         Rx = position(1,atom1) - position(1,atom2)
         Ry = position(2,atom1) - position(2,atom2)
         Rz = position(3,atom1) - position(3,atom2)
@@ -321,54 +336,60 @@ contains
     ! Return the value, gradient, and Hessian of the transition state dividing
     ! surface function.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   s1 - The value of the dividing surface function
     !   ds1 - The gradient of the dividing surface function
     !   d2s1 - The Hessian of the dividing surface function
-    subroutine evaluate(position, Natoms, s1, ds1, d2s1)
+    subroutine evaluate(context, position, Natoms, s1, ds1, d2s1)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(out) :: s1, ds1(3,Natoms), d2s1(3,Natoms,3,Natoms)
 
-        call value(position, Natoms, s1)
-        call gradient(position, Natoms, ds1)
-        call hessian(position, Natoms, d2s1)
+        call value(context, position, Natoms, s1)
+        call gradient(context, position, Natoms, ds1)
+        call hessian(context, position, Natoms, d2s1)
 
     end subroutine evaluate
 
     ! Check that a given position is valid by ensuring that all breaking and
     ! forming bonds have lengths less than Rmax.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     !   Rmax - The maximum valid bond length in atomic units for breaking/forming bonds
     ! Returns:
     !   result - 0 if the position is valid, 1 if invalid
-    subroutine check_for_valid_position(position, Natoms, Rmax, result)
+    subroutine check_for_valid_position(context, position, Natoms, Rmax, result)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(in) :: Rmax
         integer, intent(inout) :: result
 
-        double precision :: values(number_of_transition_states,number_of_bonds)
+        double precision :: values(number_of_transition_states(context),number_of_bonds(context))
         integer :: m, n, atom1, atom2
         double precision :: Rx, Ry, Rz, R
 
-        call evaluate_all(position, Natoms, values)
+        call evaluate_all(context, position, Natoms, values)
 
         m = minloc(maxval(values, 1), 1)
         n = maxloc(values(:,m), 1)
 
-        do m = 1, number_of_bonds
+        do m = 1, number_of_bonds(context)
             ! Forming bond
-            atom1 = forming_bonds(n,m,1)
-            atom2 = forming_bonds(n,m,2)
+            atom1 = forming_bonds(n,m,1,context)
+            atom2 = forming_bonds(n,m,2,context)
             Rx = position(1,atom1) - position(1,atom2)
             Ry = position(2,atom1) - position(2,atom2)
             Rz = position(3,atom1) - position(3,atom2)
@@ -378,8 +399,8 @@ contains
                 return
             end if
             ! Breaking bond
-            atom1 = breaking_bonds(n,m,1)
-            atom2 = breaking_bonds(n,m,2)
+            atom1 = breaking_bonds(n,m,1,context)
+            atom2 = breaking_bonds(n,m,2,context)
             Rx = position(1,atom1) - position(1,atom2)
             Ry = position(2,atom1) - position(2,atom2)
             Rz = position(3,atom1) - position(3,atom2)
@@ -395,28 +416,31 @@ contains
     ! Check that the transition state dividing surface does not give the
     ! same value for equivalent transition states at a given position.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   result - 0 if the position is valid, 1 if invalid
-    subroutine check_values(position, Natoms, result)
+    subroutine check_values(context, position, Natoms, result)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         integer, intent(inout) :: result
 
-        double precision :: values(number_of_transition_states,number_of_bonds), max_value
+        double precision :: values(number_of_transition_states(context),number_of_bonds(context)), max_value
         integer :: m, n, Neq
 
-        call evaluate_all(position, Natoms, values)
+        call evaluate_all(context, position, Natoms, values)
 
         m = minloc(maxval(values, 1), 1)
         n = maxloc(values(:,m), 1)
         max_value = values(n,m)
 
         Neq = 0
-        do n = 1, number_of_transition_states
+        do n = 1, number_of_transition_states(context)
             if (abs(values(n,m) - max_value) < 1.0e-10) Neq = Neq + 1
         end do
 
@@ -430,7 +454,9 @@ end module transition_state
 
 ! The ``reactants`` module defines a dividing surface for a set of bimolecular
 ! reactants, characterized by the distance at which the interaction of the
-! reactant molecules becomes negligible. The attributes are:
+! reactant molecules becomes negligible. As in the ``transition_state`` module,
+! each attribute holds a separate dividing surface for each context, in its
+! last dimension. The attributes are:
 !
 ! ========================= ====================================================
 ! Attribute                 Description
@@ -448,25 +474,29 @@ module reactants
     implicit none
 
     integer, parameter :: MAX_ATOMS = 100
+    integer, parameter :: MAX_CONTEXTS = 64
 
-    integer :: Nreactant1_atoms
-    integer :: Nreactant2_atoms
-    integer :: reactant1_atoms(MAX_ATOMS)
-    integer :: reactant2_atoms(MAX_ATOMS)
-    double precision :: massfrac(MAX_ATOMS)
-    double precision :: Rinf
+    integer :: Nreactant1_atoms(MAX_CONTEXTS)
+    integer :: Nreactant2_atoms(MAX_CONTEXTS)
+    integer :: reactant1_atoms(MAX_ATOMS,MAX_CONTEXTS)
+    integer :: reactant2_atoms(MAX_ATOMS,MAX_CONTEXTS)
+    double precision :: massfrac(MAX_ATOMS,MAX_CONTEXTS)
+    double precision :: Rinf(MAX_CONTEXTS)
 
 contains
 
     ! Return the center of mass of the first reactant.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   cm - The center of mass of the first reactant
-    subroutine reactant1_center_of_mass(position, Natoms, cm)
+    subroutine reactant1_center_of_mass(context, position, Natoms, cm)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(out) :: cm(3)
@@ -474,10 +504,10 @@ contains
         integer :: n, atom, i
 
         cm(:) = 0.0
-        do n = 1, Nreactant1_atoms
-            atom = reactant1_atoms(n)
+        do n = 1, Nreactant1_atoms(context)
+            atom = reactant1_atoms(n,context)
             do i = 1, 3
-                cm(i) = cm(i) + massfrac(atom) * position(i,atom)
+                cm(i) = cm(i) + massfrac(atom,context) * position(i,atom)
             end do
         end do
 
@@ -485,13 +515,16 @@ contains
 
     ! Return the center of mass of the second reactant.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   cm - The center of mass of the second reactant
-    subroutine reactant2_center_of_mass(position, Natoms, cm)
+    subroutine reactant2_center_of_mass(context, position, Natoms, cm)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(out) :: cm(3)
@@ -499,10 +532,10 @@ contains
         integer :: n, atom, i
 
         cm(:) = 0.0
-        do n = 1, Nreactant2_atoms
-            atom = reactant2_atoms(n)
+        do n = 1, Nreactant2_atoms(context)
+            atom = reactant2_atoms(n,context)
             do i = 1, 3
-                cm(i) = cm(i) + massfrac(atom) * position(i,atom)
+                cm(i) = cm(i) + massfrac(atom,context) * position(i,atom)
             end do
         end do
 
@@ -510,13 +543,16 @@ contains
 
     ! Return the value of the bimolecular reactants dividing surface function.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   s0 - The value of the reactants dividing surface function
-    subroutine value(position, Natoms, s0)
+    subroutine value(context, position, Natoms, s0)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(out) :: s0
@@ -524,28 +560,31 @@ contains
         double precision :: cm1(3), cm2(3)
         double precision :: Rx, Ry, Rz, R
 
-        call reactant1_center_of_mass(position, Natoms, cm1)
-        call reactant2_center_of_mass(position, Natoms, cm2)
+        call reactant1_center_of_mass(context, position, Natoms, cm1)
+        call reactant2_center_of_mass(context, position, Natoms, cm2)
 
         Rx = cm2(1) - cm1(1)
         Ry = cm2(2) - cm1(2)
         Rz = cm2(3) - cm1(3)
         R = sqrt(Rx * Rx + Ry * Ry + Rz * Rz)
 
-        s0 = Rinf - R
+        s0 = Rinf(context) - R
 
     end subroutine value
 
     ! Return the gradient of the bimolecular reactants dividing surface
     ! function.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   ds0 - The gradient of the reactants dividing surface function
-    subroutine gradient(position, Natoms, ds0)
+    subroutine gradient(context, position, Natoms, ds0)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(out) :: ds0(3,Natoms)
@@ -554,38 +593,41 @@ contains
         double precision :: Rx, Ry, Rz, Rinv
         integer :: n, atom
 
-        call reactant1_center_of_mass(position, Natoms, cm1)
-        call reactant2_center_of_mass(position, Natoms, cm2)
+        call reactant1_center_of_mass(context, position, Natoms, cm1)
+        call reactant2_center_of_mass(context, position, Natoms, cm2)
 
         Rx = cm2(1) - cm1(1)
         Ry = cm2(2) - cm1(2)
         Rz = cm2(3) - cm1(3)
         Rinv = 1.0/sqrt(Rx * Rx + Ry * Ry + Rz * Rz)
 
-        do n = 1, Nreactant1_atoms
-            atom = reactant1_atoms(n)
-            ds0(1,atom) = Rx * Rinv * massfrac(atom)
-            ds0(2,atom) = Ry * Rinv * massfrac(atom)
-            ds0(3,atom) = Rz * Rinv * massfrac(atom)
+        do n = 1, Nreactant1_atoms(context)
+            atom = reactant1_atoms(n,context)
+            ds0(1,atom) = Rx * Rinv * massfrac(atom,context)
+            ds0(2,atom) = Ry * Rinv * massfrac(atom,context)
+            ds0(3,atom) = Rz * Rinv * massfrac(atom,context)
         end do
-        do n = 1, Nreactant2_atoms
-            atom = reactant2_atoms(n)
-            ds0(1,atom) = -Rx * Rinv * massfrac(atom)
-            ds0(2,atom) = -Ry * Rinv * massfrac(atom)
-            ds0(3,atom) = -Rz * Rinv * massfrac(atom)
+        do n = 1, Nreactant2_atoms(context)
+            atom = reactant2_atoms(n,context)
+            ds0(1,atom) = -Rx * Rinv * massfrac(atom,context)
+            ds0(2,atom) = -Ry * Rinv * massfrac(atom,context)
+            ds0(3,atom) = -Rz * Rinv * massfrac(atom,context)
         end do
 
     end subroutine gradient
 
     ! Return the Hessian of the bimolecular reactants dividing surface function.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   d2s0 - The Hessian of the reactants dividing surface function
-    subroutine hessian(position, Natoms, d2s0)
+    subroutine hessian(context, position, Natoms, d2s0)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(out) :: d2s0(3,Natoms,3,Natoms)
@@ -595,8 +637,8 @@ contains
         double precision :: dxx, dyy, dzz, dxy, dxz, dyz, massfactor
         integer :: n1, atom1, n2, atom2
 
-        call reactant1_center_of_mass(position, Natoms, cm1)
-        call reactant2_center_of_mass(position, Natoms, cm2)
+        call reactant1_center_of_mass(context, position, Natoms, cm1)
+        call reactant2_center_of_mass(context, position, Natoms, cm2)
 
         Rx = cm2(1) - cm1(1)
         Ry = cm2(2) - cm1(2)
@@ -610,11 +652,11 @@ contains
         dxz = Rx * Rz * (Rinv * Rinv * Rinv)
         dyz = Ry * Rz * (Rinv * Rinv * Rinv)
 
-        do n1 = 1, Nreactant1_atoms
-            atom1 = reactant1_atoms(n1)
-            do n2 = 1, Nreactant1_atoms
-                atom2 = reactant1_atoms(n2)
-                massfactor = massfrac(atom1) * massfrac(atom2)
+        do n1 = 1, Nreactant1_atoms(context)
+            atom1 = reactant1_atoms(n1,context)
+            do n2 = 1, Nreactant1_atoms(context)
+                atom2 = reactant1_atoms(n2,context)
+                massfactor = massfrac(atom1,context) * massfrac(atom2,context)
                 d2s0(1,atom1,1,atom2) = dxx * massfactor
                 d2s0(1,atom1,2,atom2) = dxy * massfactor
                 d2s0(1,atom1,3,atom2) = dxz * massfactor
@@ -625,9 +667,9 @@ contains
                 d2s0(3,atom1,2,atom2) = dyz * massfactor
                 d2s0(3,atom1,3,atom2) = dzz * massfactor
             end do
-            do n2 = 1, Nreactant2_atoms
-                atom2 = reactant2_atoms(n2)
-                massfactor = massfrac(atom1) * massfrac(atom2)
+            do n2 = 1, Nreactant2_atoms(context)
+                atom2 = reactant2_atoms(n2,context)
+                massfactor = massfrac(atom1,context) * massfrac(atom2,context)
                 d2s0(1,atom1,1,atom2) = -dxx * massfactor
                 d2s0(1,atom1,2,atom2) = -dxy * massfactor
                 d2s0(1,atom1,3,atom2) = -dxz * massfactor
@@ -639,11 +681,11 @@ contains
                 d2s0(3,atom1,3,atom2) = -dzz * massfactor
             end do
         end do
-        do n1 = 1, Nreactant2_atoms
-            atom1 = reactant2_atoms(n1)
-            do n2 = 1, Nreactant1_atoms
-                atom2 = reactant1_atoms(n2)
-                massfactor = massfrac(atom1) * massfrac(atom2)
+        do n1 = 1, Nreactant2_atoms(context)
+            atom1 = reactant2_atoms(n1,context)
+            do n2 = 1, Nreactant1_atoms(context)
+                atom2 = reactant1_atoms(n2,context)
+                massfactor = massfrac(atom1,context) * massfrac(atom2,context)
                 d2s0(1,atom1,1,atom2) = -dxx * massfactor
                 d2s0(1,atom1,2,atom2) = -dxy * massfactor
                 d2s0(1,atom1,3,atom2) = -dxz * massfactor
@@ -654,9 +696,9 @@ contains
                 d2s0(3,atom1,2,atom2) = -dyz * massfactor
                 d2s0(3,atom1,3,atom2) = -dzz * massfactor
             end do
-            do n2 = 1, Nreactant2_atoms
-                atom2 = reactant2_atoms(n2)
-                massfactor = massfrac(atom1) * massfrac(atom2)
+            do n2 = 1, Nreactant2_atoms(context)
+                atom2 = reactant2_atoms(n2,context)
+                massfactor = massfrac(atom1,context) * massfrac(atom2,context)
                 d2s0(1,atom1,1,atom2) = dxx * massfactor
                 d2s0(1,atom1,2,atom2) = dxy * massfactor
                 d2s0(1,atom1,3,atom2) = dxz * massfactor
@@ -674,22 +716,25 @@ contains
     ! Return the value, gradient, and Hessian of the bimolecular reactants
     ! dividing surface function.
     ! Parameters:
+    !   context - The index of the context whose dividing surface is used
     !   position - A 3 x Natoms array of atomic positions
     !   Natoms - The number of atoms
     ! Returns:
     !   s0 - The value of the dividing surface function
     !   ds0 - The gradient of the dividing surface function
     !   d2s0 - The Hessian of the dividing surface function
-    subroutine evaluate(position, Natoms, s1, ds1, d2s1)
+    subroutine evaluate(context, position, Natoms, s1, ds1, d2s1)
 
         implicit none
+        integer, intent(in) :: context
+        !f2py integer, optional, intent(in) :: context = 1
         integer, intent(in) :: Natoms
         double precision, intent(in) :: position(3,Natoms)
         double precision, intent(out) :: s1, ds1(3,Natoms), d2s1(3,Natoms,3,Natoms)
 
-        call value(position, Natoms, s1)
-        call gradient(position, Natoms, ds1)
-        call hessian(position, Natoms, d2s1)
+        call value(context, position, Natoms, s1)
+        call gradient(context, position, Natoms, ds1)
+        call hessian(context, position, Natoms, d2s1)
 
     end subroutine evaluate
 
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This module contains functionality for computing observables from recorded
+RPMD trajectories. The trajectory files are read one frame at a time, so that
+trajectories larger than the available memory can be analyzed, and the
+observables of each frame are computed using the same Fortran kernels used to
+run the trajectories. The observables of each trajectory are saved as arrays
+to a NumPy ``.npz`` file next to it.
+"""
+
+import os.path
+import numpy
+import logging
+
+from rpmdrate._main import system
+from rpmdrate.trajectory import TrajectoryReader
+
+################################################################################
+
+def getDefaultBonds(rpmd):
+    """
+    Return the forming and breaking bonds of each transition state of the
+    `rpmd` system, without duplicates, as a list of pairs of atom indices
+    starting from one.
+    """
+    bonds = []
+    for ts in rpmd.transitionStates:
+        for atom1, atom2 in numpy.concatenate((ts.formingBonds, ts.breakingBonds)):
+            bond = (int(min(atom1, atom2)), int(max(atom1, atom2)))
+            if bond not in bonds:
+                bonds.append(bond)
+    return bonds
+
+def iterateObservables(reader, bonds, context=1):
+    """
+    Iterate over the frames of the trajectory being read by `reader`,
+    yielding the observables of each frame. The given `context` of the
+    Fortran layer must have been activated for the system that ran the
+    trajectory. The observables are:
+    
+    * the number of the time step at which the frame was recorded
+    
+    * the reaction coordinate :math:`\\xi` of the centroids
+    
+    * the radius of gyration of each atom
+    
+    * the ring polymer energy
+    
+    * the primitive estimate of the kinetic energy
+    
+    * the distance between the centroids of the atoms of each of the `bonds`,
+      given as pairs of atom indices starting from one
+    
+    Only the positions are recorded, so the kinetic energy is computed from
+    the ring polymer energy using the primitive estimator
+    :math:`E_\\mathrm{k} = 3 N_\\mathrm{atoms} N_\\mathrm{beads} / 2 \\beta - E_\\mathrm{ring} / N_\\mathrm{beads}`,
+    whose average for a free ring polymer is the classical value
+    :math:`3 N_\\mathrm{atoms} / 2 \\beta`. If only the
+    centroids were recorded, the radius of gyration and the energies cannot be
+    computed, and are ``nan`` instead.
+    """
+    Natoms = reader.Natoms
+    Nbeads = reader.Nbeads
+    for step, q in reader:
+        q = numpy.asfortranarray(q)
+        centroid = system.get_centroid(q)
+        xi, dxi, d2xi = system.get_reaction_coordinate(centroid, 0.0, context=context)
+        if Nbeads > 1:
+            R = system.get_radius_of_gyration(q)
+            Ering = system.get_ring_polymer_energy(q, context=context)
+            Ek = 1.5 * Natoms * Nbeads / system.beta[context-1] - Ering / Nbeads
+        else:
+            R = numpy.nan * numpy.ones(Natoms)
+            Ering = Ek = numpy.nan
+        distances = numpy.zeros(len(bonds))
+        for n, (atom1, atom2) in enumerate(bonds):
+            distances[n] = numpy.sqrt(numpy.sum((centroid[:,atom1-1] - centroid[:,atom2-1])**2))
+        yield step, xi, R, Ering, Ek, distances
+
+def getObservablesPath(path):
+    """
+    Return the path of the file to which the observables of the trajectory
+    file at `path` are saved.
+    """
+    for extension in ['.trj.gz', '.trj']:
+        if path.endswith(extension):
+            return path[:-len(extension)] + '.npz'
+    return path + '.npz'
+
+def analyzeTrajectory(rpmd, path, bonds=None):
+    """
+    Compute the observables of each frame of the trajectory file at `path`,
+    recorded for the `rpmd` system, as described in :func:`iterateObservables()`,
+    and save them to a NumPy ``.npz`` file, whose path is returned. The
+    distances are computed for the given list of `bonds`, or for the forming
+    and breaking bonds of the transition states if not given. The file
+    contains the arrays:
+    
+    =========================== ================================================
+    Array                       Description
+    =========================== ================================================
+    ``step``                    The time step of each frame
+    ``xi``                      The reaction coordinate of each frame
+    ``radiusOfGyration``        The radius of gyration of each atom in each frame, in bohr
+    ``ringPolymerEnergy``       The ring polymer energy of each frame, in hartree
+    ``kineticEnergy``           The primitive kinetic energy estimate of each frame, in hartree
+    ``bonds``                   The pair of atom indices of each bond, starting from one
+    ``bondDistance``            The distance of each bond in each frame, in bohr
+    =========================== ================================================
+    
+    """
+    if bonds is None:
+        bonds = getDefaultBonds(rpmd)
+    
+    reader = TrajectoryReader(path)
+    try:
+        if reader.Natoms != rpmd.Natoms:
+            raise ValueError('The trajectory {0} has {1:d} atoms, but the system has {2:d}.'.format(path, reader.Natoms, rpmd.Natoms))
+        for atom1, atom2 in bonds:
+            if not (1 <= atom1 <= reader.Natoms and 1 <= atom2 <= reader.Natoms):
+                raise ValueError('Invalid bond ({0:d},{1:d}); the atom indices must be between 1 and {2:d}.'.format(atom1, atom2, reader.Natoms))
+        
+        # The reaction coordinate of the umbrella sampling is used for all
+        # trajectories, since it does not depend on the current window
+        mode = rpmd.mode
+        rpmd.mode = 1
+        try:
+            context = rpmd.activate(Nbeads=reader.Nbeads)
+        finally:
+            rpmd.mode = mode
+        
+        step = []; xi = []; R = []; Ering = []; Ek = []; distances = []
+        for observables in iterateObservables(reader, bonds, context):
+            step.append(observables[0])
+            xi.append(observables[1])
+            R.append(observables[2])
+            Ering.append(observables[3])
+            Ek.append(observables[4])
+            distances.append(observables[5])
+    finally:
+        reader.close()
+    
+    Nframes = len(step)
+    outputPath = getObservablesPath(path)
+    numpy.savez_compressed(outputPath,
+        step = numpy.array(step, numpy.int64),
+        xi = numpy.array(xi, numpy.float32),
+        radiusOfGyration = numpy.array(R, numpy.float32).reshape((Nframes,rpmd.Natoms)),
+        ringPolymerEnergy = numpy.array(Ering, numpy.float32),
+        kineticEnergy = numpy.array(Ek, numpy.float32),
+        bonds = numpy.array(bonds, numpy.int32).reshape((len(bonds),2)),
+        bondDistance = numpy.array(distances, numpy.float32).reshape((Nframes,len(bonds))),
+    )
+    logging.info('Saved the observables of {0:d} frames of {1} to {2}.'.format(Nframes, path, outputPath))
+    return outputPath
+
+def runAnalysis(args):
+    """
+    Run :func:`analyzeTrajectory()` with the given tuple of `args` on a
+    subprocess, returning the path of the saved observables and ``None``, or
+    ``None`` and a description of the error if the analysis failed.
+    """
+    try:
+        return analyzeTrajectory(*args), None
+    except Exception, e:
+        return None, '{0}: {1}'.format(e.__class__.__name__, e)
+
+def analyzeTrajectories(rpmd, paths, bonds=None, processes=1):
+    """
+    Compute and save the observables of each of the trajectory files in
+    `paths`, recorded for the `rpmd` system, as described in
+    :func:`analyzeTrajectory()`, using up to `processes` processes to analyze
+    several files at once. Files that cannot be analyzed are skipped with a
+    warning. Returns the paths of the saved observables.
+    """
+    argsList = [(rpmd, path, bonds) for path in paths]
+    if processes > 1 and len(paths) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes=min(processes, len(paths)))
+        try:
+            results = pool.map(runAnalysis, argsList, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [runAnalysis(args) for args in argsList]
+    
+    outputPaths = []
+    for path, (outputPath, error) in zip(paths, results):
+        if error is not None:
+            logging.warning('Could not analyze the trajectory {0}: {1}'.format(path, error))
+        else:
+            outputPaths.append(outputPath)
+    return outputPaths
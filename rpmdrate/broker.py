@@ -0,0 +1,543 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This module contains a lightweight TCP task broker, which lets a single
+RPMDrate run farm its trajectories out to worker processes on any number of
+machines. The :class:`Broker` is used in place of the pool of subprocesses of
+an RPMD object: each call to :meth:`Broker.apply_async()` places a task (e.g.
+an umbrella sampling or recrossing factor trajectory) in a queue, which is
+served over TCP using the :mod:`multiprocessing.managers` module. Worker
+processes started with :func:`runWorker()` (e.g. via the
+``rpmdrate-worker.py`` script) connect to the broker, take tasks from the
+queue one at a time, and send back their results.
+
+Workers may join and leave at any time. Each worker sends a heartbeat while
+it runs a task; a worker that leaves, or whose heartbeat has not been heard
+for longer than the timeout, is dropped, and the tasks it was running are put
+back at the front of the queue for another worker. If a dropped worker
+finishes one of its tasks after all, the first result received is used.
+
+The tasks and their results are pickled, so the functions must be importable
+by the workers, and each worker must be able to evaluate the potential energy
+surface of the input file, which it loads from the path given by the broker
+(or on its command line, if the path differs on the worker's machine).
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import threading
+import traceback
+import collections
+import multiprocessing
+from multiprocessing.managers import BaseManager
+
+################################################################################
+
+# The methods of the task queue that are exposed to the workers
+WORKER_METHODS = ['join', 'leave', 'heartbeat', 'getTask', 'putResult', 'isClosing', 'getInputFile', 'getHeartbeatInterval']
+
+class BrokerError(Exception):
+    """
+    An exception raised when a task run by a worker of a :class:`Broker`
+    fails. The message contains the traceback from the worker.
+    """
+    pass
+
+################################################################################
+
+class AsyncResult:
+    """
+    The result of a task submitted to a :class:`Broker`, which becomes
+    available once a worker has run the task. This provides the same
+    interface as the results of a :class:`multiprocessing.Pool`.
+    """
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+    
+    def set(self, value, error=None):
+        """
+        Set the `value` returned by the task, or the traceback `error` if it
+        failed.
+        """
+        self.value = value
+        self.error = error
+        self.event.set()
+    
+    def ready(self):
+        """
+        Return ``True`` if the task has finished.
+        """
+        return self.event.is_set()
+    
+    def wait(self, timeout=None):
+        """
+        Wait until the task has finished, or until `timeout` seconds have
+        elapsed.
+        """
+        self.event.wait(timeout)
+    
+    def get(self, timeout=None):
+        """
+        Return the value returned by the task, waiting until it has finished
+        or until `timeout` seconds have elapsed. A :class:`BrokerError` is
+        raised if the task failed, and a :class:`multiprocessing.TimeoutError`
+        if it has not finished in time.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        # Wait with a timeout so that the calling thread remains responsive
+        # to keyboard interrupts
+        while not self.event.is_set():
+            remaining = 1.0 if deadline is None else min(1.0, deadline - time.time())
+            if remaining <= 0:
+                raise multiprocessing.TimeoutError()
+            self.event.wait(remaining)
+        if self.error is not None:
+            raise BrokerError('Task failed on worker:\n{0}'.format(self.error))
+        return self.value
+
+################################################################################
+
+class TaskQueue:
+    """
+    The queue of tasks shared by a :class:`Broker` with its workers. The
+    attributes are:
+    
+    =========================== ================================================
+    Attribute                   Description
+    =========================== ================================================
+    `timeout`                   The time in seconds after which a silent worker is dropped
+    `inputFile`                 The path of the input file the workers should load
+    `queue`                     The identifiers of the tasks waiting to be run, in order
+    `tasks`                     A dictionary of the function, arguments, and result of each unfinished task
+    `workers`                   A dictionary of the description, time of the last heartbeat, and running tasks of each worker
+    `closing`                   ``True`` once the broker has been closed
+    =========================== ================================================
+    
+    Only the methods listed in :data:`WORKER_METHODS` are available to the
+    workers.
+    """
+    
+    def __init__(self, timeout=120.0, inputFile=None):
+        self.timeout = float(timeout)
+        self.inputFile = inputFile
+        self.queue = collections.deque()
+        self.tasks = {}
+        self.workers = {}
+        self.closing = False
+        self.nextTaskId = 0
+        self.nextWorkerId = 0
+        self.condition = threading.Condition()
+    
+    def addTask(self, function, args):
+        """
+        Add a task that calls `function` with arguments `args` to the end of
+        the queue, returning its :class:`AsyncResult`.
+        """
+        result = AsyncResult()
+        self.condition.acquire()
+        try:
+            taskId = self.nextTaskId
+            self.nextTaskId += 1
+            self.tasks[taskId] = (function, args, result)
+            self.queue.append(taskId)
+            self.condition.notify()
+        finally:
+            self.condition.release()
+        return result
+    
+    def join(self, description):
+        """
+        Register a new worker with the given `description` (e.g. its host
+        name and process ID), returning its identifier.
+        """
+        self.condition.acquire()
+        try:
+            workerId = self.nextWorkerId
+            self.nextWorkerId += 1
+            self.workers[workerId] = [description, time.time(), set()]
+        finally:
+            self.condition.release()
+        logging.info('Worker {0:d} ({1}) joined the broker.'.format(workerId, description))
+        return workerId
+    
+    def leave(self, workerId):
+        """
+        Unregister the worker `workerId`, putting any tasks it was running
+        back in the queue.
+        """
+        self.removeWorker(workerId, 'left the broker')
+    
+    def removeWorker(self, workerId, reason):
+        """
+        Drop the worker `workerId` for the given `reason`, putting any tasks
+        it was running back at the front of the queue.
+        """
+        self.condition.acquire()
+        try:
+            worker = self.workers.pop(workerId, None)
+            if worker is None:
+                return
+            description, lastHeartbeat, running = worker
+            requeued = [taskId for taskId in sorted(running) if taskId in self.tasks]
+            self.queue.extendleft(reversed(requeued))
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+        if requeued:
+            logging.warning('Worker {0:d} ({1}) {2}; re-queueing {3:d} task(s).'.format(workerId, description, reason, len(requeued)))
+        else:
+            logging.info('Worker {0:d} ({1}) {2}.'.format(workerId, description, reason))
+    
+    def removeSilentWorkers(self):
+        """
+        Drop each worker that has not been heard from for longer than the
+        timeout.
+        """
+        now = time.time()
+        self.condition.acquire()
+        try:
+            silent = [workerId for workerId, worker in self.workers.items() if now - worker[1] > self.timeout]
+        finally:
+            self.condition.release()
+        for workerId in silent:
+            self.removeWorker(workerId, 'timed out')
+    
+    def heartbeat(self, workerId):
+        """
+        Record that the worker `workerId` is still alive. Returns ``False`` if
+        the worker is unknown, e.g. because it was dropped after timing out.
+        """
+        self.condition.acquire()
+        try:
+            if workerId not in self.workers:
+                return False
+            self.workers[workerId][1] = time.time()
+            return True
+        finally:
+            self.condition.release()
+    
+    def getTask(self, workerId, timeout=1.0):
+        """
+        Return the next task in the queue for the worker `workerId` as a
+        ``(taskId, function, args)`` tuple, waiting up to `timeout` seconds
+        for one to become available. Returns ``None`` if there is no task,
+        if the broker is closing, or if the worker is unknown.
+        """
+        deadline = time.time() + timeout
+        self.condition.acquire()
+        try:
+            while True:
+                if self.closing or workerId not in self.workers:
+                    return None
+                self.workers[workerId][1] = time.time()
+                # Skip tasks that were re-queued but then finished by the
+                # worker that was dropped
+                while self.queue and self.queue[0] not in self.tasks:
+                    self.queue.popleft()
+                if self.queue:
+                    taskId = self.queue.popleft()
+                    self.workers[workerId][2].add(taskId)
+                    function, args, result = self.tasks[taskId]
+                    return taskId, function, args
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+        finally:
+            self.condition.release()
+    
+    def putResult(self, workerId, taskId, value, error=None):
+        """
+        Set the result of the task `taskId` run by the worker `workerId` to
+        `value`, or to the traceback `error` if the task failed. The result
+        is ignored if the task has already finished.
+        """
+        self.condition.acquire()
+        try:
+            if workerId in self.workers:
+                self.workers[workerId][1] = time.time()
+                self.workers[workerId][2].discard(taskId)
+            task = self.tasks.pop(taskId, None)
+        finally:
+            self.condition.release()
+        if task is not None:
+            task[2].set(value, error)
+    
+    def isClosing(self):
+        """
+        Return ``True`` if the broker has been closed, so that the workers
+        should exit.
+        """
+        return self.closing
+    
+    def getInputFile(self):
+        """
+        Return the path of the input file that the workers should load.
+        """
+        return self.inputFile
+    
+    def getHeartbeatInterval(self):
+        """
+        Return the interval in seconds at which the workers should send a
+        heartbeat.
+        """
+        return self.timeout / 4.0
+    
+    def getWorkerCount(self):
+        """
+        Return the number of workers currently registered with the queue.
+        """
+        self.condition.acquire()
+        try:
+            return len(self.workers)
+        finally:
+            self.condition.release()
+    
+    def close(self):
+        """
+        Close the queue, so that the workers exit once they have finished
+        their current tasks.
+        """
+        self.condition.acquire()
+        try:
+            self.closing = True
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+################################################################################
+
+class Broker:
+    """
+    A TCP task broker, which serves trajectory tasks to worker processes on
+    the local and remote machines and provides the same interface as a
+    :class:`multiprocessing.Pool`, so that it can be used as the pool of an
+    RPMD object. The broker listens at the given `address`, a ``(host, port)``
+    tuple (a port of zero picks a free port), and workers must present the
+    same `authkey` to connect. The given number of local worker `processes`
+    are started on this machine. A worker that has not been heard from for
+    `timeout` seconds is dropped and its tasks are re-queued. The workers load
+    the potential energy surface from the given `inputFile`.
+    """
+    
+    def __init__(self, address, authkey, processes=0, timeout=120.0, inputFile=None):
+        self.taskQueue = TaskQueue(timeout, os.path.abspath(inputFile) if inputFile else None)
+        
+        # Each broker has its own manager class, as the registry is shared by
+        # all instances of a class
+        taskQueue = self.taskQueue
+        manager = type('BrokerManager', (BaseManager,), {})
+        manager.register('getTaskQueue', callable=lambda: taskQueue, exposed=WORKER_METHODS)
+        self.server = manager(address=address, authkey=authkey).get_server()
+        host, port = self.server.address
+        self.address = (host, port)
+        localAddress = ('localhost' if host in ['', '0.0.0.0'] else host, port)
+        
+        # Start the local workers before any threads, so that the forked
+        # processes do not inherit locks held by the threads; they wait in
+        # the listen backlog until the server starts
+        self.workers = []
+        for n in range(processes):
+            worker = multiprocessing.Process(target=runWorker, args=(localAddress, authkey))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        
+        for target in [self.server.serve_forever, self.monitor]:
+            thread = threading.Thread(target=target, name='broker')
+            thread.daemon = True
+            thread.start()
+    
+    def monitor(self):
+        """
+        Periodically drop the workers that have not been heard from for
+        longer than the timeout, until the broker is closed.
+        """
+        while not self.taskQueue.closing:
+            time.sleep(min(self.taskQueue.getHeartbeatInterval(), 1.0))
+            self.taskQueue.removeSilentWorkers()
+    
+    def apply_async(self, function, args=()):
+        """
+        Submit a task that calls `function` with arguments `args`, returning
+        an :class:`AsyncResult`.
+        """
+        return self.taskQueue.addTask(function, args)
+    
+    def apply(self, function, args=()):
+        """
+        Call `function` with arguments `args` on a worker, blocking until it
+        has finished and returning its result.
+        """
+        return self.apply_async(function, args).get()
+    
+    def close(self):
+        """
+        Stop serving tasks; the workers exit once they have finished their
+        current tasks.
+        """
+        self.taskQueue.close()
+    
+    def terminate(self):
+        """
+        Stop serving tasks and terminate the local workers immediately.
+        """
+        self.close()
+        for worker in self.workers:
+            worker.terminate()
+    
+    def join(self):
+        """
+        Wait for the local workers to exit, and give the remote workers a
+        short while to notice that the broker is closing and leave.
+        """
+        for worker in self.workers:
+            worker.join()
+        deadline = time.time() + self.taskQueue.getHeartbeatInterval()
+        while self.taskQueue.getWorkerCount() > 0 and time.time() < deadline:
+            time.sleep(0.1)
+
+################################################################################
+
+class BrokerClient(BaseManager):
+    """
+    The manager used by a worker to connect to a :class:`Broker`.
+    """
+    pass
+
+BrokerClient.register('getTaskQueue')
+
+def connectToBroker(address, authkey, timeout=60.0):
+    """
+    Connect to the broker at `address`, a ``(host, port)`` tuple, using the
+    given `authkey`, returning a proxy for its task queue. Connection errors
+    are retried for up to `timeout` seconds, so that workers may be started
+    before the broker.
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            manager = BrokerClient(address=address, authkey=authkey)
+            manager.connect()
+            return manager.getTaskQueue()
+        except (socket.error, EOFError, IOError):
+            if time.time() > deadline:
+                raise
+            time.sleep(1.0)
+
+def runWorker(address, authkey, inputFile=None):
+    """
+    Run a worker process, which connects to the broker at `address`, a
+    ``(host, port)`` tuple, using the given `authkey`, and runs tasks from its
+    queue until the broker is closed or can no longer be reached. The
+    potential energy surface is loaded from `inputFile` if given, or else from
+    the input file named by the broker (if any), unless it is already
+    available (as in a local worker forked from the broker process).
+    """
+    import rpmdrate.input
+    from rpmdrate._main import random_init_seed
+    
+    try:
+        taskQueue = connectToBroker(address, authkey)
+    except (socket.error, EOFError, IOError):
+        logging.error('Unable to connect to the broker at {0}:{1:d}.'.format(*address))
+        return
+    description = '{0}:{1:d}'.format(socket.gethostname(), os.getpid())
+    
+    if rpmdrate.input.getPotential is None:
+        path = inputFile or taskQueue.getInputFile()
+        if path is not None:
+            rpmdrate.input.loadInputFile(path, 300.0, 1)
+    
+    # Each worker needs its own stream of random numbers
+    random_init_seed((os.getpid() * 1000003 + hash(socket.gethostname()) + int(time.time())) % 2147483647)
+    
+    state = {'workerId': taskQueue.join(description), 'done': False}
+    interval = taskQueue.getHeartbeatInterval()
+    
+    def sendHeartbeats():
+        # The proxy opens a separate connection for this thread
+        while not state['done']:
+            time.sleep(interval)
+            try:
+                taskQueue.heartbeat(state['workerId'])
+            except Exception:
+                return
+    thread = threading.Thread(target=sendHeartbeats, name='heartbeat')
+    thread.daemon = True
+    thread.start()
+    
+    try:
+        while True:
+            try:
+                task = taskQueue.getTask(state['workerId'], 1.0)
+                if task is None:
+                    if taskQueue.isClosing():
+                        break
+                    elif not taskQueue.heartbeat(state['workerId']):
+                        # We were dropped after falling silent, so join again
+                        state['workerId'] = taskQueue.join(description)
+                    continue
+            except (socket.error, EOFError, IOError):
+                logging.warning('Lost connection to the broker at {0}:{1:d}.'.format(*address))
+                return
+            taskId, function, args = task
+            try:
+                value, error = function(*args), None
+            except Exception:
+                value, error = None, traceback.format_exc()
+            try:
+                taskQueue.putResult(state['workerId'], taskId, value, error)
+            except (socket.error, EOFError, IOError):
+                logging.warning('Lost connection to the broker at {0}:{1:d}.'.format(*address))
+                return
+    finally:
+        state['done'] = True
+    
+    try:
+        taskQueue.leave(state['workerId'])
+    except (socket.error, EOFError, IOError):
+        pass
+
+def parseAddress(value):
+    """
+    Parse a broker address of the form ``[HOST:]PORT`` into a ``(host, port)``
+    tuple; an empty host means all interfaces.
+    """
+    host, separator, port = value.rpartition(':')
+    return (host, int(port))
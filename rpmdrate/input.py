@@ -38,6 +38,7 @@ import sys
 import numpy
 import logging
 
+from .element import atomicMass
 from .surface import *
 from .thermostat import *
 from .main import *
@@ -58,6 +59,8 @@ transitionState = None
 equivalentTransitionStates = []
 thermostat = None
 jobList = []
+isotopologues = []
+trajectoryRecording = None
 
 def setReactants(atoms, reactant1Atoms, reactant2Atoms, Rinf):
     global reactants
@@ -71,25 +74,41 @@ def addEquivalentTransitionState(formingBonds, breakingBonds):
     global equivalentTransitionStates
     equivalentTransitionStates.append([formingBonds, breakingBonds])
 
+def addIsotopologue(label, substitutions):
+    global isotopologues
+    isotopologues.append([label, substitutions])
+
 def setThermostat(type, **kwargs):
     global thermostat
     thermostat = [type, kwargs]
 
-def generateUmbrellaConfigurations(dt, evolutionTime, xi_list, kforce):
+def setTrajectoryRecording(stride=10, centroids=False, compress=False):
+    global trajectoryRecording
+    trajectoryRecording = [stride, centroids, compress]
+
+def generateUmbrellaConfigurations(dt, evolutionTime, xi_list, kforce, stride=1):
+    global jobList
+    jobList.append(['configurations', (dt, evolutionTime, xi_list, kforce, stride)])
+
+def refineUmbrellaWindows(dt, windows, pilotTime, maxSeparation=3.0, maxIterations=4):
     global jobList
-    jobList.append(['configurations', (dt, evolutionTime, xi_list, kforce)])
+    jobList.append(['windows', (dt, windows, pilotTime, maxSeparation, maxIterations)])
 
-def conductUmbrellaSampling(dt, windows, saveTrajectories=False):
+def conductUmbrellaSampling(dt, windows, saveTrajectories=False, staticFactorError=None, minTrajectories=4):
     global jobList
-    jobList.append(['umbrella', (dt, windows, saveTrajectories)])
+    jobList.append(['umbrella', (dt, windows, saveTrajectories, staticFactorError, minTrajectories)])
+
+def reweightUmbrellaSampling(windows, T0, xi_min=None, xi_max=None, bins=5000):
+    global jobList
+    jobList.append(['reweight', (windows, T0, xi_min, xi_max, bins)])
 
 def computePotentialOfMeanForce(windows=None, xi_min=None, xi_max=None, bins=5000):
     global jobList
     jobList.append(['PMF', (windows, xi_min, xi_max, bins)])
 
-def computeRecrossingFactor(dt, equilibrationTime, childTrajectories, childSamplingTime, childrenPerSampling, childEvolutionTime, xi_current=None, saveParentTrajectory=False, saveChildTrajectories=False):
+def computeRecrossingFactor(dt, equilibrationTime, childTrajectories, childSamplingTime, childrenPerSampling, childEvolutionTime, xi_current=None, saveParentTrajectory=False, saveChildTrajectories=False, recrossingFactorError=None, xi_commit=None, childCommitmentTime=None):
     global jobList
-    jobList.append(['recrossing', (dt, equilibrationTime, childTrajectories, childSamplingTime, childrenPerSampling, childEvolutionTime, xi_current, saveParentTrajectory, saveChildTrajectories)])
+    jobList.append(['recrossing', (dt, equilibrationTime, childTrajectories, childSamplingTime, childrenPerSampling, childEvolutionTime, xi_current, saveParentTrajectory, saveChildTrajectories, recrossingFactorError, xi_commit, childCommitmentTime)])
 
 def computeRateCoefficient():
     global jobList
@@ -102,11 +121,15 @@ def potential(q):
 
 ################################################################################
 
-def loadInputFile(path, T, Nbeads, processes=1):
+def loadInputFile(path, T, Nbeads, processes=1, isotopologue=None):
     """
-    Load the RPMD input file located at `path`.
+    Load the RPMD input file located at `path`. If the label of an
+    `isotopologue` defined in the input file is given, the atoms are
+    substituted accordingly, and the output is saved to a subdirectory named
+    after the isotopologue; the umbrella configurations, which do not depend
+    on the masses, are still shared with the parent isotopologue.
     """
-    global reactants, transitionState, equivalentTransitionStates, thermostat, jobList, getPotential
+    global reactants, transitionState, equivalentTransitionStates, thermostat, jobList, isotopologues, trajectoryRecording, getPotential
     
     logging.info('Reading input file {0!r}...'.format(path))
     
@@ -115,6 +138,8 @@ def loadInputFile(path, T, Nbeads, processes=1):
     equivalentTransitionStates = []
     thermostat = None
     jobList = []
+    isotopologues = []
+    trajectoryRecording = None
     
     errorList = []
     
@@ -124,8 +149,12 @@ def loadInputFile(path, T, Nbeads, processes=1):
         'transitionState': setTransitionState,
         'equivalentTransitionState': addEquivalentTransitionState,
         'thermostat': setThermostat,
+        'isotopologue': addIsotopologue,
+        'trajectoryRecording': setTrajectoryRecording,
         'generateUmbrellaConfigurations': generateUmbrellaConfigurations,
+        'refineUmbrellaWindows': refineUmbrellaWindows,
         'conductUmbrellaSampling': conductUmbrellaSampling,
+        'reweightUmbrellaSampling': reweightUmbrellaSampling,
         'computePotentialOfMeanForce': computePotentialOfMeanForce,
         'computeRecrossingFactor': computeRecrossingFactor,
         'computeRateCoefficient': computeRateCoefficient,
@@ -149,10 +178,21 @@ def loadInputFile(path, T, Nbeads, processes=1):
     getPotential = local_context.get('get_potential', None)
     initializePotential = local_context.get('initialize_potential', None)
     randomSeed = local_context.get('random_seed', None)
+    threadSafePotential = local_context.get('thread_safe_potential', False)
     
     if not getPotential:
         errorList.append('No potential energy surface supplied; you must specify a PES via the function get_potential().')
     
+    # A compiled potential is passed to the Fortran layer as a pointer (see
+    # RPMD.getPotentialCallback()); the pointer is attached to the wrapper
+    # function, which is itself passed to subprocesses by name
+    if hasattr(getPotential, '_cpointer'):
+        potential._cpointer = getPotential._cpointer
+    elif hasattr(potential, '_cpointer'):
+        del potential._cpointer
+    if threadSafePotential and not hasattr(potential, '_cpointer'):
+        errorList.append('Only a compiled potential (an f2py-wrapped Fortran routine) can be declared thread-safe via thread_safe_potential.')
+    
     if thermostat is None:
         errorList.append('No thermostat supplied; please provide a thermostat() block.')
     else:
@@ -178,6 +218,25 @@ def loadInputFile(path, T, Nbeads, processes=1):
         else:
             errorList.append('Invalid thermostat {0!r}; valid thermostats are Andersen and GLE.'.format(thermostatType))
     
+    if trajectoryRecording is not None:
+        stride = trajectoryRecording[0]
+        if not isinstance(stride, int) or stride < 1:
+            errorList.append('Invalid trajectory recording stride {0!r}; the stride must be a positive integer.'.format(stride))
+    
+    # Sanity checking of the isotopologues
+    labels = []
+    for label0, substitutions in isotopologues:
+        if label0 in labels:
+            errorList.append('Isotopologue {0!r} is defined more than once.'.format(label0))
+        labels.append(label0)
+        for index, atom in dict(substitutions).items():
+            if not 1 <= index <= len(reactants.atoms):
+                errorList.append('Invalid atom index {0} in isotopologue {1!r}.'.format(index, label0))
+            if atom not in atomicMass:
+                errorList.append('Invalid atom {0!r} in isotopologue {1!r}.'.format(atom, label0))
+    if isotopologue is not None and isotopologue not in labels:
+        errorList.append('Isotopologue {0!r} is not defined in the input file.'.format(isotopologue))
+    
     # Sanity checking of the specified breaking and forming bond pairs in the transition state
     Nbonds = transitionState.formingBonds.shape[0]
     if transitionState.breakingBonds.shape[0] != Nbonds:
@@ -225,6 +284,14 @@ def loadInputFile(path, T, Nbeads, processes=1):
     if errorList:
         raise InputError('The input file {0!r} was invalid:\n- {1}'.format(path, '\n- '.join(errorList)))
     
+    outputDirectory = os.path.dirname(path)
+    configurationsDirectory = outputDirectory
+    if isotopologue is not None:
+        substitutions = dict(isotopologues[labels.index(isotopologue)][1])
+        atoms = [substitutions.get(index + 1, atom) for index, atom in enumerate(reactants.atoms)]
+        reactants = Reactants(atoms, reactants.reactant1Atoms, reactants.reactant2Atoms, (reactants.Rinf,"bohr"))
+        outputDirectory = os.path.join(outputDirectory, isotopologue)
+    
     system = RPMD(
         label = label,
         T = T,
@@ -234,13 +301,37 @@ def loadInputFile(path, T, Nbeads, processes=1):
         potential = potential,
         thermostat = thermostat,
         processes = processes,
-        outputDirectory = os.path.dirname(path),
+        outputDirectory = outputDirectory,
         randomSeed = randomSeed,
+        configurationsDirectory = configurationsDirectory,
+        isotopologue = isotopologue,
     )
     for formingBonds, breakingBonds in equivalentTransitionStates:
         system.addEquivalentTransitionState(formingBonds, breakingBonds)
+    if trajectoryRecording is not None:
+        system.trajectoryStride, system.trajectoryCentroids, system.compressTrajectories = trajectoryRecording
+    system.threadSafePotential = bool(threadSafePotential)
     
     if initializePotential:
         initializePotential()
 
     return system, jobList
+
+def loadSystems(path, temperatures, beadCounts, processes=1):
+    """
+    Load the RPMD input file located at `path` once for each combination of
+    the given `temperatures` and numbers of beads `beadCounts`, and for each
+    isotopologue defined in the input file, as well as for the parent
+    isotopologue. Returns a list of ``(label, system, jobList)`` tuples
+    suitable for passing to :func:`rpmdrate.jobs.runSweep()`.
+    """
+    systems = []
+    for T in temperatures:
+        for Nbeads in beadCounts:
+            system, jobList = loadInputFile(path, T, Nbeads, processes)
+            labels = [label for label, substitutions in isotopologues]
+            systems.append(('{0:g} K, {1:d} beads'.format(T, Nbeads), system, jobList))
+            for isotopologue in labels:
+                system, jobList = loadInputFile(path, T, Nbeads, processes, isotopologue)
+                systems.append(('{0}, {1:g} K, {2:d} beads'.format(isotopologue, T, Nbeads), system, jobList))
+    return systems
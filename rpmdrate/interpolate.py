@@ -71,7 +71,7 @@ class LinearInterpolator(object):
             elif xdata[imid] > x:
                 imax = imid - 1
             else:
-                break
+                return ydata[imid]
         
         if imin > imax:
             y2 = ydata[imin]
@@ -123,7 +123,7 @@ class SemiLogXInterpolator(object):
             elif xdata[imid] > x:
                 imax = imid - 1
             else:
-                break
+                return ydata[imid]
         
         if imin > imax:
             y2 = ydata[imin]
@@ -173,7 +173,7 @@ class SemiLogYInterpolator(object):
             elif xdata[imid] > x:
                 imax = imid - 1
             else:
-                break
+                return math.exp(ydata[imid])
         
         if imin > imax:
             y2 = ydata[imin]
@@ -225,7 +225,7 @@ class LogLogInterpolator(object):
             elif xdata[imid] > x:
                 imax = imid - 1
             else:
-                break
+                return math.exp(ydata[imid])
         
         if imin > imax:
             y2 = ydata[imin]
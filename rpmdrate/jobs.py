@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This module contains functions for running the jobs requested in an RPMDrate
+input file. By default the jobs are run one after another in the order they
+appear in the input file. In pipelined mode, each job is instead started as
+soon as the jobs it depends on have finished, so that independent jobs (e.g.
+the umbrella sampling and the recrossing factor) run concurrently on the
+shared pool of subprocesses. Several RPMD systems (e.g. the same input file at
+a number of temperatures and numbers of beads) can also be run together as a
+sweep sharing a single pool.
+"""
+
+import os
+import copy
+import logging
+import sys
+import threading
+
+import rpmdrate.constants as constants
+
+################################################################################
+
+# The types of job that each type of job depends on
+jobDependencies = {
+    'configurations': [],
+    'windows': ['configurations'],
+    'umbrella': ['configurations', 'windows'],
+    'reweight': [],
+    'PMF': ['umbrella'],
+    'recrossing': ['configurations', 'PMF'],
+    'rate': ['PMF', 'recrossing'],
+}
+
+# The types of job that need the merged results of all of the shards, and so
+# are not run by a shard
+unshardedJobs = ['reweight', 'PMF', 'rate']
+
+################################################################################
+
+def runJob(system, job, params):
+    """
+    Run a single job of type `job` with parameters `params`, as read from the
+    input file, on the RPMD object `system`. If the system is running a shard
+    of the sampling, the jobs that need the results of all of the shards are
+    skipped.
+    """
+    if system.shard is not None and job in unshardedJobs:
+        logging.info('Skipping {0} job, which must be run after merging the shards.'.format(job))
+        logging.info('')
+    elif job == 'configurations':
+        dt, evolutionTime, xi_list, kforce, stride = params
+        system.generateUmbrellaConfigurations(dt, evolutionTime, xi_list, kforce, stride)
+    elif job == 'windows':
+        dt, windows, pilotTime, maxSeparation, maxIterations = params
+        system.refineUmbrellaWindows(dt, windows, pilotTime, maxSeparation, maxIterations)
+    elif job == 'umbrella':
+        dt, windows, saveTrajectories, staticFactorError, minTrajectories = params
+        system.conductUmbrellaSampling(dt, windows, saveTrajectories, staticFactorError, minTrajectories)
+    elif job == 'reweight':
+        windows, T0, xi_min, xi_max, bins = params
+        system.reweightUmbrellaSampling(windows, T0, xi_min, xi_max, bins)
+    elif job == 'PMF':
+        windows, xi_min, xi_max, bins = params
+        system.computePotentialOfMeanForce(windows, xi_min, xi_max, bins)
+    elif job == 'recrossing':
+        dt, equilibrationTime, childTrajectories, childSamplingTime, childrenPerSampling, childEvolutionTime, xi_current, saveParentTrajectory, saveChildTrajectories, recrossingFactorError, xi_commit, childCommitmentTime = params
+        system.computeRecrossingFactor(dt, equilibrationTime, childTrajectories, childSamplingTime, childrenPerSampling, childEvolutionTime, xi_current, saveParentTrajectory, saveChildTrajectories, recrossingFactorError, xi_commit, childCommitmentTime)
+    elif job == 'rate':
+        system.computeRateCoefficient()
+    else:
+        raise ValueError('Invalid job type {0!r}.'.format(job))
+
+def getJobDependencies(jobList):
+    """
+    Return a list containing, for each job in `jobList`, the indices of the
+    earlier jobs that must finish before that job can start. A job depends on
+    all earlier jobs of the same type and of the types it needs results from.
+    """
+    dependencies = []
+    for i, (job, params) in enumerate(jobList):
+        dependencies.append([j for j in range(i) if jobList[j][0] == job or jobList[j][0] in jobDependencies[job]])
+    return dependencies
+
+def runJobs(system, jobList, pipeline=False):
+    """
+    Run all of the jobs in `jobList` on the RPMD object `system`. If
+    `pipeline` is ``True``, the jobs are run as a pipeline; see
+    :class:`JobPipeline` for details. Otherwise the jobs are run in order.
+    """
+    if pipeline and system.getPool() is None:
+        logging.warning('Pipelined execution requires more than one process; running jobs in order instead.')
+        pipeline = False
+    elif pipeline and system.shard is not None:
+        logging.warning('Pipelined execution is not available when running a shard; running jobs in order instead.')
+        pipeline = False
+    
+    if pipeline:
+        JobPipeline(system, jobList).run()
+    else:
+        for job, params in jobList:
+            runJob(system, job, params)
+
+def runSweep(systems, pipeline=False):
+    """
+    Run the jobs for each of a list of `systems`, given as
+    ``(label, system, jobList)`` tuples, where `label` identifies the system
+    in the log (e.g. its temperature and number of beads). The umbrella
+    configurations are stored in the top-level output directory and do not
+    depend on temperature or number of beads, so the configuration jobs are
+    run first, one system at a time; usually only the first system generates
+    them and the others reuse them. The remaining jobs of each system are then
+    run in their own thread, with all of the systems sharing the pool of
+    subprocesses of the first system, so that trajectories from every
+    combination of temperature, number of beads and umbrella window are
+    drawn from the same queue. If only one process is used, the systems are
+    instead run one after another. If any system fails, the exception is
+    raised once the other systems have finished.
+    """
+    for label, system, jobList in systems:
+        for job, params in jobList:
+            if job == 'configurations':
+                runJob(system, job, params)
+    
+    remaining = [(label, system, [(job, params) for job, params in jobList if job != 'configurations'])
+        for label, system, jobList in systems]
+    
+    pool = systems[0][1].getPool()
+    if pool is None:
+        for label, system, jobList in remaining:
+            runJobs(system, jobList, pipeline)
+        return
+    
+    errors = []
+    def runSystem(system, jobList):
+        try:
+            runJobs(system, jobList, pipeline)
+        except Exception:
+            errors.append(sys.exc_info())
+    
+    logFilter = SweepLogFilter([label for label, system, jobList in remaining])
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(logFilter)
+    try:
+        threads = []
+        for label, system, jobList in remaining:
+            system.pool = pool
+            thread = threading.Thread(target=runSystem, args=(system, jobList), name=label)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            # Join with a timeout so that the main thread remains responsive
+            # to keyboard interrupts
+            while thread.is_alive():
+                thread.join(1.0)
+    finally:
+        for handler in logging.getLogger().handlers:
+            handler.removeFilter(logFilter)
+    
+    if errors:
+        exc_type, exc_value, exc_traceback = errors[0]
+        raise exc_type, exc_value, exc_traceback
+
+def saveKineticIsotopeEffects(path, systems):
+    """
+    Save the rate coefficients computed for each of the given RPMD `systems`,
+    grouped by temperature and number of beads, to `path` on disk, along with
+    the kinetic isotope effect of each isotopologue, i.e. the ratio of the
+    rate coefficient of the parent isotopologue to that of the isotopologue.
+    The results are also printed to the log.
+    """
+    fromAtomicUnits = 1e6 * ((5.2917721092e-11)**3 / 2.418884326505e-17) * constants.Na
+    
+    f = open(path, 'w')
+    
+    f.write('****************************\n')
+    f.write('RPMD kinetic isotope effects\n')
+    f.write('****************************\n\n')
+    
+    f.write('=========== =========== ==================== =============== ===============\n')
+    f.write('T (K)       Nbeads      isotopologue         k (cm^3/mol*s)  KIE\n')
+    f.write('=========== =========== ==================== =============== ===============\n')
+    
+    logging.info('Kinetic isotope effects:')
+    for system in systems:
+        if system.isotopologue is not None:
+            continue
+        group = [system] + [other for other in systems if other.isotopologue is not None and other.T == system.T and other.Nbeads == system.Nbeads]
+        for other in group:
+            label = other.isotopologue or 'parent'
+            if other.rateCoefficient is None:
+                f.write('{0:11g} {1:11d} {2:20s} {3:>15s} {4:>15s}\n'.format(other.T, other.Nbeads, label, 'n/a', 'n/a'))
+                continue
+            k = other.rateCoefficient * fromAtomicUnits
+            if system.rateCoefficient is None or other.rateCoefficient == 0:
+                kie = 'n/a'
+            else:
+                kie = '{0:15.6g}'.format(system.rateCoefficient / other.rateCoefficient)
+            f.write('{0:11g} {1:11d} {2:20s} {3:15.6g} {4:>15s}\n'.format(other.T, other.Nbeads, label, k, kie))
+            logging.info('    {0:g} K, {1:d} beads, {2}: k = {3:g} cm^3/(mol*s), KIE = {4}'.format(other.T, other.Nbeads, label, k, kie.strip()))
+    logging.info('')
+    
+    f.write('=========== =========== ==================== =============== ===============\n')
+    
+    f.flush()
+    os.fsync(f.fileno())
+    
+    f.close()
+
+################################################################################
+
+class SweepLogFilter(logging.Filter):
+    """
+    A log filter that prefixes each message logged while running a sweep
+    with the label of the system it came from, so that the interleaved
+    output of the systems can be told apart. Messages are attributed to a
+    system via the name of the thread that logged them; threads started by
+    a job pipeline are named after the thread that started them.
+    """
+    
+    def __init__(self, labels):
+        logging.Filter.__init__(self)
+        self.labels = set(labels)
+    
+    def filter(self, record):
+        label = record.threadName.split('/')[0]
+        if label in self.labels and not getattr(record, 'sweepLabel', None):
+            record.sweepLabel = label
+            record.msg = '[{0}] {1}'.format(label, record.msg)
+        return True
+
+################################################################################
+
+class JobPipeline:
+    """
+    A dependency-aware runner for a list of RPMDrate jobs. Each job is run in
+    its own thread as soon as the jobs it depends on have finished, with all
+    of the trajectories farmed out to the pool of subprocesses shared by the
+    RPMD object. The attributes are:
+    
+    =========================== ================================================
+    Attribute                   Description
+    =========================== ================================================
+    `system`                    The RPMD object to run the jobs on
+    `jobList`                   The list of jobs to run, as read from the input file
+    `dependencies`              The indices of the jobs that each job depends on
+    `started`                   The indices of the jobs that have been started
+    `finished`                  The indices of the jobs that have finished
+    `errors`                    The exception information for each job that failed
+    =========================== ================================================
+    
+    A recrossing factor job that does not specify `xi_current` normally has
+    to wait for the potential of mean force. In a pipeline it instead starts
+    as soon as the umbrella sampling has located the maximum of the potential
+    of mean force (see :meth:`RPMD.conductUmbrellaSampling()`), using that
+    location as `xi_current`. The recrossing factor is computed on a copy of
+    the RPMD object so that it does not interfere with the umbrella sampling;
+    its results are copied back when it finishes.
+    """
+    
+    def __init__(self, system, jobList):
+        self.system = system
+        self.jobList = jobList
+        self.dependencies = getJobDependencies(jobList)
+        self.started = set()
+        self.finished = set()
+        self.errors = []
+        self.condition = threading.Condition()
+    
+    def run(self):
+        """
+        Run all of the jobs, blocking until they have finished. If any job
+        fails, no further jobs are started and the exception is raised once
+        the running jobs have finished.
+        """
+        Njobs = len(self.jobList)
+        threads = []
+        
+        self.condition.acquire()
+        try:
+            while len(self.finished) < Njobs and not self.errors:
+                for i in range(Njobs):
+                    if i in self.started:
+                        continue
+                    params = self.getReadyParameters(i)
+                    if params is None:
+                        continue
+                    job = self.jobList[i][0]
+                    logging.debug('Starting {0} job (job {1:d} of {2:d}).'.format(job, i + 1, Njobs))
+                    self.started.add(i)
+                    name = '{0}/{1}'.format(threading.current_thread().name, job)
+                    thread = threading.Thread(target=self.runJob, args=(i, job, params), name=name)
+                    thread.daemon = True
+                    thread.start()
+                    threads.append(thread)
+                # Wake up periodically, since a job may also become ready due
+                # to progress within another job
+                self.condition.wait(1.0)
+        finally:
+            self.condition.release()
+        
+        for thread in threads:
+            thread.join()
+        
+        if self.errors:
+            exc_type, exc_value, exc_traceback = self.errors[0]
+            raise exc_type, exc_value, exc_traceback
+    
+    def getReadyParameters(self, i):
+        """
+        Return the parameters to use for the job at index `i` if it is ready
+        to start, or ``None`` if it is not.
+        """
+        job, params = self.jobList[i]
+        waiting = [j for j in self.dependencies[i] if j not in self.finished]
+        if len(waiting) == 0:
+            return params
+        
+        if job == 'recrossing' and all([self.jobList[j][0] == 'PMF' for j in waiting]):
+            # The recrossing factor only needs the location of the maximum of
+            # the potential of mean force, so it need not wait for the
+            # potential of mean force itself if that location is known
+            xi_current = params[6]
+            if xi_current is not None:
+                return params
+            elif self.system.xi_barrier is not None:
+                logging.info('Starting recrossing factor calculation at estimated maximum of potential of mean force xi = {0:.4f}.'.format(self.system.xi_barrier))
+                logging.info('')
+                return params[0:6] + (self.system.xi_barrier,) + params[7:]
+        
+        return None
+    
+    def runJob(self, i, job, params):
+        """
+        Run the job at index `i` of type `job` with the parameters `params`.
+        This is the target of each job thread.
+        """
+        try:
+            if job == 'recrossing':
+                # Use a copy of the RPMD object so that this job does not modify
+                # the attributes used by the other jobs; the copy shares the
+                # same pool of subprocesses
+                system = copy.copy(self.system)
+                system.pool = self.system.pool
+                runJob(system, job, params)
+                self.system.xi_current = system.xi_current
+                self.system.recrossingFactor = system.recrossingFactor
+            else:
+                runJob(self.system, job, params)
+        except Exception:
+            self.condition.acquire()
+            self.errors.append(sys.exc_info())
+            self.condition.notify()
+            self.condition.release()
+        else:
+            self.condition.acquire()
+            self.finished.add(i)
+            self.condition.notify()
+            self.condition.release()
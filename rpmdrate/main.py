@@ -33,14 +33,23 @@ import os
 import os.path
 import sys
 import math
+import time
 import numpy
+import select
+import signal
 import logging
+import threading
+import cPickle
+import traceback
 
 import rpmdrate.constants as constants
 import rpmdrate.quantity as quantity
+import rpmdrate.statistics as statistics
+import rpmdrate.profiling as profiling
 
 from rpmdrate._main import *
 from rpmdrate.surface import TransitionState
+from rpmdrate.trajectory import TrajectoryRecorder, getTrajectoryPath
 
 ################################################################################
 
@@ -51,57 +60,329 @@ class RPMDError(Exception):
     """
     pass
 
+class TrajectoryError(RPMDError):
+    """
+    An exception raised when an individual trajectory fails, e.g. because it
+    repeatedly became unphysical, or because the process running it crashed
+    or exceeded its time limit.
+    """
+    pass
+
+################################################################################
+
+# The Fortran layer holds the parameters of up to MAX_CONTEXTS active RPMD
+# systems at once, each in its own context; the main thread always uses the
+# first, while each other thread reserves one of the rest (see getContext())
+MAX_CONTEXTS = system.dt.shape[0]
+
+_contextLock = threading.Lock()
+_freeContexts = range(MAX_CONTEXTS, 1, -1)
+_threadContexts = threading.local()
+
+class ContextHandle:
+    """
+    A reservation of the context of the Fortran layer with index `index` for
+    the thread holding it. The context is made available to other threads
+    again when the handle is deleted, which happens when the thread exits.
+    """
+    
+    def __init__(self, index):
+        self.index = index
+    
+    def __del__(self):
+        with _contextLock:
+            _freeContexts.append(self.index)
+
+def getContext():
+    """
+    Return the index (starting from one) of the context of the Fortran layer
+    to be used by the current thread. The main thread always uses the first
+    context; any other thread reserves one of the rest the first time it asks,
+    and keeps it until it exits. An :class:`RPMDError` is raised if all of the
+    contexts are already reserved.
+    """
+    if threading.current_thread().name == 'MainThread':
+        return 1
+    handle = getattr(_threadContexts, 'handle', None)
+    if handle is None:
+        with _contextLock:
+            if not _freeContexts:
+                raise RPMDError('All {0:d} contexts of the Fortran layer are in use; use fewer threads.'.format(MAX_CONTEXTS))
+            handle = ContextHandle(_freeContexts.pop())
+        _threadContexts.handle = handle
+    return handle.index
+
 ################################################################################
 
-def runUmbrellaTrajectory(rpmd, xi_current, p, q, equilibrationSteps, evolutionSteps, kforce, xi_range, saveTrajectory):
+def runTrajectory(function, args):
+    """
+    Run the trajectory `function` with the given `args`, the first of which
+    must be the RPMD object, returning a tuple ``(value, error)``: either the
+    value returned by the function and ``None``, or ``None`` and a message
+    describing why the trajectory failed. If fault isolation is turned on for
+    the RPMD object, the trajectory is run in its own child process (see
+    :func:`runIsolated()`), so that a crash or hang in the potential only
+    loses this trajectory, rather than the process running it.
+    """
+    rpmd = args[0]
+    try:
+        if rpmd.isolateTrajectories and hasattr(os, 'fork'):
+            return runIsolated(function, args, rpmd.trajectoryTimeout), None
+        else:
+            return function(*args), None
+    except TrajectoryError, e:
+        return None, str(e)
+
+def runIsolated(function, args, timeout=None):
     """
-    Run an individual umbrella integration trajectory, returning the sum of the
-    first and second moments of the reaction coordinate at each time step.
+    Run `function` with the given `args` in a child process forked from this
+    one, returning its value. A :class:`TrajectoryError` is raised if the
+    child process crashes, exits without a result, raises an exception, or
+    runs for more than `timeout` seconds (if given), in which case it is
+    killed. The child process seeds its random number generator from that of
+    this process, so that successive children draw different numbers.
+    """
+    seed = int(random() * 2147483646) + 1
+    
+    fdRead, fdWrite = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # This is the child process, which must never return
+        try:
+            os.close(fdRead)
+            random_init_seed(seed)
+            try:
+                output = (function(*args), None)
+            except TrajectoryError, e:
+                output = (None, str(e))
+            except Exception:
+                output = (None, traceback.format_exc())
+            data = cPickle.dumps(output, cPickle.HIGHEST_PROTOCOL)
+            while data:
+                data = data[os.write(fdWrite, data):]
+        finally:
+            os._exit(0)
+    
+    # Read the result as it is written, so that the child never blocks on a
+    # full pipe
+    os.close(fdWrite)
+    deadline = time.time() + timeout if timeout else None
+    chunks = []
+    try:
+        while True:
+            wait = None if deadline is None else deadline - time.time()
+            if wait is not None and wait <= 0:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                raise TrajectoryError('Trajectory exceeded its time limit of {0:g} s and was killed.'.format(timeout))
+            if not select.select([fdRead], [], [], wait)[0]:
+                continue
+            chunk = os.read(fdRead, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(fdRead)
+    
+    pid, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        raise TrajectoryError('Trajectory process crashed with signal {0:d}.'.format(os.WTERMSIG(status)))
+    elif not chunks:
+        raise TrajectoryError('Trajectory process exited with status {0:d} without a result.'.format(os.WEXITSTATUS(status)))
+    value, error = cPickle.loads(''.join(chunks))
+    if error is not None:
+        raise TrajectoryError(error)
+    return value
+
+def getKernelProfile(startTime, steps, context=1):
+    """
+    Return the kernel profiling data accumulated in the given `context` of the
+    Fortran layer since the last call to :meth:`RPMD.activate()`, along with
+    the wall time since `startTime` and the given number of time steps taken,
+    for use with :class:`rpmdrate.profiling.KernelProfile`. If energy
+    monitoring is turned on, the energy monitoring data are appended. If both
+    profiling and energy monitoring are turned off, ``None`` is returned
+    instead.
+    """
+    c = context - 1
+    if system.profiling[c] == 0 and system.monitoring[c] == 0:
+        return None
+    profile = (time.time() - startTime, steps, system.profile_time[:,c].copy(), system.profile_calls[:,c].copy())
+    if system.monitoring[c] == 1:
+        profile += ((int(system.monitor_steps[c]), float(system.monitor_temperature[c]), int(system.monitor_trajectories[c]), float(system.monitor_drift[c]), float(system.monitor_max_drift[c])),)
+    return profile
+
+def runUmbrellaTrajectory(rpmd, xi_current, p, q, equilibrationSteps, evolutionSteps, kforce, xi_range, saveTrajectory, xi_hist_min=0.0, xi_hist_width=1.0, histogramBins=1, threads=1):
+    """
+    Run an individual umbrella integration trajectory, returning the sums of
+    the first and second moments of the reaction coordinate and the number of
+    samples in each segment of ``rpmd.segmentTime`` (see
+    :meth:`Window.getValidSegments()`), the final momenta and positions, the
+    histogram of the samples in each segment used for temperature reweighting
+    (see :meth:`Window.reweight()`), and the kernel profile (see
+    :func:`getKernelProfile()`). Each time the trajectory becomes unphysical,
+    it is rolled back to the last position checkpointed by the Fortran layer
+    (every ``rpmd.checkpointSteps`` steps, unless the reaction coordinate is
+    then in the outer half of `xi_range`) with freshly sampled momenta, and
+    continues from there, keeping the samples taken before the failure; a
+    failure during equilibration, or before the first checkpoint after it,
+    restarts the trajectory from `q` instead. A :class:`TrajectoryError` is
+    raised if the trajectory becomes unphysical more than ``rpmd.maxRetries``
+    times without taking a new checkpoint. If
+    `saveTrajectory` is the path of a trajectory file, the sampling part of
+    the trajectory is recorded to it (see :meth:`RPMD.getTrajectoryRecorder()`).
+    The trajectory runs on the given number of `threads` (see
+    :meth:`RPMD.getTrajectoryThreads()`).
     """
     if xi_range is None: xi_range = 0.0
-    rpmd.activate()
+    context = rpmd.activate(threads=threads)
+    potential = rpmd.getPotentialCallback()
+    equilibrate = rpmd.getPropagator('equilibrate')
+    umbrella_trajectory = rpmd.getPropagator('umbrella_trajectory')
+    startTime = time.time()
+    blockSteps = max(1, int(round(rpmd.segmentTime / rpmd.dt)))
+    blocks = max(1, evolutionSteps / blockSteps)
+    histogram = numpy.zeros((8,histogramBins,blocks), order='F')
+    dav = numpy.zeros(blocks)
+    dav2 = numpy.zeros(blocks)
+    dcount = numpy.zeros(blocks)
     steps = 0
+    totalSteps = 0
+    failures = 0
+    equilibrated = False
+    checkpointed = False
+    p1 = numpy.asfortranarray(p.copy())
+    q1 = numpy.asfortranarray(q.copy())
+    recorder = rpmd.getTrajectoryRecorder(saveTrajectory) if saveTrajectory else None
     while steps < evolutionSteps:
-        p1 = numpy.asfortranarray(p.copy())
-        q1 = numpy.asfortranarray(q.copy())
-        result = system.equilibrate(0, p1, q1, equilibrationSteps, xi_current, rpmd.potential, kforce, False, saveTrajectory)
-        if result != 0: continue
-        dav, dav2, actualSteps, result = system.umbrella_trajectory(0, p1, q1, evolutionSteps - steps, xi_current, rpmd.potential, kforce, xi_range, saveTrajectory)
-        steps += actualSteps
-        if result != 0: continue
+        if not equilibrated:
+            result = equilibrate(0, p1, q1, equilibrationSteps, xi_current, potential, kforce, False, False, context=context)
+            totalSteps += equilibrationSteps
+            equilibrated = (result == 0)
+            checkpointed = False
+        if equilibrated:
+            q_start = q1.copy()
+            q_checkpoint = numpy.asfortranarray(q1.copy())
+            if recorder: recorder.start(evolutionSteps - steps)
+            actualSteps, result = umbrella_trajectory(0, p1, q1, evolutionSteps - steps, xi_current, potential, kforce, xi_range, recorder is not None, xi_hist_min, xi_hist_width, histogram, q_checkpoint, rpmd.checkpointSteps,
+                steps, blockSteps, dav, dav2, dcount, context=context)
+            if recorder: recorder.stop()
+            steps += actualSteps
+            totalSteps += actualSteps
+            if not numpy.array_equal(q_checkpoint, q_start):
+                # The trajectory made progress past a new checkpoint
+                checkpointed = True
+                failures = 0
+        if result != 0:
+            failures += 1
+            if failures > rpmd.maxRetries:
+                if recorder: recorder.close()
+                raise TrajectoryError('Umbrella sampling trajectory at xi = {0:.4f} became unphysical {1:d} times in a row.'.format(xi_current, failures))
+            p1 = numpy.asfortranarray(rpmd.sampleMomentum())
+            if checkpointed:
+                q1 = q_checkpoint
+            else:
+                # The equilibrated position may itself be at the edge of the
+                # valid range, so equilibrate again rather than rolling back
+                equilibrated = False
+                q1 = numpy.asfortranarray(q.copy())
+    if recorder: recorder.close()
     
-    return dav, dav2, steps, p1, q1
+    return dav, dav2, dcount, p1, q1, histogram, getKernelProfile(startTime, totalSteps, context)
 
-def runRecrossingTrajectory(rpmd, xi_current, p, q, evolutionSteps, saveTrajectory):
+def runConfigurationTrajectory(rpmd, xi_current, p, q, evolutionSteps, kforce):
+    """
+    Run an individual single-bead equilibration trajectory used to generate
+    the umbrella configuration at `xi_current`, returning the final position
+    and the kernel profile.
+    """
+    context = rpmd.activate(Nbeads=1)
+    startTime = time.time()
+    result = rpmd.getPropagator('equilibrate')(0, p, q, evolutionSteps, xi_current, rpmd.getPotentialCallback(), kforce, False, False, context=context)
+    return q, getKernelProfile(startTime, evolutionSteps, context)
+
+def runParentTrajectory(rpmd, xi_current, p, q, evolutionSteps, saveTrajectory, threads=1):
+    """
+    Evolve the recrossing factor parent trajectory, which is constrained to
+    the dividing surface at `xi_current`, for the given number of time steps
+    on the given number of `threads`, returning the result code along with
+    the final momentum and position and the kernel profile. If
+    `saveTrajectory` is the path of a trajectory file, the trajectory is
+    appended to it.
+    """
+    context = rpmd.activate(threads=threads)
+    startTime = time.time()
+    recorder = rpmd.getTrajectoryRecorder(saveTrajectory) if saveTrajectory else None
+    if recorder: recorder.start(evolutionSteps)
+    result = rpmd.getPropagator('equilibrate')(0, p, q, evolutionSteps, xi_current, rpmd.getPotentialCallback(), 0.0, True, recorder is not None, context=context)
+    if recorder:
+        recorder.stop()
+        recorder.close()
+    return result, p, q, getKernelProfile(startTime, evolutionSteps, context)
+
+def runRecrossingTrajectory(rpmd, xi_current, p, q, evolutionSteps, saveTrajectory, xi_commit=0.0, commitSteps=1, threads=1):
     """
     Run an individual pair of recrossing factor child trajectories, returning
     the contributions to the numerator and denominator of the recrossing factor
-    from this trajectory pair. We use pairs of trajectories so that we always
+    from this trajectory pair, along with the total number of time steps
+    actually taken and the kernel profile. We use pairs of trajectories so that we always
     sample in the positive and negative directions of the initial sampled
-    momenta.
+    momenta. A trajectory whose reaction coordinate remains more than
+    `xi_commit` from `xi_current` for `commitSteps` consecutive steps is
+    stopped early, as it can no longer recross the dividing surface. If
+    either trajectory becomes unphysical, the pair is run again with freshly
+    sampled momenta; a :class:`TrajectoryError` is raised if this happens
+    more than ``rpmd.maxRetries`` times. If `saveTrajectory` is the path of a
+    trajectory file, both trajectories are recorded to it, one after the
+    other. The trajectories run on the given number of `threads`.
     """
-    rpmd.activate()
-    result1 = 1; result2 = 1
-    while result1 != 0 or result2 != 0:
+    context = rpmd.activate(threads=threads)
+    potential = rpmd.getPotentialCallback()
+    recrossing_trajectory = rpmd.getPropagator('recrossing_trajectory')
+    startTime = time.time()
+    recorder = rpmd.getTrajectoryRecorder(saveTrajectory) if saveTrajectory else None
+    failures = 0
+    while True:
         # Trajectory for the negative of the sampled momenta
         t1 = numpy.array(0.0, order='F')
         p1 = (-p).copy('F')
         q1 = q.copy('F')
         kappa_num1 = numpy.zeros(evolutionSteps, order='F')
         kappa_denom1 = numpy.array(0.0, order='F')
-        result1 = system.recrossing_trajectory(t1, p1, q1, xi_current, rpmd.potential, saveTrajectory, kappa_num1, kappa_denom1)
-        if result1 != 0: continue
-
-        # Trajectory for the positive of the sampled momenta
-        t2 = numpy.array(0.0, order='F')
-        p2 = p.copy('F')
-        q2 = q.copy('F')
-        kappa_num2 = numpy.zeros(evolutionSteps, order='F')
-        kappa_denom2 = numpy.array(0.0, order='F')
-        result2 = system.recrossing_trajectory(t2, p2, q2, xi_current, rpmd.potential, saveTrajectory, kappa_num2, kappa_denom2)
-        if result2 != 0: continue
+        if recorder: recorder.start(evolutionSteps)
+        steps1, result1 = recrossing_trajectory(t1, p1, q1, xi_current, potential, recorder is not None, kappa_num1, kappa_denom1, xi_commit, commitSteps, context=context)
+        if recorder: recorder.stop()
+        
+        if result1 == 0:
+            # Trajectory for the positive of the sampled momenta
+            t2 = numpy.array(0.0, order='F')
+            p2 = p.copy('F')
+            q2 = q.copy('F')
+            kappa_num2 = numpy.zeros(evolutionSteps, order='F')
+            kappa_denom2 = numpy.array(0.0, order='F')
+            if recorder: recorder.start(evolutionSteps)
+            steps2, result2 = recrossing_trajectory(t2, p2, q2, xi_current, potential, recorder is not None, kappa_num2, kappa_denom2, xi_commit, commitSteps, context=context)
+            if recorder: recorder.stop()
+            if result2 == 0:
+                break
+        
+        failures += 1
+        if failures > rpmd.maxRetries:
+            if recorder: recorder.close()
+            raise TrajectoryError('Recrossing factor child trajectory became unphysical {0:d} times.'.format(failures))
+        p = rpmd.sampleMomentum()
+    if recorder: recorder.close()
     
-    return kappa_num1 + kappa_num2, kappa_denom1 + kappa_denom2
+    return kappa_num1 + kappa_num2, kappa_denom1 + kappa_denom2, steps1 + steps2, getKernelProfile(startTime, steps1 + steps2, context)
+
+def seedWorker(shard):
+    """
+    Seed the random number generator of a subprocess in the pool, so that the
+    subprocesses of each `shard` of a calculation draw from their own streams
+    of random numbers rather than from the state inherited from the parent.
+    """
+    index, count = shard
+    random_init_seed(((int(time.time()) * count + index) * 2654435761 + os.getpid()) % 2147483647)
 
 ################################################################################
 
@@ -123,8 +404,17 @@ class Window:
     `count`                     The number of samples taken
     `av`                        The mean of the reaction coordinate times the number of samples
     `av2`                       The variance of the reaction coordinate times the number of samples
+    `blockCount`                The number of samples taken in each trajectory
+    `blockAv`                   The contribution of each trajectory to `av`
+    `blockAv2`                  The contribution of each trajectory to `av2`
+    `histogram`                 The histogram of the samples used for temperature reweighting
+    `histogramMin`              The lower bound of the reaction coordinate in `histogram`
+    `histogramWidth`            The width of each bin in `histogram`
+    `histogramTrajectories`     The number of trajectories that contributed to `histogram`
     =========================== ================================================    
     
+    When umbrella sampling is run in adaptive mode, `trajectories` is the
+    maximum number of trajectories to run for this window.
     """
     
     def __init__(self, xi=None, kforce=None, trajectories=None, equilibrationTime=None, evolutionTime=None, xi_range=None):
@@ -146,6 +436,227 @@ class Window:
         self.count = 0
         self.av = 0.0
         self.av2 = 0.0
+        self.blockCount = []
+        self.blockAv = []
+        self.blockAv2 = []
+        self.histogram = None
+        self.histogramMin = 0.0
+        self.histogramWidth = 1.0
+        self.histogramTrajectories = 0
+
+    def copy(self, xi=None, kforce=None):
+        """
+        Return a new window with the same sampling parameters as this window,
+        but centered at `xi` and with force constant `kforce` if these are
+        given. The samples taken in this window are not copied.
+        """
+        window = Window(xi=self.xi if xi is None else xi, kforce=self.kforce if kforce is None else kforce, trajectories=self.trajectories, xi_range=self.xi_range)
+        window.equilibrationTime = self.equilibrationTime
+        window.evolutionTime = self.evolutionTime
+        return window
+
+    def initializeHistogram(self, beta, bins=100):
+        """
+        Set up an empty histogram of the samples in this window at reciprocal
+        temperature `beta` using the given number of `bins`. The histogram
+        extends to `xi_range` on either side of the center of the window if
+        this is given, or otherwise to eight times the width expected from the
+        umbrella potential alone.
+        """
+        if self.xi_range:
+            halfWidth = self.xi_range
+        else:
+            halfWidth = 8.0 / math.sqrt(beta * self.kforce)
+        self.histogram = numpy.zeros((8,bins), order='F')
+        self.histogramMin = self.xi - halfWidth
+        self.histogramWidth = 2.0 * halfWidth / bins
+        self.histogramTrajectories = 0
+
+    def addSamples(self, av, av2, count, histogram=None):
+        """
+        Add the results of one umbrella sampling trajectory, consisting of the
+        sums of the reaction coordinate `av` and its square `av2` over `count`
+        samples, to this window. The corresponding `histogram` of the samples,
+        if given, is added to that of this window.
+        """
+        self.av += av
+        self.av2 += av2
+        self.count += count
+        if count > 0:
+            self.blockAv.append(av)
+            self.blockAv2.append(av2)
+            self.blockCount.append(count)
+        if histogram is not None and self.histogram is not None:
+            self.histogram += histogram
+            self.histogramTrajectories += 1
+
+    def getValidSegments(self, av, av2, count):
+        """
+        Return a boolean array indicating which segments of an umbrella
+        sampling trajectory, given by the sums of the reaction coordinate `av`
+        and its square `av2` over the `count` samples in each segment, are
+        valid. A segment is invalid if the variance of its samples about the
+        mean of the reference distribution differs from the variance of that
+        distribution by more than half a decade, which occurs when the
+        trajectory jumps to a new region of the PES which is not a very good
+        fit. The reference distribution is that of the samples already in
+        this window, or the median over the segments if there are none yet.
+        Segments without samples are never valid.
+        """
+        av = numpy.asarray(av, numpy.float64)
+        av2 = numpy.asarray(av2, numpy.float64)
+        count = numpy.asarray(count, numpy.float64)
+        valid = count > 0
+        if not valid.any():
+            return valid
+        
+        mean = av[valid] / count[valid]
+        if self.count > 0:
+            mean0 = self.av / self.count
+            variance0 = self.av2 / self.count - mean0 * mean0
+        else:
+            mean0 = numpy.median(mean)
+            variance0 = numpy.median(av2[valid] / count[valid] - mean * mean)
+        
+        # The variance of each segment about the reference mean, which also
+        # picks up a segment whose mean has shifted
+        variance = av2[valid] / count[valid] - 2 * mean0 * mean + mean0 * mean0
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            jump = numpy.abs(numpy.log10(variance / variance0))
+        valid[valid] = jump <= 0.5
+        return valid
+
+    def reweight(self, beta0, beta, Nbeads):
+        """
+        Return a copy of this window containing an estimate of the samples that
+        would have been obtained at reciprocal temperature `beta`, obtained by
+        reweighting the histogram of the samples taken at reciprocal
+        temperature `beta0` with `Nbeads` beads. The ring polymer distribution
+        is proportional to :math:`\\exp(-\\beta U - N S / \\beta)`, where
+        :math:`U` is the bead-averaged potential and :math:`S` the spring
+        energy, so each sample has a weight :math:`\\exp(-X)` with
+        :math:`X = (\\beta - \\beta_0) U + N (1/\\beta - 1/\\beta_0) S`. The
+        average weight in each bin of the histogram is estimated using the
+        second-order cumulant expansion
+        :math:`\\ln \\left< e^{-X} \\right> \\approx -\\left< X \\right> + \\frac{1}{2} \\mathrm{var}(X)`.
+        The count of the returned window is the Kish effective sample size
+        of the reweighted samples.
+        """
+        histogram = self.histogram[:,self.histogram[0,:] > 0]
+        n, xi_sum, xi2_sum, U_sum, S_sum, U2_sum, S2_sum, US_sum = histogram
+        U_mean = U_sum / n
+        S_mean = S_sum / n
+        U_var = U2_sum / n - U_mean * U_mean
+        S_var = S2_sum / n - S_mean * S_mean
+        US_cov = US_sum / n - U_mean * S_mean
+        
+        a = beta - beta0
+        b = Nbeads * (1.0 / beta - 1.0 / beta0)
+        logW = -(a * U_mean + b * S_mean) + 0.5 * (a * a * U_var + b * b * S_var + 2 * a * b * US_cov)
+        W = numpy.exp(logW - numpy.max(logW))
+        
+        weight = numpy.sum(n * W)
+        ess = weight * weight / numpy.sum(n * W * W)
+        
+        window = self.copy()
+        window.count = ess
+        window.av = numpy.sum(W * xi_sum) / weight * ess
+        window.av2 = numpy.sum(W * xi2_sum) / weight * ess
+        return window
+
+    def getMeanForce(self, beta):
+        """
+        Return the mean force :math:`dA/d\\xi` at the center of this window,
+        as determined by umbrella integration using the samples in this window
+        alone, and its standard error. The error is estimated from the
+        scatter in the mean reaction coordinate of each trajectory, which are
+        treated as independent blocks.
+        """
+        if self.count == 0:
+            return 0.0, float('inf')
+        xi_mean = self.av / self.count
+        xi_var = self.av2 / self.count - xi_mean * xi_mean
+        dA = (self.xi - xi_mean) / (beta * xi_var)
+        blockMeans = numpy.array(self.blockAv) / numpy.array(self.blockCount)
+        error = statistics.getBlockStandardError(blockMeans, self.blockCount) / (beta * xi_var)
+        return dA, error
+
+def checkWindowOverlap(windows, pilotStatistics, maxSeparation):
+    """
+    Check the overlap of the distributions of the reaction coordinate in each
+    pair of neighboring umbrella sampling `windows`, sorted by their centers,
+    given a dict `pilotStatistics` of the mean and variance sampled in each
+    window. A pair fails if the means are more than `maxSeparation` times the
+    average of the standard deviations apart. If either window of a failing
+    pair has drifted more than one standard deviation from its center, it
+    should be stiffened; otherwise a new window is proposed halfway between
+    the pair. Returns the number of failing pairs, the list of windows to
+    stiffen, and the list of new windows.
+    """
+    failures = 0
+    stiffWindows = []
+    newWindows = []
+    for window1, window2 in zip(windows[:-1], windows[1:]):
+        xi_mean1, xi_var1 = pilotStatistics[window1]
+        xi_mean2, xi_var2 = pilotStatistics[window2]
+        sigma1 = math.sqrt(max(xi_var1, 0.0))
+        sigma2 = math.sqrt(max(xi_var2, 0.0))
+        if abs(xi_mean2 - xi_mean1) <= maxSeparation * 0.5 * (sigma1 + sigma2):
+            continue
+        failures += 1
+        
+        # A window whose sampling has drifted far from its center needs
+        # a stiffer force constant; otherwise the windows are simply
+        # too far apart, so insert a new window between them
+        drifted = False
+        for window, xi_mean, sigma in [(window1, xi_mean1, sigma1), (window2, xi_mean2, sigma2)]:
+            if abs(xi_mean - window.xi) > sigma:
+                drifted = True
+                if window not in stiffWindows:
+                    stiffWindows.append(window)
+        if drifted:
+            continue
+        
+        xi = round(0.5 * (window1.xi + window2.xi), 4)
+        if xi - window1.xi < 0.001:
+            logging.warning('Unable to improve the overlap between the windows at xi = {0:.4f} and xi = {1:.4f}.'.format(window1.xi, window2.xi))
+        else:
+            newWindows.append(window1.copy(xi=xi, kforce=0.5 * (window1.kforce + window2.kforce)))
+    
+    return failures, stiffWindows, newWindows
+
+def getConfigurationSchedule(xi_sources, xi_list, stride=1):
+    """
+    Return the order in which to generate the umbrella configurations at each
+    value of the reaction coordinate in `xi_list`, starting from existing
+    configurations at each value in `xi_sources`. The configurations form
+    chains, each generated in turn from the nearest configuration that is
+    available (existing or generated). If a `stride` greater than one is
+    given, only every `stride`-th configuration along a chain is generated
+    in sequence; the ones in between are started from the last of these (or
+    from the existing configuration at the start of the chain), so that they
+    can be generated concurrently. Returns a list of ``(l, n, serial)``
+    tuples in the order of generation, where `l` is the index into `xi_list`
+    of the configuration to generate, `n` is the configuration to start from,
+    as an index into `xi_sources` or the length of `xi_sources` plus an index
+    into `xi_list`, and `serial` is ``True`` if configurations further along
+    the chain may start from this one, so it must be generated in sequence.
+    """
+    Nsources = len(xi_sources)
+    xi_all = list(xi_sources) + list(xi_list)
+    chains = dict([(n, [n]) for n in range(Nsources)])
+    available = range(Nsources)
+    missing = range(len(xi_list))
+    schedule = []
+    while len(missing) > 0:
+        distance, l, n = min([(abs(xi_all[n] - xi_list[l]), l, n) for l in missing for n in available])
+        missing.remove(l)
+        chain = chains[n] + [Nsources + l]
+        chains[Nsources + l] = chain
+        depth = len(chain) - 1
+        schedule.append((l, chain[stride * ((depth - 1) / stride)], depth % stride == 0))
+        available.append(Nsources + l)
+    return schedule
 
 ################################################################################
 
@@ -162,17 +673,37 @@ class RPMD:
     `reactants`                 The dividing surface near the reactants, as a :class:`Reactants` object
     `transitionStates`          The dividing surface(s) near the transition state, as a list of :class:`TransitionState` objects
     `potential`                 A function that computes the potential and forces for a given position
+    `outputDirectory`           The directory in which the output files are saved, in subdirectories by temperature and number of beads
+    `configurationsDirectory`   The directory in which the umbrella configurations are saved (the output directory by default)
+    `isotopologue`              The label of the isotopologue this job is for, if any
     --------------------------- ------------------------------------------------
     `beta`                      The reciprocal temperature of the RPMD simulation
     `dt`                        The time step to use in the RPMD simulation
     `Nbeads`                    The number of beads per atom in the RPMD simulation
     `xi_current`                The current value of the reaction coordinate
+    `xi_barrier`                An estimate of the location of the maximum of the potential of mean force made during umbrella sampling
     `mode`                      A flag indicating the type of RPMD calculation currently underway (1 = umbrella, 2 = recrossing)
+    `pool`                      The pool of subprocesses shared by all parallel calculations, if any
+    `threadPool`                ``True`` to run the trajectories of parallel calculations on a pool of threads in this process instead of subprocesses
+    `profiling`                 ``True`` to time the kernels in the Fortran layer and summarize them in the log for each stage
+    `monitorEnergy`             ``True`` to monitor the kinetic temperature and energy drift of the trajectories and summarize them in the log for each stage
+    `threads`                   The number of threads each process may run trajectories on, or ``None`` to run each trajectory on a single thread
+    `threadSafePotential`       ``True`` if the potential is a compiled routine that can be evaluated for several beads at once on separate threads
+    `shard`                     The shard of the sampling run by this job as an ``(index, count)`` tuple, or ``None`` to run all of it
+    `isolateTrajectories`       ``True`` to run each trajectory in its own child process, so that a crash in the potential only loses that trajectory
+    `trajectoryTimeout`         The wall time in seconds after which an isolated trajectory is killed, or ``None`` for no limit
+    `maxRetries`                The number of times a failed trajectory is run again with fresh momenta before giving up
+    `segmentTime`               The length of the segments of umbrella sampling trajectories that are checked for outliers separately
+    `trajectoryStride`          The number of time steps between the frames of saved trajectories
+    `trajectoryCentroids`       ``True`` to save only the centroids of saved trajectories, ``False`` to save all of the beads
+    `compressTrajectories`      ``True`` to compress saved trajectories using gzip
+    `checkpointSteps`           The number of time steps between the checkpoints an umbrella sampling trajectory is rolled back to when it becomes unphysical
+    `rateCoefficient`           The computed RPMD rate coefficient in atomic units, if any
     =========================== ================================================
     
     """
 
-    def __init__(self, label, T, Nbeads, reactants, transitionState, potential, thermostat, processes=1, outputDirectory='.', randomSeed=None):
+    def __init__(self, label, T, Nbeads, reactants, transitionState, potential, thermostat, processes=1, outputDirectory='.', randomSeed=None, configurationsDirectory=None, isotopologue=None):
         """
         Initialize an RPMD object. The `mass` of each atom should be given in
         g/mol, while the `Rinf` value should be given in angstroms. (They will
@@ -189,17 +720,186 @@ class RPMD:
         self.thermostat = thermostat
         self.processes = processes
         self.outputDirectory = os.path.abspath(outputDirectory)
+        self.configurationsDirectory = os.path.abspath(configurationsDirectory or outputDirectory)
+        self.isotopologue = isotopologue
         self.randomSeed = randomSeed
         
         self.beta = 4.35974417e-18 / (constants.kB * self.T)
         self.dt = 0
         self.xi_current = 0
+        self.xi_barrier = None
         self.mode = 0
+        self.profiling = False
+        self.monitorEnergy = False
+        self.threads = None
+        self.threadSafePotential = False
+        self.shard = None
+        self.isolateTrajectories = False
+        self.trajectoryTimeout = None
+        self.maxRetries = 10
+        self.checkpointSteps = 100
+        self.segmentTime = 1.0 / 2.418884326505e-5
+        self.trajectoryStride = 10
+        self.trajectoryCentroids = False
+        self.compressTrajectories = False
+        
+        self.pool = None
+        self.threadPool = False
         
         self.umbrellaConfigurations = None
+        self.umbrellaConfigurationParameters = None
         self.umbrellaWindows = None
         self.potentialOfMeanForce = None
         self.recrossingFactor = None
+        self.rateCoefficient = None
+    
+    def __getstate__(self):
+        """
+        Return the state of this object for pickling, which happens whenever
+        it is sent to a subprocess. The pool of subprocesses cannot itself be
+        pickled, so it is omitted.
+        """
+        state = self.__dict__.copy()
+        state['pool'] = None
+        return state
+    
+    def getPool(self):
+        """
+        Return the pool of subprocesses to farm out individual trajectories to,
+        creating it the first time it is needed. The same pool is shared by
+        all of the calculations in this job. If only one process is to be
+        used, ``None`` is returned instead, unless a pool (e.g. a
+        :class:`rpmdrate.broker.Broker`) has been assigned to this object.
+        
+        If `threadPool` is ``True``, a pool of threads in this process is
+        used instead, each of which runs its trajectories in its own context
+        of the Fortran layer (see :func:`getContext()`), so that the threads
+        share one copy of the potential and its initialization. The potential
+        must then be compiled and thread-safe (see `threadSafePotential`), as
+        a Python potential would serialize the threads on the global
+        interpreter lock, and the Fortran layer must be compiled with OpenMP,
+        which guards the parts of it that the threads share.
+        """
+        if self.pool is not None:
+            return self.pool
+        if self.processes <= 1:
+            return None
+        if self.pool is None:
+            try:
+                import multiprocessing
+                import multiprocessing.pool
+            except ImportError:
+                raise ValueError('The "multiprocessing" package was not found in this Python installation; you must install this package or set processes to 1.')
+            if self.threadPool:
+                if not (self.threadSafePotential and hasattr(self.potential, '_cpointer')):
+                    raise RPMDError('A pool of threads can only be used with a compiled, thread-safe potential.')
+                if not system.get_openmp():
+                    raise RPMDError('A pool of threads requires the Fortran layer to be compiled with OpenMP support.')
+                if self.isolateTrajectories:
+                    raise RPMDError('Trajectories cannot be isolated in child processes when using a pool of threads.')
+                if self.processes >= MAX_CONTEXTS:
+                    raise RPMDError('A pool of threads can use at most {0:d} threads.'.format(MAX_CONTEXTS - 1))
+                self.pool = multiprocessing.pool.ThreadPool(processes=self.processes)
+            elif self.shard is not None:
+                self.pool = multiprocessing.Pool(processes=self.processes, initializer=seedWorker, initargs=(self.shard,))
+            else:
+                self.pool = multiprocessing.Pool(processes=self.processes)
+        return self.pool
+    
+    def getTrajectoryResult(self, function, args, result, label):
+        """
+        Return the value of the trajectory `function` run with the given
+        `args`, given the `result` returned by :func:`runTrajectory()`, or the
+        asynchronous result if it was run on the pool of subprocesses (in
+        which case this blocks until the trajectory finishes). If the
+        trajectory failed, the failure is logged, and the trajectory is run
+        again with freshly sampled momenta up to `maxRetries` times before an
+        :class:`RPMDError` is raised. The `label` describes the trajectory in
+        the log, e.g. "umbrella sampling trajectory at xi = 0.5000".
+        """
+        pool = self.getPool()
+        if pool:
+            value, error = result.get()
+        else:
+            value, error = result
+        
+        failures = 0
+        while error is not None:
+            failures += 1
+            logging.warning('The {0} failed: {1}'.format(label, error))
+            if failures > self.maxRetries:
+                raise RPMDError('The {0} failed {1:d} times; giving up.'.format(label, failures))
+            logging.warning('Running the {0} again with fresh momenta (retry {1:d} of {2:d})...'.format(label, failures, self.maxRetries))
+            # The momenta are the third argument of each trajectory function
+            p = args[2]
+            args = args[0:2] + (self.sampleMomentum(Nbeads=p.shape[2]),) + args[3:]
+            if pool:
+                value, error = pool.apply(runTrajectory, (function, args))
+            else:
+                value, error = runTrajectory(function, args)
+        
+        return value
+    
+    def getTrajectoryPath(self, workingDirectory, label):
+        """
+        Return the path of a new file in the ``trajectories`` subdirectory of
+        `workingDirectory` for saving a trajectory, whose name starts with
+        `label`. Each trajectory is saved to its own file, so that trajectories
+        running concurrently do not overwrite each other.
+        """
+        return getTrajectoryPath(os.path.join(workingDirectory, 'trajectories'), label, self.compressTrajectories)
+    
+    def getTrajectoryRecorder(self, path):
+        """
+        Return a :class:`TrajectoryRecorder` for saving a trajectory of this
+        system to `path`, using the stride and format given by the
+        `trajectoryStride`, `trajectoryCentroids` and `compressTrajectories`
+        attributes. If the file exists, the trajectory is appended to it.
+        """
+        return TrajectoryRecorder(path, self.Natoms, self.Nbeads, self.trajectoryStride, self.trajectoryCentroids, self.dt, getContext())
+    
+    def evolveParentTrajectory(self, p, q, evolutionSteps, saveTrajectory, parentProfile):
+        """
+        Evolve the parent trajectory of the recrossing factor calculation
+        from momenta `p` and positions `q` for `evolutionSteps` time steps,
+        adding its kernel timings to `parentProfile`. The parent trajectory is
+        also run on the pool (if any), so that it does not depend on the state
+        of the Fortran layer in this process, which other calculations may be
+        using concurrently. Returns the status of the trajectory (nonzero if
+        it failed) and the final momenta and positions.
+        """
+        pool = self.getPool()
+        # The parent trajectory runs alone, so it can use all of the threads
+        args = (self, self.xi_current, p, q, evolutionSteps, saveTrajectory, self.getTrajectoryThreads(1))
+        if pool:
+            value, error = pool.apply(runTrajectory, (runParentTrajectory, args))
+        else:
+            value, error = runTrajectory(runParentTrajectory, args)
+        if error is not None:
+            logging.warning('The parent trajectory failed: {0}'.format(error))
+            return 1, p, q
+        result, p, q, profile = value
+        parentProfile.add(profile)
+        return result, p, q
+    
+    def equilibrateParentTrajectory(self, q0, equilibrationSteps, saveTrajectory, parentProfile):
+        """
+        Equilibrate a new parent trajectory for the recrossing factor
+        calculation starting from the positions `q0` and freshly sampled
+        momenta, for `equilibrationSteps` time steps. A trajectory that fails
+        is started over up to `maxRetries` times before an
+        :class:`RPMDError` is raised. Returns the final momenta and positions.
+        """
+        failures = 0
+        while True:
+            q = numpy.asfortranarray(q0.copy())
+            p = self.sampleMomentum()
+            result, p, q = self.evolveParentTrajectory(p, q, equilibrationSteps, saveTrajectory, parentProfile)
+            if result == 0:
+                return p, q
+            failures += 1
+            if failures > self.maxRetries:
+                raise RPMDError('The parent trajectory at xi = {0:.4f} became unphysical {1:d} times; giving up.'.format(self.xi_current, failures))
     
     def addEquivalentTransitionState(self, formingBonds, breakingBonds):
         """
@@ -257,20 +957,77 @@ class RPMD:
             breakingBonds = breakingBonds,
         ))
     
-    def activate(self, Nbeads=None):
+    def getTrajectoryThreads(self, trajectories):
         """
-        Set this object as the active RPMD system in the Fortran layer. Note
-        that the dividing surface properties must be set in the corresponding
-        modules in ``rpmd._main``, *not* in ``rpmd._surface``.
+        Return the number of threads each trajectory should run on when
+        `trajectories` trajectories are run at once. Each of the `processes`
+        processes may use `threads` threads, so when there are fewer
+        trajectories than processes, the threads of the idle processes are
+        shared among the running trajectories. If `threads` is ``None``, each
+        trajectory runs on a single thread.
         """
+        if not self.threads:
+            return 1
+        processes = max(self.processes, 1)
+        return max(1, self.threads * processes / min(max(trajectories, 1), processes))
+    
+    def getPotentialCallback(self):
+        """
+        Return the potential to pass to the Fortran layer. A compiled
+        potential (an f2py-wrapped Fortran routine, which has a ``_cpointer``
+        attribute) is passed as a pointer, so that it is called without going
+        through Python; only then can it be evaluated on several threads.
+        """
+        return getattr(self.potential, '_cpointer', self.potential)
+    
+    def getPropagator(self, name):
+        """
+        Return the routine of the Fortran layer called `name` (one of
+        ``equilibrate``, ``umbrella_trajectory`` and ``recrossing_trajectory``)
+        to run a trajectory with. For a compiled potential, the variant of the
+        routine that releases the global interpreter lock is returned, so that
+        other threads can run at the same time; it takes the same arguments,
+        but ignores the potential in favor of the one set in the context by
+        :meth:`activate()`. A Python potential must be called with the lock
+        held.
+        """
+        if not hasattr(self.potential, '_cpointer'):
+            return getattr(system, name)
+        propagator = getattr(system, name + '_nogil')
+        # The position of the potential among the arguments of the routine
+        index = 4 if name == 'recrossing_trajectory' else 5
+        def propagate(*args, **kwargs):
+            return propagator(*(args[:index] + args[index+1:]), **kwargs)
+        return propagate
+    
+    def activate(self, Nbeads=None, threads=1):
+        """
+        Set this object as the active RPMD system in the context of the
+        Fortran layer used by the current thread (see :func:`getContext()`),
+        with the trajectories running on the given number of `threads`, and
+        return the index of that context, which must be passed to the Fortran
+        routines called from this thread. Note that the dividing surface
+        properties must be set in the corresponding modules in
+        ``rpmd._main``, *not* in ``rpmd._surface``.
+        """
+        context = getContext()
+        c = context - 1
         Natoms = self.mass.shape[0]
         Nbeads = self.Nbeads if Nbeads is None else Nbeads
-        system.dt = self.dt
-        system.beta = self.beta
-        system.mass[0:Natoms] = self.mass
-        system.mode = self.mode
-        self.reactants.activate(module=reactants)
-        self.thermostat.activate(module=system, Natoms=Natoms, Nbeads=Nbeads)
+        system.dt[c] = self.dt
+        system.beta[c] = self.beta
+        system.mass[0:Natoms,c] = self.mass
+        system.mode[c] = self.mode
+        system.profiling[c] = 1 if self.profiling else 0
+        system.reset_profile(context)
+        system.monitoring[c] = 1 if self.monitorEnergy else 0
+        system.reset_monitor(context)
+        system.threads[c] = threads
+        system.thread_potential[c] = 1 if self.threadSafePotential and hasattr(self.potential, '_cpointer') else 0
+        if hasattr(self.potential, '_cpointer'):
+            system.set_potential(self.getPotentialCallback(), context=context)
+        self.reactants.activate(module=reactants, context=context)
+        self.thermostat.activate(module=system, Natoms=Natoms, Nbeads=Nbeads, context=context)
         
         Nts = len(self.transitionStates)
         Nforming_bonds = max([ts.formingBonds.shape[0] for ts in self.transitionStates])
@@ -288,18 +1045,21 @@ class RPMD:
             formingBondLengths[n,:] = ts.formingBondLengths
             breakingBondLengths[n,:] = ts.breakingBondLengths
         
-        transition_state.number_of_transition_states = Nts
-        transition_state.number_of_bonds = Nforming_bonds
-        transition_state.forming_bonds[0:Nts,0:Nforming_bonds,:] = formingBonds
-        transition_state.forming_bond_lengths[0:Nts,0:Nforming_bonds] = formingBondLengths
-        transition_state.breaking_bonds[0:Nts,0:Nbreaking_bonds,:] = breakingBonds
-        transition_state.breaking_bond_lengths[0:Nts,0:Nbreaking_bonds] = breakingBondLengths
+        transition_state.number_of_transition_states[c] = Nts
+        transition_state.number_of_bonds[c] = Nforming_bonds
+        transition_state.forming_bonds[0:Nts,0:Nforming_bonds,:,c] = formingBonds
+        transition_state.forming_bond_lengths[0:Nts,0:Nforming_bonds,c] = formingBondLengths
+        transition_state.breaking_bonds[0:Nts,0:Nbreaking_bonds,:,c] = breakingBonds
+        transition_state.breaking_bond_lengths[0:Nts,0:Nbreaking_bonds,c] = breakingBondLengths
+        
+        return context
     
     def generateUmbrellaConfigurations(self, 
                                        dt, 
                                        evolutionTime,
                                        xi_list,
-                                       kforce):
+                                       kforce,
+                                       stride=1):
         """
         Generate a set of configurations along the reaction coordinate for
         future use in RPMD umbrella sampling. The algorithm starts near the
@@ -307,8 +1067,21 @@ class RPMD:
         running an RPMD equilibration in each window to obtain the appropriate
         configuration in that window. That configuration is then used as the
         initial position for determining the configuration in the next window.
+        
+        If a `stride` greater than one is given, only every `stride`-th window
+        is equilibrated in sequence. The windows in between are seeded from the
+        nearest of these and equilibrated concurrently on the pool of
+        subprocesses, which shortens the serial part of the calculation by
+        roughly a factor of `stride`.
+        
+        If configurations were previously saved, only those at values of the
+        reaction coordinate that were not saved are generated, each starting
+        from the nearest saved or already generated configuration, using the
+        `stride` in the same way (see :func:`getConfigurationSchedule()`).
         """
         
+        self.umbrellaConfigurationParameters = (dt, evolutionTime)
+        
         dt = float(quantity.convertTime(dt, "ps")) / 2.418884326505e-5
         evolutionTime = float(quantity.convertTime(evolutionTime, "ps")) / 2.418884326505e-5
         
@@ -323,6 +1096,8 @@ class RPMD:
         
         if isinstance(kforce, float):
             kforce = numpy.ones_like(xi_list) * kforce
+        if stride < 1:
+            raise ValueError('Invalid stride {0}; the stride must be a positive integer.'.format(stride))
         
         logging.info('****************************')
         logging.info('RPMD umbrella configurations')
@@ -338,39 +1113,104 @@ class RPMD:
         logging.info('Time step                               = {0:g} ps'.format(self.dt * 2.418884326505e-5))
         logging.info('Number of umbrella integration windows  = {0:d}'.format(Nxi))
         logging.info('Trajectory evolution time               = {0:g} ps ({1:d} steps)'.format(evolutionSteps * self.dt * 2.418884326505e-5, evolutionSteps))
+        if stride > 1:
+            logging.info('Sequential window stride                = {0:d}'.format(stride))
         logging.info('')
 
         # Set up output files and directory
         workingDirectory = self.createWorkingDirectory()
-        # The umbrella configurations are independent of temperature and number
-        # of beads, so store them in the top-level directory
-        configurationsFilename = os.path.realpath(os.path.join(workingDirectory, '..', '..', 'umbrella_configurations.dat'))
+        # The umbrella configurations are independent of temperature, number
+        # of beads, and isotopic masses, so store them in the top-level directory
+        configurationsFilename = os.path.join(self.configurationsDirectory, 'umbrella_configurations.dat')
 
         # Look for existing output file for this calculation
         # If a file exists, we won't repeat the calculation
         if os.path.exists(configurationsFilename):
             logging.info('Loading saved output from {0}'.format(configurationsFilename))
             xi_list0, q_initial0, equilibrationSteps0 = self.loadUmbrellaConfigurations(configurationsFilename)
-            if xi_list.shape[0] == xi_list0.shape[0] and all(numpy.abs(xi_list - xi_list0) < 1e-6):
+            self.umbrellaConfigurations = []
+            for l in range(xi_list0.shape[0]):
+                xi_current = xi_list0[l]
+                q_current = self.cleanGeometry(q_initial0[:,:,l])
+                self.umbrellaConfigurations.append((xi_current, q_current))
+            missing = [l for l in range(Nxi) if numpy.min(numpy.abs(xi_list0 - xi_list[l])) >= 1e-6]
+            if len(missing) == 0:
                 logging.info('Using results of previously saved umbrella configurations.')
                 logging.info('')
-                xi_list = xi_list0
-                q_initial = q_initial0
-                self.umbrellaConfigurations = []
-                for l in range(Nxi):
-                    xi_current = xi_list[l]
-                    q_current = self.cleanGeometry(q_initial[:,:,l])
-                    self.umbrellaConfigurations.append((xi_current, q_current))
                 return
             else:
-                logging.info('NOT using results of previously saved umbrella configurations.')           
+                # Only generate the configurations that are missing, starting
+                # each from the nearest configuration we already have; as
+                # below, only every stride-th configuration along the way is
+                # generated in sequence, and the rest in subprocesses
+                logging.info('Generating {0:d} missing umbrella configurations from previously saved configurations.'.format(len(missing)))
+                logging.info('')
+                context = self.activate(Nbeads)
+                self.initializeRandomNumberGenerator()
+                pool = self.getPool()
+                results = []
+                xi_sources = [xi_current for xi_current, q_current in self.umbrellaConfigurations]
+                q_sources = [q_current for xi_current, q_current in self.umbrellaConfigurations]
+                xi_missing = xi_list[missing]
+                q_missing = numpy.zeros((3,self.Natoms,len(missing)), order='F')
+                profiles = [profiling.KernelProfile() for l in missing]
+                q = numpy.zeros((3,self.Natoms,Nbeads), order='F')
+                for m, n, serial in getConfigurationSchedule(xi_sources, xi_missing, stride):
+                    l = missing[m]
+                    xi_current = xi_list[l]
+                    if n < len(xi_sources):
+                        xi_nearest = xi_sources[n]
+                        q[:,:,0] = q_sources[n]
+                    else:
+                        xi_nearest = xi_missing[n - len(xi_sources)]
+                        q[:,:,0] = q_missing[:,:,n - len(xi_sources)]
+                    
+                    p = self.sampleMomentum(Nbeads=Nbeads)
+                    if serial:
+                        # Equilibrate in this window
+                        logging.info('Generating configuration at xi = {0:.4f} from xi = {1:.4f} for {2:g} ps...'.format(xi_current, xi_nearest, evolutionSteps * self.dt * 2.418884326505e-5))
+                        system.reset_profile(context)
+                        system.reset_monitor(context)
+                        startTime = time.time()
+                        result = self.getPropagator('equilibrate')(0, p, q, evolutionSteps, xi_current, self.getPotentialCallback(), kforce[l], False, False, context=context)
+                        profiles[m].add(getKernelProfile(startTime, evolutionSteps, context))
+                        logging.info('Finished generating configuration at xi = {0:.4f}.'.format(xi_current))
+                        q_missing[:,:,m] = q[:,:,0]
+                    else:
+                        logging.info('Spawning configuration trajectory at xi = {0:.4f} from xi = {1:.4f}...'.format(xi_current, xi_nearest))
+                        args = (self, xi_current, p, q.copy(order='F'), evolutionSteps, kforce[l])
+                        if pool:
+                            results.append([m, args, pool.apply_async(runTrajectory, (runConfigurationTrajectory, args))])
+                        else:
+                            results.append([m, args, runTrajectory(runConfigurationTrajectory, args)])
+                
+                # Collect the configurations equilibrated in subprocesses
+                for m, args, result in results:
+                    # This line will block until the trajectory finishes
+                    label = 'configuration trajectory at xi = {0:.4f}'.format(xi_missing[m])
+                    q_final, profile = self.getTrajectoryResult(runConfigurationTrajectory, args, result, label)
+                    q_missing[:,:,m] = q_final[:,:,0]
+                    profiles[m].add(profile)
+                    logging.info('Finished generating configuration at xi = {0:.4f}.'.format(xi_missing[m]))
+                
+                if self.profiling:
+                    profiling.logKernelProfiles('umbrella configurations', [('{0:.4f}'.format(xi_missing[m]), profiles[m]) for m in range(len(missing))])
+                if self.monitorEnergy:
+                    profiling.logEnergyMonitor('umbrella configurations', [('{0:.4f}'.format(xi_missing[m]), profiles[m]) for m in range(len(missing))], self.T)
+                
+                for m in range(len(missing)):
+                    self.umbrellaConfigurations.append((xi_missing[m], self.cleanGeometry(q_missing[:,:,m])))
+                self.umbrellaConfigurations.sort(key=lambda config: config[0])
+                logging.info('')
+                self.saveUmbrellaConfigurations(configurationsFilename, evolutionSteps)
+                return
         else:
             logging.info('Output will be saved to {0}'.format(configurationsFilename))
         logging.info('')
 
         # Only use one bead to generate initial positions in each window
         # (We will equilibrate within each window to allow the beads to separate)
-        self.activate(Nbeads)
+        context = self.activate(Nbeads)
 
         # Seed the random number generator
         self.initializeRandomNumberGenerator()
@@ -391,29 +1231,79 @@ class RPMD:
         # Equilibrate in each window to determine the initial positions
         # First start at xi = 1 and move in the xi > 1 direction, using the
         # result of the previous xi as the initial position for the next xi
+        # If a stride is given, only every stride-th window is visited in this
+        # way; each window in between is equilibrated in a subprocess starting
+        # from the configuration of the nearest visited window on the side of
+        # the transition state, while the sequence continues in this process
+        pool = self.getPool()
+        results = []
         q_initial = numpy.zeros((3,self.Natoms,Nxi), order='F')
-        for l in range(start, Nxi):
+        profiles = [profiling.KernelProfile() for l in range(Nxi)]
+        for l in range(start, Nxi, stride):
             xi_current = xi_list[l]
             
             # Equilibrate in this window
             logging.info('Generating configuration at xi = {0:.4f} for {1:g} ps...'.format(xi_current, evolutionSteps * self.dt * 2.418884326505e-5))
             p = self.sampleMomentum(Nbeads=Nbeads)
-            result = system.equilibrate(0, p, q, evolutionSteps, xi_current, self.potential, kforce[l], False, False)
+            system.reset_profile(context)
+            system.reset_monitor(context)
+            startTime = time.time()
+            result = self.getPropagator('equilibrate')(0, p, q, evolutionSteps, xi_current, self.getPotentialCallback(), kforce[l], False, False, context=context)
+            profiles[l].add(getKernelProfile(startTime, evolutionSteps, context))
             logging.info('Finished generating configuration at xi = {0:.4f}.'.format(xi_current))
             q_initial[:,:,l] = q[:,:,0]
+            
+            dependents = range(l + 1, min(l + stride, Nxi))
+            if l == start:
+                dependents += range(start - 1, max(start - stride, -1), -1)
+            for m in dependents:
+                logging.info('Spawning configuration trajectory at xi = {0:.4f} from xi = {1:.4f}...'.format(xi_list[m], xi_current))
+                p = self.sampleMomentum(Nbeads=Nbeads)
+                args = (self, xi_list[m], p, q.copy(order='F'), evolutionSteps, kforce[m])
+                if pool:
+                    results.append([m, args, pool.apply_async(runTrajectory, (runConfigurationTrajectory, args))])
+                else:
+                    results.append([m, args, runTrajectory(runConfigurationTrajectory, args)])
                         
         # Now start at xi = 1 and move in the xi < 1 direction, using the
         # result of the previous xi as the initial position for the next xi
         q[:,:,0] = q_initial[:,:,start]
-        for l in range(start - 1, -1, -1):
+        for l in range(start - stride, -1, -stride):
             xi_current = xi_list[l]
             
             # Equilibrate in this window
             logging.info('Generating configuration at xi = {0:.4f} for {1:g} ps...'.format(xi_current, evolutionSteps * self.dt * 2.418884326505e-5))
             p = self.sampleMomentum(Nbeads=Nbeads)
-            result = system.equilibrate(0, p, q, evolutionSteps, xi_current, self.potential, kforce[l], False, False)
+            system.reset_profile(context)
+            system.reset_monitor(context)
+            startTime = time.time()
+            result = self.getPropagator('equilibrate')(0, p, q, evolutionSteps, xi_current, self.getPotentialCallback(), kforce[l], False, False, context=context)
+            profiles[l].add(getKernelProfile(startTime, evolutionSteps, context))
             logging.info('Finished generating configuration at xi = {0:.4f}.'.format(xi_current))
             q_initial[:,:,l] = q[:,:,0]
+            
+            for m in range(l - 1, max(l - stride, -1), -1):
+                logging.info('Spawning configuration trajectory at xi = {0:.4f} from xi = {1:.4f}...'.format(xi_list[m], xi_current))
+                p = self.sampleMomentum(Nbeads=Nbeads)
+                args = (self, xi_list[m], p, q.copy(order='F'), evolutionSteps, kforce[m])
+                if pool:
+                    results.append([m, args, pool.apply_async(runTrajectory, (runConfigurationTrajectory, args))])
+                else:
+                    results.append([m, args, runTrajectory(runConfigurationTrajectory, args)])
+        
+        # Collect the configurations equilibrated in subprocesses
+        for l, args, result in results:
+            # This line will block until the trajectory finishes
+            label = 'configuration trajectory at xi = {0:.4f}'.format(xi_list[l])
+            q_final, profile = self.getTrajectoryResult(runConfigurationTrajectory, args, result, label)
+            q_initial[:,:,l] = q_final[:,:,0]
+            profiles[l].add(profile)
+            logging.info('Finished generating configuration at xi = {0:.4f}.'.format(xi_list[l]))
+        
+        if self.profiling:
+            profiling.logKernelProfiles('umbrella configurations', [('{0:.4f}'.format(xi_list[l]), profiles[l]) for l in range(Nxi)])
+        if self.monitorEnergy:
+            profiling.logEnergyMonitor('umbrella configurations', [('{0:.4f}'.format(xi_list[l]), profiles[l]) for l in range(Nxi)], self.T)
         
         # Store the computed configurations on the object for future use in
         # umbrella sampling
@@ -429,37 +1319,224 @@ class RPMD:
         
         self.saveUmbrellaConfigurations(configurationsFilename, evolutionSteps)
     
+    def refineUmbrellaWindows(self,
+                              dt,
+                              windows,
+                              pilotTime,
+                              maxSeparation=3.0,
+                              maxIterations=4):
+        """
+        Refine a coarse set of umbrella sampling `windows` so that the
+        distributions of the reaction coordinate in neighboring windows
+        overlap sufficiently for umbrella integration. A short pilot trajectory
+        with a sampling time of `pilotTime` is run in each window to measure
+        the mean and variance of the reaction coordinate. Two neighboring
+        windows fail the overlap criterion if their sampled means are more than
+        `maxSeparation` times the average of their standard deviations apart.
+        If either window in a failing pair has drifted more than one standard
+        deviation from its center, its force constant is too weak and is
+        doubled; otherwise a new window is inserted halfway between the pair.
+        The modified windows are then piloted again, for up to `maxIterations`
+        rounds of refinement.
+        
+        The list of `windows` is modified in place, so that subsequent
+        umbrella sampling and potential of mean force jobs that use the same
+        list see the refined windows. The umbrella configurations for new
+        windows are seeded from the nearest existing configuration using
+        :meth:`generateUmbrellaConfigurations()`.
+        """
+        
+        # Don't continue if the user hasn't generated the initial configurations yet
+        if not self.umbrellaConfigurations:
+            raise RPMDError('You must run generateUmbrellaConfigurations() before running refineUmbrellaWindows().')
+        
+        # Set the parameters for the RPMD calculation
+        self.dt = dt = float(quantity.convertTime(dt, "ps")) / 2.418884326505e-5
+        pilotTime = float(quantity.convertTime(pilotTime, "ps")) / 2.418884326505e-5
+        pilotSteps = int(round(pilotTime / self.dt))
+        configurationTimeStep, configurationEvolutionTime = self.umbrellaConfigurationParameters
+        
+        # Use the pool of subprocesses to farm out the individual trajectories to
+        pool = self.getPool()
+        
+        logging.info('*******************************')
+        logging.info('RPMD umbrella window refinement')
+        logging.info('*******************************')
+        logging.info('')
+        
+        logging.info('Parameters')
+        logging.info('==========')
+        logging.info('Temperature                             = {0:g} K'.format(self.T))
+        logging.info('Number of beads                         = {0:d}'.format(self.Nbeads))
+        logging.info('Time step                               = {0:g} ps'.format(self.dt * 2.418884326505e-5))
+        logging.info('Number of initial windows               = {0:d}'.format(len(windows)))
+        logging.info('Pilot trajectory evolution time         = {0:g} ps ({1:d} steps)'.format(pilotSteps * self.dt * 2.418884326505e-5, pilotSteps))
+        logging.info('Maximum window separation               = {0:g} standard deviations'.format(maxSeparation))
+        logging.info('')
+        
+        # Set up output files and directory
+        workingDirectory = self.createWorkingDirectory()
+        windowsFilename = os.path.join(workingDirectory, 'umbrella_windows.dat')
+        
+        # Look for existing output file for this calculation
+        # If a file exists, we won't repeat the calculation
+        if os.path.exists(windowsFilename):
+            logging.info('Loading saved output from {0}'.format(windowsFilename))
+            xi_list, kforce_list, xi_mean_list, xi_var_list = self.loadUmbrellaWindows(windowsFilename)
+            refinedWindows = []
+            for xi, kforce in zip(xi_list, kforce_list):
+                template = min(windows, key=lambda window: abs(window.xi - xi))
+                refinedWindows.append(template.copy(xi=xi, kforce=kforce))
+            windows[:] = refinedWindows
+            logging.info('Using {0:d} previously refined umbrella windows.'.format(len(windows)))
+            logging.info('')
+            self.generateUmbrellaConfigurations(configurationTimeStep, configurationEvolutionTime, xi_list, kforce_list)
+            return
+        else:
+            logging.info('Output will be saved to {0}'.format(windowsFilename))
+        logging.info('')
+        
+        self.mode = 1
+        windows.sort(key=lambda window: window.xi)
+        
+        self.activate()
+        
+        # Seed the random number generator
+        self.initializeRandomNumberGenerator()
+
+        pilotWindows = windows[:]
+        pilotStatistics = {}
+        pilotProfiles = {}
+        for iteration in range(maxIterations + 1):
+            
+            # Run one pilot trajectory in each window that is new or changed
+            results = []
+            threads = self.getTrajectoryThreads(len(pilotWindows))
+            for window in pilotWindows:
+                q = numpy.empty((3,self.Natoms,self.Nbeads), order='F')
+                for xi, q_initial in self.umbrellaConfigurations:
+                    if xi >= window.xi:
+                        break
+                for k in range(self.Nbeads):
+                    q[:,:,k] = q_initial
+                equilibrationSteps = int(round(window.equilibrationTime / self.dt))
+                logging.info('Spawning pilot trajectory at xi = {0:.4f} with kforce = {1:g}...'.format(window.xi, window.kforce))
+                p = self.sampleMomentum()
+                args = (self, window.xi, p, q, equilibrationSteps, pilotSteps, window.kforce, window.xi_range, False, 0.0, 1.0, 1, threads)
+                if pool:
+                    results.append([window, args, pool.apply_async(runTrajectory, (runUmbrellaTrajectory, args))])
+                else:
+                    results.append([window, args, runTrajectory(runUmbrellaTrajectory, args)])
+            
+            for window, args, result in results:
+                # This line will block until the trajectory finishes
+                label = 'pilot trajectory at xi = {0:.4f}'.format(window.xi)
+                dav, dav2, dcount, p, q, histogram, profile = self.getTrajectoryResult(runUmbrellaTrajectory, args, result, label)
+                pilotProfiles.setdefault(window, profiling.KernelProfile()).add(profile)
+                xi_mean = numpy.sum(dav) / numpy.sum(dcount)
+                xi_var = numpy.sum(dav2) / numpy.sum(dcount) - xi_mean * xi_mean
+                pilotStatistics[window] = (xi_mean, xi_var)
+                logging.info('Pilot trajectory at xi = {0:.4f}: xi_mean = {1:.6f}, xi_var = {2:.5e}'.format(window.xi, xi_mean, xi_var))
+            logging.info('')
+            
+            # Check the overlap between each pair of neighboring windows
+            failures, stiffWindows, newWindows = checkWindowOverlap(windows, pilotStatistics, maxSeparation)
+            if iteration == maxIterations:
+                stiffWindows = []
+                newWindows = []
+            for window in stiffWindows:
+                window.kforce *= 2
+            pilotWindows = stiffWindows + newWindows
+            
+            if failures == 0:
+                break
+            elif len(pilotWindows) == 0:
+                logging.warning('{0:d} pairs of umbrella windows do not satisfy the overlap criterion after {1:d} rounds of refinement.'.format(failures, iteration))
+                logging.info('')
+                break
+            
+            logging.info('Refinement round {0:d}: inserting {1:d} windows and stiffening {2:d} windows.'.format(iteration + 1, len(newWindows), len(pilotWindows) - len(newWindows)))
+            logging.info('')
+            windows.extend(newWindows)
+            windows.sort(key=lambda window: window.xi)
+            
+            # Generate initial configurations for the new windows, starting
+            # from the nearest existing configuration
+            if len(newWindows) > 0:
+                self.generateUmbrellaConfigurations(configurationTimeStep, configurationEvolutionTime, [window.xi for window in windows], numpy.array([window.kforce for window in windows]))
+                self.dt = dt
+                self.mode = 1
+                self.activate()
+        
+        logging.info('Refined umbrella windows')
+        logging.info('========================')
+        logging.info('=========== =============== =============== ===============')
+        logging.info('xi          kforce          xi_mean         xi_var')
+        logging.info('=========== =============== =============== ===============')
+        for window in windows:
+            xi_mean, xi_var = pilotStatistics[window]
+            logging.info('{0:11.4f} {1:15.5e} {2:15.8f} {3:15.5e}'.format(window.xi, window.kforce, xi_mean, xi_var))
+        logging.info('=========== =============== =============== ===============')
+        logging.info('')
+        
+        if self.profiling:
+            profiling.logKernelProfiles('pilot trajectories', [('{0:.4f}'.format(window.xi), pilotProfiles.get(window, profiling.KernelProfile())) for window in windows])
+        if self.monitorEnergy:
+            profiling.logEnergyMonitor('pilot trajectories', [('{0:.4f}'.format(window.xi), pilotProfiles.get(window, profiling.KernelProfile())) for window in windows], self.T)
+        
+        self.saveUmbrellaWindows(windowsFilename, windows, pilotStatistics, pilotSteps)
+    
     def conductUmbrellaSampling(self, 
                                 dt, 
                                 windows,
-                                saveTrajectories=False):
+                                saveTrajectories=False,
+                                staticFactorError=None,
+                                minTrajectories=4):
         """
         Return the value of the static factor :math:`p^{(n)}(s_1, s_0)` as
         computed using umbrella integration.
+        
+        By default, each window is sampled until it has completed its
+        requested number of trajectories. If a `staticFactorError` is given,
+        the sampling is instead adaptive: after each window has completed
+        `minTrajectories` trajectories, new trajectories are only spawned in
+        the windows that contribute most to the uncertainty in the free
+        energy barrier, and the sampling stops once the estimated relative
+        error in the static factor falls below `staticFactorError`. In this
+        mode the number of trajectories of each window is an upper bound.
+        At least two trajectories per window are needed to estimate the
+        error, so in this mode a `minTrajectories` less than two is rejected.
+        
+        If `saveTrajectories` is ``True``, the sampling part of each
+        trajectory is saved to its own file in the ``trajectories``
+        subdirectory of the working directory (see :mod:`rpmdrate.trajectory`).
+        
+        If the `shard` attribute is set, only the windows belonging to that
+        shard are sampled, and the results are saved to the directory of the
+        shard for merging later (see :mod:`rpmdrate.shards`).
         """
         
+        if staticFactorError is not None and minTrajectories < 2:
+            raise ValueError('Invalid minimum number of trajectories {0}; at least two trajectories per window are needed to estimate the error in the static factor.'.format(minTrajectories))
+        
         # Don't continue if the user hasn't generated the initial configurations yet
         if not self.umbrellaConfigurations:
             raise RPMDError('You must run generateUmbrellaConfigurations() before running computeStaticFactor().')
         
+        if self.shard is not None:
+            if staticFactorError is not None:
+                raise RPMDError('Adaptive umbrella sampling needs all of the windows, so it cannot be split into shards.')
+            from rpmdrate.shards import getShardWindows
+            windows = getShardWindows(windows, self.shard)
+        
         # Set the parameters for the RPMD calculation
         self.dt = dt = float(quantity.convertTime(dt, "ps")) / 2.418884326505e-5
         Nwindows = len(windows)
         thermostat = self.thermostat
         self.mode = 1
-        processes = self.processes
         
-        # Create a pool of subprocesses to farm out the individual trajectories to
-        try:
-            import multiprocessing
-            if processes > 1:
-                pool = multiprocessing.Pool(processes=processes)
-            else:
-                pool = None
-        except ImportError:
-            if processes > 1:
-                raise ValueError('The "multiprocessing" package was not found in this Python installation; you must install this package or set processes to 1.')
-            pool = None
+        # Use the pool of subprocesses to farm out the individual trajectories to
+        pool = self.getPool()
         results = []
 
         logging.info('**********************')
@@ -473,28 +1550,43 @@ class RPMD:
         logging.info('Number of beads                         = {0:d}'.format(self.Nbeads))
         logging.info('Time step                               = {0:g} ps'.format(self.dt * 2.418884326505e-5))
         logging.info('Number of umbrella integration windows  = {0:d}'.format(Nwindows))
+        if self.shard is not None:
+            logging.info('Shard                                   = {0:d} of {1:d}'.format(*self.shard))
         logging.info('')
 
         # Set up output files and directory
         workingDirectory = self.createWorkingDirectory()
+        if self.shard is not None:
+            from rpmdrate.shards import getShardDirectory
+            workingDirectory = self.createWorkingDirectory(getShardDirectory(workingDirectory, self.shard))
+        statusFilename = os.path.join(workingDirectory, 'umbrella_sampling_status.dat')
+        logging.info('Progress will be summarized in {0}'.format(statusFilename))
+        logging.info('')
 
         self.activate()
 
         # Seed the random number generator
-        self.initializeRandomNumberGenerator()
+        self.initializeRandomNumberGenerator(self.shard)
 
         # Load any previous umbrella sampling trajectories for each window
         for window in windows:
+            window.initializeHistogram(self.beta)
+            histogramFilename = os.path.join(workingDirectory, 'umbrella_histogram_{0:.4f}.dat'.format(window.xi))
+            if os.path.exists(histogramFilename):
+                T, Nbeads, kforce = self.loadUmbrellaHistogram(histogramFilename, window)
+                if abs(kforce - window.kforce) > 1e-6 * abs(window.kforce):
+                    logging.warning('Force constant of saved histogram for xi = {0:.4f} does not match; discarding histogram.'.format(window.xi))
+                    window.initializeHistogram(self.beta)
             umbrellaFilename = os.path.join(workingDirectory, 'umbrella_sampling_{0:.4f}.dat'.format(window.xi))
             if os.path.exists(umbrellaFilename):
                 # Previous trajectories existed, so load them
                 logging.info('Loading saved output for xi = {0:.4f} from {1}'.format(window.xi, umbrellaFilename))
                 xi, kforce, av_list, av2_list, count_list = self.loadUmbrellaSampling(umbrellaFilename, xi_range=window.xi_range)
                 assert abs(xi - window.xi) < 1e-6
-                if len(av_list) > 0:
-                    window.av += av_list[-1]
-                    window.av2 += av2_list[-1]
-                    window.count += count_list[-1]
+                # The saved output is cumulative, so recover the contribution
+                # of each trajectory from the differences
+                for av, av2, count in zip(numpy.diff(numpy.hstack([0.0, av_list])), numpy.diff(numpy.hstack([0.0, av2_list])), numpy.diff(numpy.hstack([0, count_list]))):
+                    window.addSamples(av, av2, int(count))
                     
             else:
                 # No previous trajectories existed, so start a new output file
@@ -534,6 +1626,10 @@ class RPMD:
 
         # This implementation is breadth-first, as we would rather get some
         # data in all windows than get lots of data in a few windows
+        self.xi_barrier = None
+        previousBarrierIndex = None
+        stableIterations = 0
+        profiles = dict([(window, profiling.KernelProfile()) for window in windows])
         done = False
         while not done:
             
@@ -541,8 +1637,20 @@ class RPMD:
             results = []
             done = True
             
+            # In adaptive mode, only the windows that most need more sampling
+            # are candidates for a new trajectory in this iteration
+            if staticFactorError is None:
+                activeWindows = windows
+            else:
+                activeWindows = self.selectAdaptiveWindows(windows, staticFactorError, minTrajectories)
+            
+            # The trajectories run at once share the threads of any idle
+            # processes
+            threads = self.getTrajectoryThreads(len([window for window in activeWindows
+                if window.count < window.trajectories * int(round(window.evolutionTime / self.dt))]))
+            
             # Run one trajectory for each window that needs more sampling
-            for window in windows:
+            for window in activeWindows:
 
                 equilibrationSteps = int(round(window.equilibrationTime / self.dt))
                 evolutionSteps = int(round(window.evolutionTime / self.dt))
@@ -563,39 +1671,44 @@ class RPMD:
                 windowEquilibrationSteps = equilibrationSteps
                 logging.info('Spawning sampling trajectory at xi = {0:.4f}...'.format(window.xi))
                 p = self.sampleMomentum()
-                args = (self, window.xi, p, q, windowEquilibrationSteps, windowEvolutionSteps, window.kforce, window.xi_range, saveTrajectories)
+                if saveTrajectories:
+                    trajectoryPath = self.getTrajectoryPath(workingDirectory, 'umbrella_{0:.4f}'.format(window.xi))
+                else:
+                    trajectoryPath = None
+                args = (self, window.xi, p, q, windowEquilibrationSteps, windowEvolutionSteps, window.kforce, window.xi_range, trajectoryPath,
+                    window.histogramMin, window.histogramWidth, window.histogram.shape[1], threads)
                 if pool:
-                    results.append([window, pool.apply_async(runUmbrellaTrajectory, args)])
+                    results.append([window, args, pool.apply_async(runTrajectory, (runUmbrellaTrajectory, args))])
                 else:
-                    results.append([window, runUmbrellaTrajectory(*args)])
+                    results.append([window, args, runTrajectory(runUmbrellaTrajectory, args)])
               
             count = 0  
-            for window, result in results:
+            for window, args, result in results:
 
                 logging.info('Processing trajectory at xi = {0:.4f}...'.format(window.xi))
                     
                 # This line will block until the trajectory finishes
-                if pool:
-                    dav, dav2, dcount, p, q = result.get()
-                else:
-                    dav, dav2, dcount, p, q = result
+                label = 'umbrella sampling trajectory at xi = {0:.4f}'.format(window.xi)
+                dav, dav2, dcount, p, q, histogram, profile = self.getTrajectoryResult(runUmbrellaTrajectory, args, result, label)
+                profiles[window].add(profile)
                 
-                if window.count > 0 and dcount > 0:
-                    av = window.av / window.count
-                    av2 = window.av2 / window.count
-                    variance0 = av2 - av * av
-                    av = (window.av + dav) / (window.count + dcount)
-                    av2 = (window.av2 + dav2) / (window.count + dcount)
-                    variance = av2 - av * av
-                    if abs(math.log10(variance) - math.log10(variance0)) > 0.5:
-                        logging.warning('Discarding invalid umbrella sampling trajectory detected at xi = {0:g}: large jump in variance from {1:g} to {2:g}.'.format(xi, xi_var0, xi_var))
+                # Only discard the segments of the trajectory whose variance
+                # jumps, keeping the samples from the rest of the trajectory
+                valid = window.getValidSegments(dav, dav2, dcount)
+                invalid = (dcount > 0) & numpy.logical_not(valid)
+                if invalid.any():
+                    for segment in numpy.nonzero(invalid)[0]:
+                        logging.warning('Discarding invalid segment {0:d} of {1:d} of umbrella sampling trajectory at xi = {2:g}: large jump in variance.'.format(segment + 1, dcount.shape[0], window.xi))
+                    if not valid.any():
                         continue
+                dav = numpy.sum(dav[valid])
+                dav2 = numpy.sum(dav2[valid])
+                dcount = int(round(numpy.sum(dcount[valid])))
+                histogram = numpy.sum(histogram[:,:,valid], axis=2)
                 
                 # Update the mean and variance with the results from this trajectory
                 # Note that these are counted at each time step in each trajectory
-                window.av += dav
-                window.av2 += dav2
-                window.count += dcount
+                window.addSamples(dav, dav2, dcount, histogram)
                 
                 # Print the updated mean and variance to the log file
                 av = window.av / window.count
@@ -616,10 +1729,257 @@ class RPMD:
                 os.fsync(f.fileno())
                 f.close()
                 
+                histogramFilename = os.path.join(workingDirectory, 'umbrella_histogram_{0:.4f}.dat'.format(window.xi))
+                self.saveUmbrellaHistogram(histogramFilename, window)
+                
+                # Update the running estimates of the potential of mean force
+                # and rate coefficient, so the progress can be monitored
+                estimate = self.getUmbrellaSamplingEstimate(windows)
+                self.saveUmbrellaSamplingStatus(statusFilename, windows, estimate)
+                
                 count += 1
+            
+            if count > 0 and estimate is not None:
+                xi_current, barrier, barrierError, k_QTST, relativeError = estimate
+                logging.info('Current estimate of free energy barrier = {0:.6f} +/- {1:.6f} eV at xi = {2:.4f}'.format(barrier * 27.211, barrierError * 27.211, xi_current))
+                logging.info('Current estimate of QTST rate coefficient = {0:g} cm^3/(mol*s) (relative error {1:.3g})'.format(k_QTST * 1e6 * ((5.2917721092e-11)**3 / 2.418884326505e-17) * constants.Na, relativeError))
+            
+            # Keep track of the location of the maximum of the potential of
+            # mean force; once it stays near the same window for several
+            # iterations, make it available to calculations that only need the
+            # barrier location, such as the recrossing factor
+            xi_barrier, barrierIndex = self.estimateBarrierLocation(windows)
+            if barrierIndex is not None and barrierIndex == previousBarrierIndex:
+                stableIterations += 1
+            else:
+                stableIterations = 0
+            previousBarrierIndex = barrierIndex
+            if self.xi_barrier is None and stableIterations >= 3:
+                self.xi_barrier = xi_barrier
+                logging.info('Maximum of potential of mean force estimated at xi = {0:.4f}.'.format(xi_barrier))
+        
+        if staticFactorError is not None:
+            relativeError, contributions = self.getStaticFactorError(windows)
+            logging.info('')
+            logging.info('Estimated relative error in static factor = {0:g}'.format(relativeError))
+            logging.info('')
+            logging.info('=========== =========== ===============')
+            logging.info('xi          trajectories barrier var')
+            logging.info('=========== =========== ===============')
+            for window, contribution in zip(windows, contributions):
+                logging.info('{0:11.4f} {1:11d} {2:15.5e}'.format(window.xi, len(window.blockCount), contribution))
+            logging.info('=========== =========== ===============')
                         
         logging.info('')
         
+        if self.profiling:
+            profiling.logKernelProfiles('umbrella sampling', [('{0:.4f}'.format(window.xi), profiles[window]) for window in windows])
+        if self.monitorEnergy:
+            profiling.logEnergyMonitor('umbrella sampling', [('{0:.4f}'.format(window.xi), profiles[window]) for window in windows], self.T)
+        
+    def selectAdaptiveWindows(self, windows, staticFactorError, minTrajectories):
+        """
+        Return the umbrella sampling windows that should receive a new
+        trajectory in the next iteration of adaptive umbrella sampling. Any
+        window with fewer than `minTrajectories` completed trajectories is
+        always selected, so that the statistical error in each window can be
+        estimated. Beyond that, the windows are ranked by how much one more
+        trajectory is expected to reduce the variance in the free energy
+        barrier, and only enough windows to keep each process busy are
+        selected. No windows are selected once the relative error in the
+        static factor falls below `staticFactorError`.
+        """
+        # Windows that have already run their maximum number of trajectories
+        # cannot be sampled further
+        available = []
+        for window in windows:
+            evolutionSteps = int(round(window.evolutionTime / self.dt))
+            if window.count < window.trajectories * evolutionSteps:
+                available.append(window)
+        
+        selected = [window for window in available if len(window.blockCount) < minTrajectories]
+        if len(selected) > 0 or len(available) == 0:
+            return selected
+        
+        relativeError, contributions = self.getStaticFactorError(windows)
+        logging.info('Estimated relative error in static factor = {0:g}'.format(relativeError))
+        if relativeError <= staticFactorError:
+            return []
+        
+        # The variance contributed by each window scales as the inverse of its
+        # number of trajectories, so adding one more trajectory to a window
+        # with n trajectories reduces its contribution by a factor 1/(n+1)
+        reduction = {}
+        for window, contribution in zip(windows, contributions):
+            reduction[window] = contribution / (len(window.blockCount) + 1)
+        available.sort(key=lambda window: reduction[window], reverse=True)
+        
+        return available[0:max(self.processes, 1)]
+    
+    def getMeanForceProfile(self, windows):
+        """
+        Return a coarse estimate of the potential of mean force based on the
+        umbrella sampling conducted so far in the given `windows`. The mean
+        force and its standard error are evaluated at the center of each
+        window, and the mean force is integrated using the trapezoid rule. The
+        returned values are the indices of the windows in order of increasing
+        reaction coordinate, followed by arrays of the reaction coordinate,
+        mean force, standard error in the mean force, and potential of mean
+        force in that order.
+        """
+        Nwindows = len(windows)
+        order = sorted(range(Nwindows), key=lambda l: windows[l].xi)
+        
+        xi = numpy.zeros(Nwindows)
+        dA = numpy.zeros(Nwindows)
+        error = numpy.zeros(Nwindows)
+        for n, l in enumerate(order):
+            xi[n] = windows[l].xi
+            dA[n], error[n] = windows[l].getMeanForce(self.beta)
+        
+        A = numpy.zeros(Nwindows)
+        A[1:] = numpy.cumsum(0.5 * (xi[1:] - xi[:-1]) * (dA[1:] + dA[:-1]))
+        
+        return order, xi, dA, error, A
+    
+    def estimateBarrierLocation(self, windows):
+        """
+        Return an estimate of the value of the reaction coordinate at the
+        maximum of the potential of mean force based on the umbrella sampling
+        conducted so far in the given `windows`, along with the index of the
+        window nearest to the maximum. The location is refined by linear
+        interpolation of the mean force to zero between neighboring windows.
+        Returns ``(None, None)`` if any window has not yet been sampled.
+        """
+        if any([window.count == 0 for window in windows]):
+            return None, None
+        
+        order, xi, dA, error, A = self.getMeanForceProfile(windows)
+        start = int(numpy.argmin(numpy.abs(xi)))
+        n = start + int(numpy.argmax(A[start:]))
+        
+        # The mean force changes sign from positive to negative at the maximum
+        xi_barrier = xi[n]
+        if n > 0 and dA[n-1] > 0 and dA[n] < 0:
+            xi_barrier = xi[n-1] + (xi[n] - xi[n-1]) * dA[n-1] / (dA[n-1] - dA[n])
+        elif n < len(xi) - 1 and dA[n] > 0 and dA[n+1] < 0:
+            xi_barrier = xi[n] + (xi[n+1] - xi[n]) * dA[n] / (dA[n] - dA[n+1])
+        
+        return round(xi_barrier, 4), n
+    
+    def getStaticFactorError(self, windows):
+        """
+        Return an estimate of the relative standard error in the static factor
+        based on the umbrella sampling conducted so far in the given `windows`,
+        along with the contribution of each window to the variance in the free
+        energy barrier. The mean force at the center of each window is 
+        integrated from the reactants (:math:`\\xi = 0`) to the maximum of the
+        resulting potential of mean force, and the standard error in the mean
+        force of each window is propagated through this integration assuming
+        that the windows are independent.
+        """
+        Nwindows = len(windows)
+        order, xi, dA, error, A = self.getMeanForceProfile(windows)
+        
+        # Locate the maximum of the potential of mean force
+        start = int(numpy.argmin(numpy.abs(xi)))
+        end = start + int(numpy.argmax(A[start:]))
+        if end == start:
+            # The sampling is too noisy to locate the barrier, so be
+            # conservative and include all windows beyond the reactants
+            end = Nwindows - 1
+
+        # Each window contributes to the barrier with its trapezoid rule weight
+        weights = numpy.zeros(Nwindows)
+        weights[start:end] += 0.5 * (xi[start+1:end+1] - xi[start:end])
+        weights[start+1:end+1] += 0.5 * (xi[start+1:end+1] - xi[start:end])
+        
+        contributions = numpy.zeros(Nwindows)
+        for n, l in enumerate(order):
+            if weights[n] > 0:
+                contributions[l] = (weights[n] * error[n])**2
+        
+        relativeError = self.beta * math.sqrt(numpy.sum(contributions))
+        
+        return relativeError, contributions
+
+    def getUmbrellaSamplingEstimate(self, windows, bins=1000):
+        """
+        Return the current estimates of the potential of mean force and QTST
+        rate coefficient based on the umbrella sampling conducted so far in the
+        given `windows`. The potential of mean force is computed by umbrella
+        integration over the range of the sampled windows using the given
+        number of `bins`. The returned values are the location of the maximum
+        of the potential of mean force, the free energy barrier and its
+        estimated standard error, and the QTST rate coefficient and its
+        estimated relative error, all in atomic units. Returns ``None`` if the
+        sampled windows do not yet span the reactants (:math:`\\xi = 0`).
+        """
+        sampledWindows = [window for window in windows if window.count > 0]
+        if len(sampledWindows) < 2:
+            return None
+        xi_min = min([window.xi for window in sampledWindows])
+        xi_max = max([window.xi for window in sampledWindows])
+        potentialOfMeanForce = self.getPotentialOfMeanForce(sampledWindows, xi_min, xi_max, bins)
+        if not numpy.all(numpy.isfinite(potentialOfMeanForce[1,:])):
+            return None
+        if potentialOfMeanForce[0,0] > 0.0 or potentialOfMeanForce[0,-1] < 0.0:
+            return None
+        
+        index = numpy.argmax(potentialOfMeanForce[1,:])
+        xi_current = potentialOfMeanForce[0,index]
+        k_QTST_s0, staticFactor, k_QTST = self.getQTSTRateCoefficient(potentialOfMeanForce, xi_current)
+        barrier = -math.log(staticFactor) / self.beta
+        
+        # The relative error in the static factor (and therefore in the QTST
+        # rate coefficient) is beta times the standard error in the barrier
+        relativeError, contributions = self.getStaticFactorError(windows)
+        barrierError = relativeError / self.beta
+        
+        return xi_current, barrier, barrierError, k_QTST, relativeError
+    
+    def saveUmbrellaSamplingStatus(self, path, windows, estimate):
+        """
+        Save a summary of the progress of umbrella sampling in the given
+        `windows` to `path` on disk, including the current `estimate` as
+        returned by :meth:`getUmbrellaSamplingEstimate()`. The file is
+        overwritten each time, so it always reflects the latest results.
+        """
+        fromAtomicUnits = 1e6 * ((5.2917721092e-11)**3 / 2.418884326505e-17)
+        
+        f = open(path, 'w')
+        
+        f.write('*****************************\n')
+        f.write('RPMD umbrella sampling status\n')
+        f.write('*****************************\n\n')
+        
+        f.write('Temperature                             = {0:g} K\n'.format(self.T))
+        f.write('Number of beads                         = {0:d}\n'.format(self.Nbeads))
+        f.write('Last updated                            = {0}\n'.format(time.asctime()))
+        f.write('Number of trajectories                  = {0:d}\n'.format(sum([len(window.blockCount) for window in windows])))
+        f.write('Number of windows sampled               = {0:d} of {1:d}\n'.format(len([window for window in windows if window.count > 0]), len(windows)))
+        if estimate is not None:
+            xi_current, barrier, barrierError, k_QTST, relativeError = estimate
+            f.write('Maximum of potential of mean force      = {0:.4f}\n'.format(xi_current))
+            f.write('Free energy barrier                     = {0:.6f} +/- {1:.6f} eV\n'.format(barrier * 27.211, barrierError * 27.211))
+            f.write('k_QTST(T;xi_max)                        = {0:g} cm^3/(molecule*s)\n'.format(k_QTST * fromAtomicUnits))
+            f.write('                                        = {0:g} cm^3/(mol*s)\n'.format(k_QTST * fromAtomicUnits * constants.Na))
+            f.write('Relative error in k_QTST(T;xi_max)      = {0:g}\n'.format(relativeError))
+        f.write('\n')
+        
+        f.write('=========== =========== =============== =============== ===============\n')
+        f.write('xi          trajectories count          mean force (eV) error (eV)\n')
+        f.write('=========== =========== =============== =============== ===============\n')
+        for window in sorted(windows, key=lambda window: window.xi):
+            dA, error = window.getMeanForce(self.beta)
+            f.write('{0:11.4f} {1:11d} {2:15d} {3:15.8f} {4:15.8f}\n'.format(window.xi, len(window.blockCount), window.count, dA * 27.211, error * 27.211))
+        f.write('=========== =========== =============== =============== ===============\n')
+        
+        f.flush()
+        os.fsync(f.fileno())
+
+        f.close()
+    
     def computePotentialOfMeanForce(self, windows=None, xi_min=None, xi_max=None, bins=5000, xi_range=None):
         """
         Compute the potential of mean force of the system at the given
@@ -636,8 +1996,11 @@ class RPMD:
         if windows is None:
             windows = []
             for root, dirs, files in os.walk(workingDirectory):
+                # Skip the partial results of any shards
+                if 'shards' in dirs:
+                    dirs.remove('shards')
                 for f in files:
-                    if f.startswith('umbrella_sampling_'):
+                    if f.startswith('umbrella_sampling_') and f != 'umbrella_sampling_status.dat':
                         umbrellaFilename = os.path.join(root, f)
                         logging.info('Loading saved output from {0}'.format(umbrellaFilename))
                         xi, kforce, av_list, av2_list, count_list = self.loadUmbrellaSampling(umbrellaFilename, xi_range=xi_range)
@@ -659,8 +2022,6 @@ class RPMD:
         self.umbrellaWindows = windows
         Nwindows = len(self.umbrellaWindows)
         
-        xi_list = numpy.linspace(xi_min, xi_max, bins, True)
-        
         logging.info('****************************')
         logging.info('RPMD potential of mean force')
         logging.info('****************************')
@@ -674,40 +2035,154 @@ class RPMD:
         logging.info('Number of bins                          = {0:d}'.format(bins))
         logging.info('')
 
-        # Count the number of sampling points in each window
-        N = numpy.zeros(Nwindows)
-        for l in range(Nwindows):
-            N[l] = self.umbrellaWindows[l].count
-        
-        # Compute the slope in each bin
-        dA = numpy.zeros(bins)
-        p = numpy.zeros(Nwindows)
-        dA0 = numpy.zeros(Nwindows)
-        for n, xi in enumerate(xi_list):
-            for l, window in enumerate(self.umbrellaWindows):
-                av = window.av / window.count
-                av2 = window.av2 / window.count
-                xi_mean = av
-                xi_var = av2 - av * av
-                xi_window = window.xi
-                kforce = window.kforce
-                p[l] = 1.0 / numpy.sqrt(2 * constants.pi * xi_var) * numpy.exp(-0.5 * (xi - xi_mean)**2 / xi_var) 
-                dA0[l] = (1.0 / self.beta) * (xi - xi_mean) / xi_var - kforce * (xi - xi_window)
-            dA[n] = numpy.sum(N * p * dA0) / numpy.sum(N * p)
-            
-        # Now integrate numerically to get the potential of mean force
-        self.potentialOfMeanForce = numpy.zeros((2,bins-1))
-        A = 0.0
-        for n in range(bins-1):
-            dx = xi_list[n+1] - xi_list[n]
-            self.potentialOfMeanForce[0,n] = 0.5 * (xi_list[n] + xi_list[n+1])
-            A += 0.5 * dx * (dA[n] + dA[n+1])
-            self.potentialOfMeanForce[1,n] = A
-        self.potentialOfMeanForce[1,:] -= numpy.min(self.potentialOfMeanForce[1,:])
+        self.potentialOfMeanForce = self.getPotentialOfMeanForce(self.umbrellaWindows, xi_min, xi_max, bins)
         
         # Save the results to file
         self.savePotentialOfMeanForce(potentialFilename)
 
+    def reweightUmbrellaSampling(self, windows, T0, xi_min=None, xi_max=None, bins=5000):
+        """
+        Estimate the potential of mean force and static factor at the current
+        temperature by reweighting the umbrella sampling results saved by a
+        previous calculation in the given `windows` at temperature `T0` with
+        the same number of beads (see :meth:`Window.reweight()`). This gives a
+        provisional result at a nearby temperature without any new sampling.
+        The reweighted samples are only as good as their effective sample
+        size, so for each window the number of additional trajectories needed
+        at the current temperature to recover the effective sample size of the
+        original calculation is also reported. The results are saved to the
+        file ``umbrella_reweighting_T0.dat`` in the working directory.
+        """
+        beta0 = 4.35974417e-18 / (constants.kB * T0)
+        sourceDirectory = os.path.join(self.outputDirectory, '{0:g}'.format(T0), '{0:d}'.format(self.Nbeads))
+        
+        # Set up output files and directory
+        workingDirectory = self.createWorkingDirectory()
+        reweightingFilename = os.path.join(workingDirectory, 'umbrella_reweighting_{0:g}.dat'.format(T0))
+        
+        logging.info('*************************')
+        logging.info('RPMD umbrella reweighting')
+        logging.info('*************************')
+        logging.info('')
+        
+        logging.info('Parameters')
+        logging.info('==========')
+        logging.info('Temperature                             = {0:g} K'.format(self.T))
+        logging.info('Number of beads                         = {0:d}'.format(self.Nbeads))
+        logging.info('Reweighted from temperature             = {0:g} K'.format(T0))
+        logging.info('Number of umbrella integration windows  = {0:d}'.format(len(windows)))
+        logging.info('')
+        
+        results = []
+        for window in windows:
+            histogramFilename = os.path.join(sourceDirectory, 'umbrella_histogram_{0:.4f}.dat'.format(window.xi))
+            if not os.path.exists(histogramFilename):
+                logging.warning('No umbrella sampling histogram found for xi = {0:.4f} in {1}; skipping this window.'.format(window.xi, sourceDirectory))
+                continue
+            source = window.copy()
+            T, Nbeads, source.kforce = self.loadUmbrellaHistogram(histogramFilename, source)
+            if abs(T - T0) > 1e-6 or Nbeads != self.Nbeads:
+                raise RPMDError('The umbrella sampling histogram in {0} was computed at {1:g} K with {2:d} beads, not {3:g} K with {4:d} beads.'.format(histogramFilename, T, Nbeads, T0, self.Nbeads))
+            count = numpy.sum(source.histogram[0,:])
+            if count == 0:
+                continue
+            target = source.reweight(beta0, self.beta, self.Nbeads)
+            trajectories = int(math.ceil(source.histogramTrajectories * (1.0 - target.count / count)))
+            results.append((target, count, trajectories))
+        
+        if len(results) < 2:
+            raise RPMDError('At least two windows with saved umbrella sampling histograms at {0:g} K are needed for reweighting.'.format(T0))
+        
+        reweightedWindows = [target for target, count, trajectories in results]
+        if xi_min is None: xi_min = min([window.xi for window in reweightedWindows])
+        if xi_max is None: xi_max = max([window.xi for window in reweightedWindows])
+        potentialOfMeanForce = self.getPotentialOfMeanForce(reweightedWindows, xi_min, xi_max, bins)
+        index = numpy.argmax(potentialOfMeanForce[1,:])
+        xi_current = potentialOfMeanForce[0,index]
+        k_QTST_s0, staticFactor, k_QTST = self.getQTSTRateCoefficient(potentialOfMeanForce, xi_current)
+        
+        fromAtomicUnits = 1e6 * ((5.2917721092e-11)**3 / 2.418884326505e-17)
+        logging.info('Maximum of reweighted potential of mean force at xi = {0:.4f}'.format(xi_current))
+        logging.info('Reweighted free energy barrier          = {0:.6f} eV'.format(potentialOfMeanForce[1,index] * 27.211))
+        logging.info('Reweighted static factor                = {0:g}'.format(staticFactor))
+        logging.info('Reweighted k_QTST(T;xi_max)             = {0:g} cm^3/(mol*s)'.format(k_QTST * fromAtomicUnits * constants.Na))
+        logging.info('Additional trajectories recommended     = {0:d}'.format(sum([trajectories for target, count, trajectories in results])))
+        logging.info('')
+        
+        f = open(reweightingFilename, 'w')
+        
+        f.write('*************************\n')
+        f.write('RPMD umbrella reweighting\n')
+        f.write('*************************\n\n')
+        
+        f.write('Temperature                             = {0:g} K\n'.format(self.T))
+        f.write('Number of beads                         = {0:d}\n'.format(self.Nbeads))
+        f.write('Reweighted from temperature             = {0:g} K\n'.format(T0))
+        f.write('Maximum of potential of mean force      = {0:.4f}\n'.format(xi_current))
+        f.write('Free energy barrier                     = {0:.6f} eV\n'.format(potentialOfMeanForce[1,index] * 27.211))
+        f.write('Static factor                           = {0:g}\n'.format(staticFactor))
+        f.write('k_QTST(T;xi_max)                        = {0:g} cm^3/(molecule*s)\n'.format(k_QTST * fromAtomicUnits))
+        f.write('                                        = {0:g} cm^3/(mol*s)\n'.format(k_QTST * fromAtomicUnits * constants.Na))
+        f.write('\n')
+        
+        f.write('=========== =============== =============== =============== =============== ============\n')
+        f.write('xi          count (T0)      effective count xi_mean         xi_var          trajectories\n')
+        f.write('=========== =============== =============== =============== =============== ============\n')
+        for target, count, trajectories in results:
+            xi_mean = target.av / target.count
+            xi_var = target.av2 / target.count - xi_mean * xi_mean
+            f.write('{0:11.4f} {1:15d} {2:15.1f} {3:15.8f} {4:15.5e} {5:12d}\n'.format(target.xi, int(count), target.count, xi_mean, xi_var, trajectories))
+        f.write('=========== =============== =============== =============== =============== ============\n\n')
+        
+        f.write('=========== ===============\n')
+        f.write('xi          PMF (eV)\n')
+        f.write('=========== ===============\n')
+        for xi, W in zip(potentialOfMeanForce[0,:], potentialOfMeanForce[1,:]):
+            f.write('{0:11.6f} {1:15.8f}\n'.format(xi, W * 27.211))
+        f.write('=========== ===============\n')
+        
+        f.flush()
+        os.fsync(f.fileno())
+        
+        f.close()
+        
+        return potentialOfMeanForce
+    
+    def getPotentialOfMeanForce(self, windows, xi_min, xi_max, bins):
+        """
+        Return the potential of mean force obtained by umbrella integration
+        of the samples collected so far in the given `windows` over the given
+        reaction coordinate range using the given number of bins. The result
+        is a 2 x (`bins` - 1) array containing the reaction coordinate at the
+        center of each bin and the corresponding potential of mean force,
+        shifted so that its minimum is zero. Windows without any samples are
+        ignored.
+        """
+        windows = [window for window in windows if window.count > 0]
+        
+        # Count the number of sampling points in each window
+        N = numpy.array([window.count for window in windows], numpy.float64)
+        xi_mean = numpy.array([window.av / window.count for window in windows])
+        xi_var = numpy.array([window.av2 / window.count for window in windows]) - xi_mean * xi_mean
+        xi_window = numpy.array([window.xi for window in windows])
+        kforce = numpy.array([window.kforce for window in windows])
+        
+        # Compute the slope in each bin as the weighted average of the mean
+        # force from each window
+        xi_list = numpy.linspace(xi_min, xi_max, bins, True)
+        xi = xi_list[:,numpy.newaxis]
+        p = 1.0 / numpy.sqrt(2 * constants.pi * xi_var) * numpy.exp(-0.5 * (xi - xi_mean)**2 / xi_var)
+        dA0 = (1.0 / self.beta) * (xi - xi_mean) / xi_var - kforce * (xi - xi_window)
+        dA = numpy.sum(N * p * dA0, axis=1) / numpy.sum(N * p, axis=1)
+        
+        # Now integrate numerically to get the potential of mean force
+        potentialOfMeanForce = numpy.zeros((2,bins-1))
+        potentialOfMeanForce[0,:] = 0.5 * (xi_list[:-1] + xi_list[1:])
+        potentialOfMeanForce[1,:] = numpy.cumsum(0.5 * (xi_list[1:] - xi_list[:-1]) * (dA[:-1] + dA[1:]))
+        potentialOfMeanForce[1,:] -= numpy.min(potentialOfMeanForce[1,:])
+        
+        return potentialOfMeanForce
+    
     def computeRecrossingFactor(self, 
                                 dt, 
                                 equilibrationTime,
@@ -717,7 +2192,10 @@ class RPMD:
                                 childEvolutionTime,
                                 xi_current=None,
                                 saveParentTrajectory=False, 
-                                saveChildTrajectories=False):
+                                saveChildTrajectories=False,
+                                recrossingFactorError=None,
+                                xi_commit=None,
+                                childCommitmentTime=None):
         """
         Return the recrossing factor for the RPMD system. A constrained RPMD
         simulation is initiated in the presence of a thermostat to generate a
@@ -737,11 +2215,46 @@ class RPMD:
         child trajectories spawned from a large number of parent configurations.
         
         The `saveParentTrajectory` and `saveChildTrajectories` flags enable
-        saving of the parent trajectory and/or a sampling of child trajectories
-        as XYZ data files for later visualization in programs such as VMD.
-        This is off by default because it is very slow. 
+        saving of the parent trajectory and/or the first pair of child
+        trajectories spawned from each parent configuration to files in the
+        ``trajectories`` subdirectory of the working directory, which can be
+        converted to XYZ files for visualization in programs such as VMD (see
+        :mod:`rpmdrate.trajectory`).
+        
+        The contributions of the children of each parent configuration are
+        also accumulated separately, so that the standard error in the
+        recrossing factor can be estimated by blocking (consecutive parent
+        configurations are correlated). If a `recrossingFactorError` is given,
+        the sampling stops early once the relative standard error falls below
+        this value, provided that at least 16 parent configurations have been
+        sampled.
+        
+        If `xi_commit` is given, each child trajectory is stopped once its
+        reaction coordinate has stayed more than `xi_commit` away from
+        `xi_current` for `childCommitmentTime`, since it is then committed to
+        the reactant or product side and its contribution to the numerator
+        no longer changes.
+        
+        If the `shard` attribute is set, the shard runs its own parent
+        trajectory and its share of the child trajectories, and the results
+        are saved to the directory of the shard for merging later (see
+        :mod:`rpmdrate.shards`). As the shards do not compute the potential
+        of mean force, it is loaded from the working directory if needed; if
+        it has not been computed yet, the calculation is skipped.
         """
         
+        if self.shard is not None:
+            from rpmdrate.shards import getShardDirectory, getShardTrajectories
+            childTrajectories = getShardTrajectories(childTrajectories, self.shard)
+            potentialFilename = os.path.join(self.createWorkingDirectory(), 'potential_of_mean_force.dat')
+            if xi_current is None and self.potentialOfMeanForce is None:
+                if not os.path.exists(potentialFilename):
+                    logging.warning('Skipping recrossing factor until the umbrella sampling shards have been merged.')
+                    logging.info('')
+                    return None
+                logging.info('Loading potential of mean force from {0}'.format(potentialFilename))
+                self.loadPotentialOfMeanForce(potentialFilename)
+        
         # If xi_current not specified, use the maximum of the potential of mean force
         if xi_current is None:
             if self.potentialOfMeanForce is None:
@@ -756,6 +2269,17 @@ class RPMD:
         equilibrationSteps = int(round(equilibrationTime / dt))
         childEvolutionSteps = int(round(childEvolutionTime / dt))
         childSamplingSteps = int(round(childSamplingTime / dt))
+        if xi_commit is None:
+            xi_commit = 0.0
+            commitSteps = 1
+        else:
+            if xi_commit <= 0:
+                raise ValueError('Invalid value {0:g} for xi_commit; must be positive.'.format(xi_commit))
+            if childCommitmentTime is None:
+                commitSteps = 1
+            else:
+                childCommitmentTime = float(quantity.convertTime(childCommitmentTime, "ps")) / 2.418884326505e-5
+                commitSteps = max(1, int(round(childCommitmentTime / dt)))
         
         # Set the parameters for the RPMD calculation
         self.dt = dt
@@ -763,7 +2287,6 @@ class RPMD:
         self.xi_current = xi_current
         thermostat = self.thermostat
         self.mode = 2
-        processes = self.processes
         
         # Load the geometry from the closest umbrella configuration
         for xi, q in self.umbrellaConfigurations:
@@ -777,18 +2300,11 @@ class RPMD:
         kappa_num = numpy.zeros(childEvolutionSteps, order='F')
         kappa_denom = numpy.array(0.0, order='F')
         childCount = 0
+        kappa_batch_num = []
+        kappa_batch_denom = []
         
-        # Create a pool of subprocesses to farm out the individual trajectories to
-        try:
-            import multiprocessing
-            if processes > 1:
-                pool = multiprocessing.Pool(processes=processes)
-            else:
-                pool = None
-        except ImportError:
-            if processes > 1:
-                raise ValueError('The "multiprocessing" package was not found in this Python installation; you must install this package or set processes to 1.')
-            pool = None
+        # Use the pool of subprocesses to farm out the individual trajectories to
+        pool = self.getPool()
         results = []
 
         logging.info('**********************')
@@ -807,10 +2323,14 @@ class RPMD:
         logging.info('Frequency of child trajectory sampling  = {0:g} ps ({1:d} steps)'.format(childSamplingSteps * self.dt * 2.418884326505e-5, childSamplingSteps))
         logging.info('Length of child trajectories            = {0:g} ps ({1:d} steps)'.format(childEvolutionSteps * self.dt * 2.418884326505e-5, childEvolutionSteps))
         logging.info('Number of children per sampling         = {0:d}'.format(childrenPerSampling))
+        if self.shard is not None:
+            logging.info('Shard                                   = {0:d} of {1:d}'.format(*self.shard))
         logging.info('')
         
         # Set up output files and directory
         workingDirectory = self.createWorkingDirectory()
+        if self.shard is not None:
+            workingDirectory = self.createWorkingDirectory(getShardDirectory(workingDirectory, self.shard))
         recrossingFilename = os.path.join(workingDirectory, 'recrossing_factor_{0:.4f}.dat'.format(self.xi_current))
 
         # Look for existing output file for this calculation
@@ -820,13 +2340,16 @@ class RPMD:
             logging.info('Loading saved output from {0}'.format(recrossingFilename))
             (T0, Nbeads0, xi_current0, dt0, kappa_num0, kappa_denom0, trajectoryCount0,
                 childTrajectories0, equilibrationSteps0, childSamplingSteps0, 
-                childEvolutionSteps0, childrenPerSampling0) = self.loadRecrossingFactor(recrossingFilename)
+                childEvolutionSteps0, childrenPerSampling0, kappa_batch_num0,
+                kappa_batch_denom0) = self.loadRecrossingFactor(recrossingFilename)
             if T0 == self.T and Nbeads0 == self.Nbeads and dt0 == self.dt and abs(xi_current0 - self.xi_current) < 1e-4:
                 # We can use the old data
                 logging.info('Including previously saved output in calculation.')
                 kappa_num = kappa_num0
                 kappa_denom = kappa_denom0
                 childCount = trajectoryCount0
+                kappa_batch_num = list(kappa_batch_num0)
+                kappa_batch_denom = list(kappa_batch_denom0)
                 logging.info('Saved output contained {0:d} child trajectories; {1:d} additional additional trajectories will be run.'.format(childCount, max(childTrajectories - childCount, 0)))           
             else:
                 logging.info('NOT including previously saved output in calculation.')           
@@ -836,12 +2359,17 @@ class RPMD:
 
         recrossingFactor = []
         
-        if childCount < childTrajectories:
+        converged = self.isRecrossingFactorConverged(kappa_batch_num, kappa_batch_denom, recrossingFactorError)
+        if converged:
+            logging.info('Saved output has already reached the requested relative error in the recrossing factor.')
+            logging.info('')
+        
+        if childCount < childTrajectories and not converged:
 
             self.activate()
             
             # Seed the random number generator
-            self.initializeRandomNumberGenerator()
+            self.initializeRandomNumberGenerator(self.shard)
 
             # Generate initial position using transition state geometry
             # (All beads start at same position)
@@ -851,14 +2379,20 @@ class RPMD:
                     for k in range(self.Nbeads):
                         q0[i,j,k] = geometry[i,j]
             
+            parentProfile = profiling.KernelProfile()
+            childProfile = profiling.KernelProfile()
+            
+            # The parent trajectory is saved to a single file, to which each
+            # stage of its evolution is appended
+            if saveParentTrajectory:
+                parentTrajectoryPath = self.getTrajectoryPath(workingDirectory, 'parent_{0:.4f}'.format(xi_current))
+            else:
+                parentTrajectoryPath = None
+            
             # Equilibrate parent trajectory while constraining to dividing surface
             # and sampling from Andersen thermostat
             logging.info('Equilibrating parent trajectory for {0:g} ps...'.format(equilibrationSteps * self.dt * 2.418884326505e-5))
-            result = 1
-            while result != 0:
-                q = numpy.asfortranarray(q0.copy())
-                p = self.sampleMomentum()            
-                result = system.equilibrate(0, p, q, equilibrationSteps, self.xi_current, self.potential, 0.0, True, saveParentTrajectory)
+            p, q = self.equilibrateParentTrajectory(q0, equilibrationSteps, parentTrajectoryPath, parentProfile)
             
             logging.info('Finished equilibrating parent trajectory.')
             logging.info('')
@@ -866,56 +2400,80 @@ class RPMD:
             # Continue evolving parent trajectory, interrupting to sample sets of
             # child trajectories in order to update the recrossing factor
             parentIter = 0
-            while childCount < childTrajectories:
+            while childCount < childTrajectories and not converged:
                 
                 logging.info('Sampling {0} child trajectories at {1:g} ps...'.format(childrenPerSampling, parentIter * childSamplingSteps * self.dt * 2.418884326505e-5))
     
                 # Sample a number of child trajectories using the current parent
                 # configuration
                 results = []
-                saveChildTrajectory = saveChildTrajectories
+                threads = self.getTrajectoryThreads(childrenPerSampling / 2)
                 for child in range(childrenPerSampling / 2):
                     q_child = numpy.array(q.copy(), order='F')
                     p_child = self.sampleMomentum()
                     
-                    args = (self, xi_current, -p_child, q_child, childEvolutionSteps, saveChildTrajectory)
+                    if saveChildTrajectories and child == 0:
+                        childTrajectoryPath = self.getTrajectoryPath(workingDirectory, 'child_{0:.4f}'.format(xi_current))
+                    else:
+                        childTrajectoryPath = None
+                    args = (self, xi_current, -p_child, q_child, childEvolutionSteps, childTrajectoryPath, xi_commit, commitSteps, threads)
                     if pool:
-                        results.append(pool.apply_async(runRecrossingTrajectory, args))
+                        results.append([args, pool.apply_async(runTrajectory, (runRecrossingTrajectory, args))])
                     else:
-                        results.append(runRecrossingTrajectory(*args))           
+                        results.append([args, runTrajectory(runRecrossingTrajectory, args)])
                     childCount += 2
     
-                for child in range(childrenPerSampling / 2):
+                batch_num = 0.0
+                batch_denom = 0.0
+                childSteps = 0
+                for args, result in results:
                     # This line will block until the child trajectory finishes
-                    if pool:
-                        num, denom = results[child].get()
-                    else:
-                        num, denom = results[child]
+                    num, denom, steps, profile = self.getTrajectoryResult(runRecrossingTrajectory, args, result, 'recrossing trajectory')
+                    childSteps += steps
+                    childProfile.add(profile)
                     # Update the numerator and denominator of the recrossing factor expression
                     kappa_num += num
                     kappa_denom += denom
+                    batch_num += num[-1]
+                    batch_denom += float(denom)
+                kappa_batch_num.append(batch_num)
+                kappa_batch_denom.append(batch_denom)
             
                 logging.info('Finished sampling {0} child trajectories at {1:g} ps.'.format(childrenPerSampling, parentIter * childSamplingSteps * self.dt * 2.418884326505e-5))
+                if xi_commit > 0:
+                    logging.info('Committed child trajectories were stopped after {0:.1f}% of the evolution time on average.'.format(100.0 * childSteps / (childrenPerSampling / 2 * 2 * childEvolutionSteps)))
                 
                 self.saveRecrossingFactor(recrossingFilename, kappa_num, kappa_denom, childCount,
-                    childTrajectories, equilibrationSteps, childSamplingSteps, childEvolutionSteps, childrenPerSampling)
+                    childTrajectories, equilibrationSteps, childSamplingSteps, childEvolutionSteps, childrenPerSampling,
+                    kappa_batch_num, kappa_batch_denom)
                 
-                logging.info('Current value of transmission coefficient = {0:.6f}'.format(kappa_num[-1] / kappa_denom))
+                kappa, kappa_error = statistics.getRatioStandardError(kappa_batch_num, kappa_batch_denom)
+                logging.info('Current value of transmission coefficient = {0:.6f} +/- {1:.6f}'.format(kappa_num[-1] / kappa_denom, kappa_error))
                 logging.info('')
+                
+                converged = self.isRecrossingFactorConverged(kappa_batch_num, kappa_batch_denom, recrossingFactorError)
+                if converged:
+                    logging.info('Reached requested relative error in recrossing factor after {0:d} child trajectories.'.format(childCount))
+                    logging.info('')
+                    break
                                 
                 # Further evolve parent trajectory while constraining to dividing
                 # surface and sampling from Andersen thermostat
                 logging.info('Evolving parent trajectory to {0:g} ps...'.format((parentIter+1) * childSamplingSteps * self.dt * 2.418884326505e-5))
-                result = system.equilibrate(0, p, q, childSamplingSteps, self.xi_current, self.potential, 0.0, True, saveParentTrajectory)
-                while result != 0:
-                    q = numpy.asfortranarray(q0.copy())
-                    p = self.sampleMomentum()            
-                    result = system.equilibrate(0, p, q, equilibrationSteps, self.xi_current, self.potential, 0.0, True, saveParentTrajectory)
+                result, p, q = self.evolveParentTrajectory(p, q, childSamplingSteps, parentTrajectoryPath, parentProfile)
+                if result != 0:
+                    # Start over from the transition state geometry
+                    p, q = self.equilibrateParentTrajectory(q0, equilibrationSteps, parentTrajectoryPath, parentProfile)
                 
                 parentIter += 1
             
             logging.info('Finished sampling of {0:d} child trajectories.'.format(childCount))
             logging.info('')
+            
+            if self.profiling:
+                profiling.logKernelProfiles('recrossing factor', [('parent', parentProfile), ('children', childProfile)])
+            if self.monitorEnergy:
+                profiling.logEnergyMonitor('recrossing factor', [('parent', parentProfile), ('children', childProfile)], self.T)
         
         logging.info('Result of recrossing factor calculation:')
         logging.info('')
@@ -932,12 +2490,29 @@ class RPMD:
         logging.info('')
 
         logging.info('Final value of recrossing factor = {0:.6f}'.format(kappa_num[-1] / kappa_denom))
+        if len(kappa_batch_num) > 0:
+            kappa, kappa_error = statistics.getRatioStandardError(kappa_batch_num, kappa_batch_denom)
+            logging.info('Standard error in recrossing factor = {0:.6f}'.format(kappa_error))
         logging.info('')
         
         self.recrossingFactor = kappa_num[-1] / kappa_denom
         
         return self.recrossingFactor
 
+    def isRecrossingFactorConverged(self, kappa_batch_num, kappa_batch_denom, recrossingFactorError):
+        """
+        Return ``True`` if the relative standard error in the recrossing
+        factor, as estimated from the contributions `kappa_batch_num` and
+        `kappa_batch_denom` of each parent configuration, has fallen below
+        `recrossingFactorError`, or ``False`` if not (or if no target error
+        was given). At least 16 parent configurations are required, so that
+        the correlation between them can be accounted for by blocking.
+        """
+        if recrossingFactorError is None or len(kappa_batch_num) < 16:
+            return False
+        kappa, kappa_error = statistics.getRatioStandardError(kappa_batch_num, kappa_batch_denom)
+        return kappa_error <= recrossingFactorError * abs(kappa)
+    
     def createWorkingDirectory(self, path=None):
         """
         Create the directory used for saving the calculation output. If not
@@ -1044,6 +2619,92 @@ class RPMD:
         
         return xi_list, q_list, evolutionSteps
         
+    def saveUmbrellaWindows(self, path, windows, pilotStatistics, pilotSteps):
+        """
+        Save the results of an umbrella window refinement calculation to `path`
+        on disk. This serves as both a record of the calculation and a means of
+        reusing the refined windows when restarting a calculation.
+        """
+        f = open(path, 'w')
+        
+        f.write('*********************\n')
+        f.write('RPMD umbrella windows\n')
+        f.write('*********************\n\n')
+
+        f.write('Temperature                             = {0:g} K\n'.format(self.T))
+        f.write('Number of beads                         = {0:d}\n'.format(self.Nbeads))
+        f.write('Time step                               = {0:g} ps\n'.format(self.dt * 2.418884326505e-5))
+        f.write('Number of umbrella integration windows  = {0:d}\n'.format(len(windows)))
+        f.write('Pilot trajectory evolution time         = {0:g} ps ({1:d} steps)\n\n'.format(pilotSteps * self.dt * 2.418884326505e-5, pilotSteps))
+        
+        f.write('=========== =============== =============== ===============\n')
+        f.write('xi          kforce          xi_mean         xi_var\n')
+        f.write('=========== =============== =============== ===============\n')
+        for window in windows:
+            xi_mean, xi_var = pilotStatistics[window]
+            f.write('{0:11.4f} {1:15.8e} {2:15.8f} {3:15.5e}\n'.format(window.xi, window.kforce, xi_mean, xi_var))
+        f.write('=========== =============== =============== ===============\n')
+        
+        f.flush()
+        os.fsync(f.fileno())
+
+        f.close()
+        
+    def loadUmbrellaWindows(self, path):
+        """
+        Load the results of an umbrella window refinement calculation from
+        `path` on disk. This can be useful both as a means of postprocessing
+        results at a later date and for restarting a calculation.
+        """
+        
+        f = open(path, 'r')
+
+        # Header
+        f.readline()
+        jobtype = f.readline()
+        if jobtype.strip() != 'RPMD umbrella windows':
+            raise RPMDError('{0} is not a valid RPMD umbrella windows output file.'.format(jobtype))
+        f.readline()
+        f.readline()
+        
+        # Parameters
+        line = f.readline()
+        while line.strip() != '':
+            param, data = line.split('=')
+            param = param.strip()
+            data = data.split()
+            if param == 'Temperature':
+                T = float(data[0])
+            elif param == 'Number of beads':
+                Nbeads = int(data[0])
+            elif param == 'Time step':
+                dt = float(data[0]) / 2.418884326505e-5
+            elif param == 'Number of umbrella integration windows':
+                Nxi = int(data[0])
+            elif param == 'Pilot trajectory evolution time':
+                pilotSteps = int(data[2][1:])
+            else:
+                raise RPMDError('Invalid umbrella windows parameter {0!r}.'.format(param))
+            line = f.readline()
+        
+        # Data
+        xi_list = []; kforce_list = []; xi_mean_list = []; xi_var_list = []
+        line = f.readline()
+        line = f.readline()
+        line = f.readline()
+        line = f.readline()
+        while line != '' and len(line) > 8 and line[0:8] != '========':
+            xi, kforce, xi_mean, xi_var = [float(value) for value in line.split()]
+            xi_list.append(xi)
+            kforce_list.append(kforce)
+            xi_mean_list.append(xi_mean)
+            xi_var_list.append(xi_var)
+            line = f.readline()
+        
+        f.close()
+        
+        return numpy.array(xi_list), numpy.array(kforce_list), numpy.array(xi_mean_list), numpy.array(xi_var_list)
+        
     def loadUmbrellaSampling(self, path, xi_range=None):
         """
         Load the results of an umbrella sampling calculation from `path` on
@@ -1136,6 +2797,108 @@ class RPMD:
         
         return xi, kforce, av_list, av2_list, count_list
         
+    def saveUmbrellaHistogram(self, path, window):
+        """
+        Save the histogram of the umbrella sampling results in `window`, as
+        used for temperature reweighting, to `path` on disk. The file is
+        overwritten each time, so it always reflects the latest results.
+        """
+        
+        f = open(path, 'w')
+        
+        f.write('********************************\n')
+        f.write('RPMD umbrella sampling histogram\n')
+        f.write('********************************\n\n')
+        
+        f.write('Temperature                             = {0:g} K\n'.format(self.T))
+        f.write('Number of beads                         = {0:d}\n'.format(self.Nbeads))
+        f.write('Reaction coordinate                     = {0:.4f}\n'.format(window.xi))
+        f.write('Force constant                          = {0:g}\n'.format(window.kforce))
+        f.write('Number of trajectories                  = {0:d}\n'.format(window.histogramTrajectories))
+        f.write('Histogram lower bound                   = {0:.8f}\n'.format(window.histogramMin))
+        f.write('Histogram bin width                     = {0:.8e}\n'.format(window.histogramWidth))
+        f.write('Number of bins                          = {0:d}\n'.format(window.histogram.shape[1]))
+        f.write('\n')
+        
+        f.write('=========== ' + ' '.join(['=' * 20 for i in range(8)]) + '\n')
+        f.write('bin         count                sum xi               sum xi^2             sum U                sum S                sum U^2              sum S^2              sum U*S\n')
+        f.write('=========== ' + ' '.join(['=' * 20 for i in range(8)]) + '\n')
+        for n in range(window.histogram.shape[1]):
+            f.write('{0:11d} '.format(n + 1) + ' '.join(['{0:20.12e}'.format(value) for value in window.histogram[:,n]]) + '\n')
+        f.write('=========== ' + ' '.join(['=' * 20 for i in range(8)]) + '\n')
+        
+        f.flush()
+        os.fsync(f.fileno())
+
+        f.close()
+    
+    def loadUmbrellaHistogram(self, path, window):
+        """
+        Load the histogram of umbrella sampling results from `path` on disk
+        into `window`, replacing any histogram it already has. Returns the
+        temperature, number of beads, and force constant of the calculation
+        that produced it.
+        """
+        
+        f = open(path, 'r')
+
+        # Header
+        f.readline()
+        jobtype = f.readline()
+        if jobtype.strip() != 'RPMD umbrella sampling histogram':
+            raise RPMDError('{0} is not a valid RPMD umbrella sampling histogram output file.'.format(jobtype))
+        f.readline()
+        f.readline()
+        
+        # Parameters
+        line = f.readline()
+        while line.strip() != '':
+            param, data = line.split('=')
+            param = param.strip()
+            data = data.split()
+            if param == 'Temperature':
+                T = float(data[0])
+            elif param == 'Number of beads':
+                Nbeads = int(data[0])
+            elif param == 'Reaction coordinate':
+                xi = float(data[0])
+            elif param == 'Force constant':
+                kforce = float(data[0])
+            elif param == 'Number of trajectories':
+                trajectories = int(data[0])
+            elif param == 'Histogram lower bound':
+                xi_hist_min = float(data[0])
+            elif param == 'Histogram bin width':
+                xi_hist_width = float(data[0])
+            elif param == 'Number of bins':
+                bins = int(data[0])
+            else:
+                raise RPMDError('Invalid umbrella sampling histogram parameter {0!r}.'.format(param))
+            line = f.readline()
+        
+        if abs(xi - window.xi) > 1e-6:
+            raise RPMDError('The umbrella sampling histogram in {0} does not correspond to the window at xi = {1:.4f}.'.format(path, window.xi))
+        
+        # Data
+        histogram = numpy.zeros((8,bins), order='F')
+        line = f.readline()
+        line = f.readline()
+        line = f.readline()
+        line = f.readline()
+        while line != '' and len(line) > 8 and line[0:8] != '========':
+            data = line.split()
+            histogram[:,int(data[0])-1] = [float(value) for value in data[1:]]
+            line = f.readline()
+        
+        f.close()
+        
+        window.histogram = histogram
+        window.histogramMin = xi_hist_min
+        window.histogramWidth = xi_hist_width
+        window.histogramTrajectories = trajectories
+        
+        return T, Nbeads, kforce
+        
     def savePotentialOfMeanForce(self, path):
         """
         Save the results of a potential of mean force calculation to `path` on
@@ -1224,7 +2987,7 @@ class RPMD:
     def saveRecrossingFactor(self, path, kappa_num, kappa_denom, trajectoryCount,
                              childTrajectories, equilibrationSteps, 
                              childSamplingSteps, childEvolutionSteps, 
-                             childrenPerSampling):
+                             childrenPerSampling, kappa_batch_num, kappa_batch_denom):
         """
         Save the results of a recrossing factor calculation to `path` on disk.
         This serves as both a record of the calculation and a means of
@@ -1260,7 +3023,20 @@ class RPMD:
                 kappa_num[n] / trajectoryCount,
                 kappa_num[n] / kappa_denom,
             ))
-        f.write('========= ============= ============= ========= =========== ===========\n')
+        f.write('========= ============= ============= ========= =========== ===========\n\n')
+        
+        # The contribution of the children of each parent configuration to the
+        # final value, which is used to estimate the standard error
+        kappa, kappa_error = statistics.getRatioStandardError(kappa_batch_num, kappa_batch_denom)
+        f.write('Standard error in recrossing factor     = {0:.6f}\n'.format(kappa_error))
+        f.write('Relative error in recrossing factor     = {0:.6f}\n\n'.format(kappa_error / abs(kappa) if kappa != 0 else float('inf')))
+        
+        f.write('========= ============= =============\n')
+        f.write('Sampling  kappa_num     kappa_denom\n')
+        f.write('========= ============= =============\n')
+        for n in range(len(kappa_batch_num)):
+            f.write('{0:9d} {1:13.6f} {2:13.6f}\n'.format(n + 1, kappa_batch_num[n], kappa_batch_denom[n]))
+        f.write('========= ============= =============\n')
         
         f.flush()
         os.fsync(f.fileno())
@@ -1327,11 +3103,28 @@ class RPMD:
         kappa_num = numpy.array(kappa_num, order='F')
         kappa_denom = numpy.array(kappa_denom, order='F')
         
+        # Contributions of each parent configuration (if present; older
+        # output files do not contain these)
+        kappa_batch_num = []; kappa_batch_denom = []
+        line = f.readline()
+        while line != '' and line[0:8] != '========':
+            line = f.readline()
+        if line != '':
+            line = f.readline()
+            line = f.readline()
+            line = f.readline().strip()
+            while line != '' and line[0:8] != '========':
+                n, num, denom = line.split()
+                kappa_batch_num.append(float(num))
+                kappa_batch_denom.append(float(denom))
+                line = f.readline().strip()
+        
         f.close()
 
         return (T, Nbeads, xi_current, dt, kappa_num, kappa_denom, trajectoryCount,
             childTrajectories, equilibrationSteps, childSamplingSteps, 
-            childEvolutionSteps, childrenPerSampling)
+            childEvolutionSteps, childrenPerSampling, kappa_batch_num, 
+            kappa_batch_denom)
     
     def saveRateCoefficient(self, path, k_QTST_s0, staticFactor, xi_current, k_QTST, recrossingFactor, k_RPMD):
         """
@@ -1421,6 +3214,34 @@ class RPMD:
 
         return (T, Nbeads, k_QTST_s0, staticFactor, xi_current, k_QTST, recrossingFactor, k_RPMD)
 
+    def getQTSTRateCoefficient(self, potentialOfMeanForce, xi_current):
+        """
+        Return the quantum transition state theory (QTST) rate coefficient
+        for the given `potentialOfMeanForce` with the transition state
+        dividing surface at `xi_current`. The returned values are the rate
+        coefficient at the reactant dividing surface, the static factor, and
+        the QTST rate coefficient at the transition state dividing surface,
+        all in atomic units.
+        """
+        # Compute the rate coefficient using the reactant dividing surface
+        Rinf = self.reactants.Rinf
+        mA = self.reactants.totalMass1
+        mB = self.reactants.totalMass2
+        mu = mA * mB / (mA + mB)
+        k_QTST_s0 = float(4 * constants.pi * Rinf * Rinf / numpy.sqrt(2 * constants.pi * self.beta * mu))
+        
+        # Compute the static factor
+        from rpmdrate.interpolate import LinearInterpolator
+        f = LinearInterpolator(potentialOfMeanForce[0,:], potentialOfMeanForce[1,:])
+        W1 = f(xi_current)
+        W0 = f(0.0)
+        staticFactor = float(numpy.exp(-self.beta * (W1 - W0)))
+        
+        # Correct the rate coefficient to the transition state dividing surface
+        k_QTST = k_QTST_s0 * staticFactor
+        
+        return k_QTST_s0, staticFactor, k_QTST
+    
     def computeRateCoefficient(self):
         """
         Compute the value of the RPMD rate coefficient.
@@ -1451,23 +3272,10 @@ class RPMD:
         workingDirectory = self.createWorkingDirectory()
         rateFilename = os.path.join(workingDirectory, 'rate_coefficient_{0:.4f}.dat'.format(xi_current))
 
-        # Compute the rate coefficient using the reactant dividing surface
-        Rinf = self.reactants.Rinf
-        mA = self.reactants.totalMass1
-        mB = self.reactants.totalMass2
-        mu = mA * mB / (mA + mB)
-        k_QTST_s0 = float(4 * constants.pi * Rinf * Rinf / numpy.sqrt(2 * constants.pi * self.beta * mu))
-        
-        # Compute the static factor
+        # Compute the rate coefficient using the reactant dividing surface and
+        # correct it to the transition state dividing surface
         # (Use the same xi_current as used in the recrossing factor calculation)
-        from rpmdrate.interpolate import LinearInterpolator
-        f = LinearInterpolator(self.potentialOfMeanForce[0,:], self.potentialOfMeanForce[1,:])
-        W1 = f(xi_current)
-        W0 = f(0.0)
-        staticFactor = float(numpy.exp(-self.beta * (W1 - W0)))
-        
-        # Correct the rate coefficient to the transition state dividing surface
-        k_QTST = k_QTST_s0 * staticFactor
+        k_QTST_s0, staticFactor, k_QTST = self.getQTSTRateCoefficient(self.potentialOfMeanForce, xi_current)
         
         # Correct the rate coefficient for recrossings
         if self.recrossingFactor is None:
@@ -1482,6 +3290,7 @@ class RPMD:
 
         self.saveRateCoefficient(rateFilename, k_QTST_s0, staticFactor, xi_current, k_QTST, recrossingFactor, k_RPMD)
 
+        self.rateCoefficient = k_RPMD
         return k_RPMD
     
     def sampleMomentum(self, Nbeads=None):
@@ -1518,13 +3327,23 @@ class RPMD:
             newGeometry[:,j] -= cm
         return newGeometry
 
-    def initializeRandomNumberGenerator(self):
+    def initializeRandomNumberGenerator(self, shard=None):
         """
         Initialize the random number generator. If a valid value is found in
         the ``randomSeed`` attribute, that value is used as the seed; otherwise
-        a default value is used.
+        a default value is used. If a `shard` is given as an ``(index, count)``
+        tuple, the seed is offset by the shard index.
         """
-        if self.randomSeed is not None and isinstance(self.randomSeed, int):
+        if shard is not None:
+            # Offset the seed so that each shard draws from its own stream of
+            # random numbers
+            index, count = shard
+            if self.randomSeed is not None and isinstance(self.randomSeed, int):
+                seed = self.randomSeed
+            else:
+                seed = int(time.time())
+            random_init_seed(((seed * count + index) * 2654435761) % 2147483647)
+        elif self.randomSeed is not None and isinstance(self.randomSeed, int):
             random_init_seed(self.randomSeed)
         else:
             random_init()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This module contains functions for estimating the computational cost of the
+jobs requested in an RPMDrate input file without running them. The cost per
+time step of each kind of trajectory is measured by timing a few short
+trajectories starting from the transition state, and the number of time steps
+implied by each job is counted from its parameters, giving a projected number
+of core-hours and wall time for a given number of processes. The projection
+assumes that no saved output from a previous run is reused. The largest time
+step that conserves energy to a given tolerance is also estimated, by
+measuring the energy drift of a few short trajectories run without a
+thermostat at a range of time steps.
+"""
+
+import math
+import time
+import logging
+import numpy
+
+import rpmdrate.quantity as quantity
+from rpmdrate._main import system
+
+################################################################################
+
+def timeFunction(function, minTime):
+    """
+    Return the average wall time in seconds of a call to `function`, calling
+    it repeatedly (after a warm-up call) until at least `minTime` seconds have
+    elapsed.
+    """
+    function()
+    calls = 1
+    while True:
+        startTime = time.time()
+        for n in xrange(calls):
+            function()
+        elapsed = time.time() - startTime
+        if elapsed >= minTime:
+            return elapsed / calls
+        calls *= 2
+
+def getTimeStep(jobList):
+    """
+    Return the time step in atomic units of the first job in `jobList` that
+    runs trajectories, or ``None`` if there are no such jobs.
+    """
+    for job, params in jobList:
+        if job in ['configurations', 'windows', 'umbrella', 'recrossing']:
+            return float(quantity.convertTime(params[0], "ps")) / 2.418884326505e-5
+    return None
+
+def measureStepCosts(rpmd, dt, minTime=0.2):
+    """
+    Return a dictionary of the average wall time in seconds of a single
+    evaluation of the potential (``'potential'``) and of a single time step
+    of a single-bead configuration trajectory (``'configuration'``), an
+    umbrella sampling trajectory (``'umbrella'``), and a recrossing factor
+    parent trajectory constrained to the dividing surface (``'parent'``) for
+    the RPMD object `rpmd`, using a time step `dt` in atomic units. Each
+    measurement starts from the transition state and runs for at least
+    `minTime` seconds. The umbrella sampling cost is also used for the
+    recrossing factor child trajectories.
+    """
+    dt0, mode0 = rpmd.dt, rpmd.mode
+    geometry = rpmd.transitionStates[0].geometry
+    kforce = 0.1 * rpmd.T
+    steps = 100
+    costs = {}
+    
+    def getPosition(Nbeads):
+        q = numpy.zeros((3,rpmd.Natoms,Nbeads), order='F')
+        for k in range(Nbeads):
+            q[:,:,k] = geometry
+        return q
+    
+    def getStepCost(Nbeads, kforce, constrain):
+        # Each short trajectory starts afresh from the transition state, so
+        # that a trajectory that leaves the dividing surface region does not
+        # affect the others
+        context = rpmd.activate(Nbeads=Nbeads)
+        q0 = getPosition(Nbeads)
+        def run():
+            p = rpmd.sampleMomentum(Nbeads=Nbeads)
+            q = numpy.asfortranarray(q0.copy())
+            rpmd.getPropagator('equilibrate')(0, p, q, steps, 1.0, rpmd.getPotentialCallback(), kforce, constrain, False, context=context)
+        return timeFunction(run, minTime) / steps
+    
+    try:
+        rpmd.dt = dt
+        rpmd.initializeRandomNumberGenerator()
+        q = getPosition(rpmd.Nbeads)
+        costs['potential'] = timeFunction(lambda: rpmd.potential(q), minTime)
+        rpmd.mode = 1
+        costs['configuration'] = getStepCost(1, kforce, False)
+        costs['umbrella'] = getStepCost(rpmd.Nbeads, kforce, False)
+        rpmd.mode = 2
+        costs['parent'] = getStepCost(rpmd.Nbeads, 0.0, True)
+    finally:
+        rpmd.dt, rpmd.mode = dt0, mode0
+    
+    return costs
+
+################################################################################
+
+# The default tolerance on the energy drift of a trajectory run without a
+# thermostat, in units of the thermal energy of the ring polymer per degree of
+# freedom (see rpmdrate.profiling.KernelProfile)
+DRIFT_TOLERANCE = 0.002
+
+def measureEnergyDrift(rpmd, q, dt, evolutionTime, trajectories):
+    """
+    Return the mean and maximum energy drift and the average kinetic
+    temperature relative to the target temperature of the given number of
+    `trajectories` of length `evolutionTime` in atomic units, run without a
+    thermostat using a time step `dt` in atomic units from the positions `q`
+    with freshly sampled momenta. The trajectories are run in the same way as
+    the recrossing factor child trajectories, on the dividing surface at
+    :math:`\\xi = 1`. A trajectory that becomes unphysical is given an
+    infinite drift.
+    """
+    rpmd.dt = dt
+    context = rpmd.activate()
+    c = context - 1
+    steps = max(1, int(round(evolutionTime / dt)))
+    drifts = []
+    temperature = 0.0
+    monitorSteps = 0
+    for n in range(trajectories):
+        p1 = rpmd.sampleMomentum()
+        q1 = numpy.asfortranarray(q.copy())
+        kappa_num = numpy.zeros(steps, order='F')
+        kappa_denom = numpy.array(0.0, order='F')
+        system.reset_monitor(context)
+        actualSteps, result = rpmd.getPropagator('recrossing_trajectory')(numpy.array(0.0, order='F'), p1, q1, 1.0, rpmd.getPotentialCallback(), False, kappa_num, kappa_denom, 0.0, 1, context=context)
+        if result != 0 or system.monitor_trajectories[c] == 0:
+            drifts.append(float('inf'))
+        else:
+            drifts.append(float(system.monitor_drift[c]))
+        temperature += system.monitor_temperature[c]
+        monitorSteps += system.monitor_steps[c]
+    temperature = temperature / monitorSteps if monitorSteps > 0 else float('nan')
+    return numpy.mean(drifts), max(drifts), temperature
+
+def recommendTimeStep(rpmd, dt, tolerance=DRIFT_TOLERANCE, evolutionTime=0.02/2.418884326505e-5, trajectories=4, equilibrationSteps=1000, maxFactor=8.0):
+    """
+    Return the largest time step in atomic units for the RPMD object `rpmd`
+    for which the maximum energy drift (see :func:`measureEnergyDrift()`) of
+    trajectories of length `evolutionTime` in atomic units (20 fs by default)
+    does not exceed the given `tolerance`, along with a list of the time step,
+    mean and maximum drift, and relative kinetic temperature of each time step
+    tried. A ring polymer is first equilibrated on the dividing surface for
+    `equilibrationSteps` steps of the current time step `dt` in atomic units.
+    Multiples of `dt` are then tried in increasing powers of :math:`\\sqrt{2}`
+    up to `maxFactor`, stopping at the first time step that exceeds the
+    tolerance, since the drift of the velocity Verlet integrator grows as the
+    square of the time step. If `dt` itself exceeds the tolerance, smaller time
+    steps are tried down to `dt` / 4 instead. If no time step meets the
+    tolerance, ``None`` is returned in place of the time step.
+    """
+    dt0, mode0, monitorEnergy0 = rpmd.dt, rpmd.mode, rpmd.monitorEnergy
+    geometry = rpmd.transitionStates[0].geometry
+    rows = []
+    recommended = None
+    
+    try:
+        rpmd.dt = dt
+        rpmd.mode = 2
+        rpmd.monitorEnergy = True
+        rpmd.initializeRandomNumberGenerator()
+        context = rpmd.activate()
+        q0 = numpy.zeros((3,rpmd.Natoms,rpmd.Nbeads), order='F')
+        for k in range(rpmd.Nbeads):
+            q0[:,:,k] = geometry
+        q = numpy.asfortranarray(q0.copy())
+        result = rpmd.getPropagator('equilibrate')(0, rpmd.sampleMomentum(), q, equilibrationSteps, 1.0, rpmd.getPotentialCallback(), 0.0, True, False, context=context)
+        if result != 0:
+            # Fall back to the transition state geometry itself
+            q = q0
+        
+        n = 0
+        while 2**(0.5 * n) <= maxFactor * 1.0001:
+            dt1 = dt * 2**(0.5 * n)
+            meanDrift, maxDrift, temperature = measureEnergyDrift(rpmd, q, dt1, evolutionTime, trajectories)
+            rows.append((dt1, meanDrift, maxDrift, temperature))
+            if maxDrift > tolerance:
+                break
+            recommended = dt1
+            n += 1
+        
+        if recommended is None:
+            for n in range(1, 5):
+                dt1 = dt * 2**(-0.5 * n)
+                meanDrift, maxDrift, temperature = measureEnergyDrift(rpmd, q, dt1, evolutionTime, trajectories)
+                rows.append((dt1, meanDrift, maxDrift, temperature))
+                if maxDrift <= tolerance:
+                    recommended = dt1
+                    break
+    finally:
+        rpmd.dt, rpmd.mode, rpmd.monitorEnergy = dt0, mode0, monitorEnergy0
+    
+    return recommended, rows
+
+################################################################################
+
+def getParallelWallTime(costs, processes):
+    """
+    Return the wall time needed to run a batch of independent trajectories
+    with the given `costs` (in seconds) concurrently on the given number of
+    `processes`, assuming that the work is spread evenly.
+    """
+    if len(costs) == 0:
+        return 0.0
+    elif processes <= 1:
+        return sum(costs)
+    return max(sum(costs) / processes, max(costs))
+
+def getJobCost(job, params, costs, processes):
+    """
+    Return the number of trajectories, the number of time steps, the total
+    CPU time in seconds, and the wall time in seconds projected for a job of
+    type `job` with parameters `params`, as read from the input file, given
+    the `costs` per time step from :func:`measureStepCosts()` and the number
+    of `processes`. A note is also returned if the projection is only a bound
+    on the actual cost, e.g. for adaptive umbrella sampling.
+    """
+    def getSteps(time, dt):
+        return int(round(float(quantity.convertTime(time, "ps")) / 2.418884326505e-5 / dt))
+    
+    if job == 'configurations':
+        dt, evolutionTime, xi_list, kforce, stride = params
+        dt = float(quantity.convertTime(dt, "ps")) / 2.418884326505e-5
+        steps = getSteps(evolutionTime, dt)
+        Nxi = len(xi_list)
+        # Every stride-th configuration is generated in sequence in this
+        # process, with the others spawned on the pool along the way
+        cost = steps * costs['configuration']
+        serial = int(math.ceil(float(Nxi) / stride))
+        wallTime = Nxi * cost if processes <= 1 else max(serial * cost, Nxi * cost / processes)
+        return Nxi, Nxi * steps, Nxi * cost, wallTime, ''
+    
+    elif job == 'windows':
+        dt, windows, pilotTime, maxSeparation, maxIterations = params
+        dt = float(quantity.convertTime(dt, "ps")) / 2.418884326505e-5
+        pilotSteps = getSteps(pilotTime, dt)
+        # Only the first round of pilot trajectories can be counted in
+        # advance; each round of refinement adds more
+        steps = [int(round(window.equilibrationTime / dt)) + pilotSteps for window in windows]
+        trajectoryCosts = [n * costs['umbrella'] for n in steps]
+        return len(windows), sum(steps), sum(trajectoryCosts), getParallelWallTime(trajectoryCosts, processes), 'lower bound'
+    
+    elif job == 'umbrella':
+        dt, windows, saveTrajectories, staticFactorError, minTrajectories = params
+        dt = float(quantity.convertTime(dt, "ps")) / 2.418884326505e-5
+        # The windows are sampled breadth-first, with one trajectory per
+        # window that needs more sampling in each round
+        steps = [int(round(window.equilibrationTime / dt)) + int(round(window.evolutionTime / dt)) for window in windows]
+        trajectories = [window.trajectories for window in windows]
+        wallTime = 0.0
+        for iteration in range(max(trajectories + [0])):
+            wallTime += getParallelWallTime([n * costs['umbrella'] for n, count in zip(steps, trajectories) if count > iteration], processes)
+        totalSteps = sum([n * count for n, count in zip(steps, trajectories)])
+        note = 'upper bound' if staticFactorError is not None else ''
+        return sum(trajectories), totalSteps, totalSteps * costs['umbrella'], wallTime, note
+    
+    elif job == 'recrossing':
+        dt, equilibrationTime, childTrajectories, childSamplingTime, childrenPerSampling, childEvolutionTime, xi_current, saveParentTrajectory, saveChildTrajectories, recrossingFactorError, xi_commit, childCommitmentTime = params
+        dt = float(quantity.convertTime(dt, "ps")) / 2.418884326505e-5
+        equilibrationSteps = getSteps(equilibrationTime, dt)
+        childSamplingSteps = getSteps(childSamplingTime, dt)
+        childEvolutionSteps = getSteps(childEvolutionTime, dt)
+        # The children are run in pairs, each pair as a single trajectory
+        # of twice the length, and the parent is evolved in this process
+        # between each set of children
+        pairs = childrenPerSampling / 2
+        samplings = int(math.ceil(float(childTrajectories) / (2 * pairs))) if pairs > 0 else 0
+        parentSteps = equilibrationSteps + max(samplings - 1, 0) * childSamplingSteps
+        childSteps = samplings * pairs * 2 * childEvolutionSteps
+        cpuTime = parentSteps * costs['parent'] + childSteps * costs['umbrella']
+        wallTime = parentSteps * costs['parent'] + samplings * getParallelWallTime([2 * childEvolutionSteps * costs['umbrella']] * pairs, processes)
+        note = 'upper bound' if recrossingFactorError is not None or xi_commit is not None else ''
+        return samplings * pairs * 2, parentSteps + childSteps, cpuTime, wallTime, note
+    
+    # The other jobs do not run any trajectories
+    return 0, 0, 0.0, 0.0, ''
+
+def logPlan(systems, processes, minTime=0.2, driftTolerance=DRIFT_TOLERANCE):
+    """
+    Log the projected cost of running the jobs of each of a list of
+    `systems`, given as ``(label, system, jobList)`` tuples, on the given
+    number of `processes`, without running them. The systems of a sweep share
+    a single pool, so the projected wall time of the sweep is that of the
+    largest system or of the total CPU time spread over the pool, whichever
+    is larger. The umbrella configurations are only generated once for each
+    directory they are saved in, so they are only counted for the first
+    system that uses that directory. The largest time step whose energy drift
+    does not exceed `driftTolerance` is also recommended for each system (see
+    :func:`recommendTimeStep()`).
+    """
+    totalCPUTime = 0.0
+    maxWallTime = 0.0
+    configurationsDirectories = set()
+    for label, rpmd, jobList in systems:
+        dt = getTimeStep(jobList)
+        if dt is None:
+            logging.info('No trajectories requested for {0}.'.format(label))
+            logging.info('')
+            continue
+        
+        costs = measureStepCosts(rpmd, dt, minTime)
+        
+        logging.info('Projected cost for {0}'.format(label))
+        logging.info('=' * len('Projected cost for {0}'.format(label)))
+        logging.info('Potential evaluation ({0:d} beads)          = {1:g} ms'.format(rpmd.Nbeads, costs['potential'] * 1000))
+        logging.info('Configuration time step (1 bead)        = {0:g} ms'.format(costs['configuration'] * 1000))
+        logging.info('Umbrella sampling time step             = {0:g} ms'.format(costs['umbrella'] * 1000))
+        logging.info('Recrossing parent time step             = {0:g} ms'.format(costs['parent'] * 1000))
+        logging.info('Number of processes                     = {0:d}'.format(processes))
+        logging.info('')
+        
+        recommended, rows = recommendTimeStep(rpmd, dt, driftTolerance)
+        logging.info('=========== =========== =========== ===========')
+        logging.info('dt (ps)     Mean drift  Max drift   T_kin (K)')
+        logging.info('=========== =========== =========== ===========')
+        for dt1, meanDrift, maxDrift, temperature in sorted(rows):
+            logging.info('{0:11.4g} {1:11.4g} {2:11.4g} {3:11.4g}'.format(dt1 * 2.418884326505e-5, meanDrift, maxDrift, temperature * rpmd.T))
+        logging.info('=========== =========== =========== ===========')
+        if recommended is None:
+            logging.warning('No time step tried meets the energy drift tolerance of {0:g}; use a time step smaller than {1:g} ps.'.format(driftTolerance, min(rows)[0] * 2.418884326505e-5))
+        else:
+            logging.info('Recommended time step                   = {0:g} ps (energy drift tolerance {1:g})'.format(recommended * 2.418884326505e-5, driftTolerance))
+            if recommended > dt * 1.0001:
+                logging.info('The recommended time step would reduce the cost of the trajectories by a factor of {0:.3g}.'.format(recommended / dt))
+        logging.info('')
+        logging.info('=============== =========== =============== =========== =========== ============')
+        logging.info('Job             Trajs       Steps           Core-hours  Wall-hours  Note')
+        logging.info('=============== =========== =============== =========== =========== ============')
+        systemCPUTime = 0.0
+        systemWallTime = 0.0
+        for job, params in jobList:
+            if job == 'configurations' and rpmd.configurationsDirectory in configurationsDirectories:
+                logging.info('{0:15} {1:11d} {2:15d} {3:11.4g} {4:11.4g} {5}'.format(job, 0, 0, 0.0, 0.0, 'shared'))
+                continue
+            trajectories, steps, cpuTime, wallTime, note = getJobCost(job, params, costs, processes)
+            systemCPUTime += cpuTime
+            systemWallTime += wallTime
+            logging.info('{0:15} {1:11d} {2:15d} {3:11.4g} {4:11.4g} {5}'.format(job, trajectories, steps, cpuTime / 3600., wallTime / 3600., note).rstrip())
+        logging.info('=============== =========== =============== =========== =========== ============')
+        logging.info('{0:15} {1:11} {2:15} {3:11.4g} {4:11.4g}'.format('total', '', '', systemCPUTime / 3600., systemWallTime / 3600.))
+        logging.info('=============== =========== =============== =========== =========== ============')
+        logging.info('')
+        
+        configurationsDirectories.add(rpmd.configurationsDirectory)
+        totalCPUTime += systemCPUTime
+        maxWallTime = max(maxWallTime, systemWallTime)
+    
+    if len(systems) > 1:
+        wallTime = max(maxWallTime, totalCPUTime / max(processes, 1))
+        logging.info('Projected cost of the sweep of {0:d} systems on {1:d} processes: {2:.4g} core-hours, {3:.4g} wall-hours'.format(len(systems), processes, totalCPUTime / 3600., wallTime / 3600.))
+        logging.info('')
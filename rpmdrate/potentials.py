@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This module contains analytic potential energy surfaces for testing and
+benchmarking RPMDrate without building one of the research potential energy
+surfaces. Each surface is a callable object with the same contract as the
+``get_potential()`` function of an input file: given an array of the positions
+of each bead of each atom of shape ``(3, Natoms, Nbeads)`` in bohr, it
+returns the potential of each bead in hartree, the gradient of the potential
+with respect to the positions in hartree/bohr, and an integer that is nonzero
+if the potential could not be evaluated. Each surface is evaluated for all of
+the beads at once using NumPy, and a compiled version of the same surface
+(from the :mod:`rpmdrate._potentials` extension module) is available from the
+:meth:`getCompiledPotential()` method.
+
+The three reacting atoms are always atoms 1, 2, and 3, with the bond between
+atoms 1 and 2 broken and the bond between atoms 2 and 3 formed by the
+reaction, as in the H + H\ :sub:`2` example. For example, an input file could
+contain ::
+
+    from rpmdrate.potentials import LEPSPotential
+    get_potential = LEPSPotential()
+
+The :meth:`getTransitionStateGeometry()` method of each surface returns a
+suitable geometry for the ``transitionState()`` block.
+"""
+
+import numpy
+
+################################################################################
+
+def getMorseBond(q, atom1, atom2):
+    """
+    Return the vector from `atom2` to `atom1` (zero-based indices) for each
+    bead in the positions `q`, along with its length.
+    """
+    R = q[:,atom1,:] - q[:,atom2,:]
+    r = numpy.sqrt(numpy.sum(R * R, axis=0))
+    return R, r
+
+def addBondGradient(dVdq, atom1, atom2, dVdr, R, r):
+    """
+    Add the gradient of a potential that depends on the length `r` of the
+    bond vector `R` from `atom2` to `atom1` to `dVdq`, given the derivative
+    `dVdr` of the potential with respect to the bond length for each bead.
+    """
+    dVdR = dVdr * R / r
+    dVdq[:,atom1,:] += dVdR
+    dVdq[:,atom2,:] -= dVdR
+
+def getLinearTransitionStateGeometry(r1, r2, Natoms=3):
+    """
+    Return a linear geometry in bohr of shape ``(Natoms, 3)`` along the
+    z-axis with atom 2 at the origin, atom 1 a distance `r1` from it, and
+    atom 3 a distance `r2` from it on the other side. Any other atoms are
+    placed at the origin.
+    """
+    geometry = numpy.zeros((Natoms,3), numpy.float64)
+    geometry[0,2] = -r1
+    geometry[2,2] = r2
+    return geometry
+
+################################################################################
+
+class LEPSPotential:
+    """
+    The London-Eyring-Polanyi-Sato (LEPS) potential energy surface for three
+    identical atoms, such as H + H\ :sub:`2`. The attributes are:
+
+    =============== ============================================================
+    Attribute       Description
+    =============== ============================================================
+    `D`             The well depth of the diatomic Morse potential in hartree
+    `a`             The range parameter of the Morse potential in bohr\ :sup:`-1`
+    `r0`            The equilibrium bond length of the Morse potential in bohr
+    `sato`          The Sato parameter, which sets the height of the barrier
+    =============== ============================================================
+
+    The default parameters are those of H\ :sub:`2`, with a Sato parameter
+    that gives a linear, symmetric transition state about 0.43 eV above the
+    reactants. The potential is zero at the reactant asymptote. Only the
+    first three atoms interact; any other atoms feel no force.
+    """
+
+    def __init__(self, D=0.1744, a=1.04435, r0=1.40083, sato=0.13):
+        self.D = float(D)
+        self.a = float(a)
+        self.r0 = float(r0)
+        self.sato = float(sato)
+
+    def getCoulombAndExchange(self, r):
+        """
+        Return the Coulomb and exchange integrals and their derivatives with
+        respect to the bond length `r`.
+        """
+        D, a, r0, sato = self.D, self.a, self.r0, self.sato
+        f = 0.25 * D / (1.0 + sato)
+        E = numpy.exp(-a * (r - r0))
+        Q = f * ((3.0 + sato) * E * E - (2.0 + 6.0 * sato) * E)
+        J = f * ((1.0 + 3.0 * sato) * E * E - (6.0 + 2.0 * sato) * E)
+        dQ = -a * f * (2.0 * (3.0 + sato) * E * E - (2.0 + 6.0 * sato) * E)
+        dJ = -a * f * (2.0 * (1.0 + 3.0 * sato) * E * E - (6.0 + 2.0 * sato) * E)
+        return Q, J, dQ, dJ
+
+    def __call__(self, q):
+        Natoms = q.shape[1]
+        V = numpy.zeros(q.shape[2], numpy.float64)
+        dVdq = numpy.zeros_like(q)
+        if Natoms < 3:
+            return V, dVdq, 1
+
+        pairs = [(0,1), (1,2), (0,2)]
+        bonds = [getMorseBond(q, atom1, atom2) for atom1, atom2 in pairs]
+        Q, J, dQ, dJ = zip(*[self.getCoulombAndExchange(r) for R, r in bonds])
+
+        W2 = J[0] * J[0] + J[1] * J[1] + J[2] * J[2] - J[0] * J[1] - J[1] * J[2] - J[2] * J[0]
+        W = numpy.sqrt(numpy.maximum(W2, 0.0))
+        V = Q[0] + Q[1] + Q[2] - W + self.D
+
+        Winv = numpy.where(W > 1e-12, 0.5 / numpy.maximum(W, 1e-12), 0.0)
+        for m, (atom1, atom2) in enumerate(pairs):
+            dWdJ = (2.0 * J[m] - J[(m+1)%3] - J[(m+2)%3]) * Winv
+            R, r = bonds[m]
+            addBondGradient(dVdq, atom1, atom2, dQ[m] - dWdJ * dJ[m], R, r)
+
+        return V, dVdq, 0
+
+    def getTransitionStateGeometry(self):
+        """
+        Return the geometry in bohr of the linear, symmetric transition state,
+        found by minimizing the potential along the symmetric stretch.
+        """
+        # The potential along the symmetric stretch has a single minimum
+        # between the diatomic bond length and a few times that, which is
+        # found by bisecting on the sign of its derivative
+        def getDerivative(r):
+            q = getLinearTransitionStateGeometry(r, r).T[:,:,numpy.newaxis]
+            V, dVdq, info = self(q)
+            return dVdq[2,2,0] - dVdq[2,0,0]
+        rmin, rmax = self.r0, 3.0 * self.r0
+        while rmax - rmin > 1e-10:
+            r = 0.5 * (rmin + rmax)
+            if getDerivative(r) > 0:
+                rmax = r
+            else:
+                rmin = r
+        r = 0.5 * (rmin + rmax)
+        return getLinearTransitionStateGeometry(r, r)
+
+    def getCompiledPotential(self):
+        """
+        Return the compiled version of this potential energy surface, with
+        its parameters set to those of this object. The parameters are stored
+        in the compiled module, so only one set of LEPS parameters can be in
+        use at once.
+        """
+        from rpmdrate._potentials import potentials
+        potentials.leps_d = self.D
+        potentials.leps_a = self.a
+        potentials.leps_r0 = self.r0
+        potentials.leps_sato = self.sato
+        return potentials.leps
+
+################################################################################
+
+class ModelPotential:
+    """
+    A model potential energy surface for an A + BC -> AB + C reaction with a
+    barrier of tunable height. The potential is
+
+    .. math:: V = D (1 - x)^2 + D (1 - y)^2 - D + c x y
+
+    where :math:`x = e^{-a (r_{12} - r_0)}` and :math:`y = e^{-a (r_{23} - r_0)}`
+    for the breaking bond length :math:`r_{12}` and the forming bond length
+    :math:`r_{23}`. Far from the transition state, each bond is a Morse
+    oscillator with well depth :math:`D`, so the potential is zero at the
+    reactant and product asymptotes. The coupling strength :math:`c` is chosen
+    such that the only saddle point lies at the symmetric geometry with both
+    bond lengths equal, at a height `barrier` above the asymptotes. The
+    attributes are:
+
+    =============== ============================================================
+    Attribute       Description
+    =============== ============================================================
+    `D`             The well depth of the Morse potential in hartree
+    `a`             The range parameter of the Morse potential in bohr\ :sup:`-1`
+    `r0`            The equilibrium bond length of the Morse potential in bohr
+    `barrier`       The height of the barrier in hartree, between 0 and `D`
+    =============== ============================================================
+
+    The potential depends only on the lengths of the breaking and forming
+    bonds, so atoms 1 and 3 do not interact, and any other atoms feel no
+    force.
+    """
+
+    def __init__(self, D=0.1744, a=1.04435, r0=1.40083, barrier=0.016):
+        self.D = float(D)
+        self.a = float(a)
+        self.r0 = float(r0)
+        self.barrier = float(barrier)
+        if not 0 < self.barrier < self.D:
+            raise ValueError('Invalid barrier height {0:g}; must be between 0 and the well depth {1:g}.'.format(self.barrier, self.D))
+
+    def getCoupling(self):
+        """
+        Return the strength of the coupling between the two bonds that gives
+        the requested barrier height.
+        """
+        return 2.0 * self.D * (self.D + self.barrier) / (self.D - self.barrier)
+
+    def __call__(self, q):
+        Natoms = q.shape[1]
+        V = numpy.zeros(q.shape[2], numpy.float64)
+        dVdq = numpy.zeros_like(q)
+        if Natoms < 3:
+            return V, dVdq, 1
+        self.addPotential(q, V, dVdq)
+        return V, dVdq, 0
+
+    def addPotential(self, q, V, dVdq):
+        """
+        Add the potential and its gradient for the positions `q` to `V` and
+        `dVdq`.
+        """
+        D, a, r0, c = self.D, self.a, self.r0, self.getCoupling()
+        R12, r12 = getMorseBond(q, 0, 1)
+        R23, r23 = getMorseBond(q, 1, 2)
+        x = numpy.exp(-a * (r12 - r0))
+        y = numpy.exp(-a * (r23 - r0))
+        V += D * (1.0 - x) * (1.0 - x) + D * (1.0 - y) * (1.0 - y) - D + c * x * y
+        addBondGradient(dVdq, 0, 1, -a * x * (-2.0 * D * (1.0 - x) + c * y), R12, r12)
+        addBondGradient(dVdq, 1, 2, -a * y * (-2.0 * D * (1.0 - y) + c * x), R23, r23)
+
+    def getTransitionStateGeometry(self):
+        """
+        Return the geometry in bohr of the linear, symmetric transition state.
+        """
+        r = self.r0 - numpy.log((self.D - self.barrier) / (2.0 * self.D)) / self.a
+        return getLinearTransitionStateGeometry(r, r)
+
+    def getCompiledPotential(self):
+        """
+        Return the compiled version of this potential energy surface, with
+        its parameters set to those of this object. The parameters are stored
+        in the compiled module, so only one set of model parameters can be in
+        use at once.
+        """
+        from rpmdrate._potentials import potentials
+        potentials.model_d = self.D
+        potentials.model_a = self.a
+        potentials.model_r0 = self.r0
+        potentials.model_c = self.getCoupling()
+        return potentials.model
+
+################################################################################
+
+class SyntheticPotential:
+    """
+    A synthetic potential energy surface for a system of `Natoms` atoms with
+    an adjustable cost per evaluation. The first three atoms react on a
+    :class:`ModelPotential` surface with the given `barrier` height. Each of
+    the remaining spectator atoms is tethered to a reference position on a
+    grid next to atom 1 by a harmonic potential with force constant `kforce`
+    in hartree/bohr\ :sup:`2`, and is repelled by every other atom by an
+    exponential potential with strength `repulsion` in hartree and range
+    `range` in bohr. The cost of each evaluation scales as the square of the
+    number of atoms, and each evaluation is repeated `repeats` times to make
+    it more expensive still. The spectator atoms belong to the reactant
+    containing atoms 1 and 2.
+    """
+
+    def __init__(self, Natoms, repeats=1, barrier=0.016, kforce=0.1, repulsion=0.01, range=0.5):
+        if Natoms < 3:
+            raise ValueError('Invalid number of atoms {0:d}; must be at least 3.'.format(Natoms))
+        self.Natoms = Natoms
+        self.repeats = int(repeats)
+        self.model = ModelPotential(barrier=barrier)
+        self.kforce = float(kforce)
+        self.repulsion = float(repulsion)
+        self.range = float(range)
+        self.reference = self.getTransitionStateGeometry().T.copy()
+
+    def __call__(self, q):
+        Natoms = q.shape[1]
+        V = numpy.zeros(q.shape[2], numpy.float64)
+        dVdq = numpy.zeros_like(q)
+        if Natoms != self.Natoms:
+            return V, dVdq, 1
+
+        for n in range(max(self.repeats, 1)):
+            V[:] = 0.0
+            dVdq[:] = 0.0
+            self.model.addPotential(q, V, dVdq)
+            if Natoms > 3:
+                dq = q[:,3:,:] - self.reference[:,3:,numpy.newaxis]
+                V += 0.5 * self.kforce * numpy.sum(numpy.sum(dq * dq, axis=0), axis=0)
+                dVdq[:,3:,:] += self.kforce * dq
+                # The repulsion between each spectator atom i and each atom j < i
+                R = q[:,3:,numpy.newaxis,:] - q[:,numpy.newaxis,:,:]
+                r = numpy.sqrt(numpy.sum(R * R, axis=0))
+                mask = numpy.tri(Natoms, k=-1, dtype=bool)[3:,:,numpy.newaxis]
+                Vij = numpy.where(mask, self.repulsion * numpy.exp(-r / self.range), 0.0)
+                V += numpy.sum(numpy.sum(Vij, axis=0), axis=0)
+                dVdR = -Vij / self.range * R / numpy.where(mask, r, 1.0)
+                dVdq[:,3:,:] += numpy.sum(dVdR, axis=2)
+                dVdq -= numpy.sum(dVdR, axis=1)
+
+        return V, dVdq, 0
+
+    def getTransitionStateGeometry(self):
+        """
+        Return the geometry in bohr of the transition state of the reacting
+        atoms, with the spectator atoms at their reference positions.
+        """
+        geometry = numpy.zeros((self.Natoms,3), numpy.float64)
+        geometry[0:3,:] = self.model.getTransitionStateGeometry()
+        for j in range(3, self.Natoms):
+            n = j - 3
+            geometry[j,:] = [4.0 * (n % 5 + 1), 4.0 * (n // 5 % 5), -4.0 * (n // 25 + 1)]
+        return geometry
+
+    def getCompiledPotential(self):
+        """
+        Return the compiled version of this potential energy surface, with
+        its parameters set to those of this object. The parameters are stored
+        in the compiled module, so only one set of synthetic (and model)
+        parameters can be in use at once.
+        """
+        from rpmdrate._potentials import potentials
+        if self.Natoms > potentials.max_atoms:
+            raise ValueError('Invalid number of atoms {0:d}; the compiled potential supports at most {1:d}.'.format(self.Natoms, int(potentials.max_atoms)))
+        self.model.getCompiledPotential()
+        potentials.synthetic_reference[:,0:self.Natoms] = self.reference
+        potentials.synthetic_kforce = self.kforce
+        potentials.synthetic_repulsion = self.repulsion
+        potentials.synthetic_range = self.range
+        potentials.synthetic_repeats = self.repeats
+        return potentials.synthetic
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This module contains functions for summarizing the optional kernel profiling
+data collected by the Fortran layer. When profiling is turned on, the
+``system`` module accumulates the wall time spent in and the number of calls
+to each of the kernels in :data:`KERNELS`; each trajectory returns a snapshot
+of these along with its own wall time and number of time steps, which are
+accumulated here for each umbrella sampling window or recrossing factor stage.
+The optional energy monitoring data, i.e. the kinetic temperature of all
+trajectories and the drift of the ring polymer Hamiltonian in the recrossing
+factor child trajectories, which are run without a thermostat, are
+accumulated and summarized in the same way.
+"""
+
+import logging
+import numpy
+
+################################################################################
+
+# The kernels timed by the Fortran layer, in the order of the entries in
+# ``system.profile_time`` and ``system.profile_calls``
+KERNELS = [
+    'potential',
+    'free ring',
+    'reac coord',
+    'bias',
+    'constraint',
+    'thermostat',
+    'checks',
+    'reweight',
+]
+
+################################################################################
+
+class KernelProfile:
+    """
+    The accumulated kernel profiling data for a set of trajectories. The
+    attributes are:
+    
+    =================== ========================================================
+    Attribute           Description
+    =================== ========================================================
+    `trajectories`      The number of trajectories profiled
+    `steps`             The total number of time steps taken
+    `wallTime`          The total wall time of the trajectories in s
+    `time`              The total wall time spent in each kernel in s
+    `calls`             The total number of calls to each kernel
+    `monitorSteps`      The number of time steps whose kinetic temperature was monitored
+    `temperature`       The sum of the kinetic temperature over the monitored time steps, relative to the target temperature
+    `driftTrajectories` The number of trajectories whose energy drift was monitored
+    `drift`             The sum of the largest energy drift of each monitored trajectory
+    `maxDrift`          The largest energy drift of any monitored trajectory
+    =================== ========================================================
+    
+    The energy drift of a trajectory is the largest deviation of the ring
+    polymer Hamiltonian from its initial value, in units of the thermal energy
+    of the ring polymer per degree of freedom.
+    
+    """
+
+    def __init__(self):
+        self.trajectories = 0
+        self.steps = 0
+        self.wallTime = 0.0
+        self.time = numpy.zeros(len(KERNELS))
+        self.calls = numpy.zeros(len(KERNELS), numpy.int64)
+        self.monitorSteps = 0
+        self.temperature = 0.0
+        self.driftTrajectories = 0
+        self.drift = 0.0
+        self.maxDrift = 0.0
+
+    def add(self, profile):
+        """
+        Add the `profile` returned by a single trajectory, a tuple of the wall
+        time, number of time steps, and the kernel times and call counts,
+        optionally followed by the energy monitoring data as a tuple of
+        `monitorSteps`, `temperature`, `driftTrajectories`, `drift`, and
+        `maxDrift`. A `profile` of ``None``, as returned when profiling and
+        energy monitoring are turned off, is ignored.
+        """
+        if profile is None:
+            return
+        wallTime, steps, time, calls = profile[0:4]
+        self.trajectories += 1
+        self.steps += steps
+        self.wallTime += wallTime
+        self.time += time
+        self.calls += calls
+        if len(profile) > 4:
+            monitorSteps, temperature, driftTrajectories, drift, maxDrift = profile[4]
+            self.monitorSteps += monitorSteps
+            self.temperature += temperature
+            self.driftTrajectories += driftTrajectories
+            self.drift += drift
+            self.maxDrift = max(self.maxDrift, maxDrift)
+    
+    def merge(self, profile):
+        """
+        Add the accumulated data of another :class:`KernelProfile` object
+        `profile` to this one.
+        """
+        self.trajectories += profile.trajectories
+        self.steps += profile.steps
+        self.wallTime += profile.wallTime
+        self.time += profile.time
+        self.calls += profile.calls
+        self.monitorSteps += profile.monitorSteps
+        self.temperature += profile.temperature
+        self.driftTrajectories += profile.driftTrajectories
+        self.drift += profile.drift
+        self.maxDrift = max(self.maxDrift, profile.maxDrift)
+
+    def getStepsPerSecond(self):
+        """
+        Return the number of time steps taken per second of wall time, or zero
+        if no time has been recorded.
+        """
+        return self.steps / self.wallTime if self.wallTime > 0 else 0.0
+
+    def getOtherTime(self):
+        """
+        Return the wall time not spent in any of the profiled kernels, i.e. in
+        the rest of the integrator and the Python layer.
+        """
+        return max(self.wallTime - numpy.sum(self.time), 0.0)
+
+    def getKineticTemperature(self, T):
+        """
+        Return the average kinetic temperature in K of the monitored time
+        steps for a target temperature `T` in K, or ``nan`` if no time steps
+        were monitored.
+        """
+        return T * self.temperature / self.monitorSteps if self.monitorSteps > 0 else float('nan')
+
+    def getMeanDrift(self):
+        """
+        Return the average energy drift of the monitored trajectories, or
+        ``nan`` if no trajectories were monitored.
+        """
+        return self.drift / self.driftTrajectories if self.driftTrajectories > 0 else float('nan')
+
+################################################################################
+
+def logKernelProfiles(title, profiles):
+    """
+    Print a table of the accumulated kernel profiles to the log, one row for
+    each (label, profile) pair in `profiles`, along with their total. Kernel
+    times are given in seconds.
+    """
+    total = KernelProfile()
+    for label, profile in profiles:
+        total.merge(profile)
+    if total.trajectories == 0:
+        return
+    
+    columns = ['steps', 'time', 'steps/s'] + KERNELS + ['other']
+    divider = '=========== ' + ' '.join(['=' * 10 for column in columns])
+    heading = 'Kernel profile for {0}'.format(title)
+    logging.info(heading)
+    logging.info('=' * len(heading))
+    logging.info(divider)
+    logging.info(('{0:11} '.format('') + ' '.join(['{0:10}'.format(column) for column in columns])).rstrip())
+    logging.info(divider)
+    for label, profile in profiles + [('total', total)]:
+        if profile.trajectories == 0:
+            continue
+        values = [profile.wallTime, profile.getStepsPerSecond()] + list(profile.time) + [profile.getOtherTime()]
+        logging.info('{0:11} {1:10d} '.format(label, profile.steps) + ' '.join(['{0:10.4g}'.format(value) for value in values]))
+    logging.info(divider)
+    logging.info('')
+
+def logEnergyMonitor(title, profiles, T):
+    """
+    Print a table of the energy monitoring data accumulated in the profiles
+    to the log, one row for each (label, profile) pair in `profiles`, along
+    with their total. The kinetic temperature is compared to the target
+    temperature `T` in K, and the energy drift is given in units of the
+    thermal energy of the ring polymer per degree of freedom.
+    """
+    total = KernelProfile()
+    for label, profile in profiles:
+        total.merge(profile)
+    if total.monitorSteps == 0:
+        return
+    
+    divider = '=========== ========== ========== ========== ========== =========='
+    heading = 'Energy monitor for {0} (target temperature {1:g} K)'.format(title, T)
+    logging.info(heading)
+    logging.info('=' * len(heading))
+    logging.info(divider)
+    logging.info('{0:11} {1:10} {2:10} {3:10} {4:10} {5:10}'.format('', 'steps', 'T_kin (K)', 'trajs', 'mean drift', 'max drift').rstrip())
+    logging.info(divider)
+    for label, profile in profiles + [('total', total)]:
+        if profile.monitorSteps == 0:
+            continue
+        if profile.driftTrajectories > 0:
+            logging.info('{0:11} {1:10d} {2:10.4g} {3:10d} {4:10.4g} {5:10.4g}'.format(label, profile.monitorSteps, profile.getKineticTemperature(T), profile.driftTrajectories, profile.getMeanDrift(), profile.maxDrift))
+        else:
+            logging.info('{0:11} {1:10d} {2:10.4g}'.format(label, profile.monitorSteps, profile.getKineticTemperature(T)))
+    logging.info(divider)
+    logging.info('')
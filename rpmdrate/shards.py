@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This module contains functions for splitting the umbrella sampling and
+recrossing factor calculations of an RPMDrate job into a number of shards,
+e.g. for running as the elements of a job array on a batch-scheduled cluster.
+Each shard samples a disjoint subset of the umbrella sampling windows and a
+share of the recrossing factor child trajectories, using its own stream of
+random numbers, and saves its partial results to its own subdirectory of the
+working directory. The partial results of all of the shards are then merged
+into the standard output files, from which the potential of mean force and
+rate coefficient can be computed as usual.
+"""
+
+import os
+import re
+import logging
+import numpy
+
+from rpmdrate.main import RPMDError, Window
+from rpmdrate.jobs import runJob, unshardedJobs
+
+################################################################################
+
+def parseShard(value):
+    """
+    Parse a shard of the form ``I/N``, meaning the `I`-th of `N` shards
+    (counting from 1), into an ``(index, count)`` tuple.
+    """
+    try:
+        index, count = [int(token) for token in value.split('/')]
+    except ValueError:
+        raise ValueError('Invalid shard {0!r}; expected the form I/N.'.format(value))
+    if count < 1 or index < 1 or index > count:
+        raise ValueError('Invalid shard {0!r}; the index must be between 1 and the number of shards.'.format(value))
+    return (index, count)
+
+def getShardDirectory(workingDirectory, shard):
+    """
+    Return the directory in which the given `shard`, an ``(index, count)``
+    tuple, saves its partial results for the working directory
+    `workingDirectory`.
+    """
+    return os.path.join(workingDirectory, 'shards', '{0:d}-of-{1:d}'.format(*shard))
+
+def getShardDirectories(workingDirectory):
+    """
+    Return a list of the directories in which the shards of the calculation
+    in `workingDirectory` have saved partial results, ordered by the number
+    of shards and then by shard index.
+    """
+    path = os.path.join(workingDirectory, 'shards')
+    if not os.path.isdir(path):
+        return []
+    shards = []
+    for name in os.listdir(path):
+        match = re.match(r'^(\d+)-of-(\d+)$', name)
+        if match and os.path.isdir(os.path.join(path, name)):
+            shards.append((int(match.group(2)), int(match.group(1)), os.path.join(path, name)))
+    return [directory for count, index, directory in sorted(shards)]
+
+def getShardWindows(windows, shard):
+    """
+    Return the umbrella sampling `windows` to be sampled by the given
+    `shard`. The windows are dealt out to the shards in turn, so that each
+    shard has windows spread along the whole reaction coordinate.
+    """
+    index, count = shard
+    return windows[index-1::count]
+
+def getShardTrajectories(trajectories, shard):
+    """
+    Return the number of the given total number of recrossing factor child
+    `trajectories` to be run by the given `shard`.
+    """
+    index, count = shard
+    return trajectories * index // count - trajectories * (index - 1) // count
+
+################################################################################
+
+def mergeShards(system):
+    """
+    Merge the partial umbrella sampling and recrossing factor results saved
+    by the shards of the calculation for the RPMD object `system` into the
+    standard output files in its working directory, replacing any files of
+    the same name. Returns the number of files saved.
+    """
+    workingDirectory = system.createWorkingDirectory()
+    shardDirectories = getShardDirectories(workingDirectory)
+    if not shardDirectories:
+        logging.warning('No shards found in {0}.'.format(workingDirectory))
+        return 0
+    
+    # Collect the files of each kind saved by the shards, by name
+    partials = {}
+    for directory in shardDirectories:
+        for name in sorted(os.listdir(directory)):
+            if re.match(r'^(umbrella_sampling|umbrella_histogram|recrossing_factor)_-?\d+\.\d+\.dat$', name):
+                partials.setdefault(name, []).append(os.path.join(directory, name))
+    
+    logging.info('Merging the results of {0:d} shards in {1}'.format(len(shardDirectories), workingDirectory))
+    logging.info('')
+    logging.info('================================ =========== ============')
+    logging.info('File                             shards      trajectories')
+    logging.info('================================ =========== ============')
+    for name in sorted(partials):
+        paths = partials[name]
+        path = os.path.join(workingDirectory, name)
+        if name.startswith('umbrella_sampling_'):
+            trajectories = mergeUmbrellaSampling(system, paths, path)
+        elif name.startswith('umbrella_histogram_'):
+            trajectories = mergeUmbrellaHistogram(system, paths, path)
+        else:
+            trajectories = mergeRecrossingFactor(system, paths, path)
+        logging.info('{0:32s} {1:11d} {2:12d}'.format(name, len(paths), trajectories))
+    logging.info('================================ =========== ============')
+    logging.info('')
+    
+    return len(partials)
+
+def mergeUmbrellaSampling(system, paths, path):
+    """
+    Merge the umbrella sampling output files at `paths`, all for the same
+    window, into a single file at `path`, as if the trajectories of each file
+    had been run one after another. Returns the number of trajectories in the
+    merged file.
+    """
+    header = None
+    av = 0.0; av2 = 0.0; count = 0
+    rows = []
+    for shardPath in paths:
+        xi, kforce, av_list, av2_list, count_list = system.loadUmbrellaSampling(shardPath)
+        if header is None:
+            xi0, kforce0 = xi, kforce
+            # The header is copied verbatim from the first file, up to and
+            # including the column headings of the data
+            header = []
+            f = open(shardPath, 'r')
+            for line in f:
+                header.append(line)
+                if line.startswith('====') and len([l for l in header if l.startswith('====')]) == 2:
+                    break
+            f.close()
+        elif abs(kforce - kforce0) > 1e-6 * abs(kforce0):
+            raise RPMDError('Force constant of umbrella sampling output {0} does not match that of {1}.'.format(shardPath, paths[0]))
+        # The saved output is cumulative, so recover the contribution of each
+        # trajectory from the differences
+        for dav, dav2, dcount in zip(numpy.diff(numpy.hstack([0.0, av_list])), numpy.diff(numpy.hstack([0.0, av2_list])), numpy.diff(numpy.hstack([0, count_list]))):
+            av += dav; av2 += dav2; count += int(dcount)
+            rows.append((av, av2, count))
+    
+    f = open(path, 'w')
+    f.writelines(header)
+    for av, av2, count in rows:
+        mean = av / count
+        variance = av2 / count - mean * mean
+        f.write('{0:15.8f} {1:15.8f} {2:11d} {3:15.5e} {4:15.5e}\n'.format(av, av2, count, mean, variance))
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    
+    return len(rows)
+
+def mergeUmbrellaHistogram(system, paths, path):
+    """
+    Merge the umbrella sampling histogram files at `paths`, all for the same
+    window, into a single file at `path`. Returns the number of trajectories
+    in the merged histogram.
+    """
+    window = None
+    for shardPath in paths:
+        xi = float(re.search(r'_(-?\d+\.\d+)\.dat$', shardPath).group(1))
+        partial = Window(xi=xi)
+        T, Nbeads, kforce = system.loadUmbrellaHistogram(shardPath, partial)
+        if window is None:
+            window = partial
+            window.kforce = kforce
+        elif (partial.histogram.shape != window.histogram.shape or 
+                abs(partial.histogramMin - window.histogramMin) > 1e-8 or 
+                abs(partial.histogramWidth - window.histogramWidth) > 1e-8 * window.histogramWidth):
+            raise RPMDError('Bins of umbrella sampling histogram {0} do not match those of {1}.'.format(shardPath, paths[0]))
+        elif abs(kforce - window.kforce) > 1e-6 * abs(window.kforce):
+            raise RPMDError('Force constant of umbrella sampling histogram {0} does not match that of {1}.'.format(shardPath, paths[0]))
+        else:
+            window.histogram += partial.histogram
+            window.histogramTrajectories += partial.histogramTrajectories
+    
+    system.saveUmbrellaHistogram(path, window)
+    
+    return window.histogramTrajectories
+
+def mergeRecrossingFactor(system, paths, path):
+    """
+    Merge the recrossing factor output files at `paths`, all for the same
+    dividing surface, into a single file at `path`. The parent trajectory of
+    each shard is independent, so the contributions of the parent
+    configurations of all of the shards are simply pooled. Returns the number
+    of child trajectories in the merged file.
+    """
+    merged = None
+    for shardPath in paths:
+        (T, Nbeads, xi_current, dt, kappa_num, kappa_denom, trajectoryCount,
+            childTrajectories, equilibrationSteps, childSamplingSteps, 
+            childEvolutionSteps, childrenPerSampling, kappa_batch_num,
+            kappa_batch_denom) = system.loadRecrossingFactor(shardPath)
+        if merged is None:
+            merged = [T, Nbeads, xi_current, dt, kappa_num, float(kappa_denom), trajectoryCount,
+                childTrajectories, equilibrationSteps, childSamplingSteps, 
+                childEvolutionSteps, childrenPerSampling, list(kappa_batch_num),
+                list(kappa_batch_denom)]
+        elif T != merged[0] or Nbeads != merged[1] or abs(xi_current - merged[2]) >= 1e-4 or dt != merged[3] or childEvolutionSteps != merged[10]:
+            raise RPMDError('Parameters of recrossing factor output {0} do not match those of {1}.'.format(shardPath, paths[0]))
+        else:
+            merged[4] = merged[4] + kappa_num
+            merged[5] += float(kappa_denom)
+            merged[6] += trajectoryCount
+            merged[7] += childTrajectories
+            merged[12].extend(kappa_batch_num)
+            merged[13].extend(kappa_batch_denom)
+    
+    (T, Nbeads, xi_current, dt, kappa_num, kappa_denom, trajectoryCount,
+        childTrajectories, equilibrationSteps, childSamplingSteps, 
+        childEvolutionSteps, childrenPerSampling, kappa_batch_num,
+        kappa_batch_denom) = merged
+    system.dt = dt
+    system.xi_current = xi_current
+    system.saveRecrossingFactor(path, kappa_num, kappa_denom, trajectoryCount,
+        childTrajectories, equilibrationSteps, childSamplingSteps, childEvolutionSteps, childrenPerSampling,
+        kappa_batch_num, kappa_batch_denom)
+    
+    return trajectoryCount
+
+def runMergedJobs(system, jobList):
+    """
+    Run the jobs in `jobList` that were skipped by the shards of the
+    calculation for the RPMD object `system`, using the merged results saved
+    in its working directory (see :func:`mergeShards()`). No new trajectories
+    are run: the recrossing factor is taken from the merged output if there
+    is any, and the rate coefficient is only computed once it is available.
+    """
+    for job, params in jobList:
+        if job == 'PMF':
+            # The windows in the input file have not been sampled in this
+            # process, so they are loaded from the merged output instead
+            windows, xi_min, xi_max, bins = params
+            system.computePotentialOfMeanForce(None, xi_min, xi_max, bins)
+        elif job == 'recrossing':
+            # Locate the dividing surface in the same way as the shards did
+            xi_current = params[6]
+            if xi_current is None and system.potentialOfMeanForce is not None:
+                index = numpy.argmax(system.potentialOfMeanForce[1,:])
+                xi_current = system.potentialOfMeanForce[0,index]
+            if xi_current is None:
+                continue
+            recrossingFilename = os.path.join(system.createWorkingDirectory(), 'recrossing_factor_{0:.4f}.dat'.format(xi_current))
+            if os.path.exists(recrossingFilename):
+                kappa_num, kappa_denom = system.loadRecrossingFactor(recrossingFilename)[4:6]
+                system.xi_current = xi_current
+                system.recrossingFactor = kappa_num[-1] / kappa_denom
+                logging.info('Merged value of recrossing factor at xi = {0:.4f} is {1:.6f}.'.format(xi_current, system.recrossingFactor))
+                logging.info('')
+        elif job == 'rate' and system.recrossingFactor is None:
+            logging.info('Skipping rate job until the recrossing factor shards have been merged.')
+            logging.info('')
+        elif job in unshardedJobs:
+            runJob(system, job, params)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This module contains functions for estimating the statistical uncertainty of
+quantities sampled in an RPMD simulation, such as the mean of the reaction
+coordinate in an umbrella sampling window. Consecutive samples along a single
+trajectory are strongly correlated, so these functions work with block
+averages (e.g. the average over each independent trajectory) instead.
+"""
+
+import math
+import numpy
+
+################################################################################
+
+def getBlockMean(values, weights=None):
+    """
+    Return the weighted mean of a set of block averages `values`. The 
+    `weights` are typically the number of samples in each block; if not given,
+    all blocks are weighted equally.
+    """
+    values = numpy.array(values, numpy.float64)
+    if weights is None:
+        weights = numpy.ones_like(values)
+    else:
+        weights = numpy.array(weights, numpy.float64)
+    return numpy.sum(weights * values) / numpy.sum(weights)
+
+def getBlockStandardError(values, weights=None):
+    """
+    Return the standard error in the weighted mean of a set of block averages
+    `values`, treating each block as an independent sample. The `weights` are
+    typically the number of samples in each block; if not given, all blocks
+    are weighted equally. At least two blocks are required to estimate the
+    error; if fewer are given, infinity is returned.
+    """
+    values = numpy.array(values, numpy.float64)
+    if weights is None:
+        weights = numpy.ones_like(values)
+    else:
+        weights = numpy.array(weights, numpy.float64)
+    
+    # Discard empty blocks, which carry no information
+    values = values[weights > 0]
+    weights = weights[weights > 0]
+    Nblocks = values.shape[0]
+    if Nblocks < 2:
+        return float('inf')
+    
+    mean = numpy.sum(weights * values) / numpy.sum(weights)
+    variance = numpy.sum(weights * weights * (values - mean)**2) / numpy.sum(weights)**2
+    return math.sqrt(variance * Nblocks / (Nblocks - 1))
+
+def getBlockingStandardError(values, minBlocks=8):
+    """
+    Return the standard error in the mean of a series of correlated `values`,
+    such as consecutive batch averages along a single trajectory, using the
+    blocking method of Flyvbjerg and Petersen. Neighboring values are
+    repeatedly averaged in pairs, which removes the correlation between them,
+    and the largest standard error among the levels with at least `minBlocks`
+    blocks is returned. At least two values are required to estimate the
+    error; if fewer are given, infinity is returned.
+    """
+    values = numpy.array(values, numpy.float64)
+    if values.shape[0] < 2:
+        return float('inf')
+    
+    error = 0.0
+    while True:
+        Nblocks = values.shape[0]
+        error = max(error, numpy.std(values, ddof=1) / math.sqrt(Nblocks))
+        if Nblocks // 2 < minBlocks:
+            break
+        values = 0.5 * (values[0:2*(Nblocks//2):2] + values[1:2*(Nblocks//2):2])
+    return error
+
+def getRatioStandardError(numerators, denominators, minBlocks=8):
+    """
+    Return the ratio of the sum of the `numerators` to the sum of the
+    `denominators` collected in a series of batches, along with its standard
+    error. The error is propagated to first order from the scatter in 
+    :math:`z_b = n_b - R d_b` between batches, where :math:`R` is the ratio,
+    and the batches are blocked as in :func:`getBlockingStandardError()` to
+    account for correlation between consecutive batches.
+    """
+    numerators = numpy.array(numerators, numpy.float64)
+    denominators = numpy.array(denominators, numpy.float64)
+    Nbatches = numerators.shape[0]
+    ratio = numpy.sum(numerators) / numpy.sum(denominators)
+    z = numerators - ratio * denominators
+    error = Nbatches * getBlockingStandardError(z, minBlocks) / abs(numpy.sum(denominators))
+    return ratio, error
@@ -95,10 +95,10 @@ class TransitionState:
             R = math.sqrt(Rx * Rx + Ry * Ry + Rz * Rz)
             self.breakingBondLengths[m] = R
 
-    def activate(self, module=None):
+    def activate(self, module=None, context=1):
         """
         Set this object as the active transition state dividing surface in the
-        Fortran layer.
+        given `context` of the Fortran layer.
         """
         Nforming_bonds = self.formingBonds.shape[0]
         Nbreaking_bonds = self.breakingBonds.shape[0]
@@ -106,13 +106,14 @@ class TransitionState:
         
         if module is None: module = transition_state
 
-        module.number_of_transition_states = 1
-        module.number_of_bonds = Nforming_bonds
-        module.forming_bonds[0,0:Nforming_bonds,:] = self.formingBonds
-        module.forming_bond_lengths[0,0:Nforming_bonds] = self.formingBondLengths
+        c = context - 1
+        module.number_of_transition_states[c] = 1
+        module.number_of_bonds[c] = Nforming_bonds
+        module.forming_bonds[0,0:Nforming_bonds,:,c] = self.formingBonds
+        module.forming_bond_lengths[0,0:Nforming_bonds,c] = self.formingBondLengths
         module.number_of_breaking_bonds = Nbreaking_bonds
-        module.breaking_bonds[0,0:Nbreaking_bonds,:] = self.breakingBonds
-        module.breaking_bond_lengths[0,0:Nbreaking_bonds] = self.breakingBondLengths
+        module.breaking_bonds[0,0:Nbreaking_bonds,:,c] = self.breakingBonds
+        module.breaking_bond_lengths[0,0:Nbreaking_bonds,c] = self.breakingBondLengths
     
     def value(self, position):
         """
@@ -180,10 +181,10 @@ class Reactants:
         for j in self.reactant2Atoms:
             self.massFractions[j-1] = self.mass[j-1] / self.totalMass2
     
-    def activate(self, module=None):
+    def activate(self, module=None, context=1):
         """
         Set this object as the active bimolecular reactants dividing surface in
-        the Fortran layer.
+        the given `context` of the Fortran layer.
         """
         Natoms = self.massFractions.shape[0]
         Nreactant1_atoms = self.reactant1Atoms.shape[0]
@@ -191,12 +192,13 @@ class Reactants:
         
         if module is None: module = reactants
         
-        module.rinf = self.Rinf
-        module.massfrac[0:Natoms] = self.massFractions
-        module.nreactant1_atoms = Nreactant1_atoms
-        module.reactant1_atoms[0:Nreactant1_atoms] = self.reactant1Atoms
-        module.nreactant2_atoms = Nreactant2_atoms
-        module.reactant2_atoms[0:Nreactant2_atoms] = self.reactant2Atoms
+        c = context - 1
+        module.rinf[c] = self.Rinf
+        module.massfrac[0:Natoms,c] = self.massFractions
+        module.nreactant1_atoms[c] = Nreactant1_atoms
+        module.reactant1_atoms[0:Nreactant1_atoms,c] = self.reactant1Atoms
+        module.nreactant2_atoms[c] = Nreactant2_atoms
+        module.reactant2_atoms[0:Nreactant2_atoms,c] = self.reactant2Atoms
 
     def value(self, position):
         """
@@ -55,13 +55,13 @@ class AndersenThermostat:
         else:
             self.samplingTime = 0.0
 
-    def activate(self, module, Natoms, Nbeads):
+    def activate(self, module, Natoms, Nbeads, context=1):
         """
-        Set the thermostat as active in the Fortran layer of the given
-        `module`.
+        Set the thermostat as active in the given `context` of the Fortran
+        layer of the given `module`.
         """
-        module.thermostat = 1
-        module.andersen_sampling_time = self.samplingTime
+        module.thermostat[context-1] = 1
+        module.andersen_sampling_time[context-1] = self.samplingTime
 
 ################################################################################
 
@@ -133,18 +133,19 @@ class GLEThermostat(object):
         else:
             raise ValueError('Unexpected value {0!r} for C attribute.'.format(value))
 
-    def activate(self, module, Natoms, Nbeads):
+    def activate(self, module, Natoms, Nbeads, context=1):
         """
-        Set the thermostat as active in the Fortran layer of the given
-        `module`.
+        Set the thermostat as active in the given `context` of the Fortran
+        layer of the given `module`.
         """
+        c = context - 1
         Ns = self._A.shape[0] - 1
-        module.thermostat = 2
-        module.gle_ns = Ns
-        module.gle_a[0:Ns+1,0:Ns+1] = self._A * 2.418884326505e-17  # s^-1 to atomic units of inverse time
+        module.thermostat[c] = 2
+        module.gle_ns[c] = Ns
+        module.gle_a[0:Ns+1,0:Ns+1,c] = self._A * 2.418884326505e-17  # s^-1 to atomic units of inverse time
         if self._C is None:
-            module.gle_c[0:Ns+1,0:Ns+1] = numpy.zeros((Ns+1,Ns+1))
+            module.gle_c[0:Ns+1,0:Ns+1,c] = numpy.zeros((Ns+1,Ns+1))
             for s in range(Ns+1):
-                module.gle_c[s,s] = Nbeads / module.beta
+                module.gle_c[s,s,c] = Nbeads / module.beta[c]
         else:
-            module.gle_c[0:Ns+1,0:Ns+1] = self._C * constants.kB / 4.35974417e-18  # K to atomic units of energy
+            module.gle_c[0:Ns+1,0:Ns+1,c] = self._C * constants.kB / 4.35974417e-18  # K to atomic units of energy
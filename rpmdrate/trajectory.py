@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This module contains functionality for recording RPMD trajectories to disk for
+later inspection, and for reading them back.
+
+The trajectories are recorded by the Fortran layer into an in-memory buffer,
+which is written to disk after each call, so that recording a trajectory
+costs little more than running it. Each trajectory file starts with a header
+containing an identifying string, the number of atoms, the number of beads in
+each frame (1 if only the centroids are recorded), the number of time steps
+between frames, and the time step in atomic units. The header is followed by
+the frames, each consisting of the number of the time step at which the frame
+was recorded as a 64-bit integer, and the position of each bead in each atom
+in bohr as 32-bit floats in Fortran order, i.e. with an array shape of
+``(3, Natoms, Nbeads)``. All values are little-endian. The step number
+restarts each time the trajectory is restarted, rolled back, or continued by
+a new call into the Fortran layer. Files whose names end in ``.gz`` are
+compressed using gzip.
+"""
+
+import os
+import os.path
+import gzip
+import numpy
+import struct
+import logging
+
+from rpmdrate._main import system
+
+################################################################################
+
+# The identifying string at the start of each trajectory file
+MAGIC = 'RPMDTRJ1'
+
+# The file header and the header of each frame
+HEADER = struct.Struct('<8siiid')
+FRAME = struct.Struct('<q')
+
+# The largest recording buffer to allocate, in bytes; frames beyond it are
+# dropped with a warning
+MAX_BUFFER_SIZE = 256 * 1024 * 1024
+
+# The next index to try for each trajectory label in getTrajectoryPath()
+nextIndex = {}
+
+def getTrajectoryPath(directory, label, compress=False):
+    """
+    Return the path of a new trajectory file in `directory` whose name starts
+    with `label` and ends with a number chosen so that the file does not yet
+    exist and the path has not been returned before by this process. The file
+    is compressed if `compress` is ``True``.
+    """
+    extension = '.trj.gz' if compress else '.trj'
+    index = nextIndex.get((directory, label), 1)
+    while True:
+        path = os.path.join(directory, '{0}_{1:04d}{2}'.format(label, index, extension))
+        index += 1
+        if not os.path.exists(path):
+            break
+    nextIndex[directory, label] = index
+    return path
+
+################################################################################
+
+class TrajectoryRecorder:
+    """
+    A recorder of an RPMD trajectory to a file on disk. The attributes are:
+    
+    =========================== ================================================
+    Attribute                   Description
+    =========================== ================================================
+    `path`                      The path of the trajectory file
+    `Natoms`                    The number of atoms in the molecular system
+    `Nbeads`                    The number of beads recorded in each frame (1 if only the centroids are recorded)
+    `centroids`                 ``True`` if only the centroids are recorded, ``False`` otherwise
+    `stride`                    The number of time steps between recorded frames
+    `dt`                        The time step in atomic units
+    `context`                   The context of the Fortran layer the trajectory is run in
+    =========================== ================================================
+    
+    If the file already exists, the frames are appended to it. To record
+    a trajectory, call :meth:`start()` before each call into the Fortran
+    layer with recording turned on, and :meth:`stop()` after it.
+    """
+    
+    def __init__(self, path, Natoms, Nbeads, stride=1, centroids=False, dt=0.0, context=1):
+        self.path = path
+        self.Natoms = Natoms
+        self.Nbeads = 1 if centroids else Nbeads
+        self.centroids = centroids
+        self.stride = max(1, int(stride))
+        self.dt = dt
+        self.context = context
+        
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass
+        
+        empty = not os.path.exists(path) or os.path.getsize(path) == 0
+        if path.endswith('.gz'):
+            self.file = gzip.open(path, 'ab')
+        else:
+            self.file = open(path, 'ab')
+        if empty:
+            self.file.write(HEADER.pack(MAGIC, self.Natoms, self.Nbeads, self.stride, self.dt))
+    
+    def start(self, steps):
+        """
+        Prepare the Fortran layer to record the frames of a trajectory of up
+        to `steps` time steps.
+        """
+        capacity = max(1, steps / self.stride)
+        frameSize = 8 * 3 * self.Natoms * self.Nbeads
+        if capacity * frameSize > MAX_BUFFER_SIZE:
+            capacity = max(1, MAX_BUFFER_SIZE / frameSize)
+            logging.warning('Only the first {0:d} frames of each call will be recorded to {1}; use a larger stride.'.format(capacity, self.path))
+        
+        system.start_recording(self.Natoms, self.Nbeads, capacity, self.stride, 1 if self.centroids else 0, context=self.context)
+    
+    def stop(self):
+        """
+        Write the frames recorded by the Fortran layer since the last call to
+        :meth:`start()` to the trajectory file.
+        """
+        count = int(system.record_count[self.context-1])
+        if count > 0:
+            frames, steps = system.get_recorded_frames(self.Natoms, self.Nbeads, count, context=self.context)
+            frames = numpy.asfortranarray(frames, dtype=numpy.dtype('<f4'))
+            for n in range(count):
+                self.file.write(FRAME.pack(int(steps[n])))
+                self.file.write(frames[:,:,:,n].tostring(order='F'))
+        system.record_count[self.context-1] = 0
+        self.file.flush()
+    
+    def close(self):
+        """
+        Close the trajectory file.
+        """
+        self.file.close()
+
+################################################################################
+
+class TrajectoryReader:
+    """
+    A reader of an RPMD trajectory file written by a
+    :class:`TrajectoryRecorder`. The attributes are:
+    
+    =========================== ================================================
+    Attribute                   Description
+    =========================== ================================================
+    `path`                      The path of the trajectory file
+    `Natoms`                    The number of atoms in the molecular system
+    `Nbeads`                    The number of beads in each frame (1 if only the centroids were recorded)
+    `stride`                    The number of time steps between recorded frames
+    `dt`                        The time step in atomic units
+    =========================== ================================================
+    
+    Iterating over the reader yields the number of the time step at which each
+    frame was recorded and the position of each bead in each atom in bohr as
+    an array of shape ``(3, Natoms, Nbeads)``, reading one frame at a time, so
+    that trajectories larger than the available memory can be processed.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        f = open(path, 'rb')
+        compressed = f.read(2) == '\x1f\x8b'
+        f.close()
+        self.file = gzip.open(path, 'rb') if compressed else open(path, 'rb')
+        
+        header = self.file.read(HEADER.size)
+        if len(header) < HEADER.size or header[0:len(MAGIC)] != MAGIC:
+            self.file.close()
+            raise ValueError('{0} is not a valid RPMD trajectory file.'.format(path))
+        magic, self.Natoms, self.Nbeads, self.stride, self.dt = HEADER.unpack(header)
+    
+    def __iter__(self):
+        shape = (3, self.Natoms, self.Nbeads)
+        size = 4 * 3 * self.Natoms * self.Nbeads
+        while True:
+            data = self.file.read(FRAME.size + size)
+            if len(data) < FRAME.size + size:
+                # A truncated final frame is from a trajectory that was
+                # interrupted while it was being written
+                break
+            step, = FRAME.unpack(data[0:FRAME.size])
+            frame = numpy.fromstring(data[FRAME.size:], dtype=numpy.dtype('<f4')).reshape(shape, order='F')
+            yield step, frame.astype(numpy.float64)
+    
+    def close(self):
+        """
+        Close the trajectory file.
+        """
+        self.file.close()
+
+def convertTrajectoryToXYZ(path, xyzPath):
+    """
+    Convert the trajectory file at `path` to an XYZ file at `xyzPath` for
+    visualization in programs such as VMD. Each bead is written as a separate
+    atom, labeled by the index of its atom, with the coordinates in bohr.
+    Returns the number of frames written.
+    """
+    reader = TrajectoryReader(path)
+    f = open(xyzPath, 'w')
+    count = 0
+    try:
+        for step, frame in reader:
+            f.write('{0:6d}\n'.format(reader.Natoms * reader.Nbeads))
+            f.write('step {0:d}\n'.format(step))
+            for j in range(reader.Natoms):
+                for k in range(reader.Nbeads):
+                    f.write('{0:4d}{1:11.6f}{2:11.6f}{3:11.6f}\n'.format(j + 1, frame[0,j,k], frame[1,j,k], frame[2,j,k]))
+            count += 1
+    finally:
+        f.close()
+        reader.close()
+    return count
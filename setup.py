@@ -68,10 +68,17 @@ class test(Command):
 
 ################################################################################
 
+# The compiler flag that turns on OpenMP, so that a single trajectory can run
+# on several threads; set the RPMDRATE_OPENMP environment variable to the flag
+# your Fortran compiler needs, or to an empty string to build without OpenMP
+import os
+openmp = [flag for flag in os.environ.get('RPMDRATE_OPENMP', '-fopenmp').split() if flag]
+
 # The Fortran extension modules to build using f2py
 ext_modules = [
     Extension('rpmdrate._surface', ['rpmdrate/_surface.f90']),
-    Extension('rpmdrate._main', ['rpmdrate/_main.pyf', 'rpmdrate/_math.f90', 'rpmdrate/_surface.f90', 'rpmdrate/_main.f90', 'rpmdrate/blas_lapack.f90'], libraries=['fftw3']),
+    Extension('rpmdrate._potentials', ['rpmdrate/_potentials.f90']),
+    Extension('rpmdrate._main', ['rpmdrate/_main.pyf', 'rpmdrate/_math.f90', 'rpmdrate/_surface.f90', 'rpmdrate/_main.f90', 'rpmdrate/blas_lapack.f90'], libraries=['fftw3'], extra_f90_compile_args=openmp, extra_link_args=openmp),
 ]
 
 setup(
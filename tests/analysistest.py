@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the :mod:`rpmdrate.analysis` module.
+"""
+
+import os
+import numpy
+import shutil
+import tempfile
+import unittest
+
+from rpmdrate._main import system
+from rpmdrate.input import loadInputFile
+from rpmdrate.trajectory import TrajectoryRecorder
+from rpmdrate.analysis import *
+
+################################################################################
+
+class TestAnalysis(unittest.TestCase):
+    """
+    Contains unit tests of computing observables from trajectory files.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 4)
+        self.rpmd.activate()
+        
+        # Stretch the ring polymer of the transition state geometry along x
+        # and move it along a line at each step
+        self.geometry = self.rpmd.transitionStates[0].geometry
+        self.frames = []
+        for step in range(1, 6):
+            q = numpy.zeros((3,self.rpmd.Natoms,self.rpmd.Nbeads), order='F')
+            for k in range(self.rpmd.Nbeads):
+                q[:,:,k] = self.geometry
+                q[0,:,k] += 0.1 * k + 0.01 * step
+            self.frames.append(q)
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def record(self, name, centroids=False):
+        """
+        Record the frames to a trajectory file with the given `name`, and
+        return its path.
+        """
+        path = os.path.join(self.directory, name)
+        recorder = TrajectoryRecorder(path, self.rpmd.Natoms, self.rpmd.Nbeads, 1, centroids, self.rpmd.dt)
+        recorder.start(len(self.frames))
+        for step, q in enumerate(self.frames):
+            system.record_frame(q, step + 1)
+        recorder.stop()
+        recorder.close()
+        return path
+    
+    def testDefaultBonds(self):
+        """
+        Test that the default bonds are the forming and breaking bonds of
+        both equivalent transition states.
+        """
+        self.assertEqual(getDefaultBonds(self.rpmd), [(2,3), (1,2), (1,3)])
+    
+    def testAnalyzeTrajectory(self):
+        """
+        Test that the saved observables match those computed directly from
+        the frames.
+        """
+        path = self.record('umbrella_1.0000_0001.trj')
+        outputPath = analyzeTrajectory(self.rpmd, path, bonds=[(1,3)])
+        self.assertEqual(outputPath, os.path.join(self.directory, 'umbrella_1.0000_0001.npz'))
+        data = numpy.load(outputPath)
+        self.assertEqual(list(data['step']), [1, 2, 3, 4, 5])
+        self.assertEqual(data['radiusOfGyration'].shape, (5, self.rpmd.Natoms))
+        self.assertEqual(data['bonds'].tolist(), [[1,3]])
+        
+        q = self.frames[2]
+        centroid = system.get_centroid(q)
+        # The centroids are a translated transition state geometry, for which xi = 1
+        self.assertAlmostEqual(data['xi'][2], 1.0, 4)
+        self.assertTrue(numpy.allclose(data['radiusOfGyration'][2], system.get_radius_of_gyration(q), rtol=1e-5))
+        Ering = system.get_ring_polymer_energy(q)
+        self.assertAlmostEqual(data['ringPolymerEnergy'][2] / Ering, 1.0, 5)
+        distance = numpy.sqrt(numpy.sum((centroid[:,0] - centroid[:,2])**2))
+        self.assertAlmostEqual(data['bondDistance'][2,0], distance, 5)
+    
+    def testFreeRingPolymer(self):
+        """
+        Test that the kinetic energy averaged over configurations of a free
+        ring polymer is the classical value of :math:`3/2 k_\\mathrm{B} T`
+        per atom.
+        """
+        Natoms = self.rpmd.Natoms
+        Nbeads = self.rpmd.Nbeads
+        beta = self.rpmd.beta
+        # Sample the free ring polymer exactly from its normal modes, which
+        # are independent harmonic oscillators at the temperature 1/beta_n
+        wn = Nbeads / beta
+        laplacian = 2 * numpy.eye(Nbeads) - numpy.roll(numpy.eye(Nbeads), 1, axis=0) - numpy.roll(numpy.eye(Nbeads), -1, axis=0)
+        eigenvalues, eigenvectors = numpy.linalg.eigh(laplacian)
+        random = numpy.random.RandomState(1)
+        self.frames = []
+        for step in range(4000):
+            q = numpy.zeros((3,Natoms,Nbeads), order='F')
+            for j in range(Natoms):
+                for mode in range(1, Nbeads):
+                    sigma = 1.0 / numpy.sqrt(self.rpmd.mass[j] * wn * eigenvalues[mode])
+                    q[:,j,:] += numpy.outer(sigma * random.standard_normal(3), eigenvectors[:,mode])
+                q[:,j,:] += self.geometry[:,j:j+1]
+            self.frames.append(q)
+        
+        data = numpy.load(analyzeTrajectory(self.rpmd, self.record('free_1.0000_0001.trj')))
+        Ek = data['kineticEnergy']
+        # The estimator fluctuates by about sqrt(3 Natoms (Nbeads - 1) / 2) / beta
+        # per frame, so its mean is within a few percent of the exact value
+        self.assertAlmostEqual(numpy.mean(Ek) / (1.5 * Natoms / beta), 1.0, delta=0.05)
+        self.assertAlmostEqual(numpy.mean(data['ringPolymerEnergy']) / (1.5 * Natoms * (Nbeads - 1) * wn), 1.0, delta=0.05)
+    
+    def testCentroids(self):
+        """
+        Test that the energies are not computed from centroid trajectories.
+        """
+        path = self.record('child_1.0000_0001.trj.gz', centroids=True)
+        data = numpy.load(analyzeTrajectory(self.rpmd, path))
+        self.assertEqual(data['bondDistance'].shape, (5,3))
+        self.assertTrue(numpy.all(numpy.isnan(data['kineticEnergy'])))
+        self.assertTrue(numpy.all(numpy.isnan(data['radiusOfGyration'])))
+    
+    def testAnalyzeTrajectories(self):
+        """
+        Test analyzing several files in parallel, skipping invalid files.
+        """
+        paths = [self.record('parent_1.0000_0001.trj'), self.record('parent_1.0000_0002.trj')]
+        invalidPath = os.path.join(self.directory, 'invalid.trj')
+        f = open(invalidPath, 'w')
+        f.write('not a trajectory')
+        f.close()
+        outputPaths = analyzeTrajectories(self.rpmd, paths + [invalidPath], processes=2)
+        self.assertEqual(outputPaths, [getObservablesPath(path) for path in paths])
+        data1 = numpy.load(outputPaths[0])
+        data2 = numpy.load(outputPaths[1])
+        self.assertTrue(numpy.all(data1['xi'] == data2['xi']))
+
+################################################################################
+
+if __name__ == '__main__':
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the :mod:`rpmdrate.broker` module.
+"""
+
+import os
+import time
+import unittest
+import multiprocessing
+
+from rpmdrate.broker import *
+
+################################################################################
+
+def square(x):
+    return x * x
+
+def fail():
+    raise ValueError('This task always fails.')
+
+def sleepInWorker(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+class TestBroker(unittest.TestCase):
+    """
+    Contains unit tests of the :class:`Broker` class, using worker processes
+    on the local machine.
+    """
+    
+    def setUp(self):
+        self.authkey = 'test'
+        self.workers = []
+    
+    def tearDown(self):
+        self.broker.terminate()
+        for worker in self.workers:
+            worker.terminate()
+            worker.join()
+    
+    def startWorkers(self, count):
+        """
+        Start `count` worker processes connected to the broker.
+        """
+        for n in range(count):
+            worker = multiprocessing.Process(target=runWorker, args=(self.broker.address, self.authkey))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+    
+    def test_apply(self):
+        """
+        Test that tasks are run by the local and connecting workers and their
+        results returned in order.
+        """
+        self.broker = Broker(('localhost', 0), self.authkey, processes=2)
+        self.startWorkers(1)
+        results = [self.broker.apply_async(square, (x,)) for x in range(20)]
+        self.assertEqual([result.get(30) for result in results], [x * x for x in range(20)])
+        self.assertEqual(self.broker.apply(square, (7,)), 49)
+    
+    def test_error(self):
+        """
+        Test that a task that fails raises an error with the traceback from
+        the worker, and that the worker continues to run tasks.
+        """
+        self.broker = Broker(('localhost', 0), self.authkey, processes=1)
+        result = self.broker.apply_async(fail)
+        self.assertRaises(BrokerError, result.get, 30)
+        try:
+            result.get(30)
+        except BrokerError, e:
+            self.assertTrue('This task always fails.' in str(e))
+        self.assertEqual(self.broker.apply(square, (3,)), 9)
+    
+    def test_requeue(self):
+        """
+        Test that the task of a worker that dies is re-queued and run by
+        another worker once the first has timed out.
+        """
+        self.broker = Broker(('localhost', 0), self.authkey, timeout=1.0)
+        self.startWorkers(1)
+        result = self.broker.apply_async(sleepInWorker, (1.0,))
+        # Wait for the worker to take the task, then kill it and start another
+        while len(self.broker.taskQueue.queue) > 0:
+            time.sleep(0.05)
+        self.workers[0].terminate()
+        self.workers[0].join()
+        self.startWorkers(1)
+        self.assertEqual(result.get(30), self.workers[1].pid)
+
+################################################################################
+
+class TestTaskQueue(unittest.TestCase):
+    """
+    Contains unit tests of the :class:`TaskQueue` class.
+    """
+    
+    def test_leave(self):
+        """
+        Test that the tasks of a worker that leaves are put back at the front
+        of the queue, and that a late result for a finished task is ignored.
+        """
+        taskQueue = TaskQueue()
+        results = [taskQueue.addTask(square, (x,)) for x in range(3)]
+        worker1 = taskQueue.join('worker 1')
+        worker2 = taskQueue.join('worker 2')
+        taskId, function, args = taskQueue.getTask(worker1, 0.0)
+        self.assertEqual(args, (0,))
+        taskQueue.leave(worker1)
+        self.assertEqual(taskQueue.getTask(worker1, 0.0), None)
+        taskId2, function, args = taskQueue.getTask(worker2, 0.0)
+        self.assertEqual((taskId2, args), (taskId, (0,)))
+        taskQueue.putResult(worker2, taskId, 0)
+        taskQueue.putResult(worker1, taskId, 1)
+        self.assertEqual(results[0].get(0), 0)
+        self.assertEqual(len(taskQueue.queue), 2)
+    
+    def test_timeout(self):
+        """
+        Test that a silent worker is dropped and its tasks re-queued.
+        """
+        taskQueue = TaskQueue(timeout=0.0)
+        taskQueue.addTask(square, (2,))
+        worker = taskQueue.join('worker')
+        taskQueue.getTask(worker, 0.0)
+        self.assertEqual(len(taskQueue.queue), 0)
+        time.sleep(0.01)
+        taskQueue.removeSilentWorkers()
+        self.assertFalse(taskQueue.heartbeat(worker))
+        self.assertEqual(len(taskQueue.queue), 1)
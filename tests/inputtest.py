@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the :mod:`rpmdrate.input` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rpmdrate.element import atomicMass
+from rpmdrate.input import *
+
+################################################################################
+
+class TestLoadSystems(unittest.TestCase):
+    """
+    Contains unit tests of loading the systems of a sweep with isotopologues.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), self.inputFile)
+        f = open(self.inputFile, 'a')
+        f.write("\nisotopologue('D', {1: 'D'})\n")
+        f.close()
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def testIsotopologue(self):
+        """
+        Test that each system is loaded for the parent and the substituted
+        isotopologue, with the substituted masses and its own output
+        directory, but sharing the umbrella configurations.
+        """
+        systems = loadSystems(self.inputFile, [300.0], [1, 4])
+        self.assertEqual([label for label, system, jobList in systems], 
+            ['300 K, 1 beads', 'D, 300 K, 1 beads', '300 K, 4 beads', 'D, 300 K, 4 beads'])
+        
+        parent = systems[2][1]
+        system = systems[3][1]
+        self.assertEqual(parent.isotopologue, None)
+        self.assertEqual(system.isotopologue, 'D')
+        self.assertEqual(system.Nbeads, 4)
+        self.assertAlmostEqual(system.mass[0] / parent.mass[0], atomicMass['D'] / atomicMass['H'], 6)
+        self.assertEqual(list(system.mass[1:]), list(parent.mass[1:]))
+        
+        directory = os.path.abspath(self.directory)
+        self.assertEqual(parent.outputDirectory, directory)
+        self.assertEqual(system.outputDirectory, os.path.join(directory, 'D'))
+        self.assertEqual(system.createWorkingDirectory(), os.path.join(directory, 'D', '300', '4'))
+        self.assertEqual(parent.configurationsDirectory, directory)
+        self.assertEqual(system.configurationsDirectory, directory)
+    
+    def testInvalidIsotopologue(self):
+        """
+        Test that an isotopologue substituting an atom that does not exist is
+        rejected.
+        """
+        f = open(self.inputFile, 'a')
+        f.write("\nisotopologue('D4', {4: 'D'})\n")
+        f.close()
+        self.assertRaises(InputError, loadSystems, self.inputFile, [300.0], [4])
+
+################################################################################
+
+if __name__ == '__main__':
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
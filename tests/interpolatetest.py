@@ -105,6 +105,15 @@ class TestInterpolation(unittest.TestCase):
             yexp = self.f1(x[i])
             self.assertTrue(0.98 < yexp / yact < 1.02)
 
+    def test_dataPoints(self):
+        """
+        Test that each interpolator reproduces the data points exactly,
+        including the endpoints of the interpolation range.
+        """
+        for f in [self.f1, self.f2, self.f3, self.f4]:
+            for n in range(self.N):
+                self.assertAlmostEqual(f(self.xdata[n]), self.ydata[n], 10)
+
 ################################################################################
 
 if __name__ == '__main__':
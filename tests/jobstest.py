@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the :mod:`rpmdrate.jobs` module.
+"""
+
+import os
+import imp
+import sys
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+import multiprocessing.pool
+
+from rpmdrate.input import loadSystems
+from rpmdrate.jobs import *
+
+################################################################################
+
+class FakeRPMD:
+    """
+    A stand-in for an RPMD object exposing only the attributes inspected
+    when scheduling jobs.
+    """
+    def __init__(self):
+        self.xi_barrier = None
+
+################################################################################
+
+class TestJobDependencies(unittest.TestCase):
+    """
+    Contains unit tests of the scheduling of RPMDrate jobs.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        recrossingParams = ((0.0001,"ps"), (20,"ps"), 100, (2,"ps"), 10, (0.05,"ps"), None, False, False, None, None, None)
+        self.jobList = [
+            ['configurations', tuple()],
+            ['umbrella', tuple()],
+            ['PMF', tuple()],
+            ['recrossing', recrossingParams],
+            ['rate', tuple()],
+        ]
+    
+    def test_getJobDependencies(self):
+        """
+        Test the getJobDependencies() function.
+        """
+        dependencies = getJobDependencies(self.jobList)
+        self.assertEqual(dependencies, [[], [0], [1], [0, 2], [2, 3]])
+    
+    def test_recrossingWaitsForBarrier(self):
+        """
+        Test that a recrossing factor job without xi_current starts once the
+        barrier location has been estimated, before the PMF has finished.
+        """
+        system = FakeRPMD()
+        pipeline = JobPipeline(system, self.jobList)
+        pipeline.finished = set([0])
+        self.assertTrue(pipeline.getReadyParameters(3) is None)
+        system.xi_barrier = 0.9876
+        params = pipeline.getReadyParameters(3)
+        self.assertEqual(params[6], 0.9876)
+        self.assertEqual(params[0:6], self.jobList[3][1][0:6])
+        self.assertTrue(pipeline.getReadyParameters(4) is None)
+    
+    def test_recrossingWithReactionCoordinate(self):
+        """
+        Test that a recrossing factor job with xi_current does not wait for
+        the PMF.
+        """
+        params = list(self.jobList[3][1])
+        params[6] = 1.0
+        self.jobList[3][1] = tuple(params)
+        pipeline = JobPipeline(FakeRPMD(), self.jobList)
+        self.assertTrue(pipeline.getReadyParameters(3) is None)
+        pipeline.finished = set([0])
+        self.assertEqual(pipeline.getReadyParameters(3), self.jobList[3][1])
+
+################################################################################
+
+class LogRecorder(logging.Handler):
+    """
+    A log handler that keeps the messages logged while it is installed.
+    """
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+    
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class TestSweep(unittest.TestCase):
+    """
+    Contains unit tests of running a sweep over several systems.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), self.inputFile)
+        self.systems = loadSystems(self.inputFile, [300.0, 400.0], [1, 4])
+        # Capture the log in place of any other handlers
+        logger = logging.getLogger()
+        self.handlers = logger.handlers[:]
+        self.level = logger.level
+        self.log = LogRecorder()
+        logger.handlers = [self.log]
+        logger.setLevel(logging.INFO)
+        self.calls = []
+        self.pool = None
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        logger = logging.getLogger()
+        logger.handlers = self.handlers
+        logger.setLevel(self.level)
+        if self.pool is not None:
+            self.pool.terminate()
+        shutil.rmtree(self.directory)
+    
+    def getJobList(self, system, configurations):
+        """
+        Return a job list that generates a few umbrella configurations if
+        `configurations` is ``True``, followed by a rate job that only
+        records the system and thread it ran on and logs a message.
+        """
+        def computeRateCoefficient():
+            self.calls.append(('rate', system, threading.current_thread().name))
+            logging.info('Computed rate coefficient.')
+        system.computeRateCoefficient = computeRateCoefficient
+        saveUmbrellaConfigurations = system.saveUmbrellaConfigurations
+        def saveConfigurations(path, evolutionSteps):
+            self.calls.append(('configurations', system, threading.current_thread().name))
+            saveUmbrellaConfigurations(path, evolutionSteps)
+        system.saveUmbrellaConfigurations = saveConfigurations
+        jobList = [('rate', tuple())]
+        if configurations:
+            jobList.insert(0, ('configurations', ((0.0001,"ps"), (0.002,"ps"), [0.9, 1.0, 1.1], 0.1, 1)))
+        return jobList
+    
+    def test_configurationsGeneratedOnce(self):
+        """
+        Test that the umbrella configurations are generated by the first
+        system only, and reused by all of the others, before any other job
+        runs.
+        """
+        systems = [(label, system, self.getJobList(system, True)) for label, system, jobList in self.systems]
+        runSweep(systems)
+        self.assertEqual([(job, system) for job, system, thread in self.calls], 
+            [('configurations', systems[0][1])] + [('rate', system) for label, system, jobList in systems])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'umbrella_configurations.dat')))
+        for label, system, jobList in systems:
+            self.assertEqual(system.configurationsDirectory, os.path.abspath(self.directory))
+            self.assertEqual([xi for xi, q in system.umbrellaConfigurations], [0.9, 1.0, 1.1])
+        self.assertEqual(self.log.messages.count('Using results of previously saved umbrella configurations.'), len(systems) - 1)
+    
+    def test_serialFallback(self):
+        """
+        Test that the systems are run one after another in the calling
+        thread when only one process is used.
+        """
+        systems = [(label, system, self.getJobList(system, False)) for label, system, jobList in self.systems]
+        self.assertTrue(systems[0][1].getPool() is None)
+        runSweep(systems)
+        self.assertEqual(self.calls, [('rate', system, threading.current_thread().name) for label, system, jobList in systems])
+        self.assertEqual(self.log.messages, ['Computed rate coefficient.'] * len(systems))
+    
+    def test_labelPrefix(self):
+        """
+        Test that the systems share the pool of the first system and run in
+        their own threads, with their log messages prefixed by their labels
+        only while the sweep is running.
+        """
+        systems = [(label, system, self.getJobList(system, False)) for label, system, jobList in self.systems]
+        self.pool = multiprocessing.pool.ThreadPool(processes=1)
+        systems[0][1].pool = self.pool
+        runSweep(systems)
+        labels = [label for label, system, jobList in systems]
+        self.assertEqual(sorted([thread for job, system, thread in self.calls]), sorted(labels))
+        for label, system, jobList in systems:
+            self.assertTrue(system.pool is self.pool)
+        self.assertEqual(sorted(self.log.messages), sorted(['[{0}] Computed rate coefficient.'.format(label) for label in labels]))
+        logging.info('Finished sweep.')
+        self.assertEqual(self.log.messages[-1], 'Finished sweep.')
+    
+    def test_logFilter(self):
+        """
+        Test that messages logged from the threads started by a system are
+        attributed to that system, and that other messages are unchanged.
+        """
+        logFilter = SweepLogFilter(['300 K, 4 beads'])
+        def makeRecord(threadName):
+            record = logging.LogRecord('root', logging.INFO, __file__, 0, 'Message', None, None)
+            record.threadName = threadName
+            logFilter.filter(record)
+            return record.getMessage()
+        self.assertEqual(makeRecord('300 K, 4 beads'), '[300 K, 4 beads] Message')
+        self.assertEqual(makeRecord('300 K, 4 beads/umbrella'), '[300 K, 4 beads] Message')
+        self.assertEqual(makeRecord('MainThread'), 'Message')
+    
+    def test_parseList(self):
+        """
+        Test that comma-separated temperatures and numbers of beads are
+        parsed from the command line.
+        """
+        # Load the script without leaving a compiled copy next to the package
+        argv, dontWriteBytecode = sys.argv, sys.dont_write_bytecode
+        try:
+            sys.dont_write_bytecode = True
+            script = imp.load_source('rpmdrate_script', os.path.join(os.path.dirname(__file__), '..', 'rpmdrate.py'))
+            sys.argv = ['rpmdrate.py', self.inputFile, '300,500.5', '1,4,16']
+            args = script.parseCommandLineArguments()
+        finally:
+            sys.argv, sys.dont_write_bytecode = argv, dontWriteBytecode
+        self.assertEqual(args.T[0], [300.0, 500.5])
+        self.assertEqual(args.Nbeads[0], [1, 4, 16])
+        self.assertRaises(Exception, script.parseList(int), '1,4.5')
+
+################################################################################
+
+class TestKineticIsotopeEffects(unittest.TestCase):
+    """
+    Contains unit tests of saving the kinetic isotope effects of a sweep.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        f = open(inputFile, 'a')
+        f.write("\nisotopologue('D', {1: 'D'})\n")
+        f.close()
+        self.systems = [system for label, system, jobList in loadSystems(inputFile, [300.0], [1, 4])]
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def test_saveKineticIsotopeEffects(self):
+        """
+        Test that the rate coefficient of each isotopologue is saved next to
+        that of the parent isotopologue with the same temperature and number
+        of beads, along with their ratio.
+        """
+        parent1, isotopologue1, parent4, isotopologue4 = self.systems
+        parent1.rateCoefficient = 3.0e-16
+        parent4.rateCoefficient = 2.0e-16
+        isotopologue4.rateCoefficient = 0.5e-16
+        path = os.path.join(self.directory, 'kinetic_isotope_effects.dat')
+        saveKineticIsotopeEffects(path, self.systems)
+        
+        lines = open(path).read().splitlines()
+        self.assertEqual(lines[1], 'RPMD kinetic isotope effects')
+        separators = [n for n, line in enumerate(lines) if line.startswith('=====')]
+        rows = [line.split() for line in lines[separators[1]+1:separators[2]]]
+        self.assertEqual([row[0:3] for row in rows], [['300', '1', 'parent'], ['300', '1', 'D'], ['300', '4', 'parent'], ['300', '4', 'D']])
+        self.assertAlmostEqual(float(rows[0][4]), 1.0)
+        self.assertEqual(rows[1][3:], ['n/a', 'n/a'])
+        self.assertAlmostEqual(float(rows[2][4]), 1.0)
+        self.assertAlmostEqual(float(rows[3][3]) / float(rows[2][3]), 0.25)
+        self.assertAlmostEqual(float(rows[3][4]), 4.0)
+
+################################################################################
+
+if __name__ == '__main__':
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
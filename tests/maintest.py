@@ -0,0 +1,1161 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the fault isolation and recovery of
+trajectories in the :mod:`rpmdrate.main` module.
+"""
+
+import os
+import math
+import time
+import numpy
+import shutil
+import signal
+import tempfile
+import threading
+import unittest
+
+import rpmdrate.main
+import rpmdrate.statistics as statistics
+from rpmdrate.main import *
+from rpmdrate.input import loadInputFile, InputError
+
+################################################################################
+
+def double(rpmd, x):
+    return 2 * x
+
+def crash(rpmd):
+    os.kill(os.getpid(), signal.SIGSEGV)
+
+def hang(rpmd):
+    time.sleep(10.0)
+
+def fail(rpmd):
+    raise ValueError('This trajectory always fails.')
+
+def giveUp(rpmd):
+    raise TrajectoryError('This trajectory became unphysical.')
+
+class FakeRPMD:
+    """
+    A stand-in for the RPMD object, carrying only the fault isolation
+    settings used by :func:`runTrajectory()`.
+    """
+    def __init__(self, isolateTrajectories, trajectoryTimeout=None):
+        self.isolateTrajectories = isolateTrajectories
+        self.trajectoryTimeout = trajectoryTimeout
+
+class TestRunIsolated(unittest.TestCase):
+    """
+    Contains unit tests of the :func:`runIsolated()` function.
+    """
+    
+    def testValue(self):
+        """
+        Test that the value of the function is returned from the child process.
+        """
+        self.assertEqual(runIsolated(double, (None, 21)), 42)
+    
+    def testCrash(self):
+        """
+        Test that a crash in the child process raises a TrajectoryError.
+        """
+        self.assertRaises(TrajectoryError, runIsolated, crash, (None,))
+    
+    def testTimeout(self):
+        """
+        Test that a child process that exceeds its time limit is killed.
+        """
+        startTime = time.time()
+        self.assertRaises(TrajectoryError, runIsolated, hang, (None,), 0.5)
+        self.assertTrue(time.time() - startTime < 5.0)
+    
+    def testException(self):
+        """
+        Test that an exception in the child process raises a TrajectoryError
+        containing its traceback.
+        """
+        try:
+            runIsolated(fail, (None,))
+        except TrajectoryError, e:
+            self.assertTrue('This trajectory always fails.' in str(e))
+        else:
+            self.fail('Expected a TrajectoryError.')
+
+class TestRunTrajectory(unittest.TestCase):
+    """
+    Contains unit tests of the :func:`runTrajectory()` function.
+    """
+    
+    def testInProcess(self):
+        """
+        Test running a trajectory in this process.
+        """
+        self.assertEqual(runTrajectory(double, (FakeRPMD(False), 21)), (42, None))
+        value, error = runTrajectory(giveUp, (FakeRPMD(False),))
+        self.assertTrue(value is None)
+        self.assertEqual(error, 'This trajectory became unphysical.')
+    
+    def testIsolated(self):
+        """
+        Test running a trajectory in a child process, which turns crashes and
+        hangs into errors.
+        """
+        self.assertEqual(runTrajectory(double, (FakeRPMD(True), 21)), (42, None))
+        value, error = runTrajectory(crash, (FakeRPMD(True),))
+        self.assertTrue(value is None)
+        self.assertTrue('signal' in error)
+        value, error = runTrajectory(hang, (FakeRPMD(True, 0.5),))
+        self.assertTrue(value is None)
+        self.assertTrue('time limit' in error)
+
+class TestUmbrellaTrajectory(unittest.TestCase):
+    """
+    Contains unit tests of the :func:`runUmbrellaTrajectory()` function.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 4)
+        self.rpmd.dt = 0.0001 / 2.418884326505e-5
+        self.rpmd.mode = 1
+        self.rpmd.checkpointSteps = 20
+        self.rpmd.randomSeed = 1
+        self.rpmd.initializeRandomNumberGenerator()
+        self.q = numpy.zeros((3,self.rpmd.Natoms,self.rpmd.Nbeads), order='F')
+        for k in range(self.rpmd.Nbeads):
+            self.q[:,:,k] = self.rpmd.transitionStates[0].geometry
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def testRollback(self):
+        """
+        Test that a trajectory that repeatedly leaves the valid range of the
+        reaction coordinate is rolled back to its checkpoints, keeping all of
+        the samples taken before each failure.
+        """
+        xi_range = 0.02
+        # Count the failures of the sampling part of the trajectory
+        results = []
+        getPropagator = self.rpmd.getPropagator
+        def countResults(name):
+            propagator = getPropagator(name)
+            if name != 'umbrella_trajectory':
+                return propagator
+            def run(*args, **kwargs):
+                actualSteps, result = propagator(*args, **kwargs)
+                results.append(result)
+                return actualSteps, result
+            return run
+        self.rpmd.getPropagator = countResults
+        p = self.rpmd.sampleMomentum()
+        dav, dav2, dcount, p, q, histogram, profile = runUmbrellaTrajectory(self.rpmd, 1.0, p, self.q, 200, 2000, 0.1, xi_range, False, 0.8, 0.01, 40)
+        self.assertTrue(len([result for result in results if result != 0]) > 1)
+        self.assertAlmostEqual(numpy.sum(dcount), 2000)
+        # The moments and the histogram must count the same samples
+        self.assertAlmostEqual(numpy.sum(histogram[0,:,:]), 2000)
+        self.assertAlmostEqual(numpy.sum(dav) / numpy.sum(histogram[1,:,:]), 1.0)
+        self.assertAlmostEqual(numpy.sum(dav2) / numpy.sum(histogram[2,:,:]), 1.0)
+        self.assertTrue(abs(numpy.sum(dav) / 2000 - 1.0) < xi_range)
+    
+    def testSegments(self):
+        """
+        Test that the samples of a trajectory are accumulated separately for
+        each segment, with the remainder going to the last segment.
+        """
+        self.rpmd.segmentTime = 300 * self.rpmd.dt
+        p = self.rpmd.sampleMomentum()
+        dav, dav2, dcount, p, q, histogram, profile = runUmbrellaTrajectory(self.rpmd, 1.0, p, self.q, 200, 1000, 0.1, None, False, 0.8, 0.01, 40)
+        self.assertEqual(list(dcount), [300, 300, 400])
+        self.assertEqual(list(numpy.sum(histogram[0,:,:], axis=0)), [300, 300, 400])
+        for segment in range(3):
+            self.assertAlmostEqual(dav[segment], numpy.sum(histogram[1,:,segment]))
+            self.assertAlmostEqual(dav2[segment], numpy.sum(histogram[2,:,segment]))
+
+class TestRecrossingTrajectory(unittest.TestCase):
+    """
+    Contains unit tests of the :func:`runRecrossingTrajectory()` function.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 4)
+        self.rpmd.dt = 0.0001 / 2.418884326505e-5
+        self.rpmd.kforce = 0.0
+        self.rpmd.xi_current = 1.0
+        self.rpmd.mode = 2
+        self.rpmd.randomSeed = 1
+        self.rpmd.initializeRandomNumberGenerator()
+        self.q = numpy.zeros((3,self.rpmd.Natoms,self.rpmd.Nbeads), order='F')
+        for k in range(self.rpmd.Nbeads):
+            self.q[:,:,k] = self.rpmd.transitionStates[0].geometry
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def testCommitment(self):
+        """
+        Test that a child trajectory that has committed to a side of the
+        dividing surface is stopped early without changing its contribution to
+        the recrossing factor, and that one that stays within `xi_commit` of
+        the dividing surface runs for the full evolution time.
+        """
+        steps = 500
+        p = self.rpmd.sampleMomentum()
+        kappa_num0, kappa_denom0, steps0, profile0 = runRecrossingTrajectory(self.rpmd, 1.0, p, self.q, steps, None)
+        self.assertEqual(steps0, 2 * steps)
+        self.assertTrue(kappa_denom0 > 0)
+        
+        kappa_num, kappa_denom, actualSteps, profile = runRecrossingTrajectory(self.rpmd, 1.0, p, self.q, steps, None, 0.1, 1)
+        self.assertTrue(actualSteps < 2 * steps)
+        self.assertTrue(numpy.allclose(kappa_num, kappa_num0, rtol=1e-12, atol=1e-12))
+        self.assertAlmostEqual(kappa_denom, kappa_denom0, 12)
+        
+        kappa_num, kappa_denom, actualSteps, profile = runRecrossingTrajectory(self.rpmd, 1.0, p, self.q, steps, None, 1000.0, 1)
+        self.assertEqual(actualSteps, 2 * steps)
+        self.assertTrue(numpy.allclose(kappa_num, kappa_num0, rtol=1e-12, atol=1e-12))
+        self.assertAlmostEqual(kappa_denom, kappa_denom0, 12)
+
+class TestRecrossingFactorBatches(unittest.TestCase):
+    """
+    Contains unit tests of the :meth:`RPMD.isRecrossingFactorConverged()`
+    method and the contributions of each parent configuration saved by
+    :meth:`RPMD.saveRecrossingFactor()`.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 1)
+        self.rpmd.dt = 0.0001 / 2.418884326505e-5
+        self.rpmd.xi_current = 1.0
+        # The contributions of 32 parent configurations, rounded to the
+        # precision of the output file
+        random = numpy.random.RandomState(1)
+        self.kappa_batch_denom = numpy.round(random.uniform(1.0, 2.0, 32), 6)
+        self.kappa_batch_num = numpy.round(0.6 * self.kappa_batch_denom + random.normal(0.0, 0.1, 32), 6)
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def testConverged(self):
+        """
+        Test that the recrossing factor is converged once its relative error
+        falls below the target, and only after at least 16 parent
+        configurations.
+        """
+        kappa, kappa_error = statistics.getRatioStandardError(self.kappa_batch_num, self.kappa_batch_denom)
+        relativeError = kappa_error / abs(kappa)
+        self.assertTrue(relativeError > 0)
+        self.assertTrue(self.rpmd.isRecrossingFactorConverged(self.kappa_batch_num, self.kappa_batch_denom, relativeError * 1.01))
+        self.assertFalse(self.rpmd.isRecrossingFactorConverged(self.kappa_batch_num, self.kappa_batch_denom, relativeError * 0.99))
+        self.assertFalse(self.rpmd.isRecrossingFactorConverged(self.kappa_batch_num, self.kappa_batch_denom, None))
+        self.assertFalse(self.rpmd.isRecrossingFactorConverged(self.kappa_batch_num[0:15], self.kappa_batch_denom[0:15], 1e10))
+        self.assertTrue(self.rpmd.isRecrossingFactorConverged(self.kappa_batch_num[0:16], self.kappa_batch_denom[0:16], 1e10))
+    
+    def saveRecrossingFactor(self, path):
+        """
+        Save a recrossing factor output file with the contributions of each
+        parent configuration to `path`.
+        """
+        kappa_num = numpy.linspace(1.0, 0.5, 50)
+        self.rpmd.saveRecrossingFactor(path, kappa_num, numpy.sum(self.kappa_batch_denom), 320, 320, 100, 20, 50, 10,
+            list(self.kappa_batch_num), list(self.kappa_batch_denom))
+        return kappa_num
+    
+    def testSaveBatches(self):
+        """
+        Test that the contributions of each parent configuration are restored
+        when the recrossing factor is loaded.
+        """
+        path = os.path.join(self.directory, 'recrossing_factor_1.0000.dat')
+        kappa_num = self.saveRecrossingFactor(path)
+        
+        (T, Nbeads, xi_current, dt, kappa_num0, kappa_denom0, trajectoryCount,
+            childTrajectories, equilibrationSteps, childSamplingSteps,
+            childEvolutionSteps, childrenPerSampling, kappa_batch_num,
+            kappa_batch_denom) = self.rpmd.loadRecrossingFactor(path)
+        self.assertTrue(numpy.allclose(kappa_num0, kappa_num, rtol=0, atol=1e-4))
+        self.assertAlmostEqual(float(kappa_denom0), numpy.sum(self.kappa_batch_denom), 4)
+        self.assertEqual((trajectoryCount, childTrajectories, equilibrationSteps, childSamplingSteps, childEvolutionSteps, childrenPerSampling), (320, 320, 100, 20, 50, 10))
+        self.assertEqual(len(kappa_batch_num), 32)
+        self.assertTrue(numpy.allclose(kappa_batch_num, self.kappa_batch_num, rtol=0, atol=1e-9))
+        self.assertTrue(numpy.allclose(kappa_batch_denom, self.kappa_batch_denom, rtol=0, atol=1e-9))
+        
+        # The saved error is that of the contributions
+        kappa, kappa_error = statistics.getRatioStandardError(self.kappa_batch_num, self.kappa_batch_denom)
+        f = open(path, 'r')
+        lines = [line for line in f if line.startswith('Standard error in recrossing factor')]
+        f.close()
+        self.assertAlmostEqual(float(lines[0].split('=')[1]), kappa_error, 6)
+    
+    def testLoadWithoutBatches(self):
+        """
+        Test that a recrossing factor output file from before the
+        contributions of each parent configuration were saved can still be
+        loaded.
+        """
+        path = os.path.join(self.directory, 'recrossing_factor_1.0000.dat')
+        kappa_num = self.saveRecrossingFactor(path)
+        f = open(path, 'r')
+        lines = f.readlines()
+        f.close()
+        f = open(path, 'w')
+        for line in lines:
+            if line.startswith('Standard error in recrossing factor'):
+                break
+            f.write(line)
+        f.close()
+        
+        result = self.rpmd.loadRecrossingFactor(path)
+        self.assertTrue(numpy.allclose(result[4], kappa_num, rtol=0, atol=1e-4))
+        self.assertEqual(result[6], 320)
+        self.assertEqual(result[12], [])
+        self.assertEqual(result[13], [])
+
+class TestThreads(unittest.TestCase):
+    """
+    Contains unit tests of running trajectories on several threads.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), self.inputFile)
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def loadCompiledPotential(self, Nbeads):
+        """
+        Load the LEPS example with its compiled potential declared
+        thread-safe, set up for umbrella sampling with `Nbeads` beads.
+        """
+        f = open(self.inputFile, 'a')
+        f.write('\nget_potential = get_potential.getCompiledPotential()\nthread_safe_potential = True\n')
+        f.close()
+        rpmd, jobList = loadInputFile(self.inputFile, 300.0, Nbeads)
+        rpmd.dt = 0.0001 / 2.418884326505e-5
+        rpmd.mode = 1
+        rpmd.randomSeed = 1
+        return rpmd
+    
+    def testTrajectoryThreads(self):
+        """
+        Test that the threads of idle processes are shared among the running
+        trajectories.
+        """
+        rpmd, jobList = loadInputFile(self.inputFile, 300.0, 4, processes=4)
+        self.assertEqual(rpmd.getTrajectoryThreads(1), 1)
+        rpmd.threads = 2
+        self.assertEqual([rpmd.getTrajectoryThreads(n) for n in [1, 2, 3, 4, 10]], [8, 4, 2, 2, 2])
+        rpmd.processes = 1
+        self.assertEqual(rpmd.getTrajectoryThreads(10), 2)
+    
+    def testThreadSafePotential(self):
+        """
+        Test that only a compiled potential can be evaluated on several
+        threads.
+        """
+        rpmd = self.loadCompiledPotential(4)
+        self.assertTrue(rpmd.threadSafePotential)
+        self.assertFalse(rpmd.getPotentialCallback() is rpmd.potential)
+        rpmd.activate(threads=2)
+        self.assertEqual(system.threads[0], 2)
+        self.assertEqual(system.thread_potential[0], 1)
+        
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), self.inputFile)
+        f = open(self.inputFile, 'a')
+        f.write('\nthread_safe_potential = True\n')
+        f.close()
+        self.assertRaises(InputError, loadInputFile, self.inputFile, 300.0, 4)
+    
+    def testThreadedTrajectory(self):
+        """
+        Test that an umbrella sampling trajectory run on several threads is
+        the same as one run on a single thread.
+        """
+        rpmd = self.loadCompiledPotential(16)
+        q = numpy.zeros((3,rpmd.Natoms,rpmd.Nbeads), order='F')
+        for k in range(rpmd.Nbeads):
+            q[:,:,k] = rpmd.transitionStates[0].geometry
+        results = []
+        for threads in [1, 4]:
+            rpmd.initializeRandomNumberGenerator()
+            p = rpmd.sampleMomentum()
+            results.append(runUmbrellaTrajectory(rpmd, 1.0, p, q, 100, 500, 0.1, None, False, 0.8, 0.01, 40, threads))
+        for value1, value4 in zip(results[0][0:6], results[1][0:6]):
+            self.assertTrue(numpy.allclose(value1, value4, rtol=1e-12, atol=1e-12))
+
+class TestContexts(unittest.TestCase):
+    """
+    Contains unit tests of running several systems at once in separate
+    contexts of the Fortran layer.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), self.inputFile)
+        f = open(self.inputFile, 'a')
+        f.write('\nget_potential = get_potential.getCompiledPotential()\nthread_safe_potential = True\n')
+        f.close()
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def loadSystem(self, T, Nbeads):
+        """
+        Load the LEPS example with its compiled potential at temperature `T`
+        with `Nbeads` beads, set up for the recrossing factor calculation,
+        along with an initial momentum and position at the transition state.
+        """
+        rpmd, jobList = loadInputFile(self.inputFile, T, Nbeads)
+        rpmd.dt = 0.0001 / 2.418884326505e-5
+        rpmd.mode = 2
+        rpmd.randomSeed = 1
+        rpmd.initializeRandomNumberGenerator()
+        p = rpmd.sampleMomentum()
+        q = numpy.zeros((3,rpmd.Natoms,rpmd.Nbeads), order='F')
+        for k in range(rpmd.Nbeads):
+            q[:,:,k] = rpmd.transitionStates[0].geometry
+        return rpmd, p, q
+    
+    def testGetContext(self):
+        """
+        Test that the main thread uses the first context, that each other
+        thread reserves its own, and that it is released when the thread
+        exits.
+        """
+        self.assertEqual(getContext(), 1)
+        contexts = []
+        def run():
+            contexts.append((getContext(), getContext()))
+        for n in range(2):
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join()
+        self.assertNotEqual(contexts[0][0], 1)
+        self.assertEqual(contexts[0][0], contexts[0][1])
+        self.assertEqual(contexts[1][0], contexts[0][0])
+    
+    def testConcurrentSystems(self):
+        """
+        Test that the trajectories of two systems with different parameters
+        run concurrently on a pool of threads are the same as when they are
+        run one after the other.
+        """
+        systems = [self.loadSystem(300.0, 4), self.loadSystem(1000.0, 8)]
+        serial = [runRecrossingTrajectory(rpmd, 1.0, p, q, 200, False) for rpmd, p, q in systems]
+        
+        rpmd = systems[0][0]
+        rpmd.processes = 2
+        rpmd.threadPool = True
+        pool = rpmd.getPool()
+        try:
+            results = [pool.apply_async(runRecrossingTrajectory, (rpmd, 1.0, p, q, 200, False)) for rpmd, p, q in systems]
+            concurrent = [result.get() for result in results]
+        finally:
+            pool.terminate()
+        for value1, value2 in zip(serial, concurrent):
+            self.assertTrue(numpy.allclose(value1[0], value2[0], rtol=1e-12, atol=1e-12))
+            self.assertAlmostEqual(value1[1], value2[1], 12)
+            self.assertEqual(value1[2], value2[2])
+        self.assertFalse(numpy.allclose(serial[0][0], serial[1][0]))
+    
+    def testThreadPoolPotential(self):
+        """
+        Test that a pool of threads cannot be used with a potential that is
+        not thread-safe.
+        """
+        rpmd, p, q = self.loadSystem(300.0, 4)
+        rpmd.processes = 2
+        rpmd.threadPool = True
+        rpmd.threadSafePotential = False
+        self.assertRaises(RPMDError, rpmd.getPool)
+
+def fillHarmonicWindow(window, beta, xi_mean, count=1000.0, S=1.0):
+    """
+    Fill `window` with `count` samples of the distribution of the reaction
+    coordinate at reciprocal temperature `beta` in its umbrella potential,
+    shifted to have the mean `xi_mean`. The samples are placed on a fine grid
+    with exact Gaussian weights, so the moments of the window are free of
+    sampling noise. The spring energy of each sample is the constant `S`.
+    """
+    window.initializeHistogram(beta)
+    std = 1.0 / numpy.sqrt(beta * window.kforce)
+    xi = xi_mean + std * numpy.linspace(-7.0, 7.0, 20001)
+    n = numpy.exp(-0.5 * ((xi - xi_mean) / std)**2)
+    n *= count / numpy.sum(n)
+    U = 0.5 * window.kforce * (xi - window.xi)**2
+    bins = numpy.floor((xi - window.histogramMin) / window.histogramWidth).astype(int)
+    for row, values in enumerate([n, n * xi, n * xi * xi, n * U, n * S, n * U * U, n * S * S, n * U * S]):
+        window.histogram[row,:] = numpy.bincount(bins, values, window.histogram.shape[1])
+    window.addSamples(numpy.sum(n * xi), numpy.sum(n * xi * xi), count)
+    window.histogramTrajectories = 1
+
+class TestWindow(unittest.TestCase):
+    """
+    Contains unit tests of the :class:`Window` class.
+    """
+    
+    def getSegment(self, mean, std, count=1000):
+        """
+        Return the sums of the reaction coordinate and its square over `count`
+        samples with the given `mean` and standard deviation `std`.
+        """
+        return count * mean, count * (std * std + mean * mean), count
+    
+    def testValidSegments(self):
+        """
+        Test that only the segments whose variance jumps are invalid, both
+        for an empty window and for one that already contains samples.
+        """
+        segments = [self.getSegment(1.0, 0.01), self.getSegment(1.001, 0.011), self.getSegment(1.0, 0.1),
+            self.getSegment(1.05, 0.01), (0.0, 0.0, 0), self.getSegment(0.999, 0.009)]
+        av, av2, count = [numpy.array(values, numpy.float64) for values in zip(*segments)]
+        window = Window(xi=1.0, kforce=0.1)
+        self.assertEqual(list(window.getValidSegments(av, av2, count)), [True, True, False, False, False, True])
+        
+        window.addSamples(*self.getSegment(1.0, 0.1))
+        self.assertEqual(list(window.getValidSegments(av, av2, count)), [False, False, True, False, False, False])
+    
+    def testReweight(self):
+        """
+        Test that reweighting the samples of a harmonic umbrella potential
+        recovers the variance of the distribution at the new temperature.
+        """
+        beta0 = 1000.0
+        for beta in [900.0, 1100.0]:
+            window = Window(xi=1.0, kforce=0.1)
+            fillHarmonicWindow(window, beta0, 1.0)
+            reweighted = window.reweight(beta0, beta, 4)
+            xi_mean = reweighted.av / reweighted.count
+            xi_var = reweighted.av2 / reweighted.count - xi_mean * xi_mean
+            self.assertAlmostEqual(xi_mean, 1.0, 6)
+            self.assertAlmostEqual(xi_var * beta * window.kforce, 1.0, delta=0.002)
+            # Reweighting to a different temperature loses effective samples
+            self.assertTrue(0 < reweighted.count < window.count)
+
+class TestWindowOverlap(unittest.TestCase):
+    """
+    Contains unit tests of the :func:`checkWindowOverlap()` function.
+    """
+    
+    def getWindows(self, xi_list, moments):
+        """
+        Return windows centered at each of `xi_list` and a dict of their
+        sampled mean and standard deviation, given as `moments`.
+        """
+        windows = [Window(xi=xi, kforce=0.1) for xi in xi_list]
+        pilotStatistics = dict([(window, (mean, std * std)) for window, (mean, std) in zip(windows, moments)])
+        return windows, pilotStatistics
+    
+    def testOverlap(self):
+        """
+        Test that pairs of windows fail only if their means are more than the
+        given number of standard deviations apart, and that a new window is
+        then inserted halfway between them.
+        """
+        windows, pilotStatistics = self.getWindows([0.0, 0.1, 0.2], [(0.0, 0.04), (0.1, 0.04), (0.2, 0.04)])
+        self.assertEqual(checkWindowOverlap(windows, pilotStatistics, 3.0), (0, [], []))
+        
+        windows, pilotStatistics = self.getWindows([0.0, 0.1, 0.2], [(0.0, 0.05), (0.1, 0.02), (0.2, 0.02)])
+        failures, stiffWindows, newWindows = checkWindowOverlap(windows, pilotStatistics, 3.0)
+        self.assertEqual(failures, 1)
+        self.assertEqual(stiffWindows, [])
+        self.assertEqual([(window.xi, window.kforce) for window in newWindows], [(0.15, 0.1)])
+    
+    def testDrift(self):
+        """
+        Test that a window of a failing pair whose samples have drifted more
+        than one standard deviation from its center is stiffened instead of
+        inserting a new window.
+        """
+        windows, pilotStatistics = self.getWindows([0.0, 0.1, 0.2], [(0.0, 0.02), (0.15, 0.02), (0.2, 0.02)])
+        failures, stiffWindows, newWindows = checkWindowOverlap(windows, pilotStatistics, 3.0)
+        self.assertEqual(failures, 1)
+        self.assertEqual(stiffWindows, [windows[1]])
+        self.assertEqual(newWindows, [])
+        # The windows themselves are not modified
+        self.assertEqual([window.kforce for window in windows], [0.1, 0.1, 0.1])
+    
+    def testMinimumSpacing(self):
+        """
+        Test that no window is inserted between windows that are already
+        closer together than the resolution of the reaction coordinate.
+        """
+        windows, pilotStatistics = self.getWindows([0.0, 0.0015], [(0.0, 0.0001), (0.0015, 0.0001)])
+        self.assertEqual(checkWindowOverlap(windows, pilotStatistics, 3.0), (1, [], []))
+
+class TestRefineUmbrellaWindows(unittest.TestCase):
+    """
+    Contains unit tests of the :meth:`RPMD.refineUmbrellaWindows()` method.
+    The pilot trajectories are replaced by the exact moments of a model in
+    which the umbrella potential of each window is added to a linear
+    potential of mean force, so no molecular dynamics is run.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 1)
+        geometry = self.rpmd.transitionStates[0].geometry
+        self.rpmd.umbrellaConfigurations = [(xi, geometry) for xi in numpy.linspace(-0.05, 1.05, 12)]
+        self.rpmd.umbrellaConfigurationParameters = ((0.0001,"ps"), (1,"ps"))
+        self.configurations = []
+        self.rpmd.generateUmbrellaConfigurations = lambda dt, evolutionTime, xi_list, kforce, stride=1: self.configurations.append(list(xi_list))
+        self.pilots = []
+        self.meanForce = {}
+        self.runTrajectory = rpmdrate.main.runTrajectory
+        rpmdrate.main.runTrajectory = self.runPilotTrajectory
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        rpmdrate.main.runTrajectory = self.runTrajectory
+        shutil.rmtree(self.directory)
+    
+    def runPilotTrajectory(self, function, args):
+        """
+        Return the moments of the reaction coordinate that a pilot trajectory
+        with the given `args` would sample in the model, where the mean force
+        in each window is taken from `meanForce`, or zero by default.
+        """
+        rpmd, xi, p, q, equilibrationSteps, evolutionSteps, kforce = args[0:7]
+        self.pilots.append((xi, kforce))
+        mean = xi + self.meanForce.get(xi, 0.0) / kforce
+        variance = 1.0 / (rpmd.beta * kforce)
+        count = numpy.array([float(evolutionSteps)])
+        return (count * mean, count * (variance + mean * mean), count, p, q, numpy.zeros((8,1,1)), None), None
+    
+    def getWindows(self, xi_list, kforce=30.0):
+        """
+        Return a list of windows centered at each of `xi_list`.
+        """
+        return [Window(xi=xi, kforce=kforce, trajectories=10, equilibrationTime=(1,"ps"), evolutionTime=(10,"ps")) for xi in xi_list]
+    
+    def testInsertWindows(self):
+        """
+        Test that windows are inserted until neighboring windows overlap, and
+        that the refined windows are saved and reused.
+        """
+        windows = self.getWindows([0.0, 0.5, 1.0])
+        self.rpmd.refineUmbrellaWindows((0.0001,"ps"), windows, (1,"ps"), maxSeparation=3.0, maxIterations=6)
+        # The standard deviation in each window is 0.0056, so the windows
+        # overlap once they are 0.0156 apart, after five rounds of refinement
+        xi_list = [window.xi for window in windows]
+        self.assertEqual(len(windows), 65)
+        self.assertEqual(xi_list, sorted(xi_list))
+        self.assertTrue(numpy.allclose(numpy.diff(xi_list), 0.015625, atol=1e-4))
+        self.assertEqual([window.kforce for window in windows], [30.0] * 65)
+        self.assertEqual(len(self.pilots), 65)
+        self.assertEqual(len(self.configurations), 5)
+        self.assertEqual(self.configurations[-1], xi_list)
+        
+        # Refining the same coarse windows again loads the saved windows
+        windowsFilename = os.path.join(self.rpmd.createWorkingDirectory(), 'umbrella_windows.dat')
+        xi_list0, kforce_list0, xi_mean_list0, xi_var_list0 = self.rpmd.loadUmbrellaWindows(windowsFilename)
+        self.assertTrue(numpy.allclose(xi_list0, xi_list, atol=1e-6))
+        self.assertTrue(numpy.allclose(xi_mean_list0, xi_list, atol=1e-6))
+        self.assertTrue(numpy.allclose(xi_var_list0, 1.0 / (self.rpmd.beta * 30.0), rtol=1e-4))
+        
+        windows2 = self.getWindows([0.0, 0.5, 1.0])
+        self.rpmd.refineUmbrellaWindows((0.0001,"ps"), windows2, (1,"ps"), maxSeparation=3.0, maxIterations=6)
+        self.assertEqual(len(self.pilots), 65)
+        self.assertTrue(numpy.allclose([window.xi for window in windows2], xi_list, atol=1e-6))
+        self.assertEqual([window.kforce for window in windows2], [30.0] * 65)
+        self.assertEqual(windows2[0].trajectories, 10)
+        self.assertTrue(numpy.allclose(self.configurations[-1], xi_list, atol=1e-6))
+    
+    def testMaxIterations(self):
+        """
+        Test that refinement stops after the given number of rounds, even if
+        the windows still do not overlap.
+        """
+        windows = self.getWindows([0.0, 0.5, 1.0])
+        self.rpmd.refineUmbrellaWindows((0.0001,"ps"), windows, (1,"ps"), maxSeparation=3.0, maxIterations=2)
+        self.assertEqual([window.xi for window in windows], [0.0, 0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1.0])
+        self.assertEqual(len(self.pilots), 9)
+        self.assertTrue(os.path.exists(os.path.join(self.rpmd.createWorkingDirectory(), 'umbrella_windows.dat')))
+    
+    def testStiffenDriftedWindow(self):
+        """
+        Test that a window whose samples drift away from its center has its
+        force constant doubled rather than a window being inserted.
+        """
+        windows = self.getWindows([0.0, 0.015, 0.03])
+        self.meanForce[0.015] = 0.3
+        self.rpmd.refineUmbrellaWindows((0.0001,"ps"), windows, (1,"ps"), maxSeparation=3.0, maxIterations=1)
+        self.assertEqual([window.xi for window in windows], [0.0, 0.015, 0.03])
+        self.assertEqual([window.kforce for window in windows], [30.0, 60.0, 30.0])
+        self.assertEqual(self.pilots, [(0.0, 30.0), (0.015, 30.0), (0.03, 30.0), (0.015, 60.0)])
+        self.assertEqual(self.configurations, [])
+
+class FakePool:
+    """
+    A stand-in for a pool of subprocesses that runs each trajectory when its
+    result is requested, recording the trajectories it was given.
+    """
+    def __init__(self):
+        self.calls = []
+    
+    def apply_async(self, function, args):
+        self.calls.append(args)
+        return FakeResult(function, args)
+
+class FakeResult:
+    """
+    The result of a trajectory submitted to a :class:`FakePool`.
+    """
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+    
+    def get(self):
+        return self.function(*self.args)
+
+class TestUmbrellaConfigurations(unittest.TestCase):
+    """
+    Contains unit tests of generating umbrella configurations.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 1)
+        self.rpmd.randomSeed = 1
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def testSchedule(self):
+        """
+        Test that each configuration is started from the nearest one, and
+        that with a stride only every stride-th configuration along a chain
+        is generated in sequence, the others starting from the last of these.
+        """
+        xi_list = [1.25, 1.5, 1.75, 2.0, 2.25, 0.5]
+        self.assertEqual(getConfigurationSchedule([1.0], xi_list, 1),
+            [(0, 0, True), (1, 1, True), (2, 2, True), (3, 3, True), (4, 4, True), (5, 0, True)])
+        self.assertEqual(getConfigurationSchedule([1.0], xi_list, 2),
+            [(0, 0, False), (1, 0, True), (2, 2, False), (3, 2, True), (4, 4, False), (5, 0, False)])
+        self.assertEqual(getConfigurationSchedule([1.0], xi_list, 3),
+            [(0, 0, False), (1, 0, False), (2, 0, True), (3, 3, False), (4, 3, False), (5, 0, False)])
+        self.assertEqual(getConfigurationSchedule([0.0, 1.0], [], 2), [])
+    
+    def testMissingConfigurations(self):
+        """
+        Test that configurations missing from a saved set are generated from
+        the nearest configurations, with those not needed to start others
+        sent to the pool of subprocesses.
+        """
+        self.rpmd.generateUmbrellaConfigurations((0.0001,"ps"), (0.001,"ps"), [0.5, 1.0], 0.1)
+        self.rpmd.pool = FakePool()
+        self.rpmd.generateUmbrellaConfigurations((0.0001,"ps"), (0.001,"ps"), [0.5, 0.75, 1.0, 1.25, 1.5], 0.1, stride=2)
+        self.assertEqual([args[1] for function, args in self.rpmd.pool.calls], [0.75, 1.25])
+        self.assertEqual([xi for xi, q in self.rpmd.umbrellaConfigurations], [0.5, 0.75, 1.0, 1.25, 1.5])
+        xi_list, q_initial, equilibrationSteps = self.rpmd.loadUmbrellaConfigurations(os.path.join(self.directory, 'umbrella_configurations.dat'))
+        self.assertTrue(numpy.allclose(xi_list, [0.5, 0.75, 1.0, 1.25, 1.5]))
+        for l, (xi, q) in enumerate(self.rpmd.umbrellaConfigurations):
+            self.assertTrue(numpy.allclose(q_initial[:,:,l], q, atol=1e-6))
+            self.assertFalse(numpy.allclose(q, self.rpmd.transitionStates[0].geometry))
+
+class TestUmbrellaSampling(unittest.TestCase):
+    """
+    Contains unit tests of the :meth:`RPMD.conductUmbrellaSampling()` method.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 1)
+        self.rpmd.umbrellaConfigurations = [(xi, self.rpmd.transitionStates[0].geometry) for xi in [0.5, 1.0]]
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def testMinTrajectories(self):
+        """
+        Test that umbrella sampling is rejected if fewer than two
+        trajectories per window are requested before adaptive sampling,
+        since the error of a window cannot be estimated from one trajectory.
+        """
+        windows = [Window(xi=xi, kforce=0.1, trajectories=4, equilibrationTime=(0.001,"ps"), evolutionTime=(0.001,"ps")) for xi in [0.5, 1.0]]
+        for minTrajectories in [0, 1]:
+            self.assertRaises(ValueError, self.rpmd.conductUmbrellaSampling, (0.0001,"ps"), windows, False, 0.1, minTrajectories)
+
+def setWindowBlocks(window, Nblocks, scatter):
+    """
+    Replace the trajectories of the filled `window` by `Nblocks` blocks of
+    equal size, whose mean reaction coordinates alternate `scatter` above and
+    below the mean of the window, leaving the moments of the window unchanged.
+    """
+    xi_mean = window.av / window.count
+    count = window.count / Nblocks
+    window.blockAv = []
+    window.blockAv2 = []
+    window.blockCount = []
+    for n in range(Nblocks):
+        xi = xi_mean + scatter * (1 if n % 2 == 0 else -1)
+        window.blockAv.append(count * xi)
+        window.blockAv2.append(window.av2 / Nblocks)
+        window.blockCount.append(count)
+
+class TestAdaptiveUmbrellaSampling(unittest.TestCase):
+    """
+    Contains unit tests of the :meth:`RPMD.selectAdaptiveWindows()` and
+    :meth:`RPMD.getStaticFactorError()` methods.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 1)
+        self.rpmd.dt = 0.0001 / 2.418884326505e-5
+        self.rpmd.processes = 3
+        # The mean force changes sign at xi = 0.6, so the potential of mean
+        # force has its maximum there
+        self.windows = []
+        for l, xi in enumerate(numpy.linspace(-0.1, 1.1, 13)):
+            window = Window(xi=xi, kforce=0.1, trajectories=10, equilibrationTime=(0.01,"ps"), evolutionTime=(0.1,"ps"))
+            fillHarmonicWindow(window, self.rpmd.beta, xi - 0.01 * (0.6 - xi), count=4000.0)
+            setWindowBlocks(window, 2 + 2 * (l % 2), 0.001 * (1 + l % 3))
+            self.windows.append(window)
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def testStaticFactorError(self):
+        """
+        Test that the error in the mean force of each window is propagated to
+        the free energy barrier with its trapezoid rule weight between the
+        reactants and the maximum of the potential of mean force.
+        """
+        relativeError, contributions = self.rpmd.getStaticFactorError(self.windows)
+        weights = [0.0, 0.05, 0.1, 0.1, 0.1, 0.1, 0.1, 0.05, 0.0, 0.0, 0.0, 0.0, 0.0]
+        for window, weight, contribution in zip(self.windows, weights, contributions):
+            dA, error = window.getMeanForce(self.rpmd.beta)
+            self.assertTrue(error > 0)
+            self.assertTrue(numpy.allclose(contribution, (weight * error)**2, rtol=1e-6, atol=0))
+        self.assertAlmostEqual(relativeError, self.rpmd.beta * math.sqrt(numpy.sum(contributions)), 12)
+        
+        # The result does not depend on the order of the windows
+        relativeError2, contributions2 = self.rpmd.getStaticFactorError(self.windows[::-1])
+        self.assertAlmostEqual(relativeError2, relativeError, 12)
+        self.assertTrue(numpy.allclose(contributions2, contributions[::-1], rtol=1e-12, atol=0))
+    
+    def testMinTrajectories(self):
+        """
+        Test that the windows with fewer than the minimum number of
+        trajectories are always selected, however small the error is.
+        """
+        for l in [0, 5, 9, 12]:
+            setWindowBlocks(self.windows[l], 1, 0.0)
+        selected = self.rpmd.selectAdaptiveWindows(self.windows, 1e10, 2)
+        self.assertEqual(selected, [self.windows[l] for l in [0, 5, 9, 12]])
+        
+        # Windows that have run all of their trajectories are not selected
+        self.windows[5].trajectories = 1
+        selected = self.rpmd.selectAdaptiveWindows(self.windows, 1e10, 2)
+        self.assertEqual(selected, [self.windows[l] for l in [0, 9, 12]])
+    
+    def testRanking(self):
+        """
+        Test that the windows are ranked by the expected reduction in the
+        variance of the free energy barrier from one more trajectory, and that
+        no more windows are selected than there are processes.
+        """
+        relativeError, contributions = self.rpmd.getStaticFactorError(self.windows)
+        reduction = [contribution / (len(window.blockCount) + 1) for window, contribution in zip(self.windows, contributions)]
+        order = sorted(range(len(self.windows)), key=lambda l: reduction[l], reverse=True)
+        self.assertTrue(reduction[order[2]] > reduction[order[3]])
+        
+        selected = self.rpmd.selectAdaptiveWindows(self.windows, 0.0, 2)
+        self.assertEqual(selected, [self.windows[l] for l in order[0:3]])
+        # Only windows between the reactants and the barrier contribute
+        for window in selected:
+            self.assertTrue(0.0 <= window.xi <= 0.6 + 1e-8)
+        
+        # The best window is skipped once it has run all of its trajectories
+        self.windows[order[0]].trajectories = 1
+        selected = self.rpmd.selectAdaptiveWindows(self.windows, 0.0, 2)
+        self.assertEqual(selected, [self.windows[l] for l in order[1:4]])
+        
+        self.rpmd.processes = 1
+        selected = self.rpmd.selectAdaptiveWindows(self.windows, 0.0, 2)
+        self.assertEqual(selected, [self.windows[order[1]]])
+    
+    def testConverged(self):
+        """
+        Test that no windows are selected once the relative error in the
+        static factor falls below the target.
+        """
+        relativeError, contributions = self.rpmd.getStaticFactorError(self.windows)
+        self.assertTrue(relativeError > 0)
+        self.assertEqual(self.rpmd.selectAdaptiveWindows(self.windows, relativeError * 1.01, 2), [])
+        self.assertEqual(len(self.rpmd.selectAdaptiveWindows(self.windows, relativeError * 0.99, 2)), 3)
+
+class TestUmbrellaSamplingEstimate(unittest.TestCase):
+    """
+    Contains unit tests of the :meth:`RPMD.getUmbrellaSamplingEstimate()` and
+    :meth:`RPMD.saveUmbrellaSamplingStatus()` methods.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 1)
+        self.rpmd.dt = 0.0001 / 2.418884326505e-5
+        # The mean force changes sign at xi = 0.6, so the potential of mean
+        # force has its maximum there
+        self.windows = []
+        for l, xi in enumerate(numpy.linspace(-0.1, 1.1, 13)):
+            window = Window(xi=xi, kforce=0.1, trajectories=10, equilibrationTime=(0.01,"ps"), evolutionTime=(0.1,"ps"))
+            fillHarmonicWindow(window, self.rpmd.beta, xi - 0.01 * (0.6 - xi), count=4000)
+            setWindowBlocks(window, 2 + 2 * (l % 2), 0.001 * (1 + l % 3))
+            self.windows.append(window)
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def testEstimate(self):
+        """
+        Test that the estimate is the QTST rate coefficient at the maximum of
+        the potential of mean force of the sampled windows.
+        """
+        xi_current, barrier, barrierError, k_QTST, relativeError = self.rpmd.getUmbrellaSamplingEstimate(self.windows, bins=500)
+        
+        potentialOfMeanForce = self.rpmd.getPotentialOfMeanForce(self.windows, -0.1, 1.1, 500)
+        index = numpy.argmax(potentialOfMeanForce[1,:])
+        self.assertEqual(xi_current, potentialOfMeanForce[0,index])
+        self.assertAlmostEqual(xi_current, 0.6, 2)
+        k_QTST_s0, staticFactor, k_QTST0 = self.rpmd.getQTSTRateCoefficient(potentialOfMeanForce, xi_current)
+        self.assertAlmostEqual(barrier * 27.211, -math.log(staticFactor) / self.rpmd.beta * 27.211, 9)
+        self.assertTrue(barrier > 0)
+        self.assertAlmostEqual(k_QTST / k_QTST0, 1.0, 9)
+        
+        relativeError0, contributions = self.rpmd.getStaticFactorError(self.windows)
+        self.assertAlmostEqual(relativeError, relativeError0, 12)
+        self.assertAlmostEqual(barrierError * self.rpmd.beta, relativeError0, 12)
+    
+    def testIncompleteSampling(self):
+        """
+        Test that no estimate is made until at least two windows have been
+        sampled and the sampled windows span the reactants.
+        """
+        windows = [Window(xi=window.xi, kforce=window.kforce) for window in self.windows]
+        self.assertTrue(self.rpmd.getUmbrellaSamplingEstimate(windows) is None)
+        windows[0] = self.windows[0]
+        self.assertTrue(self.rpmd.getUmbrellaSamplingEstimate(windows) is None)
+        
+        windows = self.windows[:]
+        windows[0] = Window(xi=windows[0].xi, kforce=windows[0].kforce)
+        windows[1] = Window(xi=windows[1].xi, kforce=windows[1].kforce)
+        self.assertTrue(self.rpmd.getUmbrellaSamplingEstimate(windows) is None)
+        windows[0] = self.windows[0]
+        self.assertFalse(self.rpmd.getUmbrellaSamplingEstimate(windows) is None)
+    
+    def readStatus(self, path):
+        """
+        Return the header values of the status file at `path` as a dict,
+        along with the rows of its table of windows.
+        """
+        header = {}
+        rows = []
+        f = open(path, 'r')
+        lines = f.read().splitlines()
+        f.close()
+        separators = [n for n, line in enumerate(lines) if line.startswith('====')]
+        self.assertEqual(len(separators), 3)
+        for line in lines[0:separators[0]]:
+            if '=' in line and not line.startswith('*'):
+                key, value = line.split('=', 1)
+                header[key.strip()] = value.strip()
+        for line in lines[separators[1]+1:separators[2]]:
+            rows.append(line.split())
+        return header, rows
+    
+    def testSaveStatus(self):
+        """
+        Test that the status file reports the estimate and the mean force of
+        each window.
+        """
+        path = os.path.join(self.directory, 'umbrella_sampling_status.dat')
+        estimate = self.rpmd.getUmbrellaSamplingEstimate(self.windows)
+        xi_current, barrier, barrierError, k_QTST, relativeError = estimate
+        self.rpmd.saveUmbrellaSamplingStatus(path, self.windows[::-1], estimate)
+        
+        header, rows = self.readStatus(path)
+        self.assertEqual(int(header['Number of beads']), 1)
+        self.assertEqual(int(header['Number of trajectories']), sum([len(window.blockCount) for window in self.windows]))
+        self.assertEqual(header['Number of windows sampled'], '13 of 13')
+        self.assertAlmostEqual(float(header['Maximum of potential of mean force']), xi_current, 4)
+        value, error, units = header['Free energy barrier'].replace('+/-', '').split()
+        self.assertAlmostEqual(float(value), barrier * 27.211, 6)
+        self.assertAlmostEqual(float(error), barrierError * 27.211, 6)
+        self.assertAlmostEqual(float(header['Relative error in k_QTST(T;xi_max)']) / relativeError, 1.0, 5)
+        
+        self.assertEqual(len(rows), 13)
+        for row, window in zip(rows, self.windows):
+            dA, error = window.getMeanForce(self.rpmd.beta)
+            self.assertAlmostEqual(float(row[0]), window.xi, 4)
+            self.assertEqual(int(row[1]), len(window.blockCount))
+            self.assertEqual(int(row[2]), window.count)
+            self.assertAlmostEqual(float(row[3]), dA * 27.211, 8)
+            self.assertAlmostEqual(float(row[4]), error * 27.211, 8)
+        
+        # Without an estimate only the progress of the windows is reported
+        self.windows[0] = Window(xi=self.windows[0].xi, kforce=self.windows[0].kforce)
+        self.rpmd.saveUmbrellaSamplingStatus(path, self.windows, None)
+        header, rows = self.readStatus(path)
+        self.assertEqual(header['Number of windows sampled'], '12 of 13')
+        self.assertFalse('Free energy barrier' in header)
+        self.assertEqual(len(rows), 13)
+        self.assertEqual(int(rows[0][2]), 0)
+
+class TestUmbrellaReweighting(unittest.TestCase):
+    """
+    Contains unit tests of the :meth:`RPMD.reweightUmbrellaSampling()` method.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 4)
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def testSameTemperature(self):
+        """
+        Test that reweighting to the temperature of the umbrella sampling
+        reproduces the saved potential of mean force.
+        """
+        workingDirectory = self.rpmd.createWorkingDirectory()
+        windows = []
+        for xi in numpy.linspace(-0.1, 1.1, 13):
+            window = Window(xi=xi, kforce=0.1)
+            fillHarmonicWindow(window, self.rpmd.beta, xi + 0.01 * xi * (1.0 - xi))
+            self.rpmd.saveUmbrellaHistogram(os.path.join(workingDirectory, 'umbrella_histogram_{0:.4f}.dat'.format(xi)), window)
+            windows.append(window)
+        self.rpmd.computePotentialOfMeanForce(windows, bins=500)
+        
+        potentialOfMeanForce = self.rpmd.reweightUmbrellaSampling([window.copy() for window in windows], self.rpmd.T, bins=500)
+        self.rpmd.loadPotentialOfMeanForce(os.path.join(workingDirectory, 'potential_of_mean_force.dat'))
+        self.assertEqual(potentialOfMeanForce.shape, self.rpmd.potentialOfMeanForce.shape)
+        self.assertTrue(numpy.allclose(potentialOfMeanForce[0,:], self.rpmd.potentialOfMeanForce[0,:], rtol=0, atol=1e-6))
+        self.assertTrue(numpy.allclose(potentialOfMeanForce[1,:] * 27.211, self.rpmd.potentialOfMeanForce[1,:] * 27.211, rtol=0, atol=1e-9))
+        self.assertTrue(numpy.max(potentialOfMeanForce[1,:]) > 0)
+        self.assertTrue(os.path.exists(os.path.join(workingDirectory, 'umbrella_reweighting_300.dat')))
+
+################################################################################
+
+if __name__ == '__main__':
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
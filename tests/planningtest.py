@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the :mod:`rpmdrate.planning` module.
+"""
+
+import os
+import numpy
+import shutil
+import tempfile
+import unittest
+
+from rpmdrate.main import Window
+from rpmdrate.input import loadInputFile
+from rpmdrate.planning import *
+
+################################################################################
+
+class TestJobCost(unittest.TestCase):
+    """
+    Contains unit tests of the :func:`getJobCost()` function.
+    """
+    
+    def setUp(self):
+        self.costs = {'potential': 1e-4, 'configuration': 1e-5, 'umbrella': 1e-4, 'parent': 2e-4}
+        self.dt = (0.0001,"ps")
+    
+    def test_parallelWallTime(self):
+        """
+        Test that a batch of trajectories is spread over the processes, but
+        takes no less time than its longest trajectory.
+        """
+        self.assertAlmostEqual(getParallelWallTime([1.0, 2.0, 3.0], 1), 6.0)
+        self.assertAlmostEqual(getParallelWallTime([1.0, 2.0, 3.0], 2), 3.0)
+        self.assertAlmostEqual(getParallelWallTime([1.0, 1.0, 1.0, 1.0], 2), 2.0)
+        self.assertAlmostEqual(getParallelWallTime([], 4), 0.0)
+    
+    def test_configurations(self):
+        """
+        Test the cost of generating the umbrella configurations, with and
+        without a stride.
+        """
+        params = (self.dt, (1,"ps"), numpy.arange(0.0, 1.0, 0.1), 1.0, 1)
+        trajectories, steps, cpuTime, wallTime, note = getJobCost('configurations', params, self.costs, 4)
+        self.assertEqual(trajectories, 10)
+        self.assertEqual(steps, 100000)
+        self.assertAlmostEqual(cpuTime, 1.0)
+        self.assertAlmostEqual(wallTime, 1.0)
+        params = (self.dt, (1,"ps"), numpy.arange(0.0, 1.0, 0.1), 1.0, 5)
+        trajectories, steps, cpuTime, wallTime, note = getJobCost('configurations', params, self.costs, 4)
+        self.assertAlmostEqual(cpuTime, 1.0)
+        self.assertAlmostEqual(wallTime, 0.25)
+    
+    def test_umbrella(self):
+        """
+        Test the cost of umbrella sampling, which runs the windows breadth-first.
+        """
+        windows = [
+            Window(xi=0.0, kforce=1.0, trajectories=2, equilibrationTime=(1,"ps"), evolutionTime=(9,"ps")),
+            Window(xi=0.5, kforce=1.0, trajectories=1, equilibrationTime=(1,"ps"), evolutionTime=(9,"ps")),
+            Window(xi=1.0, kforce=1.0, trajectories=1, equilibrationTime=(1,"ps"), evolutionTime=(9,"ps")),
+        ]
+        params = (self.dt, windows, False, None, 4)
+        trajectories, steps, cpuTime, wallTime, note = getJobCost('umbrella', params, self.costs, 2)
+        self.assertEqual(trajectories, 4)
+        self.assertEqual(steps, 400000)
+        self.assertAlmostEqual(cpuTime, 40.0)
+        # The first round of three trajectories takes 15 s on two processes,
+        # and the second round of one trajectory takes 10 s
+        self.assertAlmostEqual(wallTime, 25.0)
+        self.assertEqual(note, '')
+        params = (self.dt, windows, False, 0.05, 4)
+        self.assertEqual(getJobCost('umbrella', params, self.costs, 2)[4], 'upper bound')
+    
+    def test_recrossing(self):
+        """
+        Test the cost of the recrossing factor, with the parent trajectory
+        evolved between each set of children.
+        """
+        params = (self.dt, (1,"ps"), 1000, (0.1,"ps"), 100, (0.01,"ps"), None, False, False, None, None, None)
+        trajectories, steps, cpuTime, wallTime, note = getJobCost('recrossing', params, self.costs, 50)
+        self.assertEqual(trajectories, 1000)
+        self.assertEqual(steps, 10000 + 9 * 1000 + 1000 * 100)
+        self.assertAlmostEqual(cpuTime, 19000 * 2e-4 + 100000 * 1e-4)
+        self.assertAlmostEqual(wallTime, 19000 * 2e-4 + 10 * 200 * 1e-4)
+    
+    def test_other(self):
+        """
+        Test that the jobs that do not run trajectories cost nothing.
+        """
+        self.assertEqual(getJobCost('PMF', (None, None, None, 5000), self.costs, 4), (0, 0, 0.0, 0.0, ''))
+        self.assertEqual(getJobCost('rate', tuple(), self.costs, 4), (0, 0, 0.0, 0.0, ''))
+
+################################################################################
+
+class TestRecommendTimeStep(unittest.TestCase):
+    """
+    Contains unit tests of the :func:`recommendTimeStep()` function.
+    """
+    
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        try:
+            inputFile = os.path.join(directory, 'input.py')
+            shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+            self.rpmd, jobList = loadInputFile(inputFile, 300.0, 4)
+        finally:
+            shutil.rmtree(directory)
+        self.dt = 0.0001 / 2.418884326505e-5
+        self.evolutionTime = 0.005 / 2.418884326505e-5
+    
+    def test_recommendTimeStep(self):
+        """
+        Test that the drift grows with the time step, and that the
+        recommended time step is the largest one within the tolerance.
+        """
+        recommended, rows = recommendTimeStep(self.rpmd, self.dt, 0.002, self.evolutionTime, trajectories=2, equilibrationSteps=100)
+        self.assertEqual(self.rpmd.dt, 0)
+        self.assertFalse(self.rpmd.monitorEnergy)
+        self.assertAlmostEqual(rows[0][0], self.dt)
+        self.assertTrue(rows[0][2] < rows[-1][2])
+        self.assertTrue(recommended >= self.dt)
+        for dt, meanDrift, maxDrift, temperature in rows:
+            if dt <= recommended:
+                self.assertTrue(maxDrift <= 0.002)
+            self.assertTrue(0.5 < temperature < 2.0)
+        self.assertTrue(rows[-1][2] > 0.002 or rows[-1][0] > 7.99 * self.dt)
+    
+    def test_tooLarge(self):
+        """
+        Test that smaller time steps are tried if the given time step exceeds
+        the tolerance.
+        """
+        recommended, rows = recommendTimeStep(self.rpmd, 8 * self.dt, 0.0005, self.evolutionTime, trajectories=2, equilibrationSteps=100)
+        self.assertTrue(rows[0][2] > 0.0005)
+        self.assertTrue(len(rows) > 1)
+        self.assertTrue(all([row[0] < 8 * self.dt for row in rows[1:]]))
+        if recommended is not None:
+            self.assertTrue(recommended < 8 * self.dt)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the :mod:`rpmdrate.potentials` module.
+"""
+
+import numpy
+import unittest
+
+from rpmdrate.potentials import *
+
+################################################################################
+
+def getRandomPositions(Natoms, Nbeads):
+    """
+    Return a random, slightly distorted transition state-like geometry for
+    each of `Nbeads` beads, as an array of shape ``(3, Natoms, Nbeads)``.
+    """
+    numpy.random.seed(1)
+    q = SyntheticPotential(Natoms).getTransitionStateGeometry().T[:,:,numpy.newaxis]
+    return q + 0.2 * numpy.random.randn(3, Natoms, Nbeads)
+
+def getNumericalGradient(potential, q, h=1e-5):
+    """
+    Return the gradient of `potential` at the positions `q` by central
+    finite differences.
+    """
+    dVdq = numpy.zeros_like(q)
+    for i in range(q.shape[0]):
+        for j in range(q.shape[1]):
+            qp = q.copy(); qp[i,j,:] += h
+            qm = q.copy(); qm[i,j,:] -= h
+            dVdq[i,j,:] = (potential(qp)[0] - potential(qm)[0]) / (2 * h)
+    return dVdq
+
+class TestPotentials(unittest.TestCase):
+    """
+    Contains unit tests of the analytic potential energy surfaces.
+    """
+
+    def setUp(self):
+        self.potentials = [LEPSPotential(), ModelPotential(), SyntheticPotential(7, repulsion=0.5, range=2.0)]
+
+    def test_gradient(self):
+        """
+        Test that the gradient of each potential matches the finite
+        difference derivative of the potential.
+        """
+        for potential in self.potentials:
+            Natoms = getattr(potential, 'Natoms', 3)
+            q = getRandomPositions(Natoms, 4)
+            V, dVdq, info = potential(q)
+            self.assertEqual(info, 0)
+            self.assertEqual(V.shape, (4,))
+            self.assertEqual(dVdq.shape, q.shape)
+            self.assertTrue(numpy.allclose(dVdq, getNumericalGradient(potential, q), atol=1e-8))
+
+    def test_compiled(self):
+        """
+        Test that the compiled version of each potential matches the NumPy
+        version.
+        """
+        for potential in self.potentials:
+            Natoms = getattr(potential, 'Natoms', 3)
+            q = getRandomPositions(Natoms, 4)
+            V0, dVdq0, info0 = potential(q)
+            V, dVdq, info = potential.getCompiledPotential()(q)
+            self.assertEqual(info, 0)
+            self.assertTrue(numpy.allclose(V, V0, atol=1e-12))
+            self.assertTrue(numpy.allclose(dVdq, dVdq0, atol=1e-12))
+
+    def test_transitionState(self):
+        """
+        Test that the transition state geometry of each three-atom potential
+        is a stationary point.
+        """
+        for potential in self.potentials[0:2]:
+            q = potential.getTransitionStateGeometry().T[:,:,numpy.newaxis]
+            V, dVdq, info = potential(q)
+            self.assertTrue(numpy.allclose(dVdq, 0.0, atol=1e-8))
+
+    def test_lepsBarrier(self):
+        """
+        Test the height of the barrier of the LEPS potential, relative to the
+        reactant asymptote at zero.
+        """
+        potential = LEPSPotential()
+        q = potential.getTransitionStateGeometry().T[:,:,numpy.newaxis]
+        self.assertAlmostEqual(potential(q)[0][0] * 27.211, 0.4316, 3)
+        q = getLinearTransitionStateGeometry(potential.r0, 50.0).T[:,:,numpy.newaxis]
+        self.assertAlmostEqual(potential(q)[0][0], 0.0, 10)
+
+    def test_modelBarrier(self):
+        """
+        Test that the barrier of the model potential has the requested
+        height, and that an invalid barrier height raises an error.
+        """
+        potential = ModelPotential(barrier=0.02)
+        q = potential.getTransitionStateGeometry().T[:,:,numpy.newaxis]
+        self.assertAlmostEqual(potential(q)[0][0], 0.02, 12)
+        q = getLinearTransitionStateGeometry(potential.r0, 50.0).T[:,:,numpy.newaxis]
+        self.assertAlmostEqual(potential(q)[0][0], 0.0, 12)
+        self.assertRaises(ValueError, ModelPotential, barrier=0.5)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the :mod:`rpmdrate.profiling` module.
+"""
+
+import numpy
+import unittest
+
+from rpmdrate.profiling import *
+
+################################################################################
+
+class TestKernelProfile(unittest.TestCase):
+    """
+    Contains unit tests of the :class:`KernelProfile` class.
+    """
+    
+    def setUp(self):
+        self.time = numpy.arange(len(KERNELS), dtype=numpy.float64) * 0.01
+        self.calls = numpy.arange(len(KERNELS)) * 10
+
+    def test_add(self):
+        """
+        Test that the profiles of individual trajectories are accumulated,
+        and that a profile of ``None`` is ignored.
+        """
+        profile = KernelProfile()
+        profile.add((1.0, 100, self.time, self.calls))
+        profile.add(None)
+        profile.add((3.0, 300, self.time, self.calls))
+        self.assertEqual(profile.trajectories, 2)
+        self.assertEqual(profile.steps, 400)
+        self.assertAlmostEqual(profile.wallTime, 4.0, 12)
+        self.assertTrue(numpy.allclose(profile.time, 2 * self.time))
+        self.assertTrue(numpy.all(profile.calls == 2 * self.calls))
+
+    def test_getStepsPerSecond(self):
+        """
+        Test that the number of time steps per second is computed correctly.
+        """
+        profile = KernelProfile()
+        self.assertEqual(profile.getStepsPerSecond(), 0.0)
+        profile.add((2.0, 500, self.time, self.calls))
+        self.assertAlmostEqual(profile.getStepsPerSecond(), 250.0, 12)
+
+    def test_getOtherTime(self):
+        """
+        Test that the time not spent in the profiled kernels is computed
+        correctly.
+        """
+        profile = KernelProfile()
+        profile.add((1.0, 100, self.time, self.calls))
+        self.assertAlmostEqual(profile.getOtherTime(), 1.0 - numpy.sum(self.time), 12)
+
+    def test_monitor(self):
+        """
+        Test that the energy monitoring data are accumulated, and that
+        profiles without them are still accepted.
+        """
+        profile = KernelProfile()
+        self.assertTrue(numpy.isnan(profile.getKineticTemperature(300.0)))
+        self.assertTrue(numpy.isnan(profile.getMeanDrift()))
+        profile.add((1.0, 100, self.time, self.calls, (100, 110.0, 2, 0.002, 0.0015)))
+        profile.add((1.0, 100, self.time, self.calls))
+        profile.add((1.0, 100, self.time, self.calls, (100, 90.0, 1, 0.004, 0.004)))
+        self.assertEqual(profile.trajectories, 3)
+        self.assertEqual(profile.monitorSteps, 200)
+        self.assertAlmostEqual(profile.getKineticTemperature(300.0), 300.0, 12)
+        self.assertEqual(profile.driftTrajectories, 3)
+        self.assertAlmostEqual(profile.getMeanDrift(), 0.002, 12)
+        self.assertAlmostEqual(profile.maxDrift, 0.004, 12)
+        total = KernelProfile()
+        total.merge(profile)
+        total.merge(profile)
+        self.assertEqual(total.monitorSteps, 400)
+        self.assertEqual(total.steps, 600)
+        self.assertAlmostEqual(total.maxDrift, 0.004, 12)
+
+################################################################################
+
+if __name__ == '__main__':
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
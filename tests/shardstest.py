@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the :mod:`rpmdrate.shards` module.
+"""
+
+import os
+import shutil
+import tempfile
+import numpy
+import unittest
+
+from rpmdrate.main import RPMDError, Window
+from rpmdrate.input import loadInputFile
+from rpmdrate.shards import *
+
+################################################################################
+
+class TestShards(unittest.TestCase):
+    """
+    Contains unit tests of the splitting of the sampling into shards.
+    """
+    
+    def test_parseShard(self):
+        """
+        Test that shards are parsed, counting from one.
+        """
+        self.assertEqual(parseShard('1/4'), (1, 4))
+        self.assertEqual(parseShard('4/4'), (4, 4))
+        for value in ['0/4', '5/4', '1', '1/0', 'a/b']:
+            self.assertRaises(ValueError, parseShard, value)
+    
+    def test_windows(self):
+        """
+        Test that each window is sampled by exactly one shard.
+        """
+        windows = [Window(xi=0.1 * n, kforce=1.0) for n in range(11)]
+        sampled = []
+        for index in range(1, 4):
+            sampled.extend(getShardWindows(windows, (index, 3)))
+        self.assertEqual(sorted([window.xi for window in sampled]), [window.xi for window in windows])
+    
+    def test_trajectories(self):
+        """
+        Test that the child trajectories are shared among the shards.
+        """
+        for trajectories in [0, 10, 1001]:
+            counts = [getShardTrajectories(trajectories, (index, 7)) for index in range(1, 8)]
+            self.assertEqual(sum(counts), trajectories)
+            self.assertTrue(max(counts) - min(counts) <= 1)
+
+################################################################################
+
+class TestMerge(unittest.TestCase):
+    """
+    Contains unit tests of the merging of the partial results of the shards.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.system, jobList = loadInputFile(inputFile, 300.0, 4)
+        self.system.dt = 0.0001 / 2.418884326505e-5
+        self.workingDirectory = self.system.createWorkingDirectory()
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def saveUmbrellaSampling(self, shard, xi, kforce, samples):
+        """
+        Save an umbrella sampling output file for the window at `xi` from the
+        given `shard`, with the given per-trajectory `samples` as a list of
+        ``(av, av2, count)`` tuples.
+        """
+        directory = self.system.createWorkingDirectory(getShardDirectory(self.workingDirectory, shard))
+        f = open(os.path.join(directory, 'umbrella_sampling_{0:.4f}.dat'.format(xi)), 'w')
+        f.write('**********************\n')
+        f.write('RPMD umbrella sampling\n')
+        f.write('**********************\n\n')
+        f.write('Temperature                             = 300 K\n')
+        f.write('Number of beads                         = 4\n')
+        f.write('Reaction coordinate                     = {0:.4f}\n'.format(xi))
+        f.write('Force constant                          = {0:g}\n\n'.format(kforce))
+        f.write('=============== =============== =========== =============== ===============\n')
+        f.write('total av        total av2       count       xi_mean         xi_var\n')
+        f.write('=============== =============== =========== =============== ===============\n')
+        av = 0.0; av2 = 0.0; count = 0
+        for dav, dav2, dcount in samples:
+            av += dav; av2 += dav2; count += dcount
+            f.write('{0:15.8f} {1:15.8f} {2:11d} {3:15.5e} {4:15.5e}\n'.format(av, av2, count, av / count, av2 / count - (av / count)**2))
+        f.close()
+    
+    def saveRecrossingFactor(self, shard, kappa_num, kappa_denom, batches):
+        """
+        Save a recrossing factor output file from the given `shard`.
+        """
+        directory = self.system.createWorkingDirectory(getShardDirectory(self.workingDirectory, shard))
+        self.system.xi_current = 0.5
+        self.system.saveRecrossingFactor(os.path.join(directory, 'recrossing_factor_0.5000.dat'), 
+            numpy.array(kappa_num), kappa_denom, 10 * len(batches), 10 * len(batches), 100, 50, len(kappa_num), 10, 
+            [num for num, denom in batches], [denom for num, denom in batches])
+    
+    def test_umbrellaSampling(self):
+        """
+        Test that the trajectories of each window are pooled across the shards.
+        """
+        self.saveUmbrellaSampling((1, 2), 0.5, 0.1, [(10.0, 6.0, 20), (11.0, 7.0, 20)])
+        self.saveUmbrellaSampling((2, 2), 0.5, 0.1, [(9.0, 5.0, 20)])
+        self.saveUmbrellaSampling((2, 2), 0.6, 0.1, [(12.0, 8.0, 20)])
+        self.assertEqual(mergeShards(self.system), 2)
+        xi, kforce, av_list, av2_list, count_list = self.system.loadUmbrellaSampling(os.path.join(self.workingDirectory, 'umbrella_sampling_0.5000.dat'))
+        self.assertAlmostEqual(xi, 0.5)
+        self.assertAlmostEqual(kforce, 0.1)
+        self.assertTrue(numpy.allclose(av_list, [10.0, 21.0, 30.0]))
+        self.assertTrue(numpy.allclose(av2_list, [6.0, 13.0, 18.0]))
+        self.assertEqual(list(count_list), [20, 40, 60])
+        
+        # Merging again gives the same result
+        mergeShards(self.system)
+        xi, kforce, av_list, av2_list, count_list = self.system.loadUmbrellaSampling(os.path.join(self.workingDirectory, 'umbrella_sampling_0.5000.dat'))
+        self.assertEqual(list(count_list), [20, 40, 60])
+    
+    def test_umbrellaSamplingMismatch(self):
+        """
+        Test that windows with different force constants are not merged.
+        """
+        self.saveUmbrellaSampling((1, 2), 0.5, 0.1, [(10.0, 6.0, 20)])
+        self.saveUmbrellaSampling((2, 2), 0.5, 0.2, [(9.0, 5.0, 20)])
+        self.assertRaises(RPMDError, mergeShards, self.system)
+    
+    def test_recrossingFactor(self):
+        """
+        Test that the child trajectories are pooled across the shards.
+        """
+        self.saveRecrossingFactor((1, 2), [4.0, 3.0, 2.0], 4.0, [(1.0, 2.0), (1.0, 2.0)])
+        self.saveRecrossingFactor((2, 2), [4.0, 2.0, 1.0], 4.0, [(0.5, 2.0), (0.5, 2.0)])
+        self.assertEqual(mergeShards(self.system), 1)
+        (T, Nbeads, xi_current, dt, kappa_num, kappa_denom, trajectoryCount,
+            childTrajectories, equilibrationSteps, childSamplingSteps, 
+            childEvolutionSteps, childrenPerSampling, kappa_batch_num,
+            kappa_batch_denom) = self.system.loadRecrossingFactor(os.path.join(self.workingDirectory, 'recrossing_factor_0.5000.dat'))
+        self.assertAlmostEqual(xi_current, 0.5)
+        self.assertTrue(numpy.allclose(kappa_num, [8.0, 5.0, 3.0]))
+        self.assertAlmostEqual(float(kappa_denom), 8.0)
+        self.assertEqual(trajectoryCount, 40)
+        self.assertEqual(childTrajectories, 40)
+        self.assertEqual(kappa_batch_num, [1.0, 1.0, 0.5, 0.5])
+        self.assertEqual(kappa_batch_denom, [2.0, 2.0, 2.0, 2.0])
+
+################################################################################
+
+if __name__ == '__main__':
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the :mod:`rpmdrate.statistics` module.
+"""
+
+import math
+import numpy
+import unittest
+
+from rpmdrate.statistics import *
+
+################################################################################
+
+class TestBlockStatistics(unittest.TestCase):
+    """
+    Contains unit tests of the block averaging functions.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.values = numpy.array([0.51, 0.48, 0.55, 0.47, 0.50, 0.52], numpy.float64)
+        self.weights = numpy.array([1000, 1000, 1000, 1000, 1000, 1000], numpy.float64)
+    
+    def test_getBlockMean(self):
+        """
+        Test the getBlockMean() function.
+        """
+        self.assertAlmostEqual(getBlockMean(self.values), numpy.mean(self.values), 12)
+        self.assertAlmostEqual(getBlockMean(self.values, self.weights), numpy.mean(self.values), 12)
+        self.assertAlmostEqual(getBlockMean([1.0, 4.0], [3, 1]), 1.75, 12)
+    
+    def test_getBlockStandardError(self):
+        """
+        Test that the getBlockStandardError() function reduces to the usual
+        standard error of the mean for equally-weighted blocks.
+        """
+        N = self.values.shape[0]
+        expected = numpy.std(self.values, ddof=1) / math.sqrt(N)
+        self.assertAlmostEqual(getBlockStandardError(self.values), expected, 12)
+        self.assertAlmostEqual(getBlockStandardError(self.values, self.weights), expected, 12)
+    
+    def test_getBlockStandardErrorEmptyBlocks(self):
+        """
+        Test that empty blocks are ignored by the getBlockStandardError()
+        function, and that at least two blocks are required.
+        """
+        values = numpy.hstack([self.values, [100.0]])
+        weights = numpy.hstack([self.weights, [0]])
+        self.assertAlmostEqual(getBlockStandardError(values, weights), getBlockStandardError(self.values), 12)
+        self.assertEqual(getBlockStandardError([0.5]), float('inf'))
+        self.assertEqual(getBlockStandardError([0.5, 0.6], [1, 0]), float('inf'))
+
+    def test_getBlockingStandardError(self):
+        """
+        Test that the getBlockingStandardError() function reduces to the usual
+        standard error for a short series, and that it detects correlation
+        between neighboring values.
+        """
+        N = self.values.shape[0]
+        expected = numpy.std(self.values, ddof=1) / math.sqrt(N)
+        self.assertAlmostEqual(getBlockingStandardError(self.values), expected, 12)
+        self.assertEqual(getBlockingStandardError([0.5]), float('inf'))
+        
+        # Repeating each value makes neighbors perfectly correlated, so the
+        # naive standard error is too small by a factor of about sqrt(2)
+        values = numpy.repeat(numpy.tile(self.values, 8), 2)
+        naive = numpy.std(values, ddof=1) / math.sqrt(values.shape[0])
+        blocked = getBlockingStandardError(values)
+        self.assertTrue(blocked > 1.3 * naive)
+    
+    def test_getRatioStandardError(self):
+        """
+        Test the getRatioStandardError() function.
+        """
+        numerators = numpy.array([3.0, 2.0, 4.0, 3.0, 5.0, 1.0])
+        denominators = numpy.array([6.0, 5.0, 7.0, 6.0, 8.0, 4.0])
+        ratio, error = getRatioStandardError(numerators, denominators)
+        self.assertAlmostEqual(ratio, 18.0 / 36.0, 12)
+        z = numerators - ratio * denominators
+        expected = 6 * (numpy.std(z, ddof=1) / math.sqrt(6)) / 36.0
+        self.assertAlmostEqual(error, expected, 12)
+        
+        # A constant ratio in every batch has no error
+        ratio, error = getRatioStandardError(0.5 * denominators, denominators)
+        self.assertAlmostEqual(ratio, 0.5, 12)
+        self.assertAlmostEqual(error, 0.0, 12)
+
+################################################################################
+
+if __name__ == '__main__':
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+################################################################################
+#
+#   RPMDrate - Bimolecular reaction rates via ring polymer molecular dynamics
+#
+#   Copyright (c) 2012 by Joshua W. Allen (jwallen@mit.edu)
+#                         William H. Green (whgreen@mit.edu)
+#                         Yury V. Suleimanov (ysuleyma@mit.edu, ysuleyma@princeton.edu)
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a 
+#   copy of this software and associated documentation files (the "Software"), 
+#   to deal in the Software without restriction, including without limitation
+#   the rights to use, copy, modify, merge, publish, distribute, sublicense, 
+#   and/or sell copies of the Software, and to permit persons to whom the 
+#   Software is furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#   THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER 
+#   DEALINGS IN THE SOFTWARE. 
+#
+################################################################################
+
+"""
+This script contains unit tests of the :mod:`rpmdrate.trajectory` module.
+"""
+
+import os
+import numpy
+import shutil
+import tempfile
+import unittest
+
+from rpmdrate._main import system
+from rpmdrate.main import runUmbrellaTrajectory
+from rpmdrate.input import loadInputFile
+from rpmdrate.trajectory import *
+
+################################################################################
+
+class TestTrajectoryFiles(unittest.TestCase):
+    """
+    Contains unit tests of recording trajectory files and reading them back.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.q = numpy.asfortranarray(numpy.random.random((3,2,4)))
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def record(self, path, steps, stride, centroids=False):
+        """
+        Record a trajectory of the given number of `steps` to `path`, in which
+        each bead moves by one bohr along x at each step.
+        """
+        recorder = TrajectoryRecorder(path, 2, 4, stride, centroids, 1.5)
+        recorder.start(steps)
+        for step in range(1, steps + 1):
+            q = self.q.copy('F')
+            q[0,:,:] += step
+            system.record_frame(q, step)
+        recorder.stop()
+        recorder.close()
+    
+    def testPath(self):
+        """
+        Test that each trajectory path is new.
+        """
+        path1 = getTrajectoryPath(self.directory, 'umbrella_0.5000')
+        path2 = getTrajectoryPath(self.directory, 'umbrella_0.5000')
+        self.assertNotEqual(path1, path2)
+        open(os.path.join(self.directory, 'child_0.5000_0001.trj.gz'), 'w').close()
+        self.assertEqual(getTrajectoryPath(self.directory, 'child_0.5000', compress=True), os.path.join(self.directory, 'child_0.5000_0002.trj.gz'))
+    
+    def testRoundTrip(self):
+        """
+        Test that the recorded frames are read back, with every stride-th
+        step, and that further frames are appended to an existing file.
+        """
+        path = os.path.join(self.directory, 'trajectory.trj')
+        self.record(path, 10, 3)
+        self.record(path, 4, 3)
+        reader = TrajectoryReader(path)
+        self.assertEqual((reader.Natoms, reader.Nbeads, reader.stride, reader.dt), (2, 4, 3, 1.5))
+        frames = list(reader)
+        reader.close()
+        self.assertEqual([step for step, frame in frames], [3, 6, 9, 3])
+        for step, frame in frames:
+            q = self.q.copy()
+            q[0,:,:] += step
+            self.assertEqual(frame.shape, (3,2,4))
+            self.assertTrue(numpy.allclose(frame, q, atol=1e-5))
+    
+    def testCompressedCentroids(self):
+        """
+        Test recording only the centroids to a compressed file.
+        """
+        path = os.path.join(self.directory, 'trajectory.trj.gz')
+        self.record(path, 10, 5, centroids=True)
+        reader = TrajectoryReader(path)
+        self.assertEqual(reader.Nbeads, 1)
+        frames = list(reader)
+        reader.close()
+        self.assertEqual([step for step, frame in frames], [5, 10])
+        for step, frame in frames:
+            centroid = numpy.mean(self.q, axis=2)
+            centroid[0,:] += step
+            self.assertTrue(numpy.allclose(frame[:,:,0], centroid, atol=1e-5))
+    
+    def testConvertToXYZ(self):
+        """
+        Test converting a trajectory file to an XYZ file.
+        """
+        path = os.path.join(self.directory, 'trajectory.trj')
+        self.record(path, 4, 1)
+        xyzPath = os.path.join(self.directory, 'trajectory.xyz')
+        self.assertEqual(convertTrajectoryToXYZ(path, xyzPath), 4)
+        lines = open(xyzPath).readlines()
+        self.assertEqual(len(lines), 4 * (2 + 8))
+        self.assertEqual(int(lines[0]), 8)
+
+class TestUmbrellaTrajectoryRecording(unittest.TestCase):
+    """
+    Contains unit tests of recording umbrella sampling trajectories.
+    """
+    
+    def setUp(self):
+        """
+        A function run before each unit test in this class.
+        """
+        self.directory = tempfile.mkdtemp()
+        inputFile = os.path.join(self.directory, 'input.py')
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'examples', 'LEPS', 'input.py'), inputFile)
+        self.rpmd, jobList = loadInputFile(inputFile, 300.0, 4)
+        self.rpmd.dt = 0.0001 / 2.418884326505e-5
+        self.rpmd.mode = 1
+        self.rpmd.initializeRandomNumberGenerator()
+        self.q = numpy.zeros((3,self.rpmd.Natoms,self.rpmd.Nbeads), order='F')
+        for k in range(self.rpmd.Nbeads):
+            self.q[:,:,k] = self.rpmd.transitionStates[0].geometry
+    
+    def tearDown(self):
+        """
+        A function run after each unit test in this class.
+        """
+        shutil.rmtree(self.directory)
+    
+    def testRecording(self):
+        """
+        Test that the sampling part of an umbrella sampling trajectory is
+        recorded, and that the last frame matches the final position.
+        """
+        self.rpmd.trajectoryStride = 25
+        path = self.rpmd.getTrajectoryPath(self.directory, 'umbrella_1.0000')
+        p = self.rpmd.sampleMomentum()
+        dav, dav2, dcount, p, q, histogram, profile = runUmbrellaTrajectory(self.rpmd, 1.0, p, self.q, 100, 500, 0.1, None, path)
+        reader = TrajectoryReader(path)
+        frames = list(reader)
+        reader.close()
+        self.assertEqual([step for step, frame in frames], range(25, 501, 25))
+        self.assertTrue(numpy.allclose(frames[-1][1], q, atol=1e-4))
+
+################################################################################
+
+if __name__ == '__main__':
+    unittest.main(testRunner=unittest.TextTestRunner(verbosity=2))